@@ -1,124 +1,106 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file
-from supabase import create_client, Client
-import pytz
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file, Response, stream_with_context
 from datetime import datetime, timedelta, date
 import os
 from dotenv import load_dotenv
-import csv
 import io
+import heapq
+import threading
+import time
 import traceback
 from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# Cargar variables de entorno (antes de importar módulos que leen configuración)
+load_dotenv()
 
 # Importar utilidades de parsing de tarjetas
 from tarjeta_utils import parse_card_data, validate_card_format, get_card_info, debug_card_parsing
 
 # Importar utilidades de tiempo
-from time_utils import get_current_time, get_current_time_formatted, format_datetime_for_display, format_time_only
+from time_utils import get_current_time, get_current_time_formatted, format_datetime_for_display, format_time_only, parse_iso_utc, parse_iso_local, a_hora_local, calcular_descansos_activos
 
 # Importar módulo de base de datos
 import db_utils
+from db_utils import get_client, get_admin_client
 
-# Cargar variables de entorno
-load_dotenv()
+# Importar utilidades de exportación
+from export_utils import TIPOS_REPORTE, generar_exportacion_archivo, iterar_paquete_zip, nombre_archivo_exportacion, mimetype_exportacion, normalizar_formato
+import export_cache
+import export_jobs
+import salud
+import metricas
+import perfilador
+import archivo_historico
+from sesiones import InterfazSesionServidor
+import auth_admin
+from importacion_usuarios import importar_usuarios, reasignar_usuarios
+
+# Importar políticas de descanso (límites por turno/sitio)
+from politicas import obtener_politica, describir_politicas, recargar_politicas
 
 # Configuración Flask
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
 
-# Estado de conexión global para mostrar en la interfaz
-conexion_supabase_status = {
-    'conectado': False,
-    'mensaje': '',
-    'detalle': ''
+# IP real del cliente detrás del proxy de Render (para el límite de intentos de login)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv('TRUSTED_PROXY_HOPS', '1')))
+
+# Sesiones en el servidor: la cookie solo lleva el ID firmado y no se reenvía
+# en cada respuesta; la expiración deslizante la lleva el almacén de sesiones
+app.session_interface = InterfazSesionServidor()
+
+# Perfilado por muestreo de peticiones lentas (opt-in con PROFILER_ENABLED)
+perfilador.instalar(app)
+
+# Estado de conexión global para mostrar en la interfaz (lo actualiza el calentamiento)
+conexion_supabase_status = db_utils.estado_conexion
+
+# Estado del arranque: los clientes de Supabase se crean de forma diferida y el
+# calentamiento corre en segundo plano, así el worker arranca sin esperar a la red
+# y queda en modo degradado (en vez de terminar) si Supabase no responde.
+estado_arranque = {
+    'iniciado': None,
+    'terminado': None,
+    'listo': False,
+    'usuarios_precargados': 0,
+    'descansos_precargados': 0
 }
+_calentamiento_lock = threading.Lock()
+_calentamiento_hilo = None
 
-# Cliente Supabase
-try:
-    print("Iniciando conexión a Supabase...")
-    
-    # Verificar variables de entorno
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_anon_key = os.getenv('SUPABASE_ANON_KEY')
-    supabase_service_key = os.getenv('SUPABASE_SERVICE_KEY')
-    
-    print(f"SUPABASE_URL: {'CONFIGURADA' if supabase_url else 'NO ENCONTRADA'}")
-    print(f"SUPABASE_ANON_KEY: {'CONFIGURADA' if supabase_anon_key else 'NO ENCONTRADA'}")
-    print(f"SUPABASE_SERVICE_KEY: {'CONFIGURADA' if supabase_service_key else 'NO ENCONTRADA'}")
-    
-    if not supabase_url or not supabase_anon_key or not supabase_service_key:
-        conexion_supabase_status.update({
-            'conectado': False,
-            'mensaje': 'Error: Variables de entorno faltantes',
-            'detalle': 'Verifica el archivo .env'
-        })
-        print("❌ Error: Variables de entorno de Supabase no están configuradas")
-        print("Verifica que el archivo .env contenga:")
-        print("SUPABASE_URL=https://tu-proyecto.supabase.co")
-        print("SUPABASE_ANON_KEY=tu-anon-key")
-        print("SUPABASE_SERVICE_KEY=tu-service-key")
-        exit(1)
-    
-    # Intentar crear clientes con configuración específica para producción
-    print("🔗 Creando cliente público...")
-    try:
-        # Configuración específica para evitar problemas de proxy
-        from supabase import ClientOptions
-        options = ClientOptions()
-        supabase: Client = create_client(supabase_url, supabase_anon_key, options)
-    except Exception as client_error:
-        print(f"⚠️ Error con opciones específicas, intentando configuración básica: {client_error}")
-        # Fallback a configuración básica
-        supabase: Client = create_client(supabase_url, supabase_anon_key)
-    
-    print("🔗 Creando cliente administrativo...")
-    try:
-        from supabase import ClientOptions
-        options_admin = ClientOptions()
-        supabase_admin: Client = create_client(supabase_url, supabase_service_key, options_admin)
-    except Exception as admin_error:
-        print(f"⚠️ Error con opciones específicas para admin, intentando configuración básica: {admin_error}")
-        # Fallback a configuración básica
-        supabase_admin: Client = create_client(supabase_url, supabase_service_key)
-    
-    # Probar conexión básica
-    print("🧪 Probando conexión...")
-    test_response = supabase.table('usuarios').select("id").limit(1).execute()
-    print(f"✅ Conexión exitosa - Respuesta: {len(test_response.data) if test_response.data else 0} registros")
+def _calentar_aplicacion():
+    """Conecta con Supabase y precarga el directorio de usuarios y los descansos activos"""
+    estado_arranque['iniciado'] = time.time()
+    print("🔥 Calentamiento: conectando con Supabase...")
     
-    conexion_supabase_status.update({
-        'conectado': True,
-        'mensaje': 'Conexión establecida correctamente',
-        'detalle': f'Usuarios en BD: {len(test_response.data) if test_response.data else 0}'
-    })
-    
-    print("✅ Conexión a Supabase establecida correctamente")
-    
-    # Inicializar clientes en db_utils
-    import db_utils
-    db_utils.initialize_db_clients(supabase, supabase_admin)
-    
-except Exception as e:
-    conexion_supabase_status.update({
-        'conectado': False,
-        'mensaje': f'Error de conexión: {str(e)}',
-        'detalle': f'Tipo: {type(e).__name__}'
-    })
+    if db_utils.verificar_conexion():
+        salud.refrescar_base_datos()
+        estado_arranque['usuarios_precargados'] = db_utils.precargar_directorio_usuarios()
+        estado_arranque['descansos_precargados'] = db_utils.precargar_descansos_activos()
+        estado_arranque['listo'] = (estado_arranque['usuarios_precargados'] >= 0 and
+                                    estado_arranque['descansos_precargados'] >= 0)
     
-    print(f"❌ Error detallado conectando a Supabase:")
-    print(f"   Tipo de error: {type(e).__name__}")
-    print(f"   Mensaje: {str(e)}")
-    
-    import traceback
-    print(f"   Stack trace: {traceback.format_exc()}")
-    
-    print("\n🔧 Posibles soluciones:")
-    print("1. Verificar que el archivo .env existe y contiene las variables correctas")
-    print("2. Verificar que las credenciales de Supabase son válidas")
-    print("3. Verificar conexión a internet")
-    print("4. Verificar que las tablas existen en Supabase")
-    
-    exit(1)
+    estado_arranque['terminado'] = time.time()
+    if estado_arranque['listo']:
+        print(f"✅ Calentamiento completo en {estado_arranque['terminado'] - estado_arranque['iniciado']:.2f}s")
+    else:
+        print(f"⚠️ Calentamiento incompleto, la aplicación funciona en modo degradado: {conexion_supabase_status['mensaje']}")
+
+def iniciar_calentamiento():
+    """Lanza el calentamiento en un hilo (una vez por worker, o de nuevo si quedó degradado)"""
+    global _calentamiento_hilo
+    with _calentamiento_lock:
+        if _calentamiento_hilo is not None and (_calentamiento_hilo.is_alive() or estado_arranque['listo']):
+            return
+        _calentamiento_hilo = threading.Thread(target=_calentar_aplicacion, name='calentamiento', daemon=True)
+        _calentamiento_hilo.start()
+
+@app.before_request
+def asegurar_calentamiento():
+    # Cubre el arranque con 'gunicorn app:app' (sin pasar por create_app)
+    if _calentamiento_hilo is None:
+        iniciar_calentamiento()
 
 # Zona horaria (importada de time_utils)
 from time_utils import TZ as tz
@@ -133,55 +115,87 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Mensaje del kiosco cuando Supabase no responde dentro del techo de latencia
+MENSAJE_SIN_CONEXION = "Sin conexión con la base de datos. Intente nuevamente en unos segundos."
+MENSAJE_FORMATO_INVALIDO = "Formato de tarjeta inválido. Intente nuevamente."
+MENSAJE_NO_ENCONTRADO = "Usuario no encontrado"
+
+def clasificar_pasada(mensaje, tipo_mensaje):
+    """
+    Resultado de una pasada de tarjeta para las métricas del kiosco
+    Retorna: uno de metricas.RESULTADOS_PASADA
+    """
+    if tipo_mensaje in ('entrada', 'salida'):
+        return tipo_mensaje
+    if mensaje == MENSAJE_SIN_CONEXION:
+        return 'sin_conexion'
+    if mensaje == MENSAJE_NO_ENCONTRADO:
+        return 'no_encontrado'
+    if mensaje == MENSAJE_FORMATO_INVALIDO:
+        return 'formato_invalido'
+    return 'error'
+
+# Función auxiliar para calcular el registro de un descanso que se cierra
+def preparar_tiempo_descanso(usuario_id, descanso_activo, turno=None):
+    """
+    Calcula duración, tipo (según la política del turno) y horas locales del
+    registro de tiempos_descanso. La comparten el kiosco síncrono y el ASGI.
+    Retorna: dict listo para insertar en tiempos_descanso
+    """
+    # Calcular duración
+    inicio = parse_iso_utc(descanso_activo['inicio'])
+    
+    fin = get_current_time()  # Usar hora local
+    duracion_minutos = max(1, int((fin - inicio).total_seconds() / 60))  # Mínimo 1 minuto
+    tipo = obtener_politica(turno).tipo_por_duracion(duracion_minutos)
+    
+    print(f"   Duración: {duracion_minutos} min → {tipo}")
+    
+    # Convertir ambos tiempos a la misma zona horaria (local)
+    inicio_local = a_hora_local(inicio)
+    fin_local = fin  # ya está en hora local
+    
+    print(f"   🕐 Conversión de tiempos:")
+    print(f"      Inicio UTC: {inicio.strftime('%H:%M:%S %Z')}")
+    print(f"      Inicio Local: {inicio_local.strftime('%H:%M:%S %Z')}")
+    print(f"      Fin Local: {fin_local.strftime('%H:%M:%S %Z')}")
+    
+    # Preparar datos para tiempos_descanso
+    tiempo_data = {
+        'usuario_id': usuario_id,
+        'tipo': tipo,
+        'fecha': inicio_local.date().isoformat(),
+        'inicio': inicio_local.time().isoformat(),
+        'fin': fin_local.time().isoformat(),
+        'duracion_minutos': duracion_minutos
+    }
+    
+    print(f"   📊 Datos a insertar:")
+    print(f"      Fecha: {tiempo_data['fecha']}")
+    print(f"      Inicio: {tiempo_data['inicio']}")
+    print(f"      Fin: {tiempo_data['fin']}")
+    print(f"      Duración: {tiempo_data['duracion_minutos']} min")
+    
+    return tiempo_data
+
 # Función auxiliar para cerrar un descanso
-def cerrar_descanso_usuario(usuario_id, descanso_activo):
+def cerrar_descanso_usuario(usuario_id, descanso_activo, turno=None):
     """
     Función dedicada para cerrar un descanso de usuario
+    El tipo (DESCANSO/COMIDA) se decide con la política del turno del usuario
     Retorna: (success: bool, mensaje: str, detalle: dict)
     """
     try:
         print(f"🔄 Iniciando proceso de cierre para usuario ID: {usuario_id}")
         print(f"   Descanso a cerrar: ID {descanso_activo['id']}")
         
-        # Calcular duración
-        inicio = datetime.fromisoformat(descanso_activo['inicio'].replace('Z', '+00:00'))
-        if inicio.tzinfo is None:
-            inicio = inicio.replace(tzinfo=pytz.UTC)
-        
-        fin = get_current_time()  # Usar hora local
-        duracion_minutos = max(1, int((fin - inicio).total_seconds() / 60))  # Mínimo 1 minuto
-        tipo = 'COMIDA' if duracion_minutos >= 30 else 'DESCANSO'
-        
-        print(f"   Duración: {duracion_minutos} min → {tipo}")
-        
-        # Convertir ambos tiempos a la misma zona horaria (local)
-        inicio_local = inicio.astimezone(tz)
-        fin_local = fin  # ya está en hora local
-        
-        print(f"   🕐 Conversión de tiempos:")
-        print(f"      Inicio UTC: {inicio.strftime('%H:%M:%S %Z')}")
-        print(f"      Inicio Local: {inicio_local.strftime('%H:%M:%S %Z')}")
-        print(f"      Fin Local: {fin_local.strftime('%H:%M:%S %Z')}")
-        
-        # Preparar datos para tiempos_descanso
-        tiempo_data = {
-            'usuario_id': usuario_id,
-            'tipo': tipo,
-            'fecha': inicio_local.date().isoformat(),
-            'inicio': inicio_local.time().isoformat(),
-            'fin': fin_local.time().isoformat(),
-            'duracion_minutos': duracion_minutos
-        }
-        
-        print(f"   📊 Datos a insertar:")
-        print(f"      Fecha: {tiempo_data['fecha']}")
-        print(f"      Inicio: {tiempo_data['inicio']}")
-        print(f"      Fin: {tiempo_data['fin']}")
-        print(f"      Duración: {tiempo_data['duracion_minutos']} min")
+        tiempo_data = preparar_tiempo_descanso(usuario_id, descanso_activo, turno)
+        tipo = tiempo_data['tipo']
+        duracion_minutos = tiempo_data['duracion_minutos']
         
         # Paso 1: Insertar en tiempos_descanso
         print(f"   📝 Insertando tiempo de descanso...")
-        insert_response = supabase_admin.table('tiempos_descanso').insert(tiempo_data).execute()
+        insert_response = db_utils.ejecutar(get_admin_client().table('tiempos_descanso').insert(tiempo_data), 'escritura')
         
         if not insert_response.data:
             error_msg = "Error insertando en tiempos_descanso"
@@ -193,7 +207,9 @@ def cerrar_descanso_usuario(usuario_id, descanso_activo):
         
         # Paso 2: Eliminar de descansos
         print(f"   🗑️ Eliminando descanso activo...")
-        delete_response = supabase_admin.table('descansos').delete().eq('id', descanso_activo['id']).execute()
+        # Borrar por ID es idempotente: se reintenta para no dejar el descanso abierto tras el insert
+        delete_response = db_utils.ejecutar(get_admin_client().table('descansos').delete().eq('id', descanso_activo['id']),
+                                            'escritura', idempotente=True)
         
         if delete_response.data:
             print(f"   ✅ Descanso eliminado: {len(delete_response.data)} registros")
@@ -201,14 +217,18 @@ def cerrar_descanso_usuario(usuario_id, descanso_activo):
             print(f"   ⚠️ ADVERTENCIA: No se confirmó eliminación - Error: {delete_response.error if hasattr(delete_response, 'error') else 'Sin error'}")
 
         # Paso 3: Verificación final
-        verify_response = supabase_admin.table('descansos').select("*").eq('usuario_id', usuario_id).execute()
-        descansos_restantes = len(verify_response.data)
-        print(f"   🔍 Verificación: {descansos_restantes} descansos activos restantes")
-        
-        if descansos_restantes > 0:
-            print(f"   ⚠️ PROBLEMA: Quedan descansos activos")
-            for resto in verify_response.data:
-                print(f"      - ID {resto['id']}, Inicio: {resto['inicio']}")
+        try:
+            verify_response = db_utils.ejecutar(get_admin_client().table('descansos').select("*").eq('usuario_id', usuario_id))
+            descansos_restantes = len(verify_response.data)
+            print(f"   🔍 Verificación: {descansos_restantes} descansos activos restantes")
+            
+            if descansos_restantes > 0:
+                print(f"   ⚠️ PROBLEMA: Quedan descansos activos")
+                for resto in verify_response.data:
+                    print(f"      - ID {resto['id']}, Inicio: {resto['inicio']}")
+        except db_utils.ServicioNoDisponible:
+            descansos_restantes = None
+            print(f"   ⚠️ Verificación omitida: Supabase no disponible")
         
         success_msg = f"Descanso cerrado: {tipo} de {duracion_minutos} min"
         print(f"   ✅ ÉXITO: {success_msg}")
@@ -231,8 +251,47 @@ def cerrar_descanso_usuario(usuario_id, descanso_activo):
 # def get_current_time():
 #     return datetime.now(tz)
 
+# Función auxiliar para armar la tabla de usuarios en descanso del kiosco
+def construir_filas_descansos(pendientes):
+    """
+    Calcula los tiempos de todos los descansos en un solo paso, contra el mismo "ahora"
+    Recibe: lista de (usuario_info, inicio_iso) ya resueltos
+    Retorna: lista de dicts para index.html (la usan el kiosco síncrono y el ASGI)
+    """
+    parseados = []
+    for usuario_info, inicio_iso in pendientes:
+        try:
+            # Procesar hora de inicio asegurando zona horaria consistente
+            parseados.append((usuario_info, parse_iso_utc(inicio_iso), parse_iso_local(inicio_iso)))
+        except Exception as e_tiempo:
+            print(f"   ❌ Error calculando tiempo para usuario {usuario_info['nombre']}: {e_tiempo}")
+    
+    ahora = get_current_time()  # Ya está en hora local
+    estado = calcular_descansos_activos([inicio for _, inicio, _ in parseados], ahora,
+                                        turnos=[usuario_info.get('turno') for usuario_info, _, _ in parseados])
+    print(f"   ⏰ Tiempos calculados para {len(parseados)} descansos (ahora: {ahora.strftime('%H:%M:%S %Z')})")
+    
+    filas = []
+    for (usuario_info, inicio, inicio_local), tiempo_transcurrido, tiempo_restante, tipo_probable, excedido, limite, limite_comida in zip(
+            parseados, estado['transcurrido'], estado['restante'], estado['tipo_probable'], estado['excedido'],
+            estado['maximo'], estado['limite_comida']):
+        filas.append({
+            'nombre': usuario_info['nombre'],
+            'codigo': usuario_info['codigo'],
+            'tiempo_transcurrido': tiempo_transcurrido,
+            'tiempo_restante': tiempo_restante,
+            'tipo_probable': tipo_probable,
+            'excedido': excedido,
+            'limite': limite,  # Límites de la política del turno, para el recoloreo en JavaScript
+            'limite_comida': limite_comida,
+            'inicio_formateado': inicio_local.strftime('%H:%M'),  # Para mostrar
+            'inicio_iso': inicio.isoformat()  # Para cálculos de JavaScript
+        })
+    return filas
+
 # Ruta principal - Lector de tarjetas
 @app.route('/', methods=['GET', 'POST'])
+@db_utils.con_limite_latencia()
 def index():
     # TEMPORALMENTE COMENTADO: Si hay admin logueado, redirigir a registros
     # if 'admin_id' in session:
@@ -246,16 +305,18 @@ def index():
         
         if entrada_raw:
             # ✨ NUEVA FUNCIONALIDAD: Parsear datos de tarjeta con banda magnética
-            entrada = parse_card_data(entrada_raw)
+            with metricas.medir_etapa('parseo'):
+                entrada = parse_card_data(entrada_raw)
+                formato_valido = validate_card_format(entrada)
             
             print(f"🔍 Procesando entrada:")
             print(f"   Datos crudos: '{entrada_raw}'")
             print(f"   Datos parseados: '{entrada}'")
             
             # Validar formato de tarjeta
-            if not validate_card_format(entrada):
+            if not formato_valido:
                 print(f"⚠️ Formato de tarjeta inválido")
-                mensaje = "Formato de tarjeta inválido. Intente nuevamente."
+                mensaje = MENSAJE_FORMATO_INVALIDO
                 tipo_mensaje = "error"
             else:
                 try:
@@ -264,18 +325,20 @@ def index():
                     
                     # Usar búsqueda inteligente centralizada
                     print(f"🔍 Iniciando búsqueda inteligente para: '{entrada}'")
-                    usuario = buscar_usuario_inteligente(entrada)
-                    
-                    # Si no se encuentra con datos parseados, intentar con datos originales
-                    if not usuario and entrada != entrada_raw:
-                        print(f"🔄 Intentando con datos originales como fallback...")
-                        usuario = buscar_usuario_inteligente(entrada_raw)
+                    with metricas.medir_etapa('busqueda'):
+                        usuario = buscar_usuario_inteligente(entrada)
+                        
+                        # Si no se encuentra con datos parseados, intentar con datos originales
+                        if not usuario and entrada != entrada_raw:
+                            print(f"🔄 Intentando con datos originales como fallback...")
+                            usuario = buscar_usuario_inteligente(entrada_raw)
                     
                     if usuario:
                         print(f"👤 Usuario encontrado: {usuario['nombre']} (ID: {usuario['id']})")
                         
                         # Verificar si tiene descanso activo usando db_utils
-                        descanso_activo = obtener_descanso_activo(usuario['id'])
+                        with metricas.medir_etapa('descanso_activo'):
+                            descanso_activo = obtener_descanso_activo(usuario['id'])
                         
                         if descanso_activo:
                             print(f"🚪 PROCESANDO SALIDA DE DESCANSO")
@@ -283,7 +346,8 @@ def index():
                             print(f"   Descanso ID: {descanso_activo['id']}")
                             
                             # Usar función helper para cerrar descanso
-                            success, resultado_msg, detalle = cerrar_descanso_usuario(usuario['id'], descanso_activo)
+                            with metricas.medir_etapa('cierre'):
+                                success, resultado_msg, detalle = cerrar_descanso_usuario(usuario['id'], descanso_activo, usuario.get('turno'))
                             
                             if success:
                                 mensaje = f"{usuario['nombre']} - Salida registrada ({resultado_msg})"
@@ -297,7 +361,8 @@ def index():
                                 
                         else:
                             # Registrar entrada a descanso usando db_utils
-                            descanso_creado = crear_descanso(usuario['id'], get_current_time().isoformat())
+                            with metricas.medir_etapa('apertura'):
+                                descanso_creado = crear_descanso(usuario['id'], get_current_time().isoformat())
                             
                             if descanso_creado:
                                 print(f"✅ Entrada registrada: {descanso_creado}")
@@ -306,13 +371,23 @@ def index():
                             else:
                                 mensaje = f"Error al registrar entrada para {usuario['nombre']}"
                                 tipo_mensaje = "error"
+                    elif db_utils.servicio_degradado():
+                        # No encontrado en el directorio local y Supabase no respondió
+                        mensaje = MENSAJE_SIN_CONEXION
+                        tipo_mensaje = "error"
                     else:
-                        mensaje = "Usuario no encontrado"
+                        mensaje = MENSAJE_NO_ENCONTRADO
                         tipo_mensaje = "error"
                         
+                except db_utils.ServicioNoDisponible as e:
+                    print(f"⚠️ Kiosco sin conexión a Supabase: {e}")
+                    mensaje = MENSAJE_SIN_CONEXION
+                    tipo_mensaje = "error"
                 except Exception as e:
                     mensaje = f"Error al procesar: {str(e)}"
                     tipo_mensaje = "error"
+            
+            metricas.registrar_pasada(clasificar_pasada(mensaje, tipo_mensaje))
     
     # Obtener usuarios en descanso con información de usuario
     usuarios_en_descanso = []
@@ -332,7 +407,8 @@ def index():
             for i, d in enumerate(descansos_activos):
                 print(f"   {i+1}. ID: {d['id']}, Usuario ID: {d['usuario_id']}, Inicio: {d['inicio']}")
         
-        # Procesar cada descanso activo
+        # Procesar cada descanso activo: primero resolver usuario e inicio
+        pendientes = []
         for i, d in enumerate(descansos_activos):
             print(f"\n👤 Procesando descanso {i+1}/{len(descansos_activos)}:")
             print(f"   Descanso ID: {d['id']}")
@@ -340,73 +416,19 @@ def index():
             print(f"   Inicio: {d['inicio']}")
             
             try:
-                # Obtener información del usuario para cada descanso
+                # Obtener información del usuario: primero del directorio precargado
                 print(f"   🔍 Buscando información del usuario ID {d['usuario_id']}...")
-                user_response = supabase.table('usuarios').select("nombre, codigo").eq('id', d['usuario_id']).execute()
+                usuario_info = db_utils.obtener_usuario_directorio(d['usuario_id'])
                 
-                print(f"   📊 Respuesta de usuario: {len(user_response.data)} registros encontrados")
+                if usuario_info is None:
+                    user_response = db_utils.ejecutar(get_client().table('usuarios').select("nombre, codigo, turno").eq('id', d['usuario_id']), 'kiosco')
+                    print(f"   📊 Respuesta de usuario: {len(user_response.data)} registros encontrados")
+                    usuario_info = user_response.data[0] if user_response.data else None
                 
-                if user_response.data:
-                    usuario_info = user_response.data[0]
+                if usuario_info:
                     print(f"   ✅ Usuario encontrado: {usuario_info['nombre']} (Código: {usuario_info['codigo']})")
                     
-                    # Calcular tiempo transcurrido
-                    try:
-                        # Procesar hora de inicio asegurando zona horaria consistente
-                        inicio = datetime.fromisoformat(d['inicio'].replace('Z', '+00:00'))
-                        if inicio.tzinfo is None:
-                            inicio = inicio.replace(tzinfo=pytz.UTC)
-                        
-                        # Convertir inicio a zona horaria local para comparar
-                        inicio_local = inicio.astimezone(tz)
-                        ahora = get_current_time()  # Ya está en hora local
-                        
-                        # Calcular diferencia en minutos
-                        diferencia_segundos = (ahora - inicio_local).total_seconds()
-                        tiempo_transcurrido = int(diferencia_segundos / 60)
-                        
-                        # Debug: mostrar cálculos detallados
-                        print(f"   ⏰ Cálculo de tiempo:")
-                        print(f"      Inicio UTC: {inicio.strftime('%H:%M:%S %Z')}")
-                        print(f"      Inicio Local: {inicio_local.strftime('%H:%M:%S %Z')}")
-                        print(f"      Ahora Local: {ahora.strftime('%H:%M:%S %Z')}")
-                        print(f"      Diferencia segundos: {diferencia_segundos}")
-                        print(f"      Tiempo transcurrido: {tiempo_transcurrido} minutos")
-                        
-                        # Si el tiempo es negativo, podría ser un problema de sincronización
-                        if tiempo_transcurrido < 0:
-                            print(f"   ⚠️ ADVERTENCIA: Tiempo negativo detectado ({tiempo_transcurrido} min)")
-                            print(f"      Esto podría indicar un problema de sincronización de tiempo")
-                            # Forzar a 0 para evitar valores negativos en la UI
-                            tiempo_transcurrido = 0
-                        
-                        # Determinar tiempo máximo según el tiempo transcurrido
-                        tiempo_maximo = 40 if tiempo_transcurrido >= 20 else 20
-                        tiempo_restante = max(0, tiempo_maximo - tiempo_transcurrido)
-                        tipo_probable = 'COMIDA' if tiempo_transcurrido >= 20 else 'DESCANSO'
-                        
-                        # Asegurar que los valores sean números válidos y no negativos
-                        tiempo_transcurrido = max(0, tiempo_transcurrido)
-                        tiempo_restante = max(0, tiempo_restante)
-                        
-                        print(f"   📋 Tipo probable: {tipo_probable}")
-                        print(f"   ⏳ Tiempo restante: {tiempo_restante} min")
-                        
-                        usuario_descanso = {
-                            'nombre': usuario_info['nombre'],
-                            'codigo': usuario_info['codigo'],
-                            'tiempo_transcurrido': tiempo_transcurrido,
-                            'tiempo_restante': tiempo_restante,
-                            'tipo_probable': tipo_probable,
-                            'inicio_formateado': inicio.astimezone(tz).strftime('%H:%M'),  # Para mostrar
-                            'inicio_iso': inicio.isoformat()  # Para cálculos de JavaScript
-                        }
-                        
-                        usuarios_en_descanso.append(usuario_descanso)
-                        print(f"   ✅ Usuario agregado a la lista de descansos")
-                        
-                    except Exception as e_tiempo:
-                        print(f"   ❌ Error calculando tiempo para usuario {usuario_info['nombre']}: {e_tiempo}")
+                    pendientes.append((usuario_info, d['inicio']))
                         
                 else:
                     print(f"   ⚠️ PROBLEMA: No se encontró información para usuario ID {d['usuario_id']}")
@@ -416,6 +438,8 @@ def index():
                 print(f"   ❌ Error procesando descanso individual (ID: {d['id']}): {e_usuario}")
                 print(f"   Stack trace: {traceback.format_exc()}")
         
+        usuarios_en_descanso = construir_filas_descansos(pendientes)
+        
         print(f"\n📊 RESUMEN FINAL:")
         print(f"   Total descansos activos en BD: {len(descansos_activos)}")
         print(f"   Total usuarios procesados exitosamente: {len(usuarios_en_descanso)}")
@@ -442,61 +466,35 @@ def index():
 # Login administrativo
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    # Debug: mostrar parámetro next
-    next_page = request.args.get('next')
-    print(f"🔍 Login accedido con parámetro next: '{next_page}'")
-    
     if request.method == 'POST':
         usuario = request.form.get('usuario', '').strip()
         clave = request.form.get('clave', '').strip()
         
-        print(f"🔐 Intento de login:")
-        print(f"   Usuario recibido: '{usuario}'")
-        print(f"   Clave recibida: '{clave}'")
+        print(f"🔐 Intento de login: usuario '{usuario}' desde {request.remote_addr}")
         
         try:
-            # Buscar administrador usando cliente administrativo
-            print(f"   Buscando administrador en BD...")
-            response = supabase_admin.table('administradores').select("*").eq('usuario', usuario).eq('activo', True).execute()
-            
-            print(f"   Respuesta BD: {len(response.data) if response.data else 0} resultados")
-            
-            if response.data:
-                admin = response.data[0]
-                print(f"   Admin encontrado:")
-                print(f"      ID: {admin['id']}")
-                print(f"      Usuario: '{admin['usuario']}'")
-                print(f"      Nombre: '{admin['nombre']}'")
-                print(f"      Clave BD: '{admin['clave']}'")
-                print(f"      Activo: {admin['activo']}")
-                
-                if admin['clave'] == clave:
-                    print(f"   ✅ Credenciales válidas - Iniciando sesión")
-                    session.permanent = True
-                    session['admin_id'] = admin['id']
-                    session['admin_nombre'] = admin['nombre']
-                    session['last_activity'] = datetime.now().isoformat()
-                    
-                    # Verificar si hay un destino específico
-                    next_page = request.args.get('next')
-                    if next_page and next_page in ['/base_datos', '/registros', '/reportes']:
-                        print(f"   🎯 Redirigiendo a página solicitada: {next_page}")
-                        return redirect(next_page)
-                    else:
-                        print(f"   🎯 Redirigiendo a página por defecto: registros")
-                        return redirect(url_for('registros'))
-                else:
-                    print(f"   ❌ Clave incorrecta: '{clave}' != '{admin['clave']}'")
-                    return render_template('login.html', error=f'Credenciales inválidas. Usuario: {usuario}, Clave esperada: {admin["clave"]}')
-            else:
-                print(f"   ❌ Usuario no encontrado o inactivo")
-                return render_template('login.html', error=f'Usuario "{usuario}" no encontrado o inactivo')
-                
+            # Límites de intentos, caché de administradores y verificación del hash
+            admin = auth_admin.autenticar(usuario, clave, request.remote_addr)
+        except auth_admin.LimiteIntentos as e:
+            return render_template('login.html', error=f'Demasiados intentos. Espere {int(e.espera) + 1} segundos e intente nuevamente.'), 429
         except Exception as e:
             print(f"   ❌ Error en login: {e}")
-            import traceback
             print(f"   Stack trace: {traceback.format_exc()}")
-            return render_template('login.html', error=f'Error al verificar credenciales: {str(e)}')
+            return render_template('login.html', error='Error al verificar credenciales. Intente nuevamente.')
+        
+        if not admin:
+            return render_template('login.html', error='Usuario o clave incorrectos')
+        
+        session['admin_id'] = admin['id']
+        session['admin_nombre'] = admin['nombre']
+        
+        # Verificar si hay un destino específico
+        next_page = request.args.get('next')
+        if next_page and next_page in ['/base_datos', '/registros', '/reportes']:
+            print(f"   🎯 Redirigiendo a página solicitada: {next_page}")
+            return redirect(next_page)
+        print(f"   🎯 Redirigiendo a página por defecto: registros")
+        return redirect(url_for('registros'))
     
     return render_template('login.html')
 
@@ -512,6 +510,7 @@ def logout():
 def base_datos():
     mensaje = None
     tipo_mensaje = None
+    reporte_importacion = None
     
     if request.method == 'POST':
         action = request.form.get('action')
@@ -528,10 +527,10 @@ def base_datos():
                 print(f"   Nombre: '{nombre}', Tarjeta: '{tarjeta}', Turno: '{turno}', Código: '{codigo}'")
                 
                 if nombre and tarjeta and turno and codigo:
-                    # Verificar si el código ya existe
-                    existing = supabase.table('usuarios').select("id").eq('codigo', codigo).execute()
-                    if existing.data:
-                        mensaje = f"Ya existe un usuario con el código {codigo}"
+                    # Código y tarjeta únicos: índices del directorio en memoria (sin consulta previa)
+                    duplicado = db_utils.verificar_unicidad(codigo, tarjeta)
+                    if duplicado:
+                        mensaje = duplicado
                         tipo_mensaje = "error"
                     else:
                         # DEBUG: Imprimir valores exactos antes de crear
@@ -543,7 +542,7 @@ def base_datos():
                         
                         # Crear usuario
                         try:
-                            result = supabase_admin.table('usuarios').insert({
+                            result = get_admin_client().table('usuarios').insert({
                                 'nombre': nombre,
                                 'tarjeta': tarjeta,
                                 'turno': turno,
@@ -551,12 +550,19 @@ def base_datos():
                             }).execute()
                             
                             print(f"✅ Usuario creado exitosamente: {result}")
+                            if result.data:
+                                db_utils.registrar_usuario_en_directorio(result.data[0])
+                            else:
+                                db_utils.invalidar_directorio_usuarios()
                             mensaje = f"Usuario {nombre} creado exitosamente"
                             tipo_mensaje = "success"
                             
                         except Exception as create_error:
                             print(f"❌ ERROR ESPECÍFICO AL CREAR: {create_error}")
-                            if "usuarios_turno_check" in str(create_error):
+                            duplicado = db_utils.mensaje_violacion_unicidad(create_error)
+                            if duplicado:
+                                mensaje = duplicado
+                            elif "usuarios_turno_check" in str(create_error):
                                 # Error de restricción de turno - la BD debería estar corregida
                                 mensaje = f"Error de restricción de turno: '{turno}' no está permitido. Valores válidos: 'Full', 'Part Time', 'Llamado'"
                                 print("⚠️ Error de restricción - revisar que la BD esté actualizada")
@@ -568,19 +574,41 @@ def base_datos():
                     tipo_mensaje = "error"
                     print(f"❌ Campos faltantes - Nombre: {bool(nombre)}, Tarjeta: {bool(tarjeta)}, Turno: {bool(turno)}, Código: {bool(codigo)}")
                     
+            elif action == 'import':
+                # Importación masiva desde CSV/XLSX (validación en memoria, escritura por lotes)
+                archivo = request.files.get('archivo')
+                dry_run = request.form.get('dry_run') == '1'
+                
+                if not archivo or not archivo.filename:
+                    mensaje = "Seleccione un archivo CSV o XLSX"
+                    tipo_mensaje = "error"
+                else:
+                    try:
+                        reporte_importacion = importar_usuarios(archivo.stream, archivo.filename, dry_run=dry_run)
+                        errores = len(reporte_importacion['errores'])
+                        prefijo = "Simulación: se crearían" if dry_run else "Importación completada:"
+                        mensaje = (f"{prefijo} {reporte_importacion['nuevos']} nuevos, "
+                                   f"{reporte_importacion['actualizados']} actualizados, "
+                                   f"{reporte_importacion['sin_cambios']} sin cambios, {errores} con errores")
+                        tipo_mensaje = "success" if not errores else "error"
+                    except ValueError as e:
+                        mensaje = f"No se pudo leer el archivo: {e}"
+                        tipo_mensaje = "error"
+                    except db_utils.DirectorioIncompleto as e:
+                        mensaje = f"Importación cancelada: {e}"
+                        tipo_mensaje = "error"
+                    
             elif action == 'delete':
                 # Eliminar usuario
                 user_id = request.form.get('user_id')
                 print(f"🗑️ Eliminando usuario ID: {user_id}")
                 
                 if user_id:
-                    # Obtener nombre del usuario antes de eliminar
-                    user_info = supabase.table('usuarios').select("nombre").eq('id', user_id).execute()
-                    nombre_usuario = user_info.data[0]['nombre'] if user_info.data else "Usuario"
-                    
-                    # Eliminar usuario
-                    result = supabase_admin.table('usuarios').delete().eq('id', user_id).execute()
+                    # Eliminar usuario (la respuesta trae la fila eliminada, con su nombre)
+                    result = get_admin_client().table('usuarios').delete().eq('id', user_id).execute()
                     print(f"✅ Usuario eliminado: {result}")
+                    nombre_usuario = result.data[0]['nombre'] if result.data else "Usuario"
+                    db_utils.quitar_usuario_del_directorio(user_id)
                     mensaje = f"Usuario {nombre_usuario} eliminado exitosamente"
                     tipo_mensaje = "success"
                 else:
@@ -596,19 +624,60 @@ def base_datos():
             mensaje = f"Error: {str(e)}"
             tipo_mensaje = "error"
     
-    # Obtener todos los usuarios
+    # Página del directorio en memoria (búsqueda y paginación sin consultar Supabase)
+    listado = _listado_usuarios()
+    if not listado['disponible'] and not mensaje:  # Solo mostrar este error si no hay otro mensaje
+        mensaje = "Error al cargar la lista de usuarios"
+        tipo_mensaje = "error"
+    elif not listado['completo'] and not mensaje:
+        mensaje = "La lista de usuarios está incompleta (no se pudieron cargar todos); recargue en unos minutos"
+        tipo_mensaje = "error"
+    
+    return render_template('base_datos.html', usuarios=listado['usuarios'], listado=listado,
+                           mensaje=mensaje, tipo_mensaje=tipo_mensaje, reporte_importacion=reporte_importacion)
+
+def _listado_usuarios():
+    """Página del directorio según los parámetros q, pagina y por_pagina de la URL"""
+    return db_utils.listar_usuarios_directorio(
+        request.args.get('q', '').strip(),
+        pagina=request.args.get('pagina', 1, type=int),
+        por_pagina=request.args.get('por_pagina', db_utils.USUARIOS_POR_PAGINA, type=int)
+    )
+
+# Búsqueda incremental del directorio (filtro de la pantalla Base de Datos)
+@app.route('/usuarios/buscar')
+@login_required
+def buscar_usuarios():
+    listado = _listado_usuarios()
+    if not listado['disponible']:
+        return jsonify({'error': 'No se pudo cargar la lista de usuarios'}), 503
+    return jsonify(listado)
+
+# Cambios masivos de tarjeta/turno por código (p. ej. reemisión de credenciales)
+@app.route('/usuarios/lote', methods=['POST'])
+@login_required
+def reasignar_usuarios_lote():
+    datos = request.get_json(silent=True)
+    cambios = datos.get('cambios') if isinstance(datos, dict) else datos
+    if not isinstance(cambios, list) or not cambios:
+        return jsonify({'error': 'Enviar {"cambios": [{"codigo": ..., "tarjeta": ..., "turno": ...}]}'}), 400
+    
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'si', 'sí') or \
+        (isinstance(datos, dict) and datos.get('dry_run') is True)
+    
     try:
-        response = supabase.table('usuarios').select("*").order('nombre').execute()
-        usuarios = response.data
-        print(f"📊 Usuarios obtenidos: {len(usuarios)}")
+        reporte = reasignar_usuarios(cambios, dry_run=dry_run)
+        print(f"🪪 Reasignación solicitada por {session.get('admin_nombre', 'admin')}: "
+              f"{reporte['actualizados']} actualizados, {len(reporte['errores'])} con errores")
+        return jsonify(reporte)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except db_utils.DirectorioIncompleto as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        usuarios = []
-        print(f"❌ Error al obtener usuarios: {e}")
-        if not mensaje:  # Solo mostrar este error si no hay otro mensaje
-            mensaje = "Error al cargar la lista de usuarios"
-            tipo_mensaje = "error"
-    
-    return render_template('base_datos.html', usuarios=usuarios, mensaje=mensaje, tipo_mensaje=tipo_mensaje)
+        print(f"❌ Error en reasignación masiva: {e}")
+        print(f"📍 Stack trace: {traceback.format_exc()}")
+        return jsonify({'error': f'Error aplicando cambios: {str(e)}'}), 500
 
 # Editar usuario
 @app.route('/editar_usuario/<user_id>', methods=['GET', 'POST'])
@@ -628,9 +697,13 @@ def editar_usuario(user_id):
             print(f"🔄 Actualizando usuario ID: {user_id}")
             print(f"   Nuevos valores - Nombre: '{nombre}', Tarjeta: '{tarjeta}', Turno: '{turno}', Código: '{codigo}'")
             
-            if nombre and tarjeta and turno and codigo:
+            duplicado = db_utils.verificar_unicidad(codigo, tarjeta, user_id) if nombre and tarjeta and turno and codigo else None
+            if duplicado:
+                mensaje = duplicado
+                tipo_mensaje = "error"
+            elif nombre and tarjeta and turno and codigo:
                 try:
-                    result = supabase_admin.table('usuarios').update({
+                    result = get_admin_client().table('usuarios').update({
                         'nombre': nombre,
                         'tarjeta': tarjeta,
                         'turno': turno,
@@ -638,11 +711,18 @@ def editar_usuario(user_id):
                     }).eq('id', user_id).execute()
                     
                     print(f"✅ Usuario actualizado exitosamente: {result}")
+                    if result.data:
+                        db_utils.registrar_usuario_en_directorio(result.data[0])
+                    else:
+                        db_utils.invalidar_directorio_usuarios()
                     return redirect(url_for('base_datos'))
                     
                 except Exception as update_error:
                     print(f"❌ ERROR AL ACTUALIZAR: {update_error}")
-                    if "usuarios_turno_check" in str(update_error):
+                    duplicado = db_utils.mensaje_violacion_unicidad(update_error)
+                    if duplicado:
+                        mensaje = duplicado
+                    elif "usuarios_turno_check" in str(update_error):
                         mensaje = f"""
                         ERROR DE RESTRICCIÓN DE BASE DE DATOS
                         
@@ -667,7 +747,7 @@ def editar_usuario(user_id):
     
     # Obtener usuario
     try:
-        response = supabase.table('usuarios').select("*").eq('id', user_id).execute()
+        response = get_client().table('usuarios').select("*").eq('id', user_id).execute()
         usuario = response.data[0] if response.data else None
         
         if not usuario:
@@ -722,22 +802,29 @@ def registros():
         fecha_fin = date.today().isoformat()
     
     try:
+        # Meses cerrados ya archivados: se leen del archivo, el resto de la tabla
+        rango_archivo, rango_tabla = archivo_historico.dividir_rango(fecha_inicio, fecha_fin)
+        
         # Construir query base
-        query = supabase.table('tiempos_descanso').select("*, usuarios(id, nombre, codigo)")
+        query = get_client().table('tiempos_descanso').select("*, usuarios(id, nombre, codigo)")
         
         # Aplicar filtros de fecha
-        query = query.gte('fecha', fecha_inicio).lte('fecha', fecha_fin)
-        print(f"   Filtro de fecha aplicado: {fecha_inicio} a {fecha_fin}")
+        if rango_tabla:
+            query = query.gte('fecha', rango_tabla[0]).lte('fecha', rango_tabla[1])
+        print(f"   Filtro de fecha aplicado: {fecha_inicio} a {fecha_fin} (tabla: {rango_tabla}, archivo: {rango_archivo})")
         
         # Filtro por usuario (puede ser por ID o por nombre)
+        if usuario_id and not usuario_id.isdigit():
+            print(f"   ⚠️ usuario_id inválido ignorado: '{usuario_id}'")
+            usuario_id = ''
         if usuario_id:
             query = query.eq('usuario_id', usuario_id)
             print(f"   Filtro por usuario_id: {usuario_id}")
         elif usuario_nombre:
-            # Buscar el ID del usuario por su nombre
-            user_response = supabase.table('usuarios').select("id").eq('nombre', usuario_nombre).execute()
-            if user_response.data:
-                usuario_id = user_response.data[0]['id']
+            # Buscar el ID del usuario por su nombre (en el directorio, sin consulta previa)
+            usuario_filtro = db_utils.buscar_usuario_en_directorio('nombre', usuario_nombre)
+            if usuario_filtro:
+                usuario_id = usuario_filtro['id']
                 query = query.eq('usuario_id', usuario_id)
                 print(f"   Filtro por usuario_nombre '{usuario_nombre}' → ID: {usuario_id}")
             else:
@@ -748,9 +835,16 @@ def registros():
             query = query.eq('tipo', tipo_descanso)
             print(f"   Filtro por tipo: {tipo_descanso}")
         
-        # Ejecutar query
-        response = query.order('fecha', desc=True).order('inicio', desc=True).execute()
-        registros = response.data or []
+        # Ejecutar query principal y lista de usuarios para el filtro en paralelo
+        consultas = {'usuarios': get_client().table('usuarios').select("id, nombre").order('nombre')}
+        if rango_tabla:
+            consultas['registros'] = query.order('fecha', desc=True).order('inicio', desc=True)
+        respuestas = db_utils.consultas_paralelas(consultas, 'reporte')
+        registros = (respuestas['registros'].data or []) if rango_tabla else []
+        if rango_archivo:
+            # Más antiguos que los de la tabla: al final, en el mismo orden descendente
+            registros.extend(archivo_historico.leer_registros(*rango_archivo, usuario_id=usuario_id or None,
+                                                              tipo=tipo_descanso or None, ordenar=True))
         
         print(f"📊 Registros obtenidos después de filtros: {len(registros)}")
         
@@ -759,9 +853,8 @@ def registros():
             r['fecha_formateada'] = datetime.fromisoformat(r['fecha']).strftime('%d/%m/%Y')
             r['duracion_formateada'] = f"{r['duracion_minutos']} min"
         
-        # Obtener lista de usuarios para el filtro
-        response_usuarios = supabase.table('usuarios').select("id, nombre").order('nombre').execute()
-        usuarios = response_usuarios.data or []
+        # Lista de usuarios para el filtro
+        usuarios = respuestas['usuarios'].data or []
         
         # Calcular estadísticas básicas
         total_registros = len(registros)
@@ -815,6 +908,7 @@ def registros():
 # Reportes y estadísticas
 @app.route('/reportes')
 @login_required
+@metricas.medir_reporte('pagina', 'html')
 def reportes():
     # Obtener parámetros
     fecha_inicio = request.args.get('fecha_inicio', '')
@@ -830,12 +924,16 @@ def reportes():
         # Obtener todos los registros del período con manejo de errores mejorado
         print(f"🔍 Obteniendo reportes para período: {fecha_inicio} a {fecha_fin}")
         
-        response = supabase.table('tiempos_descanso').select("*, usuarios(nombre, codigo)")\
-            .gte('fecha', fecha_inicio)\
-            .lte('fecha', fecha_fin)\
-            .execute()
-        
-        registros = response.data if response.data else []
+        rango_archivo, rango_tabla = archivo_historico.dividir_rango(fecha_inicio, fecha_fin)
+        registros = []
+        if rango_tabla:
+            response = get_client().table('tiempos_descanso').select("*, usuarios(nombre, codigo, turno)")\
+                .gte('fecha', rango_tabla[0])\
+                .lte('fecha', rango_tabla[1])\
+                .execute()
+            registros = response.data if response.data else []
+        if rango_archivo:
+            registros.extend(archivo_historico.leer_registros(*rango_archivo))
         print(f"📊 Registros obtenidos: {len(registros)}")
         
         # Filtrar registros con datos válidos
@@ -940,7 +1038,11 @@ def reportes():
                         'tiempo_descansos': 0,
                         'tiempo_comidas': 0,
                         'tiempo_total': 0,
-                        'exceso_total': 0  # Para calcular usuarios que más se exceden
+                        'exceso_total': 0,  # Para calcular usuarios que más se exceden
+                        'exceso_descansos': 0,
+                        'exceso_comidas': 0,
+                        'descansos_con_exceso': 0,
+                        'comidas_con_exceso': 0
                     }
                 
                 # Stats por día
@@ -951,23 +1053,25 @@ def reportes():
                         'usuarios_unicos': set()
                     }
                 
-                # Calcular exceso
-                exceso = 0
-                if tipo == 'DESCANSO' and duracion > 20:
-                    exceso = duracion - 20
-                elif tipo == 'COMIDA' and duracion > 40:
-                    exceso = duracion - 40
+                # Calcular exceso según la política del turno del usuario
+                exceso = obtener_politica(usuario_data.get('turno') if usuario_data else None).exceso(tipo, duracion)
                 
                 # Actualizar contadores
                 if tipo == 'DESCANSO':
                     stats_por_usuario[usuario_nombre]['descansos'] += 1
                     stats_por_usuario[usuario_nombre]['tiempo_descansos'] += duracion
+                    if exceso > 0:
+                        stats_por_usuario[usuario_nombre]['descansos_con_exceso'] += 1
+                        stats_por_usuario[usuario_nombre]['exceso_descansos'] += exceso
                     stats_por_dia[fecha]['descansos'] += 1
                     total_descansos += 1
                     tiempo_total_descansos += duracion
                 else:
                     stats_por_usuario[usuario_nombre]['comidas'] += 1
                     stats_por_usuario[usuario_nombre]['tiempo_comidas'] += duracion
+                    if exceso > 0:
+                        stats_por_usuario[usuario_nombre]['comidas_con_exceso'] += 1
+                        stats_por_usuario[usuario_nombre]['exceso_comidas'] += exceso
                     stats_por_dia[fecha]['comidas'] += 1
                     total_comidas += 1
                     tiempo_total_comidas += duracion
@@ -984,10 +1088,9 @@ def reportes():
         for fecha in stats_por_dia:
             stats_por_dia[fecha]['usuarios_unicos'] = len(stats_por_dia[fecha]['usuarios_unicos'])
         
-        # Ordenar usuarios por tiempo total (top 10)
-        top_usuarios = sorted(stats_por_usuario.items(), 
-                            key=lambda x: x[1]['exceso_total'], 
-                            reverse=True)[:10]
+        # Top 10 usuarios por exceso (heap en vez de ordenar todos los usuarios)
+        top_usuarios = heapq.nlargest(10, stats_por_usuario.items(),
+                                      key=lambda x: x[1]['exceso_total'])
         
         # Formatear top usuarios para el template
         top_usuarios_formateado = []
@@ -1004,10 +1107,10 @@ def reportes():
                     'total_minutos': stats['tiempo_total'],  # ← Esta es la clave que falta
                     'tiempo_total': stats['tiempo_total'],
                     'exceso_total': stats['exceso_total'],
-                    'exceso_comidas': max(0, stats['tiempo_comidas'] - (stats['comidas'] * 40)) if stats['comidas'] > 0 else 0,
-                    'comidas_con_exceso': len([c for c in range(stats['comidas']) if (stats['tiempo_comidas'] / stats['comidas']) > 40]) if stats['comidas'] > 0 else 0,
-                    'exceso_descansos': max(0, stats['tiempo_descansos'] - (stats['descansos'] * 20)) if stats['descansos'] > 0 else 0,
-                    'descansos_con_exceso': len([d for d in range(stats['descansos']) if (stats['tiempo_descansos'] / stats['descansos']) > 20]) if stats['descansos'] > 0 else 0
+                    'exceso_comidas': stats['exceso_comidas'],
+                    'comidas_con_exceso': stats['comidas_con_exceso'],
+                    'exceso_descansos': stats['exceso_descansos'],
+                    'descansos_con_exceso': stats['descansos_con_exceso']
                 })
         
         # Preparar datos para gráficos
@@ -1080,13 +1183,17 @@ def reportes_simple():
     try:
         print(f"🔍 Reportes simple - Período: {fecha_inicio} a {fecha_fin}")
         
-        # Consulta básica sin JOIN complicado
-        response = supabase.table('tiempos_descanso').select("*")\
-            .gte('fecha', fecha_inicio)\
-            .lte('fecha', fecha_fin)\
-            .execute()
-        
-        registros_raw = response.data or []
+        # Consulta básica sin JOIN complicado (los meses archivados se leen del archivo)
+        rango_archivo, rango_tabla = archivo_historico.dividir_rango(fecha_inicio, fecha_fin)
+        registros_raw = []
+        if rango_tabla:
+            response = get_client().table('tiempos_descanso').select("*")\
+                .gte('fecha', rango_tabla[0])\
+                .lte('fecha', rango_tabla[1])\
+                .execute()
+            registros_raw = response.data or []
+        if rango_archivo:
+            registros_raw.extend(archivo_historico.leer_registros(*rango_archivo))
         print(f"📊 Registros obtenidos: {len(registros_raw)}")
         
         # Estadísticas básicas
@@ -1162,391 +1269,231 @@ def reportes_simple():
 def exportar_csv():
     fecha_inicio = request.args.get('fecha_inicio', (date.today() - timedelta(days=30)).isoformat())
     fecha_fin = request.args.get('fecha_fin', date.today().isoformat())
-    tipo_reporte = request.args.get('tipo', 'completo')  # completo, resumen, estadisticas
-    formato = request.args.get('formato', 'csv')  # csv, excel
+    tipo_reporte = request.args.get('tipo', 'completo')  # completo, resumen, estadisticas, paquete
+    if tipo_reporte not in TIPOS_REPORTE:
+        tipo_reporte = 'completo'
+    formato = normalizar_formato(request.args.get('formato'), tipo_reporte)  # csv, excel, parquet, arrow
     
     try:
         print(f"📊 Exportando {tipo_reporte} en formato {formato} para período: {fecha_inicio} a {fecha_fin}")
         
-        if tipo_reporte == 'estadisticas':
-            return exportar_estadisticas_csv(fecha_inicio, fecha_fin, formato)
-        elif tipo_reporte == 'resumen':
-            return exportar_resumen_csv(fecha_inicio, fecha_fin, formato)
-        else:
-            return exportar_completo_csv(fecha_inicio, fecha_fin, formato)
+        nombre = nombre_archivo_exportacion(tipo_reporte, fecha_inicio, fecha_fin, formato)
+        
+        if export_cache.es_periodo_cerrado(fecha_fin):
+            # Período cerrado: se genera una vez y se sirve desde caché con ETag
+            entrada = export_cache.obtener_exportacion_cacheada(tipo_reporte, fecha_inicio, fecha_fin, formato)
+            return _respuesta_exportacion_cacheada(entrada, formato, nombre)
+        
+        if tipo_reporte == 'paquete':
+            # Una sola lectura del período, ZIP comprimido y enviado a medida que se genera
+            return Response(
+                stream_with_context(metricas.medir_flujo(iterar_paquete_zip(fecha_inicio, fecha_fin), tipo_reporte, formato)),
+                mimetype=mimetype_exportacion(formato),
+                headers={'Content-Disposition': f'attachment; filename="{nombre}"'}
+            )
+        
+        archivo = generar_exportacion_archivo(tipo_reporte, fecha_inicio, fecha_fin, formato)
+        return _respuesta_exportacion(archivo, formato, nombre)
             
     except Exception as e:
         print(f"❌ Error al exportar CSV: {e}")
         print(f"📍 Stack trace: {traceback.format_exc()}")
-        return redirect(url_for('registros'))
+        return render_template('error.html', error=f'Error al exportar: {str(e)}'), 500
 
-def exportar_completo_csv(fecha_inicio, fecha_fin, formato='csv'):
-    """Exportar todos los registros detallados"""
+def _respuesta_exportacion(archivo, formato, nombre):
+    """Envía un archivo exportado, comprimido con gzip/zstd si el cliente lo acepta"""
+    codificacion = export_cache.codificacion_preferida(request.headers.get('Accept-Encoding', ''), formato)
+    
+    if not codificacion:
+        return send_file(archivo, mimetype=mimetype_exportacion(formato), as_attachment=True, download_name=nombre)
+    
+    respuesta = Response(
+        stream_with_context(export_cache.iterar_comprimido(archivo, codificacion, cerrar=True)),
+        mimetype=mimetype_exportacion(formato),
+        headers={
+            'Content-Disposition': f'attachment; filename="{nombre}"',
+            'Content-Encoding': codificacion
+        }
+    )
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+def _respuesta_exportacion_cacheada(entrada, formato, nombre):
+    """Envía una exportación cacheada con ETag fuerte, soportando If-None-Match (304)"""
+    codificacion = export_cache.codificacion_preferida(request.headers.get('Accept-Encoding', ''), formato)
+    if codificacion:
+        entrada = export_cache.obtener_variante_comprimida(entrada, codificacion)
+    
+    respuesta = send_file(
+        entrada['ruta'],
+        mimetype=mimetype_exportacion(formato),
+        as_attachment=True,
+        download_name=nombre,
+        etag=entrada['etag'],
+        last_modified=entrada['modificado'],
+        max_age=86400,
+        conditional=True
+    )
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.cache_control.public = False
+    respuesta.cache_control.private = True
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+def _trabajo_publico(trabajo):
+    """Datos de un trabajo de exportación que se pueden enviar al cliente"""
+    datos = {k: v for k, v in trabajo.items() if k not in ('clave', 'ruta_archivo')}
+    if trabajo['estado'] == export_jobs.ESTADO_LISTO:
+        datos['descarga'] = url_for('descargar_exportacion', trabajo_id=trabajo['id'])
+    return datos
+
+# Exportación en segundo plano: encolar trabajo
+@app.route('/exportaciones', methods=['POST'])
+@login_required
+def crear_exportacion():
+    fecha_inicio = request.values.get('fecha_inicio') or (date.today() - timedelta(days=30)).isoformat()
+    fecha_fin = request.values.get('fecha_fin') or date.today().isoformat()
+    tipo_reporte = request.values.get('tipo', 'completo')
+    
+    if tipo_reporte not in TIPOS_REPORTE:
+        return jsonify({'error': f'Tipo de reporte no válido: {tipo_reporte}'}), 400
+    
+    formato = normalizar_formato(request.values.get('formato'), tipo_reporte)
+    
     try:
-        # Obtener registros con manejo robusto de errores
-        response = supabase.table('tiempos_descanso').select("*, usuarios(nombre, codigo, turno)")\
-            .gte('fecha', fecha_inicio)\
-            .lte('fecha', fecha_fin)\
-            .order('fecha', desc=True)\
-            .order('inicio', desc=True)\
-            .execute()
-        
-        registros = response.data or []
-        print(f"📊 Registros obtenidos para exportación: {len(registros)}")
-        
-        # Crear CSV en memoria
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';', quotechar='"')
-        
-        # Encabezados mejorados
-        writer.writerow([
-            'Fecha',
-            'Día de la Semana', 
-            'Nombre Completo',
-            'Código',
-            'Turno',
-            'Tipo de Descanso',
-            'Hora Entrada',
-            'Hora Salida',
-            'Duración (minutos)',
-            'Duración (horas)',
-            'Exceso (minutos)',
-            'Estado',
-            'Observaciones'
-        ])
-        
-        # Datos con información enriquecida
-        for r in registros:
-            try:
-                fecha_obj = datetime.fromisoformat(r['fecha'])
-                usuario_data = r.get('usuarios', {})
-                duracion = r.get('duracion_minutos', 0)
-                tipo = r.get('tipo', 'DESCANSO')
-                
-                # Calcular exceso
-                limite = 40 if tipo == 'COMIDA' else 20
-                exceso = max(0, duracion - limite)
-                
-                # Determinar estado
-                if exceso > 30:
-                    estado = 'EXCESO ALTO'
-                elif exceso > 0:
-                    estado = 'CON EXCESO'
-                else:
-                    estado = 'NORMAL'
-                
-                # Observaciones
-                observaciones = []
-                if exceso > 0:
-                    observaciones.append(f'Excedió {exceso} min del límite')
-                if duracion < 5:
-                    observaciones.append('Duración muy corta')
-                
-                writer.writerow([
-                    fecha_obj.strftime('%d/%m/%Y'),
-                    fecha_obj.strftime('%A').capitalize(),
-                    usuario_data.get('nombre', 'Usuario Desconocido'),
-                    usuario_data.get('codigo', 'N/A'),
-                    usuario_data.get('turno', 'N/A'),
-                    tipo,
-                    r.get('inicio', 'N/A'),
-                    r.get('fin', 'N/A'),
-                    duracion,
-                    round(duracion / 60, 2),
-                    exceso,
-                    estado,
-                    '; '.join(observaciones) if observaciones else 'Sin observaciones'
-                ])
-                
-            except Exception as e_row:
-                print(f"⚠️ Error procesando registro ID {r.get('id', 'desconocido')}: {e_row}")
-                continue
-        
-        # Preparar respuesta
-        output.seek(0)
-        filename = f'descansos_completo_{fecha_inicio}_{fecha_fin}.csv'
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),  # UTF-8 con BOM para Excel
-            mimetype='text/csv; charset=utf-8',
-            as_attachment=True,
-            download_name=filename
-        )
-        
-    except Exception as e:
-        print(f"❌ Error en exportación completa: {e}")
-        raise e
+        date.fromisoformat(fecha_inicio)
+        date.fromisoformat(fecha_fin)
+    except ValueError:
+        return jsonify({'error': 'Fechas no válidas, usar formato YYYY-MM-DD'}), 400
+    
+    trabajo = export_jobs.enviar_exportacion(tipo_reporte, fecha_inicio, fecha_fin, formato)
+    return jsonify(_trabajo_publico(trabajo)), 202
+
+# Exportación en segundo plano: consultar progreso
+@app.route('/exportaciones/<trabajo_id>')
+@login_required
+def estado_exportacion(trabajo_id):
+    trabajo = export_jobs.obtener_trabajo(trabajo_id)
+    if not trabajo:
+        return jsonify({'error': 'Exportación no encontrada o expirada'}), 404
+    return jsonify(_trabajo_publico(trabajo))
+
+# Exportación en segundo plano: descargar archivo
+@app.route('/exportaciones/<trabajo_id>/descargar')
+@login_required
+def descargar_exportacion(trabajo_id):
+    trabajo = export_jobs.obtener_trabajo(trabajo_id)
+    if not trabajo or trabajo['estado'] != export_jobs.ESTADO_LISTO or not os.path.exists(trabajo['ruta_archivo']):
+        return render_template('error.html', error='Exportación no disponible o expirada'), 404
+    
+    return _respuesta_exportacion(open(trabajo['ruta_archivo'], 'rb'), trabajo['formato'], trabajo['nombre_archivo'])
+
+# Perfiles de peticiones lentas (pilas muestreadas, ver perfilador.py)
+@app.route('/perfiles')
+@login_required
+def listar_perfiles():
+    return jsonify({
+        'habilitado': perfilador.HABILITADO,
+        'umbral_ms': perfilador.UMBRAL_MS,
+        'perfiles': [dict(p, descarga=url_for('descargar_perfil', perfil_id=p['id'])) for p in perfilador.listar_perfiles()]
+    })
+
+# Descargar las pilas de un perfil en formato collapsed (flamegraph.pl, speedscope)
+@app.route('/perfiles/<perfil_id>')
+@login_required
+def descargar_perfil(perfil_id):
+    ruta = perfilador.ruta_perfil(perfil_id)
+    if not ruta:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    return send_file(ruta, mimetype='text/plain', as_attachment=True, download_name=f"{perfil_id}.folded")
+
+# Políticas de descanso vigentes (por turno)
+@app.route('/politicas')
+@login_required
+def ver_politicas():
+    return jsonify(describir_politicas(turnos=list(db_utils.TURNOS_VALIDOS)))
 
-def exportar_resumen_csv(fecha_inicio, fecha_fin, formato='csv'):
-    """Exportar resumen por usuario"""
+# Reclasificar registros históricos con la política vigente
+@app.route('/politicas/recalcular', methods=['POST'])
+@login_required
+def recalcular_politicas():
+    fecha_inicio = request.values.get('fecha_inicio')
+    fecha_fin = request.values.get('fecha_fin')
+    aplicar = request.values.get('aplicar', '').lower() in ('1', 'true', 'si', 'sí')
+    
     try:
-        # Obtener datos
-        response = supabase.table('tiempos_descanso').select("*, usuarios(nombre, codigo, turno)")\
-            .gte('fecha', fecha_inicio)\
-            .lte('fecha', fecha_fin)\
-            .execute()
-        
-        registros = response.data or []
-        
-        # Procesar estadísticas por usuario
-        stats_usuarios = {}
-        
-        for r in registros:
-            try:
-                usuario_data = r.get('usuarios', {})
-                usuario_nombre = usuario_data.get('nombre', 'Usuario Desconocido')
-                
-                if usuario_nombre not in stats_usuarios:
-                    stats_usuarios[usuario_nombre] = {
-                        'codigo': usuario_data.get('codigo', 'N/A'),
-                        'turno': usuario_data.get('turno', 'N/A'),
-                        'total_descansos': 0,
-                        'total_comidas': 0,
-                        'tiempo_descansos': 0,
-                        'tiempo_comidas': 0,
-                        'exceso_descansos': 0,
-                        'exceso_comidas': 0,
-                        'dias_activos': set()
-                    }
-                
-                tipo = r.get('tipo', 'DESCANSO')
-                duracion = r.get('duracion_minutos', 0)
-                fecha = r.get('fecha', '')
-                
-                # Actualizar estadísticas
-                if tipo == 'DESCANSO':
-                    stats_usuarios[usuario_nombre]['total_descansos'] += 1
-                    stats_usuarios[usuario_nombre]['tiempo_descansos'] += duracion
-                    if duracion > 20:
-                        stats_usuarios[usuario_nombre]['exceso_descansos'] += (duracion - 20)
-                else:
-                    stats_usuarios[usuario_nombre]['total_comidas'] += 1
-                    stats_usuarios[usuario_nombre]['tiempo_comidas'] += duracion
-                    if duracion > 40:
-                        stats_usuarios[usuario_nombre]['exceso_comidas'] += (duracion - 40)
-                
-                stats_usuarios[usuario_nombre]['dias_activos'].add(fecha)
-                
-            except Exception as e_user:
-                print(f"⚠️ Error procesando usuario en registro: {e_user}")
-                continue
-        
-        # Crear CSV
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';', quotechar='"')
-        
-        # Encabezados
-        writer.writerow([
-            'Nombre',
-            'Código',
-            'Turno',
-            'Días Activos',
-            'Total Descansos',
-            'Total Comidas',
-            'Tiempo Total Descansos (min)',
-            'Tiempo Total Comidas (min)',
-            'Tiempo Total (horas)',
-            'Promedio Descanso (min)',
-            'Promedio Comida (min)',
-            'Exceso Descansos (min)',
-            'Exceso Comidas (min)',
-            'Exceso Total (min)',
-            'Eficiencia (%)',
-            'Estado General'
-        ])
-        
-        # Datos resumidos
-        for nombre, stats in stats_usuarios.items():
-            try:
-                # Convertir set a conteo
-                dias_activos = len(stats['dias_activos'])
-                
-                # Calcular promedios
-                promedio_descanso = round(stats['tiempo_descansos'] / stats['total_descansos'], 1) if stats['total_descansos'] > 0 else 0
-                promedio_comida = round(stats['tiempo_comidas'] / stats['total_comidas'], 1) if stats['total_comidas'] > 0 else 0
-                
-                # Tiempo total
-                tiempo_total_min = stats['tiempo_descansos'] + stats['tiempo_comidas']
-                tiempo_total_horas = round(tiempo_total_min / 60, 2)
-                
-                # Exceso total
-                exceso_total = stats['exceso_descansos'] + stats['exceso_comidas']
-                
-                # Eficiencia (menos exceso = más eficiente)
-                tiempo_esperado = (stats['total_descansos'] * 20) + (stats['total_comidas'] * 40)
-                eficiencia = round((tiempo_esperado / tiempo_total_min * 100), 1) if tiempo_total_min > 0 else 100
-                
-                # Estado general
-                if exceso_total > 120:  # Más de 2 horas de exceso
-                    estado = 'CRÍTICO'
-                elif exceso_total > 60:  # Más de 1 hora de exceso
-                    estado = 'ALTO EXCESO'
-                elif exceso_total > 30:  # Más de 30 min de exceso
-                    estado = 'MODERADO EXCESO'
-                elif exceso_total > 0:
-                    estado = 'LEVE EXCESO'
-                else:
-                    estado = 'ÓPTIMO'
-                
-                writer.writerow([
-                    nombre,
-                    stats['codigo'],
-                    stats['turno'],
-                    dias_activos,
-                    stats['total_descansos'],
-                    stats['total_comidas'],
-                    stats['tiempo_descansos'],
-                    stats['tiempo_comidas'],
-                    tiempo_total_horas,
-                    promedio_descanso,
-                    promedio_comida,
-                    stats['exceso_descansos'],
-                    stats['exceso_comidas'],
-                    exceso_total,
-                    eficiencia,
-                    estado
-                ])
-                
-            except Exception as e_summary:
-                print(f"⚠️ Error creando resumen para {nombre}: {e_summary}")
-                continue
-        
-        # Preparar respuesta
-        output.seek(0)
-        filename = f'resumen_usuarios_{fecha_inicio}_{fecha_fin}.csv'
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv; charset=utf-8',
-            as_attachment=True,
-            download_name=filename
-        )
-        
+        date.fromisoformat(fecha_inicio)
+        date.fromisoformat(fecha_fin)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Fechas no válidas, usar formato YYYY-MM-DD'}), 400
+    
+    try:
+        recargar_politicas()
+        resultado = db_utils.recalcular_tipos_periodo(fecha_inicio, fecha_fin, aplicar=aplicar)
+        print(f"📐 Reclasificación solicitada por {session.get('admin_nombre', 'admin')}: {resultado}")
+        return jsonify(resultado)
     except Exception as e:
-        print(f"❌ Error en exportación resumen: {e}")
-        raise e
+        print(f"❌ Error reclasificando registros: {e}")
+        print(f"📍 Stack trace: {traceback.format_exc()}")
+        return jsonify({'error': f'Error reclasificando registros: {str(e)}'}), 500
 
-def exportar_estadisticas_csv(fecha_inicio, fecha_fin, formato='csv'):
-    """Exportar estadísticas generales del período"""
+# Archivo histórico de tiempos_descanso (meses cerrados en Parquet)
+@app.route('/archivo')
+@login_required
+def estado_archivo_historico():
+    return jsonify(archivo_historico.estado_archivo())
+
+# Copiar los meses cerrados al archivo histórico (simulación salvo aplicar=true;
+# solo se borran de la tabla con ARCHIVE_PURGE=true)
+@app.route('/archivo/ejecutar', methods=['POST'])
+@login_required
+def ejecutar_archivado():
+    aplicar = request.values.get('aplicar', '').lower() in ('1', 'true', 'si', 'sí')
+    
     try:
-        # Obtener datos
-        response = supabase.table('tiempos_descanso').select("*, usuarios(nombre, codigo, turno)")\
-            .gte('fecha', fecha_inicio)\
-            .lte('fecha', fecha_fin)\
-            .execute()
-        
-        registros = response.data or []
-        
-        # Crear CSV
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';', quotechar='"')
-        
-        # Estadísticas generales
-        total_registros = len(registros)
-        total_descansos = len([r for r in registros if r.get('tipo') == 'DESCANSO'])
-        total_comidas = len([r for r in registros if r.get('tipo') == 'COMIDA'])
-        
-        tiempo_total_descansos = sum(r.get('duracion_minutos', 0) for r in registros if r.get('tipo') == 'DESCANSO')
-        tiempo_total_comidas = sum(r.get('duracion_minutos', 0) for r in registros if r.get('tipo') == 'COMIDA')
-        
-        # Escribir estadísticas generales
-        writer.writerow(['ESTADÍSTICAS GENERALES'])
-        writer.writerow(['Período', f'{fecha_inicio} a {fecha_fin}'])
-        writer.writerow(['Fecha de exportación', datetime.now().strftime('%d/%m/%Y %H:%M:%S')])
-        writer.writerow([])
-        
-        writer.writerow(['RESUMEN GENERAL'])
-        writer.writerow(['Total de registros', total_registros])
-        writer.writerow(['Total descansos', total_descansos])
-        writer.writerow(['Total comidas', total_comidas])
-        writer.writerow(['Tiempo total descansos (min)', tiempo_total_descansos])
-        writer.writerow(['Tiempo total comidas (min)', tiempo_total_comidas])
-        writer.writerow(['Tiempo total (horas)', round((tiempo_total_descansos + tiempo_total_comidas) / 60, 2)])
-        writer.writerow([])
-        
-        # Promedios
-        writer.writerow(['PROMEDIOS'])
-        writer.writerow(['Promedio descanso (min)', round(tiempo_total_descansos / total_descansos, 1) if total_descansos > 0 else 0])
-        writer.writerow(['Promedio comida (min)', round(tiempo_total_comidas / total_comidas, 1) if total_comidas > 0 else 0])
-        writer.writerow([])
-        
-        # Estadísticas por día
-        writer.writerow(['ESTADÍSTICAS POR DÍA'])
-        writer.writerow(['Fecha', 'Día', 'Descansos', 'Comidas', 'Total', 'Usuarios Únicos'])
-        
-        # Agrupar por fecha
-        stats_por_dia = {}
-        for r in registros:
-            try:
-                fecha = r.get('fecha', '')
-                if fecha not in stats_por_dia:
-                    stats_por_dia[fecha] = {
-                        'descansos': 0,
-                        'comidas': 0,
-                        'usuarios': set()
-                    }
-                
-                tipo = r.get('tipo', 'DESCANSO')
-                usuario_data = r.get('usuarios', {})
-                usuario_nombre = usuario_data.get('nombre', 'Desconocido')
-                
-                if tipo == 'DESCANSO':
-                    stats_por_dia[fecha]['descansos'] += 1
-                else:
-                    stats_por_dia[fecha]['comidas'] += 1
-                
-                stats_por_dia[fecha]['usuarios'].add(usuario_nombre)
-                
-            except Exception as e_day:
-                print(f"⚠️ Error procesando día: {e_day}")
-                continue
-        
-        for fecha in sorted(stats_por_dia.keys()):
-            try:
-                fecha_obj = datetime.fromisoformat(fecha)
-                stats = stats_por_dia[fecha]
-                
-                writer.writerow([
-                    fecha_obj.strftime('%d/%m/%Y'),
-                    fecha_obj.strftime('%A').capitalize(),
-                    stats['descansos'],
-                    stats['comidas'],
-                    stats['descansos'] + stats['comidas'],
-                    len(stats['usuarios'])
-                ])
-                
-            except Exception as e_day_write:
-                print(f"⚠️ Error escribiendo día {fecha}: {e_day_write}")
-                continue
-        
-        # Preparar respuesta
-        output.seek(0)
-        filename = f'estadisticas_{fecha_inicio}_{fecha_fin}.csv'
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv; charset=utf-8',
-            as_attachment=True,
-            download_name=filename
-        )
-        
+        resultado = db_utils.archivar_historial(aplicar=aplicar)
+        print(f"🗄️ Archivado solicitado por {session.get('admin_nombre', 'admin')}: {resultado['movidos']} registros borrados de la tabla")
+        return jsonify(resultado)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
-        print(f"❌ Error en exportación estadísticas: {e}")
-        raise e
+        print(f"❌ Error archivando historial: {e}")
+        print(f"📍 Stack trace: {traceback.format_exc()}")
+        return jsonify({'error': f'Error archivando historial: {str(e)}'}), 500
 
-# Middleware para verificar sesión activa
-@app.before_request
-def check_session():
-    if 'admin_id' in session:
-        # Verificar tiempo de inactividad
-        if 'last_activity' in session:
-            last_activity = datetime.fromisoformat(session['last_activity'])
-            if datetime.now() - last_activity > timedelta(minutes=30):
-                session.clear()
-                return redirect(url_for('login'))
-        
-        # Actualizar última actividad
-        session['last_activity'] = datetime.now().isoformat()
+# Liveness: el proceso responde (no consulta la base de datos)
+@app.route('/live')
+def liveness():
+    return jsonify({'status': 'vivo', 'timestamp': get_current_time().isoformat()})
+
+# Readiness: calentamiento completo, chequeo de base de datos reciente, circuito
+# cerrado, pool sin saturar y backlog acotado; se responde solo con datos en memoria
+@app.route('/ready')
+def readiness():
+    if not estado_arranque['listo'] and _calentamiento_hilo is not None and not _calentamiento_hilo.is_alive():
+        # Reintentar en segundo plano; la respuesta no espera
+        iniciar_calentamiento()
+    
+    estado = salud.estado_salud(estado_arranque)
+    return jsonify({
+        'status': 'listo' if estado['listo'] else 'degradado',
+        'motivos': estado['motivos'],
+        'conexion': conexion_supabase_status,
+        'arranque': estado_arranque,
+        'salud': estado
+    }), 200 if estado['listo'] else 503
+
+# Métricas en formato de texto de Prometheus (agregadas entre workers)
+@app.route('/metrics')
+def metrics():
+    if metricas.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {metricas.METRICS_TOKEN}':
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    
+    cuerpo, content_type = metricas.exponer_metricas()
+    if cuerpo is None:
+        return Response('prometheus_client no está instalado\n', status=501, mimetype='text/plain')
+    return Response(cuerpo, content_type=content_type)
 
 # Manejo de errores
 @app.errorhandler(404)
@@ -1563,7 +1510,7 @@ def ver_descansos():
     """Ver usuarios en descanso en formato simple"""
     try:
         # Obtener descansos activos
-        descansos_response = supabase.table('descansos').select("*").execute()
+        descansos_response = get_client().table('descansos').select("*").execute()
         
         html = "<h1>🔍 Diagnóstico de Usuarios en Descanso</h1>"
         html += f"<p><strong>Fecha/Hora:</strong> {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}</p>"
@@ -1578,7 +1525,7 @@ def ver_descansos():
                 html += f"<strong>Inicio:</strong> {d['inicio']}<br>"
                 
                 # Buscar información del usuario
-                user_response = supabase.table('usuarios').select("nombre, codigo").eq('id', d['usuario_id']).execute()
+                user_response = get_client().table('usuarios').select("nombre, codigo").eq('id', d['usuario_id']).execute()
                 
                 if user_response.data:
                     usuario = user_response.data[0]
@@ -1586,12 +1533,12 @@ def ver_descansos():
                     
                     # Calcular tiempo
                     try:
-                        inicio = datetime.fromisoformat(d['inicio'].replace('Z', '+00:00'))
+                        inicio = parse_iso_utc(d['inicio'])
                         ahora = get_current_time()
                         tiempo_transcurrido = int((ahora - inicio).total_seconds() / 60)
                         
                         html += f"<strong>Tiempo transcurrido:</strong> {tiempo_transcurrido} minutos<br>"
-                        html += f"<strong>Tipo probable:</strong> {'COMIDA' if tiempo_transcurrido >= 20 else 'DESCANSO'}<br>"
+                        html += f"<strong>Tipo probable:</strong> {obtener_politica().tipo_probable(tiempo_transcurrido)}<br>"
                         
                     except Exception as e:
                         html += f"<strong>Error calculando tiempo:</strong> {e}<br>"
@@ -1627,7 +1574,12 @@ def debug_descansos():
         
         # 1. Verificar tabla descansos
         resultado.append("\n1️⃣ CONSULTANDO TABLA DESCANSOS")
-        descansos_response = supabase.table('descansos').select("*").execute()
+        respuestas = db_utils.consultas_paralelas({
+            'descansos': get_client().table('descansos').select("*"),
+            'usuarios_total': db_utils.consulta_conteo('usuarios'),
+            'usuarios_muestra': get_client().table('usuarios').select("*").limit(5)
+        })
+        descansos_response = respuestas['descansos']
         resultado.append(f"✓ Descansos activos encontrados: {len(descansos_response.data)}")
         
         if descansos_response.data:
@@ -1642,19 +1594,25 @@ def debug_descansos():
         
         # 2. Verificar tabla usuarios
         resultado.append("\n2️⃣ CONSULTANDO TABLA USUARIOS")
-        usuarios_response = supabase.table('usuarios').select("*").execute()
-        resultado.append(f"✓ Total usuarios en BD: {len(usuarios_response.data)}")
+        resultado.append(f"✓ Total usuarios en BD: {respuestas['usuarios_total'].count}")
         
-        if usuarios_response.data:
+        if respuestas['usuarios_muestra'].data:
             resultado.append("👥 Primeros 5 usuarios:")
-            for i, u in enumerate(usuarios_response.data[:5]):
+            for i, u in enumerate(respuestas['usuarios_muestra'].data):
                 resultado.append(f"   {i+1}. ID: {u['id']} - {u['nombre']} (Código: {u['codigo']})")
         
+        # Solo se traen los usuarios con descanso activo (no toda la tabla)
+        ids_en_descanso = list({d['usuario_id'] for d in descansos_response.data or []})
+        usuarios_con_descanso = []
+        if ids_en_descanso:
+            usuarios_con_descanso = db_utils.ejecutar(get_client().table('usuarios').select("*").in_('id', ids_en_descanso)).data or []
+        usuarios_totales = respuestas['usuarios_total'].count or 0
+        
         # 3. Cruzar datos
-        if descansos_response.data and usuarios_response.data:
+        if descansos_response.data and usuarios_totales:
             resultado.append("\n3️⃣ CRUZANDO DATOS")
             
-            usuarios_dict = {u['id']: u for u in usuarios_response.data}
+            usuarios_dict = {u['id']: u for u in usuarios_con_descanso}
             usuarios_en_descanso_debug = []
             
             for d in descansos_response.data:
@@ -1668,12 +1626,13 @@ def debug_descansos():
                     
                     # Calcular tiempo
                     try:
-                        inicio = datetime.fromisoformat(d['inicio'].replace('Z', '+00:00'))
+                        inicio = parse_iso_utc(d['inicio'])
                         ahora = get_current_time()
                         tiempo_transcurrido = int((ahora - inicio).total_seconds() / 60)
-                        tiempo_maximo = 40 if tiempo_transcurrido >= 20 else 20
+                        politica = obtener_politica(usuario.get('turno'))
+                        tiempo_maximo = politica.maximo_probable(tiempo_transcurrido)
                         tiempo_restante = max(0, tiempo_maximo - tiempo_transcurrido)
-                        tipo_probable = 'COMIDA' if tiempo_transcurrido >= 20 else 'DESCANSO'
+                        tipo_probable = politica.tipo_probable(tiempo_transcurrido)
                         
                         resultado.append(f"   ⏰ Tiempo transcurrido: {tiempo_transcurrido} min")
                         resultado.append(f"   📋 Tipo: {tipo_probable}")
@@ -1709,7 +1668,7 @@ def debug_descansos():
                 'diagnostico': resultado,
                 'datos': {
                     'descansos_activos': len(descansos_response.data),
-                    'usuarios_totales': len(usuarios_response.data),
+                    'usuarios_totales': usuarios_totales,
                     'usuarios_en_descanso': len(usuarios_en_descanso_debug),
                     'descansos_raw': descansos_response.data,
                     'usuarios_procesados': usuarios_en_descanso_debug
@@ -1722,7 +1681,7 @@ def debug_descansos():
                 'error': 'Datos insuficientes',
                 'datos': {
                     'descansos_activos': len(descansos_response.data) if descansos_response.data else 0,
-                    'usuarios_totales': len(usuarios_response.data) if usuarios_response.data else 0,
+                    'usuarios_totales': usuarios_totales,
                     'usuarios_en_descanso': 0,
                     'descansos_raw': descansos_response.data if descansos_response.data else [],
                     'usuarios_procesados': []
@@ -1754,7 +1713,7 @@ def test_flujo_completo(codigo):
         resultado.append(f"=== TEST FLUJO COMPLETO: {codigo} ===")
         
         # 1. Buscar usuario
-        user_response = supabase.table('usuarios').select('*').eq('codigo', codigo.upper()).execute()
+        user_response = get_client().table('usuarios').select('*').eq('codigo', codigo.upper()).execute()
         if not user_response.data:
             return jsonify({'error': f'Usuario con código {codigo} no encontrado'}), 404
         
@@ -1762,12 +1721,12 @@ def test_flujo_completo(codigo):
         resultado.append(f"✓ Usuario: {usuario['nombre']} (ID: {usuario['id']})")
         
         # 2. Limpiar descansos previos
-        clean_response = supabase_admin.table('descansos').delete().eq('usuario_id', usuario['id']).execute()
+        clean_response = get_admin_client().table('descansos').delete().eq('usuario_id', usuario['id']).execute()
         resultado.append(f"✓ Limpieza: {len(clean_response.data) if clean_response.data else 0} descansos eliminados")
         
         # 3. SIMULAR ENTRADA
         resultado.append(f"--- SIMULANDO ENTRADA ---")
-        entrada_response = supabase_admin.table('descansos').insert({
+        entrada_response = get_admin_client().table('descansos').insert({
             'usuario_id': usuario['id'],
             'inicio': get_current_time().isoformat(),
             'tipo': 'Pendiente'
@@ -1788,21 +1747,21 @@ def test_flujo_completo(codigo):
         resultado.append(f"--- SIMULANDO SALIDA ---")
         
         # Buscar el descanso recién creado
-        descanso_response = supabase.table('descansos').select('*').eq('id', descanso_id).execute()
+        descanso_response = get_client().table('descansos').select('*').eq('id', descanso_id).execute()
         if not descanso_response.data:
             return jsonify({'error': 'Descanso creado no encontrado', 'log': resultado}), 500
         
         descanso_activo = descanso_response.data[0]
         
         # Cerrar usando función helper
-        success, mensaje, detalle = cerrar_descanso_usuario(usuario['id'], descanso_activo)
+        success, mensaje, detalle = cerrar_descanso_usuario(usuario['id'], descanso_activo, usuario.get('turno'))
         
         resultado.append(f"{'✓' if success else '✗'} Cierre: {mensaje}")
         
         # 6. Verificación final completa
         resultado.append(f"--- VERIFICACIÓN FINAL ---")
-        final_descansos = supabase.table('descansos').select('*').eq('usuario_id', usuario['id']).execute()
-        final_tiempos = supabase.table('tiempos_descanso').select('*').eq('usuario_id', usuario['id']).order('id', desc=True).limit(1).execute()
+        final_descansos = get_client().table('descansos').select('*').eq('usuario_id', usuario['id']).execute()
+        final_tiempos = get_client().table('tiempos_descanso').select('*').eq('usuario_id', usuario['id']).order('id', desc=True).limit(1).execute()
         
         resultado.append(f"✓ Descansos activos: {len(final_descansos.data)}")
         resultado.append(f"✓ Registros en historial: {len(final_tiempos.data)}")
@@ -1836,7 +1795,7 @@ def test_close_by_code(codigo):
         resultado.append(f"=== TEST CIERRE POR CÓDIGO: {codigo} ===")
         
         # 1. Buscar usuario
-        user_response = supabase.table('usuarios').select('*').eq('codigo', codigo.upper()).execute()
+        user_response = get_client().table('usuarios').select('*').eq('codigo', codigo.upper()).execute()
         if not user_response.data:
             return jsonify({'error': f'Usuario con código {codigo} no encontrado'}), 404
         
@@ -1844,7 +1803,7 @@ def test_close_by_code(codigo):
         resultado.append(f"✓ Usuario encontrado: {usuario['nombre']} (ID: {usuario['id']})")
         
         # 2. Buscar descanso activo
-        descanso_response = supabase.table('descansos').select('*').eq('usuario_id', usuario['id']).execute()
+        descanso_response = get_client().table('descansos').select('*').eq('usuario_id', usuario['id']).execute()
         
         if not descanso_response.data:
             resultado.append(f"⚠️ Usuario no tiene descanso activo")
@@ -1859,7 +1818,7 @@ def test_close_by_code(codigo):
         resultado.append(f"   Inicio: {descanso_activo['inicio']}")
         
         # 3. Cerrar descanso usando función helper
-        success, mensaje, detalle = cerrar_descanso_usuario(usuario['id'], descanso_activo)
+        success, mensaje, detalle = cerrar_descanso_usuario(usuario['id'], descanso_activo, usuario.get('turno'))
         
         resultado.append(f"{'✓' if success else '✗'} Resultado: {mensaje}")
         if detalle:
@@ -1889,7 +1848,7 @@ def test_operation(usuario_id):
         resultado = []
         
         # 1. Verificar usuario
-        user_response = supabase.table('usuarios').select('*').eq('id', usuario_id).execute()
+        user_response = get_client().table('usuarios').select('*').eq('id', usuario_id).execute()
         if not user_response.data:
             return jsonify({'error': f'Usuario {usuario_id} no encontrado'}), 404
         
@@ -1897,11 +1856,11 @@ def test_operation(usuario_id):
         resultado.append(f"✓ Usuario encontrado: {usuario['nombre']}")
         
         # 2. Limpiar descansos previos
-        clean_response = supabase_admin.table('descansos').delete().eq('usuario_id', usuario_id).execute()
+        clean_response = get_admin_client().table('descansos').delete().eq('usuario_id', usuario_id).execute()
         resultado.append(f"✓ Limpieza: {len(clean_response.data) if clean_response.data else 0} descansos eliminados")
         
         # 3. Crear descanso
-        crear_response = supabase_admin.table('descansos').insert({
+        crear_response = get_admin_client().table('descansos').insert({
             'usuario_id': usuario_id,
             'inicio': get_current_time().isoformat(),
             'tipo': 'Pendiente'
@@ -1920,13 +1879,13 @@ def test_operation(usuario_id):
         
         # 5. Cerrar descanso
         descanso = crear_response.data[0]
-        inicio = datetime.fromisoformat(descanso['inicio'].replace('Z', '+00:00'))
+        inicio = parse_iso_utc(descanso['inicio'])
         fin = get_current_time()
         duracion_minutos = int((fin - inicio).total_seconds() / 60)
-        tipo = 'COMIDA' if duracion_minutos >= 30 else 'DESCANSO'
+        tipo = obtener_politica().tipo_por_duracion(duracion_minutos)
         
         # Insertar tiempo
-        tiempo_response = supabase_admin.table('tiempos_descanso').insert({
+        tiempo_response = get_admin_client().table('tiempos_descanso').insert({
             'usuario_id': usuario_id,
             'tipo': tipo,
             'fecha': inicio.date().isoformat(),
@@ -1940,7 +1899,7 @@ def test_operation(usuario_id):
             return jsonify({'error': 'No se pudo registrar tiempo', 'log': resultado}), 500
         
         # Eliminar descanso activo
-        delete_response = supabase_admin.table('descansos').delete().eq('id', descanso_id).execute()
+        delete_response = get_admin_client().table('descansos').delete().eq('id', descanso_id).execute()
         
         resultado.append(f"✓ Tiempo registrado: {tipo} - {duracion_minutos} min")
         resultado.append(f"✓ Descanso eliminado: {len(delete_response.data) if delete_response.data else 0}")
@@ -1963,21 +1922,29 @@ def test_operation(usuario_id):
 def status():
     """Mostrar el estado actual de la conexión y sistema"""
     try:
-        # Probar conexión actual
-        test_users = supabase.table('usuarios').select('*').limit(3).execute()
-        test_descansos = supabase.table('descansos').select('*').execute()
-        test_tiempos = supabase.table('tiempos_descanso').select('*').limit(3).execute()
+        # Conteos y muestras cacheados: O(1) sin importar el tamaño del historial
+        estadisticas = db_utils.estadisticas_tablas()
+        conteos = estadisticas['tablas']
         
         status_info = {
             'timestamp': get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
             'conexion': conexion_supabase_status,
+            'pool_http': db_utils.metricas_conexion(),
+            'resiliencia': db_utils.estado_resiliencia(),
             'tablas': {
-                'usuarios': len(test_users.data) if test_users.data else 0,
-                'descansos_activos': len(test_descansos.data) if test_descansos.data else 0,
-                'tiempos_registrados': len(test_tiempos.data) if test_tiempos.data else 0
+                'usuarios': conteos.get('usuarios'),
+                'descansos_activos': conteos.get('descansos'),
+                'tiempos_registrados': conteos.get('tiempos_descanso'),
+                'tiempos_archivados': archivo_historico.estado_archivo()['registros']
             },
-            'usuarios_muestra': test_users.data if test_users.data else [],
-            'descansos_activos_muestra': test_descansos.data if test_descansos.data else []
+            'conteos': {
+                'metodos': estadisticas['metodos'],
+                'errores': estadisticas['errores'],
+                'calculado': estadisticas['calculado'],
+                'edad_segundos': estadisticas['edad_segundos']
+            },
+            'usuarios_muestra': estadisticas['usuarios_muestra'],
+            'descansos_activos_muestra': estadisticas['descansos_activos_muestra']
         }
         
         return jsonify(status_info)
@@ -1986,6 +1953,8 @@ def status():
         return jsonify({
             'error': str(e),
             'conexion': conexion_supabase_status,
+            'pool_http': db_utils.metricas_conexion(),
+            'resiliencia': db_utils.estado_resiliencia(),
             'timestamp': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
         }), 500
 
@@ -2001,21 +1970,31 @@ def debug():
         # Probar conexión básica
         debug_info.append("=== PRUEBAS DE CONEXIÓN ===")
         
+        # 1-4 y 7. Conteos (sin descargar las tablas), una fila de muestra y
+        # prueba del cliente admin, en paralelo
+        respuestas = db_utils.consultas_paralelas({
+            'usuarios': db_utils.consulta_conteo('usuarios'),
+            'descansos': db_utils.consulta_conteo('descansos'),
+            'tiempos': db_utils.consulta_conteo('tiempos_descanso', 'exact'),
+            'administradores': db_utils.consulta_conteo('administradores'),
+            'muestra_usuario': get_client().table('usuarios').select("*").limit(1),
+            'muestra_descanso': get_client().table('descansos').select("*").limit(1),
+            'admin_client': get_admin_client().table('usuarios').select("*").limit(1)
+        }, 'reporte')
+        users_response = respuestas['muestra_usuario']
+        breaks_response = respuestas['muestra_descanso']
+        
         # 1. Verificar usuarios
-        users_response = supabase.table('usuarios').select("*").execute()
-        debug_info.append(f"✅ Usuarios encontrados: {len(users_response.data)}")
+        debug_info.append(f"✅ Usuarios encontrados: {respuestas['usuarios'].count}")
         
         # 2. Verificar descansos activos
-        breaks_response = supabase.table('descansos').select("*").execute()
-        debug_info.append(f"✅ Descansos activos: {len(breaks_response.data)}")
+        debug_info.append(f"✅ Descansos activos: {respuestas['descansos'].count}")
         
         # 3. Verificar tiempos de descanso
-        times_response = supabase.table('tiempos_descanso').select("*").execute()
-        debug_info.append(f"✅ Registros históricos: {len(times_response.data)}")
+        debug_info.append(f"✅ Registros históricos: {respuestas['tiempos'].count}")
         
         # 4. Verificar administradores
-        admin_response = supabase.table('administradores').select("*").execute()
-        debug_info.append(f"✅ Administradores: {len(admin_response.data)}")
+        debug_info.append(f"✅ Administradores: {respuestas['administradores'].count}")
         
         # 5. Mostrar estructura de un usuario si existe
         if users_response.data:
@@ -2034,7 +2013,7 @@ def debug():
         debug_info.append("\n=== PRUEBA DE ESCRITURA ===")
         
         # 7. Probar escritura con admin client
-        test_response = supabase_admin.table('usuarios').select("*").limit(1).execute()
+        test_response = respuestas['admin_client']
         debug_info.append(f"✅ Cliente admin funciona: {len(test_response.data)} registros")
         
     except Exception as e:
@@ -2054,7 +2033,7 @@ def debug_close_break(descanso_id):
         debug_info.append(f"=== INTENTANDO CERRAR DESCANSO {descanso_id} ===")
         
         # 1. Buscar el descanso
-        response = supabase.table('descansos').select("*").eq('id', descanso_id).execute()
+        response = get_client().table('descansos').select("*").eq('id', descanso_id).execute()
         if not response.data:
             debug_info.append("❌ Descanso no encontrado")
             return "<pre>" + "\n".join(debug_info) + "</pre>"
@@ -2063,7 +2042,7 @@ def debug_close_break(descanso_id):
         debug_info.append(f"✅ Descanso encontrado: {descanso}")
         
         # 2. Buscar el usuario
-        user_response = supabase.table('usuarios').select("*").eq('id', descanso['usuario_id']).execute()
+        user_response = get_client().table('usuarios').select("*").eq('id', descanso['usuario_id']).execute()
         if not user_response.data:
             debug_info.append("❌ Usuario no encontrado")
             return "<pre>" + "\n".join(debug_info) + "</pre>"
@@ -2072,10 +2051,10 @@ def debug_close_break(descanso_id):
         debug_info.append(f"✅ Usuario encontrado: {usuario['nombre']}")
         
         # 3. Calcular duración
-        inicio = datetime.fromisoformat(descanso['inicio'].replace('Z', '+00:00'))
+        inicio = parse_iso_utc(descanso['inicio'])
         fin = get_current_time()
         duracion_minutos = int((fin - inicio).total_seconds() / 60)
-        tipo = 'COMIDA' if duracion_minutos >= 30 else 'DESCANSO'
+        tipo = obtener_politica().tipo_por_duracion(duracion_minutos)
         
         debug_info.append(f"⏱️ Duración: {duracion_minutos} minutos, Tipo: {tipo}")
         
@@ -2090,11 +2069,11 @@ def debug_close_break(descanso_id):
         }
         debug_info.append(f"📝 Datos a insertar: {insert_data}")
         
-        insert_response = supabase_admin.table('tiempos_descanso').insert(insert_data).execute()
+        insert_response = get_admin_client().table('tiempos_descanso').insert(insert_data).execute()
         debug_info.append(f"✅ Inserción exitosa: {insert_response.data}")
         
         # 5. Eliminar de descansos
-        delete_response = supabase_admin.table('descansos').delete().eq('id', descanso_id).execute()
+        delete_response = get_admin_client().table('descansos').delete().eq('id', descanso_id).execute()
         debug_info.append(f"🗑️ Eliminación exitosa: {delete_response.data}")
         
         debug_info.append("🎉 PROCESO COMPLETADO EXITOSAMENTE")
@@ -2109,13 +2088,17 @@ def debug_close_break(descanso_id):
 # Health check para Render
 @app.route('/health')
 def health_check():
-    """Health check endpoint para Render"""
-    try:
-        # Verificar conexión a Supabase
-        test_response = supabase.table('usuarios').select("id").limit(1).execute()
-        return {"status": "healthy", "database": "connected"}, 200
-    except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}, 500
+    """Health check endpoint para Render (usa el último chequeo de la base, no consulta en cada sonda)"""
+    estado = salud.estado_salud(estado_arranque)
+    base_datos = estado['base_datos']
+    respuesta = {
+        "status": "healthy" if estado['listo'] else "unhealthy",
+        "database": "connected" if base_datos['ok'] else ("unknown" if base_datos['ok'] is None else "disconnected"),
+        **estado
+    }
+    if base_datos['error']:
+        respuesta['error'] = base_datos['error']
+    return respuesta, 200 if estado['listo'] else 503
 
 # Ruta de debug específica para reportes
 @app.route('/debug_reportes')
@@ -2125,18 +2108,34 @@ def debug_reportes():
         debug_info = []
         debug_info.append("=== DEBUG REPORTES ===")
         
+        fecha_inicio = (date.today() - timedelta(days=7)).isoformat()
+        fecha_fin = date.today().isoformat()
+        
+        # Las cuatro pruebas son independientes: se lanzan en paralelo y cada
+        # una conserva su propio error
+        respuestas = db_utils.consultas_paralelas({
+            'conexion': get_client().table('usuarios').select("id").limit(1),
+            'basica': get_client().table('tiempos_descanso').select("*").limit(5),
+            'join': get_client().table('tiempos_descanso').select("*, usuarios(nombre, codigo)").limit(3),
+            'filtrada': get_client().table('tiempos_descanso').select("*, usuarios(nombre, codigo)", count='exact')
+                .gte('fecha', fecha_inicio)
+                .lte('fecha', fecha_fin)
+                .limit(3)
+        }, 'reporte', capturar_errores=True)
+        for nombre in ('conexion', 'basica'):
+            if isinstance(respuestas[nombre], Exception):
+                raise respuestas[nombre]
+        
         # Probar conexión básica
         debug_info.append("1. Probando conexión a Supabase...")
-        test_response = supabase.table('usuarios').select("id").limit(1).execute()
+        test_response = respuestas['conexion']
         debug_info.append(f"✅ Conexión OK - {len(test_response.data)} usuarios encontrados")
         
         # Probar consulta de tiempos_descanso
         debug_info.append("2. Probando tabla tiempos_descanso...")
-        fecha_inicio = (date.today() - timedelta(days=7)).isoformat()
-        fecha_fin = date.today().isoformat()
         
         # Consulta básica sin JOIN
-        basic_response = supabase.table('tiempos_descanso').select("*").limit(5).execute()
+        basic_response = respuestas['basica']
         debug_info.append(f"✅ Consulta básica OK - {len(basic_response.data)} registros")
         
         if basic_response.data:
@@ -2148,7 +2147,9 @@ def debug_reportes():
         # Probar consulta con JOIN
         debug_info.append("3. Probando consulta con JOIN...")
         try:
-            join_response = supabase.table('tiempos_descanso').select("*, usuarios(nombre, codigo)").limit(3).execute()
+            if isinstance(respuestas['join'], Exception):
+                raise respuestas['join']
+            join_response = respuestas['join']
             debug_info.append(f"✅ JOIN OK - {len(join_response.data)} registros")
             
             if join_response.data:
@@ -2162,11 +2163,10 @@ def debug_reportes():
         # Probar consulta con filtros de fecha
         debug_info.append("4. Probando consulta con filtros de fecha...")
         try:
-            filtered_response = supabase.table('tiempos_descanso').select("*, usuarios(nombre, codigo)")\
-                .gte('fecha', fecha_inicio)\
-                .lte('fecha', fecha_fin)\
-                .execute()
-            debug_info.append(f"✅ Filtros OK - {len(filtered_response.data)} registros en período")
+            if isinstance(respuestas['filtrada'], Exception):
+                raise respuestas['filtrada']
+            filtered_response = respuestas['filtrada']
+            debug_info.append(f"✅ Filtros OK - {filtered_response.count} registros en período")
             
         except Exception as e_filter:
             debug_info.append(f"❌ Error en filtros: {e_filter}")
@@ -2187,7 +2187,7 @@ def debug_reportes():
             'sample_data': {
                 'basic_count': len(basic_response.data) if basic_response.data else 0,
                 'join_count': len(join_response.data) if 'join_response' in locals() and join_response.data else 0,
-                'filtered_count': len(filtered_response.data) if 'filtered_response' in locals() and filtered_response.data else 0
+                'filtered_count': filtered_response.count or 0 if 'filtered_response' in locals() else 0
             }
         })
         
@@ -2309,5 +2309,13 @@ def test_card_parsing():
     </html>
     '''
 
+def create_app():
+    """
+    Factory para gunicorn ('app:create_app()'): devuelve la aplicación sin
+    bloquear y deja el calentamiento corriendo en segundo plano.
+    """
+    iniciar_calentamiento()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
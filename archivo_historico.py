@@ -0,0 +1,528 @@
+"""
+Archivo Histórico de tiempos_descanso
+=====================================
+
+Los meses cerrados se copian de la tabla tiempos_descanso a archivos Parquet
+locales (uno por mes, comprimidos con zstd), y las consultas de esos meses se
+leen del archivo, para que las del día a día solo toquen los meses recientes de
+la tabla sin importar la antigüedad del sistema.
+
+Contenido de ARCHIVE_DIR:
+- tiempos_AAAA-MM.parquet: registros del mes con los datos del usuario al
+  momento de archivar (nombre, código, turno)
+- resumen_AAAA-MM.parquet: resumen diario por (fecha, usuario_id, tipo) con
+  cantidad y minutos, que se conserva junto al detalle
+- manifiesto.json: meses archivados; es lo que define el corte
+
+Corte: primer día del mes siguiente al último mes archivado. Las fechas
+anteriores al corte se leen del archivo y las demás de la tabla (ver
+dividir_rango); db_descansos hace ese ruteo de forma transparente y ejecuta el
+proceso de archivado.
+
+Por defecto el archivado solo copia: las filas siguen en Supabase, que sigue
+siendo la fuente de verdad (y tiene sus propios respaldos). Si ARCHIVE_DIR se
+pierde (redeploy sin disco persistente), con él se pierde el manifiesto, las
+consultas vuelven a la tabla y la siguiente ejecución copia los meses de nuevo.
+
+Borrar de la tabla los meses ya archivados requiere ARCHIVE_PURGE=true, y
+además que ARCHIVE_DIR se haya configurado explícitamente en un punto de
+montaje propio fuera del directorio temporal (o ARCHIVE_DIR_PERSISTENT=true en
+un servidor cuyo disco raíz es persistente): desde ese momento el archivo es
+la única copia de esos meses. Antes de habilitarlo hay que respaldar
+ARCHIVE_DIR fuera del servidor después de cada archivado; para restaurar, se
+vuelve a copiar el directorio completo (Parquet y manifiesto) en ARCHIVE_DIR.
+
+Requiere pyarrow; si no está instalado el archivo queda deshabilitado y todas
+las consultas van a la tabla.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PYARROW_DISPONIBLE = True
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+    PYARROW_DISPONIBLE = False
+
+from db_usuarios import obtener_directorio_usuarios
+
+# Configuración
+ARCHIVO_DIR = os.getenv('ARCHIVE_DIR') or os.path.join(tempfile.gettempdir(), 'breaktime_archivo')
+ARCHIVO_DIR_CONFIGURADO = bool(os.getenv('ARCHIVE_DIR'))
+ARCHIVO_DIR_PERSISTENTE = os.getenv('ARCHIVE_DIR_PERSISTENT', 'false').lower() in ('1', 'true', 'si', 'sí')
+ARCHIVO_PURGAR = os.getenv('ARCHIVE_PURGE', 'false').lower() in ('1', 'true', 'si', 'sí')
+MESES_CALIENTES = int(os.getenv('ARCHIVE_HOT_MONTHS', '3'))
+
+_MANIFIESTO = 'manifiesto.json'
+
+_lock = threading.Lock()
+# (mtime del manifiesto, contenido): se relee solo si otro proceso lo cambió
+_manifiesto_cache: Tuple[Optional[float], Dict] = (None, {})
+
+def _esquema_registros() -> 'pa.Schema':
+    return pa.schema([
+        ('id', pa.int64()),
+        ('usuario_id', pa.int64()),
+        ('fecha', pa.date32()),
+        ('tipo', pa.string()),
+        ('inicio', pa.time64('us')),
+        ('fin', pa.time64('us')),
+        ('duracion_minutos', pa.int32()),
+        ('nombre', pa.string()),
+        ('codigo', pa.string()),
+        ('turno', pa.string())
+    ])
+
+def _esquema_resumen() -> 'pa.Schema':
+    return pa.schema([
+        ('fecha', pa.date32()),
+        ('usuario_id', pa.int64()),
+        ('tipo', pa.string()),
+        ('cantidad', pa.int32()),
+        ('minutos', pa.int64())
+    ])
+
+def _ruta(prefijo: str, mes: str) -> str:
+    return os.path.join(ARCHIVO_DIR, f"{prefijo}_{mes}.parquet")
+
+def mes_de(fecha: date) -> str:
+    """'AAAA-MM' de una fecha"""
+    return fecha.strftime('%Y-%m')
+
+def limites_mes(mes: str) -> Tuple[date, date]:
+    """
+    Primer y último día de un mes
+
+    Args:
+        mes: 'AAAA-MM'
+
+    Returns:
+        Tupla (primer día, último día)
+    """
+    inicio = date.fromisoformat(f"{mes}-01")
+    siguiente = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, siguiente - timedelta(days=1)
+
+def meses_entre(desde: date, hasta: date) -> List[str]:
+    """Meses 'AAAA-MM' que tocan el rango [desde, hasta], en orden"""
+    meses = []
+    actual = desde.replace(day=1)
+    while actual <= hasta:
+        meses.append(mes_de(actual))
+        actual = (actual + timedelta(days=32)).replace(day=1)
+    return meses
+
+def limite_archivable(hoy: Optional[date] = None) -> date:
+    """
+    Primer día que debe quedar en la tabla: el mes actual y los MESES_CALIENTES
+    anteriores no se archivan
+    """
+    primero = (hoy or date.today()).replace(day=1)
+    for _ in range(MESES_CALIENTES):
+        primero = (primero - timedelta(days=1)).replace(day=1)
+    return primero
+
+def _tipo_montaje(punto: str) -> Optional[str]:
+    """Tipo de sistema de archivos de un punto de montaje (Linux), o None"""
+    try:
+        with open('/proc/mounts', encoding='utf-8') as f:
+            for linea in f:
+                campos = linea.split()
+                if len(campos) > 2 and campos[1] == punto:
+                    return campos[2]
+    except OSError:
+        pass
+    return None
+
+def verificar_persistencia() -> Optional[str]:
+    """
+    Comprueba que ARCHIVE_DIR sobreviva a un reinicio o redeploy antes de
+    borrar filas de la tabla
+
+    Returns:
+        None si es persistente; si no, el motivo
+    """
+    if not ARCHIVO_DIR_CONFIGURADO:
+        return "ARCHIVE_DIR no está configurado (se usaría el directorio temporal)"
+
+    ruta = os.path.realpath(ARCHIVO_DIR)
+    temporal = os.path.realpath(tempfile.gettempdir())
+    if os.path.commonpath([ruta, temporal]) == temporal:
+        return f"ARCHIVE_DIR ({ruta}) está dentro del directorio temporal {temporal}"
+    if ARCHIVO_DIR_PERSISTENTE:
+        return None
+
+    # Subir hasta el primer directorio existente y buscar un montaje distinto de la raíz
+    actual = ruta
+    while not os.path.exists(actual):
+        actual = os.path.dirname(actual)
+    while actual != os.path.dirname(actual):
+        if os.path.ismount(actual):
+            if _tipo_montaje(actual) in ('tmpfs', 'ramfs'):
+                return f"ARCHIVE_DIR ({ruta}) está en memoria ({actual})"
+            return None
+        actual = os.path.dirname(actual)
+    return (f"ARCHIVE_DIR ({ruta}) no está en un disco montado; "
+            "montar un disco persistente o definir ARCHIVE_DIR_PERSISTENT=true")
+
+# ============================================================================
+# Manifiesto y corte
+# ============================================================================
+
+def meses_archivados() -> Dict[str, Dict]:
+    """
+    Meses archivados según el manifiesto
+
+    Returns:
+        Dict {'AAAA-MM': {registros, archivado, purgado}}
+    """
+    global _manifiesto_cache
+    ruta = os.path.join(ARCHIVO_DIR, _MANIFIESTO)
+    try:
+        mtime = os.stat(ruta).st_mtime
+    except OSError:
+        return {}
+    if _manifiesto_cache[0] != mtime:
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                _manifiesto_cache = (mtime, json.load(f).get('meses', {}))
+        except (OSError, ValueError) as e:
+            print(f"❌ Error leyendo manifiesto del archivo histórico: {e}")
+            return _manifiesto_cache[1]
+    return _manifiesto_cache[1]
+
+def _guardar_manifiesto(meses: Dict[str, Dict]):
+    os.makedirs(ARCHIVO_DIR, exist_ok=True)
+    ruta = os.path.join(ARCHIVO_DIR, _MANIFIESTO)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump({'meses': dict(sorted(meses.items()))}, f, indent=1)
+    os.replace(temporal, ruta)
+
+def corte() -> Optional[date]:
+    """
+    Primer día que se lee de la tabla (las fechas anteriores están archivadas)
+
+    Returns:
+        date, o None si no hay meses archivados o falta pyarrow
+    """
+    meses = meses_archivados()
+    if not meses or not PYARROW_DISPONIBLE:
+        return None
+    return limites_mes(max(meses))[1] + timedelta(days=1)
+
+def dividir_rango(fecha_inicio: str, fecha_fin: str) -> Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]:
+    """
+    Divide un rango de fechas entre el archivo y la tabla
+
+    Args:
+        fecha_inicio: Fecha de inicio (ISO)
+        fecha_fin: Fecha de fin (ISO)
+
+    Returns:
+        Tupla (rango_archivo, rango_tabla); cada uno es (inicio, fin) en ISO o
+        None si esa parte del rango está vacía
+    """
+    limite = corte()
+    if limite is None:
+        return None, (fecha_inicio, fecha_fin)
+
+    inicio, fin = date.fromisoformat(fecha_inicio), date.fromisoformat(fecha_fin)
+    rango_archivo = (fecha_inicio, min(fin, limite - timedelta(days=1)).isoformat()) if inicio < limite else None
+    rango_tabla = (max(inicio, limite).isoformat(), fecha_fin) if fin >= limite else None
+    return rango_archivo, rango_tabla
+
+# ============================================================================
+# Escritura
+# ============================================================================
+
+def _a_time(valor: Any) -> Optional[time]:
+    try:
+        return time.fromisoformat(valor) if isinstance(valor, str) else valor
+    except ValueError:
+        return None
+
+def _tabla_registros(registros: Iterable[Dict]) -> 'pa.Table':
+    columnas: Dict[str, list] = {campo.name: [] for campo in _esquema_registros()}
+    for r in registros:
+        usuario = r.get('usuarios') or {}
+        columnas['id'].append(r['id'])
+        columnas['usuario_id'].append(r.get('usuario_id'))
+        columnas['fecha'].append(date.fromisoformat(r['fecha']) if isinstance(r['fecha'], str) else r['fecha'])
+        columnas['tipo'].append(r.get('tipo'))
+        columnas['inicio'].append(_a_time(r.get('inicio')))
+        columnas['fin'].append(_a_time(r.get('fin')))
+        columnas['duracion_minutos'].append(r.get('duracion_minutos'))
+        columnas['nombre'].append(usuario.get('nombre', r.get('nombre')))
+        columnas['codigo'].append(usuario.get('codigo', r.get('codigo')))
+        columnas['turno'].append(usuario.get('turno', r.get('turno')))
+    return pa.table(columnas, schema=_esquema_registros()).sort_by([('fecha', 'ascending'), ('inicio', 'ascending')])
+
+def _tabla_resumen(tabla: 'pa.Table') -> 'pa.Table':
+    """Resumen diario por (fecha, usuario_id, tipo)"""
+    agrupado = tabla.group_by(['fecha', 'usuario_id', 'tipo']).aggregate([('id', 'count'), ('duracion_minutos', 'sum')])
+    return pa.table({
+        'fecha': agrupado['fecha'],
+        'usuario_id': agrupado['usuario_id'],
+        'tipo': agrupado['tipo'],
+        'cantidad': agrupado['id_count'].cast(pa.int32()),
+        'minutos': agrupado['duracion_minutos_sum'].cast(pa.int64())
+    }, schema=_esquema_resumen()).sort_by([('fecha', 'ascending'), ('usuario_id', 'ascending')])
+
+def _escribir_parquet(tabla: 'pa.Table', ruta: str):
+    """Escribe a un temporal y lo renombra: los lectores nunca ven un archivo a medias"""
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    pq.write_table(tabla, temporal, compression='zstd')
+    os.replace(temporal, ruta)
+
+def archivar_mes(mes: str, registros: List[Dict]) -> Dict:
+    """
+    Escribe (o completa) el archivo de un mes y lo registra en el manifiesto
+
+    Si el mes ya tenía archivo, los registros nuevos se agregan (los IDs
+    repetidos no se duplican). El archivo escrito se relee para verificar la
+    cantidad de filas antes de registrarlo.
+
+    Args:
+        mes: 'AAAA-MM'
+        registros: Registros de tiempos_descanso del mes con usuarios(nombre, codigo, turno)
+
+    Returns:
+        Dict con registros (total del mes en el archivo) y agregados
+
+    Raises:
+        RuntimeError: Si pyarrow no está instalado o la verificación falla
+    """
+    if not PYARROW_DISPONIBLE:
+        raise RuntimeError("Archivo histórico no disponible: instalar pyarrow")
+
+    os.makedirs(ARCHIVO_DIR, exist_ok=True)
+    ruta = _ruta('tiempos', mes)
+
+    with _lock:
+        nueva = _tabla_registros(registros)
+        if os.path.exists(ruta):
+            existente = pq.read_table(ruta, schema=_esquema_registros())
+            ids_existentes = pc.is_in(nueva['id'], value_set=existente['id'])
+            nueva = pa.concat_tables([existente, nueva.filter(pc.invert(ids_existentes))])
+            nueva = nueva.sort_by([('fecha', 'ascending'), ('inicio', 'ascending')])
+        else:
+            existente = None
+
+        _escribir_parquet(nueva, ruta)
+        escritos = pq.read_metadata(ruta).num_rows
+        if escritos != nueva.num_rows:
+            raise RuntimeError(f"Verificación del archivo {mes} falló: {escritos} filas escritas de {nueva.num_rows}")
+        _escribir_parquet(_tabla_resumen(nueva), _ruta('resumen', mes))
+
+        meses = dict(meses_archivados())
+        meses[mes] = {
+            'registros': escritos,
+            'archivado': datetime.now().isoformat(timespec='seconds'),
+            'purgado': False
+        }
+        _guardar_manifiesto(meses)
+
+    agregados = escritos - (existente.num_rows if existente is not None else 0)
+    print(f"🗄️ Mes {mes} archivado: {escritos} registros ({agregados} nuevos)")
+    return {'registros': escritos, 'agregados': agregados}
+
+def marcar_purgado(mes: str):
+    """Registra que los registros del mes ya se borraron de la tabla"""
+    with _lock:
+        meses = dict(meses_archivados())
+        if mes in meses:
+            meses[mes] = dict(meses[mes], purgado=True)
+            _guardar_manifiesto(meses)
+
+# ============================================================================
+# Lectura
+# ============================================================================
+
+def _filtros(fecha_inicio: str, fecha_fin: str, usuario_id: Optional[int] = None, tipo: Optional[str] = None) -> list:
+    filtros = [('fecha', '>=', date.fromisoformat(fecha_inicio)), ('fecha', '<=', date.fromisoformat(fecha_fin))]
+    if usuario_id is not None:
+        filtros.append(('usuario_id', '=', usuario_id))
+    if tipo:
+        filtros.append(('tipo', '=', tipo))
+    return filtros
+
+def _meses_en_rango(fecha_inicio: str, fecha_fin: str) -> List[str]:
+    archivados = meses_archivados()
+    return [m for m in meses_entre(date.fromisoformat(fecha_inicio), date.fromisoformat(fecha_fin))
+            if m in archivados and os.path.exists(_ruta('tiempos', m))]
+
+def _a_registro(fila: Dict, directorio: Dict[Any, Dict]) -> Dict:
+    """
+    Fila del archivo con la misma forma que devuelve PostgREST (con el JOIN de usuarios)
+
+    Args:
+        fila: Fila del Parquet
+        directorio: Instantánea de obtener_directorio_usuarios, tomada una vez por lectura
+    """
+    # Datos actuales del usuario si sigue en el directorio (como el JOIN de la tabla);
+    # si no, los guardados al archivar
+    actual = directorio.get(fila['usuario_id']) or {}
+    return {
+        'id': fila['id'],
+        'usuario_id': fila['usuario_id'],
+        'fecha': fila['fecha'].isoformat(),
+        'tipo': fila['tipo'],
+        'inicio': fila['inicio'].isoformat() if fila['inicio'] is not None else None,
+        'fin': fila['fin'].isoformat() if fila['fin'] is not None else None,
+        'duracion_minutos': fila['duracion_minutos'],
+        'usuarios': {
+            'id': fila['usuario_id'],
+            'nombre': actual.get('nombre', fila['nombre']),
+            'codigo': actual.get('codigo', fila['codigo']),
+            'turno': actual.get('turno', fila['turno'])
+        }
+    }
+
+def leer_registros(fecha_inicio: str, fecha_fin: str, usuario_id: Any = None, tipo: Optional[str] = None,
+                   ordenar: bool = False) -> Iterator[Dict]:
+    """
+    Registros archivados de un rango, con la forma de un select de tiempos_descanso
+
+    Lee solo los meses del rango y filtra dentro de cada archivo por fecha,
+    usuario y tipo (row groups y columnas que no corresponden no se leen).
+
+    Args:
+        fecha_inicio: Fecha de inicio (ISO)
+        fecha_fin: Fecha de fin (ISO)
+        usuario_id: Filtrar por usuario (opcional)
+        tipo: Filtrar por tipo, 'DESCANSO' o 'COMIDA' (opcional)
+        ordenar: Si True, por fecha e inicio descendente (como los reportes)
+
+    Yields:
+        Dict con los campos del registro y 'usuarios' {id, nombre, codigo, turno}
+    """
+    if not PYARROW_DISPONIBLE:
+        return
+    if usuario_id in (None, ''):
+        usuario_id = None
+    else:
+        try:
+            usuario_id = int(usuario_id)
+        except (TypeError, ValueError):
+            # Ningún registro tiene ese usuario: filtrar sin romper la lectura
+            print(f"⚠️ usuario_id no numérico en el archivo histórico: '{usuario_id}'")
+            return
+    meses = _meses_en_rango(fecha_inicio, fecha_fin)
+    directorio = obtener_directorio_usuarios() if meses else {}
+    for mes in (reversed(meses) if ordenar else meses):
+        tabla = pq.read_table(_ruta('tiempos', mes), filters=_filtros(fecha_inicio, fecha_fin, usuario_id, tipo))
+        if ordenar:
+            tabla = tabla.sort_by([('fecha', 'descending'), ('inicio', 'descending')])
+        for fila in tabla.to_pylist():
+            yield _a_registro(fila, directorio)
+
+def resumen_diario(fecha_inicio: str, fecha_fin: str) -> List[Dict]:
+    """
+    Resumen diario archivado por (fecha, usuario_id, tipo)
+
+    Args:
+        fecha_inicio: Fecha de inicio (ISO)
+        fecha_fin: Fecha de fin (ISO)
+
+    Returns:
+        Lista de dicts con fecha (ISO), usuario_id, tipo, cantidad y minutos
+    """
+    if not PYARROW_DISPONIBLE:
+        return []
+    filas = []
+    for mes in _meses_en_rango(fecha_inicio, fecha_fin):
+        ruta = _ruta('resumen', mes)
+        if os.path.exists(ruta):
+            for fila in pq.read_table(ruta, filters=_filtros(fecha_inicio, fecha_fin)).to_pylist():
+                filas.append(dict(fila, fecha=fila['fecha'].isoformat()))
+    return filas
+
+def contar_registros(fecha_inicio: str, fecha_fin: str) -> int:
+    """Cantidad de registros archivados en un rango (desde los resúmenes diarios)"""
+    return sum(fila['cantidad'] for fila in resumen_diario(fecha_inicio, fecha_fin))
+
+def reclasificar(fecha_inicio: str, fecha_fin: str, tipo_por_registro: Callable[[Dict], str],
+                 aplicar: bool = False) -> Dict[str, Any]:
+    """
+    Recalcula el tipo de los registros archivados de un rango (ver
+    db_descansos.recalcular_tipos_periodo) y reescribe los meses con cambios
+
+    Args:
+        fecha_inicio: Fecha de inicio (ISO)
+        fecha_fin: Fecha de fin (ISO)
+        tipo_por_registro: Función registro → tipo según la política vigente
+        aplicar: Si False solo cuenta los cambios
+
+    Returns:
+        Dict con revisados, a_descanso, a_comida y actualizados
+    """
+    resultado = {'revisados': 0, 'a_descanso': 0, 'a_comida': 0, 'actualizados': 0}
+    if not PYARROW_DISPONIBLE:
+        return resultado
+
+    inicio, fin = date.fromisoformat(fecha_inicio), date.fromisoformat(fecha_fin)
+    meses = _meses_en_rango(fecha_inicio, fecha_fin)
+    directorio = obtener_directorio_usuarios() if meses else {}
+    for mes in meses:
+        ruta = _ruta('tiempos', mes)
+        with _lock:
+            tabla = pq.read_table(ruta, schema=_esquema_registros())
+            tipos = tabla['tipo'].to_pylist()
+            cambios = 0
+            for i, fila in enumerate(tabla.to_pylist()):
+                if not inicio <= fila['fecha'] <= fin:
+                    continue
+                resultado['revisados'] += 1
+                tipo_nuevo = tipo_por_registro(_a_registro(fila, directorio))
+                if tipo_nuevo != fila['tipo']:
+                    resultado['a_descanso' if tipo_nuevo == 'DESCANSO' else 'a_comida'] += 1
+                    tipos[i] = tipo_nuevo
+                    cambios += 1
+            if aplicar and cambios:
+                tabla = tabla.set_column(tabla.schema.get_field_index('tipo'), 'tipo', pa.array(tipos, pa.string()))
+                _escribir_parquet(tabla, ruta)
+                _escribir_parquet(_tabla_resumen(tabla), _ruta('resumen', mes))
+                resultado['actualizados'] += cambios
+    return resultado
+
+def estado_archivo() -> Dict:
+    """
+    Estado del archivo histórico (para /status y /archivo)
+
+    Returns:
+        Dict con disponible, directorio, persistente, purga, corte, meses, registros y bytes
+    """
+    meses = meses_archivados()
+    limite = corte()
+    motivo = verificar_persistencia()
+    tamano = 0
+    for mes in meses:
+        for prefijo in ('tiempos', 'resumen'):
+            try:
+                tamano += os.path.getsize(_ruta(prefijo, mes))
+            except OSError:
+                pass
+    return {
+        'disponible': PYARROW_DISPONIBLE,
+        'directorio': ARCHIVO_DIR,
+        'persistente': motivo is None,
+        'motivo_no_persistente': motivo,
+        'purga_habilitada': ARCHIVO_PURGAR,
+        'meses_calientes': MESES_CALIENTES,
+        'corte': limite.isoformat() if limite else None,
+        'meses': meses,
+        'registros': sum(m.get('registros', 0) for m in meses.values()),
+        'pendientes_purga': sorted(m for m, datos in meses.items() if not datos.get('purgado')),
+        'bytes': tamano
+    }
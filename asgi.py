@@ -0,0 +1,232 @@
+"""
+Servidor ASGI del Kiosco
+========================
+
+Atiende la ruta del lector de tarjetas ('/') de forma asíncrona con db_async
+y delega todas las demás rutas a la aplicación Flask (WSGIMiddleware de
+a2wsgi).
+
+En el kiosco síncrono cada pasada de tarjeta bloquea un worker durante varias
+llamadas HTTP seguidas. Aquí un solo worker con event loop atiende muchos
+kioscos a la vez, y la búsqueda del usuario se lanza en paralelo con la lista
+de descansos activos (que además sirve para saber si el usuario ya está en
+descanso y para armar la tabla, sin consultas extra).
+
+Las rutas Flask corren en un pool de FLASK_THREADS hilos, así que una
+exportación o descarga larga no bloquea /health ni /ready, y el iterable de la
+respuesta se cierra al terminar (send_file libera su archivo). asgiref
+(WsgiToAsgi) corría todas en un único hilo compartido y nunca llamaba a close().
+
+Arranque (render.yaml):
+    gunicorn -k uvicorn.workers.UvicornWorker 'asgi:create_asgi_app()'
+"""
+
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+
+import db_async
+import metricas
+import db_utils
+from app import (app, create_app, construir_filas_descansos, preparar_tiempo_descanso, clasificar_pasada,
+                 MENSAJE_SIN_CONEXION, MENSAJE_FORMATO_INVALIDO, MENSAJE_NO_ENCONTRADO, conexion_supabase_status)
+from tarjeta_utils import parse_card_data, validate_card_format
+from time_utils import get_current_time, get_current_time_formatted
+
+# Configuración
+HILOS_FLASK = int(os.getenv('FLASK_THREADS', '10'))
+
+# Rutas atendidas por el camino asíncrono
+RUTAS_KIOSCO = ('/',)
+
+# Tamaño máximo del formulario del kiosco (bytes)
+TAMANO_MAX_FORMULARIO = 16 * 1024
+
+async def procesar_entrada(entrada_raw: str, descansos_activos: Optional[List[Dict]] = None) -> Tuple[str, str, List[Dict]]:
+    """
+    Registra la entrada o salida de descanso para una pasada de tarjeta
+
+    Args:
+        entrada_raw: Datos leídos por el lector (o código tipeado)
+        descansos_activos: Lista ya consultada (si es None se consulta en paralelo)
+
+    Returns:
+        Tupla (mensaje, tipo_mensaje, descansos activos actualizados)
+    """
+    with metricas.medir_etapa('parseo'):
+        entrada = parse_card_data(entrada_raw)
+        formato_valido = validate_card_format(entrada)
+    print(f"🔍 [ASGI] Procesando entrada: '{entrada_raw}' → '{entrada}'")
+
+    if not formato_valido:
+        if descansos_activos is None:
+            descansos_activos = await db_async.obtener_todos_descansos_activos()
+        return MENSAJE_FORMATO_INVALIDO, "error", descansos_activos
+
+    # Consultas independientes en paralelo (la lista de descansos resuelve
+    # también el chequeo de descanso activo, así que cuenta como búsqueda)
+    with metricas.medir_etapa('busqueda'):
+        if descansos_activos is None:
+            usuario, descansos_activos = await asyncio.gather(db_async.buscar_usuario_inteligente(entrada),
+                                                              db_async.obtener_todos_descansos_activos())
+        else:
+            usuario = await db_async.buscar_usuario_inteligente(entrada)
+
+        if not usuario and entrada != entrada_raw:
+            usuario = await db_async.buscar_usuario_inteligente(entrada_raw)
+
+    if not usuario:
+        if db_utils.servicio_degradado():
+            return MENSAJE_SIN_CONEXION, "error", descansos_activos
+        return MENSAJE_NO_ENCONTRADO, "error", descansos_activos
+
+    try:
+        with metricas.medir_etapa('descanso_activo'):
+            if db_utils.servicio_degradado():
+                # La lista puede venir del snapshot: confirmar contra la base (propaga si no responde)
+                descanso_activo = await db_async.obtener_descanso_activo(usuario['id'])
+            else:
+                descanso_activo = next((d for d in descansos_activos if d['usuario_id'] == usuario['id']), None)
+    except db_utils.ServicioNoDisponible as e:
+        print(f"⚠️ Kiosco sin conexión a Supabase: {e}")
+        return MENSAJE_SIN_CONEXION, "error", descansos_activos
+
+    if descanso_activo:
+        with metricas.medir_etapa('cierre'):
+            tiempo_data = preparar_tiempo_descanso(usuario['id'], descanso_activo, usuario.get('turno'))
+            success, resultado_msg, _ = await db_async.cerrar_descanso(usuario['id'], descanso_activo, tiempo_data)
+        if success:
+            descansos_activos = [d for d in descansos_activos if d['id'] != descanso_activo['id']]
+            return f"{usuario['nombre']} - Salida registrada ({resultado_msg})", "salida", descansos_activos
+        return f"Error al registrar salida de {usuario['nombre']}: {resultado_msg}", "error", descansos_activos
+
+    with metricas.medir_etapa('apertura'):
+        descanso_creado = await db_async.crear_descanso(usuario['id'], get_current_time().isoformat())
+    if descanso_creado:
+        return f"{usuario['nombre']} - Entrada a descanso registrada", "entrada", descansos_activos + [descanso_creado]
+    if db_utils.servicio_degradado():
+        return MENSAJE_SIN_CONEXION, "error", descansos_activos
+    return f"Error al registrar entrada para {usuario['nombre']}", "error", descansos_activos
+
+async def filas_descansos(descansos_activos: List[Dict]) -> List[Dict]:
+    """
+    Arma la tabla de usuarios en descanso (usuarios resueltos en una sola consulta)
+
+    Args:
+        descansos_activos: Descansos activos
+
+    Returns:
+        Lista de dicts para index.html
+    """
+    usuarios = await db_async.obtener_usuarios_por_ids(d['usuario_id'] for d in descansos_activos)
+    pendientes = [(usuarios[d['usuario_id']], d['inicio']) for d in descansos_activos if d['usuario_id'] in usuarios]
+    return construir_filas_descansos(pendientes)
+
+async def pagina_kiosco(entrada_raw: Optional[str], base_url: str) -> str:
+    """
+    Genera la página del kiosco (GET) o procesa una pasada de tarjeta (POST)
+
+    Args:
+        entrada_raw: Datos del formulario, o None en un GET
+        base_url: URL base de la petición (para url_for en la plantilla)
+
+    Returns:
+        str: HTML de index.html
+    """
+    mensaje = None
+    tipo_mensaje = None
+
+    with db_utils.limite_latencia():
+        if entrada_raw:
+            try:
+                mensaje, tipo_mensaje, descansos_activos = await procesar_entrada(entrada_raw)
+            except Exception as e:
+                mensaje = f"Error al procesar: {str(e)}"
+                tipo_mensaje = "error"
+                descansos_activos = await db_async.obtener_todos_descansos_activos()
+            metricas.registrar_pasada(clasificar_pasada(mensaje, tipo_mensaje))
+        else:
+            descansos_activos = await db_async.obtener_todos_descansos_activos()
+
+        try:
+            descansos = await filas_descansos(descansos_activos)
+        except Exception as e:
+            print(f"❌ ERROR CRÍTICO al obtener descansos: {e}")
+            descansos = []
+
+    with app.test_request_context('/', base_url=base_url):
+        return render_template('index.html',
+                               descansos=descansos,
+                               hora_actual=get_current_time_formatted(),
+                               mensaje=mensaje,
+                               tipo_mensaje=tipo_mensaje,
+                               conexion_status=conexion_supabase_status)
+
+async def _leer_formulario(receive) -> Dict[str, List[str]]:
+    cuerpo = b''
+    while True:
+        mensaje = await receive()
+        cuerpo += mensaje.get('body', b'')
+        if len(cuerpo) > TAMANO_MAX_FORMULARIO:
+            raise ValueError("Formulario demasiado grande")
+        if not mensaje.get('more_body'):
+            break
+    return parse_qs(cuerpo.decode('utf-8', errors='replace'))
+
+def _base_url(scope) -> str:
+    cabeceras = dict(scope.get('headers') or [])
+    host = cabeceras.get(b'host', b'localhost').decode('latin-1')
+    return f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}"
+
+async def _responder(send, estado: int, cuerpo: bytes, tipo: bytes = b'text/html; charset=utf-8'):
+    await send({
+        'type': 'http.response.start',
+        'status': estado,
+        'headers': [(b'content-type', tipo), (b'content-length', str(len(cuerpo)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+class AplicacionKiosco:
+    """Aplicación ASGI: kiosco asíncrono + resto de rutas en Flask"""
+
+    def __init__(self, flask_app):
+        self.flask = WSGIMiddleware(flask_app, workers=HILOS_FLASK)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http' and scope['path'] in RUTAS_KIOSCO and scope['method'] in ('GET', 'POST'):
+            try:
+                entrada_raw = None
+                if scope['method'] == 'POST':
+                    entrada_raw = (await _leer_formulario(receive)).get('entrada', [''])[0].strip()
+                html = await pagina_kiosco(entrada_raw, _base_url(scope))
+            except ValueError as e:
+                await _responder(send, 413, str(e).encode(), b'text/plain; charset=utf-8')
+                return
+            await _responder(send, 200, html.encode('utf-8'))
+            return
+
+        await self.flask(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                await db_async.cerrar_clientes_async()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+def create_asgi_app() -> AplicacionKiosco:
+    """
+    Factory para gunicorn con UvicornWorker ('asgi:create_asgi_app()')
+    """
+    return AplicacionKiosco(create_app())
@@ -0,0 +1,204 @@
+"""
+Autenticación de Administradores
+================================
+
+Login de administradores sin consultas ni hashes innecesarios:
+
+- Claves con hash lento y salado (scrypt de werkzeug) en la columna 'clave'.
+  Una clave heredada en texto plano se acepta una vez y se reemplaza por su
+  hash en ese mismo login.
+- Caché de administradores por nombre de usuario (ADMIN_CACHE_TTL_SECONDS),
+  también de los usuarios inexistentes, para que un ataque no consulte la BD
+  en cada intento.
+- Limitador de cubeta de tokens por IP y por usuario: una ráfaga de fuerza
+  bruta se rechaza en memoria antes de consultar la BD y antes de calcular
+  el hash.
+
+Los límites son por worker: con N workers el total permitido es N veces el
+configurado, lo que sigue cortando una ráfaga.
+
+Generar el hash de una clave nueva:
+    python auth_admin.py <clave>
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from db_admin import actualizar_clave_administrador, obtener_administrador_por_usuario
+
+# Configuración
+CACHE_TTL_SEGUNDOS = int(os.getenv('ADMIN_CACHE_TTL_SECONDS', '60'))
+IP_CAPACIDAD = int(os.getenv('LOGIN_IP_BURST', '10'))
+IP_POR_MINUTO = float(os.getenv('LOGIN_IP_PER_MINUTE', '5'))
+USUARIO_CAPACIDAD = int(os.getenv('LOGIN_USER_BURST', '5'))
+USUARIO_POR_MINUTO = float(os.getenv('LOGIN_USER_PER_MINUTE', '2'))
+
+# Prefijos de los hashes de werkzeug (lo demás se trata como texto plano heredado)
+PREFIJOS_HASH = ('scrypt:', 'pbkdf2:')
+
+class LimiteIntentos(Exception):
+    """Demasiados intentos de login desde una IP o para un usuario"""
+
+    def __init__(self, espera: float):
+        super().__init__(f"Demasiados intentos, reintentar en {espera:.0f}s")
+        self.espera = espera
+
+# Máximo de usuarios en caché (los inexistentes los elige quien ataca)
+MAX_CACHE = 1000
+
+class LimitadorTokens:
+    """Cubetas de tokens por clave (IP o usuario), en memoria del worker"""
+
+    # Sobre este tamaño se descartan las cubetas llenas (equivalen a no tener cubeta)
+    MAX_CUBETAS = 10000
+
+    def __init__(self, capacidad: int, por_minuto: float):
+        self.capacidad = capacidad
+        self.por_segundo = por_minuto / 60
+        self._cubetas: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, clave: str, ahora: float) -> float:
+        tokens, momento = self._cubetas.get(clave, (self.capacidad, ahora))
+        return min(self.capacidad, tokens + (ahora - momento) * self.por_segundo)
+
+    def consumir(self, clave: str) -> float:
+        """
+        Consume un token
+
+        Args:
+            clave: IP o nombre de usuario
+
+        Returns:
+            float: 0 si se permitió; si no, segundos hasta el próximo token
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(clave, ahora)
+            if tokens < 1:
+                self._cubetas[clave] = (tokens, ahora)
+                return (1 - tokens) / self.por_segundo
+            self._cubetas[clave] = (tokens - 1, ahora)
+            if len(self._cubetas) > self.MAX_CUBETAS:
+                self._podar(ahora)
+        return 0.0
+
+    def reiniciar(self, clave: str):
+        """Llena la cubeta de una clave (p. ej. tras un login correcto)"""
+        with self._lock:
+            self._cubetas.pop(clave, None)
+
+    def _podar(self, ahora: float):
+        for clave in [c for c in self._cubetas if self._tokens(c, ahora) >= self.capacidad]:
+            del self._cubetas[clave]
+
+limitador_ip = LimitadorTokens(IP_CAPACIDAD, IP_POR_MINUTO)
+limitador_usuario = LimitadorTokens(USUARIO_CAPACIDAD, USUARIO_POR_MINUTO)
+
+_cache: Dict[str, Tuple[Optional[Dict], float]] = {}
+_hash_ficticio: Optional[str] = None
+
+def es_hash(clave: Optional[str]) -> bool:
+    """True si el valor guardado es un hash de werkzeug"""
+    return bool(clave) and clave.startswith(PREFIJOS_HASH)
+
+def generar_hash_clave(clave: str) -> str:
+    """
+    Hash lento y salado de una clave
+
+    Args:
+        clave: Clave en texto plano
+
+    Returns:
+        str: Hash para guardar en administradores.clave
+    """
+    return generate_password_hash(clave)
+
+def _obtener_administrador(usuario: str) -> Optional[Dict]:
+    """Administrador activo por usuario, con caché (incluye inexistentes)"""
+    ahora = time.monotonic()
+    cacheado = _cache.get(usuario)
+    if cacheado and cacheado[1] > ahora:
+        return cacheado[0]
+
+    admin = obtener_administrador_por_usuario(usuario)
+    if len(_cache) >= MAX_CACHE:
+        for clave in [c for c, (_, expira) in _cache.items() if expira <= ahora] or list(_cache):
+            _cache.pop(clave, None)
+    _cache[usuario] = (admin, ahora + CACHE_TTL_SEGUNDOS)
+    return admin
+
+def invalidar_administrador(usuario: Optional[str] = None):
+    """Descarta la caché de un administrador (o de todos)"""
+    if usuario is None:
+        _cache.clear()
+    else:
+        _cache.pop(usuario, None)
+
+def _verificar_clave(admin: Dict, clave: str) -> bool:
+    guardada = admin.get('clave') or ''
+    if es_hash(guardada):
+        return check_password_hash(guardada, clave)
+
+    # Clave heredada en texto plano: comparar en tiempo constante y migrar a hash
+    if not guardada or not hmac.compare_digest(guardada.encode('utf-8'), clave.encode('utf-8')):
+        return False
+    nuevo_hash = generar_hash_clave(clave)
+    if actualizar_clave_administrador(admin['id'], nuevo_hash):
+        admin['clave'] = nuevo_hash
+        print(f"🔐 Clave del administrador {admin['usuario']} migrada a hash")
+    return True
+
+def autenticar(usuario: str, clave: str, ip: Optional[str] = None) -> Optional[Dict]:
+    """
+    Valida las credenciales de un administrador aplicando los límites de intentos
+
+    Args:
+        usuario: Nombre de usuario
+        clave: Clave en texto plano
+        ip: IP del cliente (para el límite por IP)
+
+    Returns:
+        Dict con los datos del administrador (sin la clave) o None si no son válidas
+
+    Raises:
+        LimiteIntentos: Si la IP o el usuario agotaron sus intentos
+    """
+    if not usuario or not clave:
+        return None
+
+    # Límites en memoria: se revisan antes de tocar la BD o calcular el hash
+    espera = max(limitador_ip.consumir(ip or 'desconocida'), limitador_usuario.consumir(usuario.lower()))
+    if espera > 0:
+        print(f"🚫 Login bloqueado por límite de intentos: usuario '{usuario}', IP {ip}")
+        raise LimiteIntentos(espera)
+
+    admin = _obtener_administrador(usuario)
+    if admin is None:
+        # Mismo costo que una clave incorrecta, para no revelar qué usuarios existen
+        global _hash_ficticio
+        if _hash_ficticio is None:
+            _hash_ficticio = generar_hash_clave(os.urandom(16).hex())
+        check_password_hash(_hash_ficticio, clave)
+        print(f"❌ Login fallido: usuario '{usuario}' no encontrado o inactivo")
+        return None
+
+    if not _verificar_clave(admin, clave):
+        print(f"❌ Login fallido: clave incorrecta para '{usuario}'")
+        return None
+
+    limitador_usuario.reiniciar(usuario.lower())
+    print(f"✅ Administrador autenticado: {admin['nombre']}")
+    return {k: v for k, v in admin.items() if k != 'clave'}
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Uso: python auth_admin.py <clave>")
+        sys.exit(1)
+    print(generar_hash_clave(sys.argv[1]))
@@ -7,11 +7,12 @@ Maneja todas las operaciones relacionadas con administradores del sistema.
 
 import traceback
 from typing import Dict, Optional
-from db_core import get_client
+from db_core import get_client, get_admin_client
+from db_resiliencia import ejecutar
 
 def buscar_administrador(usuario: str, password: str) -> Optional[Dict]:
     """
-    Valida las credenciales de un administrador
+    Valida las credenciales de un administrador (ver auth_admin.autenticar)
     
     Args:
         usuario: Nombre de usuario del administrador
@@ -20,23 +21,51 @@ def buscar_administrador(usuario: str, password: str) -> Optional[Dict]:
     Returns:
         Dict con datos del administrador o None si no es válido
     """
+    from auth_admin import autenticar, LimiteIntentos
     try:
-        client = get_client()
-        response = client.table('administradores').select('*').eq('usuario', usuario).eq('password', password).execute()
-        
-        if response.data and len(response.data) > 0:
-            admin_data = response.data[0]
-            print(f"✅ Administrador autenticado: {admin_data['nombre']}")
-            return admin_data
-        
-        print(f"❌ Credenciales inválidas para usuario: {usuario}")
+        return autenticar(usuario, password)
+    except LimiteIntentos as e:
+        print(f"🚫 {e}")
         return None
-        
     except Exception as e:
         print(f"❌ Error autenticando administrador: {e}")
         traceback.print_exc()
         return None
 
+def obtener_administrador_por_usuario(usuario: str) -> Optional[Dict]:
+    """
+    Obtiene un administrador activo por su nombre de usuario (incluye el hash de la clave)
+    
+    Args:
+        usuario: Nombre de usuario
+        
+    Returns:
+        Dict con datos del administrador o None si no existe o está inactivo
+        
+    Raises:
+        Exception: Si la consulta falla (para no confundir un error con credenciales inválidas)
+    """
+    response = ejecutar(get_admin_client().table('administradores').select('*').eq('usuario', usuario).eq('activo', True).limit(1))
+    return response.data[0] if response.data else None
+
+def actualizar_clave_administrador(admin_id, clave_hash: str) -> bool:
+    """
+    Guarda el hash de la clave de un administrador
+    
+    Args:
+        admin_id: ID del administrador
+        clave_hash: Hash generado con auth_admin.generar_hash_clave
+        
+    Returns:
+        bool: True si se actualizó
+    """
+    try:
+        response = ejecutar(get_admin_client().table('administradores').update({'clave': clave_hash}).eq('id', admin_id), 'escritura')
+        return bool(response.data)
+    except Exception as e:
+        print(f"❌ Error actualizando clave de administrador: {e}")
+        return False
+
 def obtener_administrador_por_id(admin_id: str) -> Optional[Dict]:
     """
     Obtiene los datos de un administrador por su ID
@@ -59,4 +88,4 @@ def obtener_administrador_por_id(admin_id: str) -> Optional[Dict]:
     except Exception as e:
         print(f"❌ Error obteniendo administrador por ID: {e}")
         traceback.print_exc()
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,347 @@
+"""
+Módulo Asíncrono de Base de Datos
+=================================
+
+Variante asyncio de las funciones de db_utils que usa el kiosco, para el
+camino ASGI (ver asgi.py). Un worker con event loop atiende muchos kioscos a
+la vez en lugar de quedar bloqueado durante cada llamada HTTP, y las consultas
+independientes de una misma petición pueden lanzarse en paralelo.
+
+Usa el cliente AsyncPostgrestClient con la misma URL, claves, límites de pool,
+plazos, circuit breaker y cachés locales (directorio de usuarios y snapshot de
+descansos activos) que la versión síncrona.
+"""
+
+import asyncio
+import traceback
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.utils import AsyncClient
+
+import db_core
+from db_core import get_client, get_admin_client
+from db_resiliencia import ejecutar_async, ServicioNoDisponible
+from db_usuarios import (TAMANO_PAGINA_DIRECTORIO, _buscar_en_directorio, directorio_vigente, guardar_directorio_usuarios,
+                         obtener_usuario_directorio, pagina_final_directorio)
+from db_descansos import _guardar_snapshot_activos, obtener_snapshot_descansos_activos
+
+# Clientes por event loop: (loop, público, administrativo)
+_clientes: Optional[Tuple[asyncio.AbstractEventLoop, AsyncPostgrestClient, AsyncPostgrestClient]] = None
+
+async def _registrar_evento(evento: str, info: Dict):
+    # httpcore espera un callback de trace asíncrono en el cliente async
+    db_core._registrar_evento(evento, info)
+
+async def _al_enviar(request: httpx.Request):
+    db_core._al_enviar(request)
+    request.extensions['trace'] = _registrar_evento
+
+async def _al_recibir(response: httpx.Response):
+    db_core._al_recibir(response)
+
+class _PostgrestAsyncConPool(AsyncPostgrestClient):
+    """Cliente PostgREST asíncrono con los límites de pool y métricas de db_core"""
+
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout, verify: bool = True) -> AsyncClient:
+        return AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(db_core.TIMEOUT_LECTURA, connect=db_core.TIMEOUT_CONEXION),
+            verify=verify,
+            follow_redirects=True,
+            http2=db_core.USAR_HTTP2,
+            limits=httpx.Limits(
+                max_connections=db_core.POOL_MAX_CONEXIONES,
+                max_keepalive_connections=db_core.POOL_MAX_KEEPALIVE,
+                keepalive_expiry=db_core.POOL_KEEPALIVE_SEGUNDOS
+            ),
+            event_hooks={'request': [_al_enviar], 'response': [_al_recibir]}
+        )
+
+def _crear_cliente_async(cliente_sync) -> AsyncPostgrestClient:
+    # Misma URL y cabeceras de autenticación que el cliente síncrono
+    return _PostgrestAsyncConPool(cliente_sync.rest_url, headers=dict(cliente_sync.options.headers),
+                                  schema=cliente_sync.options.schema)
+
+def _get_clientes() -> Tuple[AsyncPostgrestClient, AsyncPostgrestClient]:
+    global _clientes
+    loop = asyncio.get_running_loop()
+    if _clientes is None or _clientes[0] is not loop:
+        # Las conexiones de httpx quedan atadas al event loop que las creó
+        _clientes = (loop, _crear_cliente_async(get_client()), _crear_cliente_async(get_admin_client()))
+        print("🔌 Clientes asíncronos de Supabase creados")
+    return _clientes[1], _clientes[2]
+
+def get_async_client() -> AsyncPostgrestClient:
+    """Obtiene el cliente público asíncrono (debe llamarse dentro del event loop)"""
+    return _get_clientes()[0]
+
+def get_async_admin_client() -> AsyncPostgrestClient:
+    """Obtiene el cliente administrativo asíncrono (debe llamarse dentro del event loop)"""
+    return _get_clientes()[1]
+
+async def cerrar_clientes_async():
+    """Cierra las conexiones de los clientes asíncronos (al apagar el worker)"""
+    global _clientes
+    if _clientes is not None:
+        _, cliente, admin = _clientes
+        _clientes = None
+        await asyncio.gather(cliente.aclose(), admin.aclose(), return_exceptions=True)
+
+async def buscar_usuario_por_tarjeta(numero_tarjeta: str) -> Optional[Dict]:
+    """
+    Busca un usuario por número de tarjeta magnética
+
+    Args:
+        numero_tarjeta: Número de la tarjeta magnética
+
+    Returns:
+        Dict con datos del usuario o None si no se encuentra
+    """
+    try:
+        response = await ejecutar_async(get_async_client().table('usuarios').select('*').eq('tarjeta', numero_tarjeta), 'kiosco')
+        if response.data and len(response.data) > 1:
+            print(f"⚠️ Tarjeta {numero_tarjeta} asignada a {len(response.data)} usuarios; se usa {response.data[0]['nombre']}")
+        return response.data[0] if response.data else None
+
+    except ServicioNoDisponible as e:
+        print(f"⚠️ Supabase no disponible ({e}); buscando tarjeta en el directorio local")
+        return _buscar_en_directorio('tarjeta', numero_tarjeta)
+    except Exception as e:
+        print(f"❌ Error buscando usuario por tarjeta: {e}")
+        traceback.print_exc()
+        return None
+
+async def buscar_usuario_por_codigo(codigo_empleado: str) -> Optional[Dict]:
+    """
+    Busca un usuario por código de empleado
+
+    Args:
+        codigo_empleado: Código del empleado
+
+    Returns:
+        Dict con datos del usuario o None si no se encuentra
+    """
+    try:
+        response = await ejecutar_async(get_async_client().table('usuarios').select('*').eq('codigo', codigo_empleado.upper()), 'kiosco')
+        return response.data[0] if response.data else None
+
+    except ServicioNoDisponible as e:
+        print(f"⚠️ Supabase no disponible ({e}); buscando código en el directorio local")
+        return _buscar_en_directorio('codigo', codigo_empleado.upper())
+    except Exception as e:
+        print(f"❌ Error buscando usuario por código: {e}")
+        traceback.print_exc()
+        return None
+
+async def buscar_usuario_inteligente(entrada: str) -> Optional[Dict]:
+    """
+    Búsqueda por tarjeta magnética o código de empleado
+
+    A diferencia de la versión síncrona, ambas consultas se lanzan en paralelo;
+    la tarjeta sigue teniendo prioridad.
+
+    Args:
+        entrada: Datos de entrada (tarjeta o código)
+
+    Returns:
+        Dict con datos del usuario o None si no se encuentra
+    """
+    por_tarjeta, por_codigo = await asyncio.gather(buscar_usuario_por_tarjeta(entrada),
+                                                   buscar_usuario_por_codigo(entrada))
+    usuario = por_tarjeta or por_codigo
+    if usuario is None:
+        print(f"❌ Usuario no encontrado con entrada: '{entrada}'")
+    return usuario
+
+async def obtener_descanso_activo(usuario_id: str) -> Optional[Dict]:
+    """
+    Verifica si un usuario tiene un descanso activo
+
+    Args:
+        usuario_id: ID del usuario
+
+    Returns:
+        Dict con datos del descanso activo o None si no tiene
+
+    Raises:
+        ServicioNoDisponible: Si no se pudo consultar (para no duplicar descansos)
+    """
+    try:
+        response = await ejecutar_async(get_async_client().table('descansos').select('*').eq('usuario_id', usuario_id), 'kiosco')
+        return response.data[0] if response.data else None
+
+    except ServicioNoDisponible:
+        raise
+    except Exception as e:
+        print(f"❌ Error verificando descanso activo: {e}")
+        traceback.print_exc()
+        return None
+
+async def crear_descanso(usuario_id: str, inicio_iso: str) -> Optional[Dict]:
+    """
+    Crea un nuevo descanso activo para un usuario
+
+    Args:
+        usuario_id: ID del usuario
+        inicio_iso: Timestamp de inicio en formato ISO
+
+    Returns:
+        Dict con datos del descanso creado o None si hay error
+    """
+    try:
+        descanso_existente = await obtener_descanso_activo(usuario_id)
+        if descanso_existente:
+            print(f"⚠️ Usuario ya tiene descanso activo: ID {descanso_existente['id']}")
+            return None
+
+        datos_descanso = {
+            'usuario_id': usuario_id,
+            'inicio': inicio_iso,
+            'tipo': 'Pendiente'
+        }
+        response = await ejecutar_async(get_async_admin_client().table('descansos').insert(datos_descanso), 'escritura')
+
+        if response.data:
+            print(f"✅ Descanso creado para usuario: {usuario_id}")
+            return response.data[0]
+        return None
+
+    except ServicioNoDisponible as e:
+        print(f"❌ Supabase no disponible, descanso no creado: {e}")
+        return None
+    except Exception as e:
+        print(f"❌ Error creando descanso: {e}")
+        traceback.print_exc()
+        return None
+
+async def cerrar_descanso(usuario_id: str, descanso_activo: Dict, tiempo_data: Dict) -> Tuple[bool, str, Dict]:
+    """
+    Cierra un descanso activo y guarda el tiempo en tiempos_descanso
+
+    Args:
+        usuario_id: ID del usuario
+        descanso_activo: Dict con datos del descanso activo
+        tiempo_data: Dict con datos del tiempo a guardar
+
+    Returns:
+        Tuple (success: bool, mensaje: str, detalle: dict)
+    """
+    try:
+        admin_client = get_async_admin_client()
+
+        insert_response = await ejecutar_async(admin_client.table('tiempos_descanso').insert(tiempo_data), 'escritura')
+        if not insert_response.data:
+            return False, "Error insertando en tiempos_descanso", {'insert_response': insert_response}
+        tiempo_id = insert_response.data[0]['id']
+
+        # Borrar por ID es idempotente: se reintenta para no dejar el descanso abierto tras el insert
+        await ejecutar_async(admin_client.table('descansos').delete().eq('id', descanso_activo['id']),
+                             'escritura', idempotente=True)
+
+        tipo = tiempo_data.get('tipo', 'DESCANSO')
+        duracion = tiempo_data.get('duracion_minutos', 0)
+        success_msg = f"Descanso cerrado: {tipo} de {duracion} min"
+        print(f"✅ {success_msg} (usuario {usuario_id})")
+
+        return True, success_msg, {
+            'tiempo_id': tiempo_id,
+            'tipo': tipo,
+            'duracion_minutos': duracion
+        }
+
+    except Exception as e:
+        error_msg = f"Error cerrando descanso: {str(e)}"
+        print(f"❌ {error_msg}")
+        return False, error_msg, {'exception': str(e)}
+
+async def obtener_todos_descansos_activos() -> List[Dict]:
+    """
+    Obtiene todos los descansos activos del sistema
+
+    Returns:
+        Lista de diccionarios con descansos activos (o el último snapshot si
+        Supabase no está disponible)
+    """
+    try:
+        response = await ejecutar_async(get_async_client().table('descansos').select('*'), 'kiosco')
+        _guardar_snapshot_activos(response.data or [])
+        return response.data or []
+
+    except ServicioNoDisponible as e:
+        snapshot = obtener_snapshot_descansos_activos()
+        if snapshot is not None:
+            print(f"⚠️ Supabase no disponible ({e}); usando snapshot de descansos activos")
+            return list(snapshot[0])
+        print(f"❌ Supabase no disponible y sin snapshot de descansos activos: {e}")
+        return []
+    except Exception as e:
+        print(f"❌ Error obteniendo descansos activos: {e}")
+        traceback.print_exc()
+        return []
+
+async def precargar_directorio_usuarios() -> int:
+    """
+    Carga todos los usuarios en el directorio en memoria (compartido con db_usuarios)
+
+    Returns:
+        int: Cantidad de usuarios cargados, o -1 si la consulta falló
+    """
+    try:
+        usuarios = []
+        total = None
+        while True:
+            query = get_async_client().table('usuarios').select('*', count='exact' if total is None else None)
+            response = await ejecutar_async(query.order('id').range(len(usuarios), len(usuarios) + TAMANO_PAGINA_DIRECTORIO - 1))
+            pagina = response.data or []
+            if total is None:
+                total = getattr(response, 'count', None)
+            usuarios.extend(pagina)
+            if pagina_final_directorio(pagina, len(usuarios), total):
+                break
+        return guardar_directorio_usuarios(usuarios, total)
+    except Exception as e:
+        print(f"❌ Error precargando directorio de usuarios: {e}")
+        return -1
+
+async def obtener_usuarios_por_ids(usuario_ids: Iterable[Any]) -> Dict[Any, Dict]:
+    """
+    Resuelve varios usuarios por ID sin bloquear el event loop
+
+    Usa el directorio en memoria (recargándolo de forma asíncrona si expiró) y
+    trae los que falten con una sola consulta.
+
+    Args:
+        usuario_ids: IDs de usuario
+
+    Returns:
+        Dict id -> datos del usuario (los no encontrados se omiten)
+    """
+    ids = list(dict.fromkeys(usuario_ids))
+    if not ids:
+        return {}
+
+    if not directorio_vigente():
+        await precargar_directorio_usuarios()
+
+    # Con el directorio vigente obtener_usuario_directorio no consulta la base
+    usuarios = {}
+    faltantes = []
+    for usuario_id in ids:
+        usuario = obtener_usuario_directorio(usuario_id) if directorio_vigente() else None
+        if usuario is not None:
+            usuarios[usuario_id] = usuario
+        else:
+            faltantes.append(usuario_id)
+
+    if faltantes:
+        try:
+            response = await ejecutar_async(get_async_client().table('usuarios').select('id, nombre, codigo, turno').in_('id', faltantes), 'kiosco')
+            for usuario in response.data or []:
+                usuarios[usuario['id']] = usuario
+        except ServicioNoDisponible as e:
+            print(f"⚠️ Supabase no disponible ({e}); {len(faltantes)} usuarios sin resolver")
+
+    return usuarios
@@ -3,19 +3,74 @@ Módulo Core de Base de Datos
 ===========================
 
 Maneja la inicialización y configuración básica de los clientes de Supabase.
+
+Los clientes se crean de forma diferida, la primera vez que se piden, a partir
+de las variables de entorno. Importar este módulo no hace llamadas de red, de
+modo que los workers arrancan aunque Supabase no esté disponible.
+
+Conexiones HTTP: ambos clientes (público y administrativo) comparten un único
+transporte httpx por worker, con HTTP/2, keep-alive y límites de pool
+configurables (DB_POOL_*), para que las consultas reutilicen conexiones TLS
+abiertas en vez de hacer un handshake por petición. timeout_llamada() permite
+fijar un timeout distinto para las consultas de un bloque, y
+metricas_conexion() informa cuántas peticiones reutilizaron una conexión.
 """
 
-from typing import Optional
-from supabase import Client
+import atexit
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient
+from supabase import Client, create_client
+
+# Configuración del pool de conexiones
+POOL_MAX_CONEXIONES = int(os.getenv('DB_POOL_MAX_CONNECTIONS', '20'))
+POOL_MAX_KEEPALIVE = int(os.getenv('DB_POOL_MAX_KEEPALIVE', '10'))
+POOL_KEEPALIVE_SEGUNDOS = float(os.getenv('DB_POOL_KEEPALIVE_SECONDS', '60'))
+TIMEOUT_CONEXION = float(os.getenv('DB_TIMEOUT_CONNECT', '5'))
+TIMEOUT_LECTURA = float(os.getenv('DB_TIMEOUT_READ', '15'))
+USAR_HTTP2 = os.getenv('DB_HTTP2', 'true').lower() in ('1', 'true', 'si', 'sí')
 
 # Variables globales para los clientes de Supabase
 _supabase_client: Optional[Client] = None
 _supabase_admin: Optional[Client] = None
+_lock = threading.Lock()
+
+# Transporte HTTP compartido (un pool por worker)
+_transporte: Optional[httpx.HTTPTransport] = None
+_transporte_lock = threading.Lock()
+
+# Timeout de las llamadas del contexto actual (ver timeout_llamada)
+_timeout_llamada: contextvars.ContextVar = contextvars.ContextVar('timeout_llamada', default=None)
+
+# Métricas de reutilización de conexiones
+_metricas_lock = threading.Lock()
+_metricas = {
+    'peticiones': 0,
+    'conexiones_nuevas': 0,
+    'handshakes_tls': 0,
+    'errores': 0,
+    'timeouts': 0,
+    'segundos_total': 0.0
+}
+
+# Estado de conexión (se muestra en la interfaz y en /ready)
+estado_conexion: Dict = {
+    'conectado': False,
+    'mensaje': 'Conexión pendiente',
+    'detalle': ''
+}
 
 def initialize_db_clients(supabase_client: Client, supabase_admin: Client):
     """
     Inicializa los clientes de Supabase para uso en las utilidades
-    
+
     Args:
         supabase_client: Cliente público de Supabase
         supabase_admin: Cliente administrativo de Supabase
@@ -25,14 +80,230 @@ def initialize_db_clients(supabase_client: Client, supabase_admin: Client):
     _supabase_admin = supabase_admin
     print("✅ Clientes de base de datos inicializados en db_core")
 
+def _sumar_metrica(nombre: str, valor=1):
+    with _metricas_lock:
+        _metricas[nombre] += valor
+
+def _get_transporte() -> httpx.HTTPTransport:
+    """Transporte con pool de conexiones compartido por todos los clientes del worker"""
+    global _transporte
+    if _transporte is None:
+        with _transporte_lock:
+            if _transporte is None:
+                _transporte = httpx.HTTPTransport(
+                    http2=USAR_HTTP2,
+                    limits=httpx.Limits(
+                        max_connections=POOL_MAX_CONEXIONES,
+                        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                        keepalive_expiry=POOL_KEEPALIVE_SEGUNDOS
+                    ),
+                    retries=0
+                )
+                print(f"🔌 Pool HTTP creado: {POOL_MAX_CONEXIONES} conexiones, "
+                      f"{POOL_MAX_KEEPALIVE} keep-alive, HTTP/2 {'activo' if USAR_HTTP2 else 'inactivo'}")
+    return _transporte
+
+def _registrar_evento(evento: str, info: Dict):
+    """Callback de trace de httpcore: cuenta conexiones nuevas y handshakes"""
+    if evento == 'connection.connect_tcp.complete':
+        _sumar_metrica('conexiones_nuevas')
+    elif evento == 'connection.start_tls.complete':
+        _sumar_metrica('handshakes_tls')
+
+def _al_enviar(request: httpx.Request):
+    request.extensions['trace'] = _registrar_evento
+    request.extensions['inicio_peticion'] = time.perf_counter()
+
+    # Timeout específico del bloque actual
+    timeout = _timeout_llamada.get()
+    if timeout is not None:
+        request.extensions['timeout'] = httpx.Timeout(timeout, connect=min(timeout, TIMEOUT_CONEXION)).as_dict()
+
+def _al_recibir(response: httpx.Response):
+    inicio = response.request.extensions.get('inicio_peticion')
+    with _metricas_lock:
+        _metricas['peticiones'] += 1
+        if inicio is not None:
+            _metricas['segundos_total'] += time.perf_counter() - inicio
+        if response.status_code >= 500:
+            _metricas['errores'] += 1
+
+    # Un 5xx es una falla del servicio, no un error de datos (ver db_resiliencia)
+    if response.status_code >= 500:
+        response.raise_for_status()
+
+class _PostgrestConPool(SyncPostgrestClient):
+    """Cliente PostgREST que usa el transporte compartido y registra métricas"""
+
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout, verify: bool = True) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(TIMEOUT_LECTURA, connect=TIMEOUT_CONEXION),
+            verify=verify,
+            follow_redirects=True,
+            transport=_get_transporte(),
+            event_hooks={'request': [_al_enviar], 'response': [_al_recibir]}
+        )
+
+def _init_postgrest_con_pool(rest_url: str, headers: Dict[str, str], schema: str, timeout=None) -> SyncPostgrestClient:
+    return _PostgrestConPool(rest_url, headers=headers, schema=schema)
+
+def _crear_cliente(url: str, key: str) -> Client:
+    """Crea un cliente, con configuración básica como respaldo"""
+    try:
+        # Configuración específica para evitar problemas de proxy
+        from supabase import ClientOptions
+        cliente = create_client(url, key, ClientOptions())
+    except Exception as client_error:
+        print(f"⚠️ Error con opciones específicas, intentando configuración básica: {client_error}")
+        cliente = create_client(url, key)
+
+    # Las consultas (postgrest) usan el pool compartido
+    cliente._init_postgrest_client = _init_postgrest_con_pool
+    cliente._postgrest = None
+    return cliente
+
+def _inicializar_desde_entorno():
+    """Crea ambos clientes desde las variables de entorno (sin consultas)"""
+    global _supabase_client, _supabase_admin
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_anon_key = os.getenv('SUPABASE_ANON_KEY')
+    supabase_service_key = os.getenv('SUPABASE_SERVICE_KEY')
+
+    if not supabase_url or not supabase_anon_key or not supabase_service_key:
+        estado_conexion.update({
+            'conectado': False,
+            'mensaje': 'Error: Variables de entorno faltantes',
+            'detalle': 'Verifica SUPABASE_URL, SUPABASE_ANON_KEY y SUPABASE_SERVICE_KEY en el archivo .env'
+        })
+        raise RuntimeError("Variables de entorno de Supabase no configuradas")
+
+    print("🔗 Creando clientes de Supabase...")
+    _supabase_client = _crear_cliente(supabase_url, supabase_anon_key)
+    _supabase_admin = _crear_cliente(supabase_url, supabase_service_key)
+
 def get_client() -> Client:
-    """Obtiene el cliente público de Supabase"""
+    """Obtiene el cliente público de Supabase (lo crea la primera vez)"""
     if _supabase_client is None:
-        raise RuntimeError("Cliente de Supabase no inicializado. Llama a initialize_db_clients() primero.")
+        with _lock:
+            if _supabase_client is None:
+                _inicializar_desde_entorno()
     return _supabase_client
 
 def get_admin_client() -> Client:
-    """Obtiene el cliente administrativo de Supabase"""
+    """Obtiene el cliente administrativo de Supabase (lo crea la primera vez)"""
     if _supabase_admin is None:
-        raise RuntimeError("Cliente administrativo de Supabase no inicializado. Llama a initialize_db_clients() primero.")
-    return _supabase_admin
\ No newline at end of file
+        with _lock:
+            if _supabase_admin is None:
+                _inicializar_desde_entorno()
+    return _supabase_admin
+
+def verificar_conexion() -> bool:
+    """
+    Prueba la conexión con una consulta mínima y actualiza estado_conexion
+
+    Returns:
+        bool: True si Supabase respondió
+    """
+    try:
+        test_response = get_client().table('usuarios').select("id").limit(1).execute()
+        estado_conexion.update({
+            'conectado': True,
+            'mensaje': 'Conexión establecida correctamente',
+            'detalle': f'Usuarios en BD: {len(test_response.data) if test_response.data else 0}'
+        })
+        print("✅ Conexión a Supabase establecida correctamente")
+        return True
+
+    except Exception as e:
+        if estado_conexion['mensaje'] != 'Error: Variables de entorno faltantes':
+            estado_conexion.update({
+                'conectado': False,
+                'mensaje': f'Error de conexión: {str(e)}',
+                'detalle': f'Tipo: {type(e).__name__}'
+            })
+        print(f"❌ Error conectando a Supabase ({type(e).__name__}): {e}")
+        return False
+
+@contextmanager
+def timeout_llamada(segundos: float) -> Iterator[None]:
+    """
+    Fija el timeout de las consultas hechas dentro del bloque
+
+    Ejemplo:
+        with timeout_llamada(2):
+            get_client().table('usuarios').select('*').eq('tarjeta', t).execute()
+
+    Args:
+        segundos: Timeout total por petición HTTP
+    """
+    token = _timeout_llamada.set(segundos)
+    try:
+        yield
+    except httpx.TimeoutException:
+        _sumar_metrica('timeouts')
+        raise
+    finally:
+        _timeout_llamada.reset(token)
+
+def metricas_conexion() -> Dict:
+    """
+    Métricas del pool HTTP del worker
+
+    Returns:
+        Dict con peticiones, conexiones nuevas, handshakes TLS, reutilizadas,
+        porcentaje de reutilización y latencia promedio
+    """
+    with _metricas_lock:
+        metricas = dict(_metricas)
+
+    peticiones = metricas['peticiones']
+    metricas['reutilizadas'] = max(0, peticiones - metricas['conexiones_nuevas'])
+    metricas['porcentaje_reutilizacion'] = round(metricas['reutilizadas'] / peticiones * 100, 1) if peticiones else 0.0
+    metricas['latencia_promedio_ms'] = round(metricas.pop('segundos_total') / peticiones * 1000, 1) if peticiones else 0.0
+    metricas['limites'] = {
+        'max_conexiones': POOL_MAX_CONEXIONES,
+        'max_keepalive': POOL_MAX_KEEPALIVE,
+        'keepalive_segundos': POOL_KEEPALIVE_SEGUNDOS,
+        'timeout_conexion': TIMEOUT_CONEXION,
+        'timeout_lectura': TIMEOUT_LECTURA,
+        'http2': USAR_HTTP2
+    }
+    return metricas
+
+def estado_pool() -> Dict:
+    """
+    Ocupación actual del pool HTTP del worker (sin hacer peticiones)
+
+    Returns:
+        Dict con conexiones abiertas, en uso, peticiones en espera y saturación (0-1)
+    """
+    estado = {'abiertas': 0, 'en_uso': 0, 'en_espera': 0, 'maximo': POOL_MAX_CONEXIONES, 'saturacion': 0.0}
+    transporte = _transporte
+    pool = getattr(transporte, '_pool', None)
+    if pool is None:
+        return estado
+
+    try:
+        conexiones = list(pool.connections)
+        estado['abiertas'] = len(conexiones)
+        estado['en_uso'] = sum(1 for c in conexiones if not c.is_idle())
+        # Peticiones del pool que todavía no tienen conexión asignada (atributo interno de httpcore)
+        estado['en_espera'] = sum(1 for r in getattr(pool, '_requests', []) if getattr(r, 'is_queued', lambda: False)())
+    except Exception:
+        return estado
+
+    estado['saturacion'] = round(min(1.0, (estado['en_uso'] + estado['en_espera']) / POOL_MAX_CONEXIONES), 2)
+    return estado
+
+def cerrar_conexiones():
+    """Cierra las conexiones abiertas del pool (al apagar el worker)"""
+    global _transporte
+    with _transporte_lock:
+        if _transporte is not None:
+            _transporte.close()
+            _transporte = None
+
+atexit.register(cerrar_conexiones)
@@ -3,12 +3,24 @@ Módulo de Gestión de Descansos
 ==============================
 
 Maneja todas las operaciones relacionadas con descansos activos y registros de tiempo.
+
+Las lecturas de tiempos_descanso por período se dividen entre la tabla y el
+archivo histórico (meses cerrados, ver archivo_historico.py) según el corte.
 """
 
+import threading
 import traceback
-from typing import Dict, List, Optional, Tuple, Any
-from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple, Any, Callable, Iterator
+from datetime import datetime, date, timedelta
+import time
 from db_core import get_client, get_admin_client
+from db_resiliencia import ejecutar, ServicioNoDisponible
+from politicas import obtener_politica, version_politicas
+import archivo_historico
+import metricas
+
+# Última lista de descansos activos obtenida con éxito: (descansos, timestamp)
+_snapshot_activos: Optional[Tuple[List[Dict], float]] = None
 
 def obtener_descanso_activo(usuario_id: str) -> Optional[Dict]:
     """
@@ -22,7 +34,7 @@ def obtener_descanso_activo(usuario_id: str) -> Optional[Dict]:
     """
     try:
         client = get_client()
-        response = client.table('descansos').select('*').eq('usuario_id', usuario_id).execute()
+        response = ejecutar(client.table('descansos').select('*').eq('usuario_id', usuario_id), 'kiosco')
         
         if response.data and len(response.data) > 0:
             print(f"✅ Descanso activo encontrado para usuario: {usuario_id}")
@@ -31,6 +43,9 @@ def obtener_descanso_activo(usuario_id: str) -> Optional[Dict]:
         print(f"ℹ️ No hay descanso activo para usuario: {usuario_id}")
         return None
         
+    except ServicioNoDisponible:
+        # Sin Supabase no se puede saber con certeza: se propaga para no duplicar descansos
+        raise
     except Exception as e:
         print(f"❌ Error verificando descanso activo: {e}")
         traceback.print_exc()
@@ -63,7 +78,7 @@ def crear_descanso(usuario_id: str, inicio_iso: str) -> Optional[Dict]:
             'tipo': 'Pendiente'
         }
         
-        response = admin_client.table('descansos').insert(datos_descanso).execute()
+        response = ejecutar(admin_client.table('descansos').insert(datos_descanso), 'escritura')
         
         if response.data and len(response.data) > 0:
             print(f"✅ Descanso creado para usuario: {usuario_id}")
@@ -72,6 +87,9 @@ def crear_descanso(usuario_id: str, inicio_iso: str) -> Optional[Dict]:
         print(f"❌ Error al crear descanso - Sin datos de respuesta")
         return None
         
+    except ServicioNoDisponible as e:
+        print(f"❌ Supabase no disponible, descanso no creado: {e}")
+        return None
     except Exception as e:
         print(f"❌ Error creando descanso: {e}")
         traceback.print_exc()
@@ -86,7 +104,9 @@ def obtener_todos_descansos_activos() -> List[Dict]:
     """
     try:
         client = get_client()
-        response = client.table('descansos').select('*').execute()
+        response = ejecutar(client.table('descansos').select('*'), 'kiosco')
+        
+        _guardar_snapshot_activos(response.data or [])
         
         if response.data:
             print(f"✅ Obtenidos {len(response.data)} descansos activos")
@@ -95,11 +115,48 @@ def obtener_todos_descansos_activos() -> List[Dict]:
         print("ℹ️ No hay descansos activos")
         return []
         
+    except ServicioNoDisponible as e:
+        if _snapshot_activos is not None:
+            descansos, momento = _snapshot_activos
+            print(f"⚠️ Supabase no disponible ({e}); usando snapshot de hace {time.time() - momento:.0f}s")
+            return list(descansos)
+        print(f"❌ Supabase no disponible y sin snapshot de descansos activos: {e}")
+        return []
     except Exception as e:
         print(f"❌ Error obteniendo descansos activos: {e}")
         traceback.print_exc()
         return []
 
+def _guardar_snapshot_activos(descansos: List[Dict]):
+    global _snapshot_activos
+    _snapshot_activos = (descansos, time.time())
+    metricas.actualizar_descansos_activos(len(descansos))
+
+def obtener_snapshot_descansos_activos() -> Optional[Tuple[List[Dict], float]]:
+    """
+    Última lista de descansos activos leída con éxito
+    
+    Returns:
+        Tupla (descansos, timestamp) o None si todavía no se ha leído
+    """
+    return _snapshot_activos
+
+def precargar_descansos_activos() -> int:
+    """
+    Lee los descansos activos al arrancar para dejar el snapshot listo
+    
+    Returns:
+        int: Cantidad de descansos activos, o -1 si la consulta falló
+    """
+    try:
+        response = ejecutar(get_client().table('descansos').select('*'))
+        _guardar_snapshot_activos(response.data or [])
+        print(f"⏱️ Descansos activos precargados: {len(response.data or [])}")
+        return len(response.data or [])
+    except Exception as e:
+        print(f"❌ Error precargando descansos activos: {e}")
+        return -1
+
 def cerrar_descanso(usuario_id: str, descanso_activo: Dict, tiempo_data: Dict) -> Tuple[bool, str, Dict]:
     """
     Cierra un descanso activo y guarda el tiempo en tiempos_descanso
@@ -119,7 +176,7 @@ def cerrar_descanso(usuario_id: str, descanso_activo: Dict, tiempo_data: Dict) -
         
         # Paso 1: Insertar en tiempos_descanso
         print(f"   📝 Insertando tiempo de descanso...")
-        insert_response = admin_client.table('tiempos_descanso').insert(tiempo_data).execute()
+        insert_response = ejecutar(admin_client.table('tiempos_descanso').insert(tiempo_data), 'escritura')
         
         if not insert_response.data:
             error_msg = "Error insertando en tiempos_descanso"
@@ -131,7 +188,9 @@ def cerrar_descanso(usuario_id: str, descanso_activo: Dict, tiempo_data: Dict) -
         
         # Paso 2: Eliminar de descansos
         print(f"   🗑️ Eliminando descanso activo...")
-        delete_response = admin_client.table('descansos').delete().eq('id', descanso_activo['id']).execute()
+        # Borrar por ID es idempotente: se reintenta para no dejar el descanso abierto tras el insert
+        delete_response = ejecutar(admin_client.table('descansos').delete().eq('id', descanso_activo['id']),
+                                   'escritura', idempotente=True)
         
         if delete_response.data:
             print(f"   ✅ Descanso eliminado: {len(delete_response.data)} registros")
@@ -139,9 +198,13 @@ def cerrar_descanso(usuario_id: str, descanso_activo: Dict, tiempo_data: Dict) -
             print(f"   ⚠️ ADVERTENCIA: No se confirmó eliminación")
 
         # Paso 3: Verificación final
-        verify_response = admin_client.table('descansos').select("*").eq('usuario_id', usuario_id).execute()
-        descansos_restantes = len(verify_response.data)
-        print(f"   🔍 Verificación: {descansos_restantes} descansos activos restantes")
+        try:
+            verify_response = ejecutar(admin_client.table('descansos').select("*").eq('usuario_id', usuario_id))
+            descansos_restantes = len(verify_response.data)
+            print(f"   🔍 Verificación: {descansos_restantes} descansos activos restantes")
+        except ServicioNoDisponible:
+            descansos_restantes = None
+            print(f"   ⚠️ Verificación omitida: Supabase no disponible")
         
         tipo = tiempo_data.get('tipo', 'DESCANSO')
         duracion = tiempo_data.get('duracion_minutos', 0)
@@ -171,28 +234,36 @@ def obtener_registros_periodo(fecha_inicio: date, fecha_fin: date, usuario_id: O
         usuario_id: ID del usuario (opcional, si no se especifica trae todos)
         
     Returns:
-        Lista de registros de descansos
+        Lista de registros de descansos (los meses archivados, del archivo histórico)
     """
     try:
-        client = get_client()
-        query = client.table('tiempos_descanso').select('''
-            *,
-            usuarios (
-                id,
-                nombre,
-                codigo,
-                turno
-            )
-        ''').gte('fecha', fecha_inicio.isoformat()).lte('fecha', fecha_fin.isoformat())
+        rango_archivo, rango_tabla = archivo_historico.dividir_rango(fecha_inicio.isoformat(), fecha_fin.isoformat())
+        registros = []
         
-        if usuario_id:
-            query = query.eq('usuario_id', usuario_id)
+        if rango_tabla:
+            client = get_client()
+            query = client.table('tiempos_descanso').select('''
+                *,
+                usuarios (
+                    id,
+                    nombre,
+                    codigo,
+                    turno
+                )
+            ''').gte('fecha', rango_tabla[0]).lte('fecha', rango_tabla[1])
+            
+            if usuario_id:
+                query = query.eq('usuario_id', usuario_id)
+            
+            registros = ejecutar(query.order('fecha', desc=True), 'reporte').data or []
         
-        response = query.order('fecha', desc=True).execute()
+        if rango_archivo:
+            # Más antiguos que los de la tabla: se agregan al final manteniendo el orden descendente
+            registros.extend(archivo_historico.leer_registros(*rango_archivo, usuario_id=usuario_id, ordenar=True))
         
-        if response.data:
-            print(f"✅ Obtenidos {len(response.data)} registros para el período")
-            return response.data
+        if registros:
+            print(f"✅ Obtenidos {len(registros)} registros para el período")
+            return registros
         
         print("ℹ️ No hay registros para el período especificado")
         return []
@@ -201,3 +272,285 @@ def obtener_registros_periodo(fecha_inicio: date, fecha_fin: date, usuario_id: O
         print(f"❌ Error obteniendo registros del período: {e}")
         traceback.print_exc()
         return []
+
+def iterar_registros_periodo(fecha_inicio: str, fecha_fin: str,
+                             columnas: str = '*, usuarios(nombre, codigo, turno)',
+                             ordenar: bool = False,
+                             tamano_pagina: int = 1000,
+                             progreso: Optional[Callable[[int, Optional[int]], None]] = None) -> Iterator[Dict]:
+    """
+    Itera los registros de tiempos_descanso de un período página por página
+    
+    A diferencia de obtener_registros_periodo, no carga todo el período en memoria
+    y propaga las excepciones (pensado para exportaciones en segundo plano).
+    Los meses archivados se leen del archivo histórico, después de los de la
+    tabla (con ordenar=True el orden descendente se mantiene).
+    
+    Args:
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        columnas: Columnas a seleccionar (incluye el JOIN con usuarios); los
+            registros archivados traen siempre todas
+        ordenar: Si True ordena por fecha e inicio descendente
+        tamano_pagina: Cantidad de registros por consulta
+        progreso: Callback opcional (procesados, total) llamado tras cada página
+        
+    Yields:
+        Dict con cada registro
+    """
+    rango_archivo, rango_tabla = archivo_historico.dividir_rango(fecha_inicio, fecha_fin)
+    total_archivo = archivo_historico.contar_registros(*rango_archivo) if rango_archivo else 0
+    procesados_tabla = 0
+    
+    def progreso_tabla(procesados, total):
+        nonlocal procesados_tabla
+        procesados_tabla = procesados
+        if progreso:
+            progreso(procesados, total + total_archivo if total is not None else None)
+    
+    if rango_tabla:
+        yield from _iterar_tabla(rango_tabla[0], rango_tabla[1], columnas, ordenar, tamano_pagina, progreso_tabla)
+    
+    if rango_archivo:
+        procesados = procesados_tabla
+        total = procesados_tabla + total_archivo
+        for registro in archivo_historico.leer_registros(*rango_archivo, ordenar=ordenar):
+            yield registro
+            procesados += 1
+            if progreso and procesados % tamano_pagina == 0:
+                progreso(procesados, total)
+        if progreso:
+            progreso(procesados, total)
+        print(f"🗄️ Iterados {procesados - procesados_tabla} registros archivados para {rango_archivo[0]} a {rango_archivo[1]}")
+
+def _iterar_tabla(fecha_inicio: str, fecha_fin: str, columnas: str, ordenar: bool, tamano_pagina: int,
+                  progreso: Optional[Callable[[int, Optional[int]], None]]) -> Iterator[Dict]:
+    """Itera los registros de la tabla tiempos_descanso (sin el archivo histórico)"""
+    client = get_client()
+    desde = 0
+    total = None
+    procesados = 0
+    
+    while True:
+        query = client.table('tiempos_descanso').select(columnas, count='exact' if total is None else None)\
+            .gte('fecha', fecha_inicio)\
+            .lte('fecha', fecha_fin)
+        
+        if ordenar:
+            query = query.order('fecha', desc=True).order('inicio', desc=True)
+        
+        # Orden estable para que el paginado no repita ni salte filas
+        response = ejecutar(query.order('id').range(desde, desde + tamano_pagina - 1), 'reporte')
+        pagina = response.data or []
+        
+        if total is None:
+            total = getattr(response, 'count', None)
+        
+        for registro in pagina:
+            yield registro
+        
+        procesados += len(pagina)
+        if progreso:
+            progreso(procesados, total)
+        
+        if len(pagina) < tamano_pagina:
+            break
+        desde += tamano_pagina
+    
+    print(f"✅ Iterados {procesados} registros para el período {fecha_inicio} a {fecha_fin}")
+
+def huella_periodo(fecha_inicio: str, fecha_fin: str) -> str:
+    """
+    Huella barata de los datos de un período, para saber si una exportación
+    cacheada sigue vigente (un descanso que cruza la medianoche se inserta
+    después en el día anterior; un registro nuevo cambia la cantidad y el ID
+    máximo)
+    
+    Args:
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        
+    Returns:
+        str: 'cantidad:id_maximo:archivados'
+        
+    Raises:
+        Exception: Si la consulta falla
+    """
+    rango_archivo, rango_tabla = archivo_historico.dividir_rango(fecha_inicio, fecha_fin)
+    
+    cantidad, id_maximo = 0, None
+    if rango_tabla:
+        response = ejecutar(get_client().table('tiempos_descanso').select('id', count='exact')
+                            .gte('fecha', rango_tabla[0]).lte('fecha', rango_tabla[1])
+                            .order('id', desc=True).limit(1), 'reporte')
+        cantidad = getattr(response, 'count', None) or 0
+        id_maximo = response.data[0]['id'] if response.data else None
+    
+    archivados = archivo_historico.contar_registros(*rango_archivo) if rango_archivo else 0
+    return f"{cantidad}:{id_maximo}:{archivados}"
+
+def recalcular_tipos_periodo(fecha_inicio: str, fecha_fin: str, aplicar: bool = False,
+                             tamano_lote: int = 500) -> Dict[str, Any]:
+    """
+    Reclasifica en bloque los registros históricos con la política vigente
+    
+    El tipo (DESCANSO/COMIDA) se guarda al cerrar el descanso; si RR.HH. cambia
+    el umbral, este proceso lo recalcula a partir de duracion_minutos y del turno
+    de cada usuario. Los excesos y estados de los reportes no se guardan, así que
+    se recalculan solos al generar el reporte.
+    
+    Args:
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        aplicar: Si False solo informa los cambios (simulación)
+        tamano_lote: Cantidad de IDs por UPDATE
+        
+    Returns:
+        Dict con revisados, cambios por tipo nuevo y actualizados
+    """
+    def tipo_por_registro(r: Dict) -> str:
+        turno = (r.get('usuarios') or {}).get('turno')
+        return obtener_politica(turno).tipo_por_duracion(r.get('duracion_minutos') or 0)
+    
+    revisados = 0
+    cambios: Dict[str, List[int]] = {'DESCANSO': [], 'COMIDA': []}
+    copias: Dict[str, List[int]] = {'DESCANSO': [], 'COMIDA': []}
+    rango_archivo, _ = archivo_historico.dividir_rango(fecha_inicio, fecha_fin)
+    
+    # Se recorre todo el rango: si el archivado no purgó la tabla, las filas de
+    # los meses archivados siguen ahí y deben quedar iguales al archivo
+    # (se actualizan, pero ya se cuentan en el resultado del archivo)
+    for r in _iterar_tabla(fecha_inicio, fecha_fin, 'id, fecha, tipo, duracion_minutos, usuarios(turno)',
+                           False, 1000, None):
+        en_archivo = rango_archivo is not None and r['fecha'] <= rango_archivo[1]
+        if not en_archivo:
+            revisados += 1
+        tipo_nuevo = tipo_por_registro(r)
+        if tipo_nuevo != r.get('tipo'):
+            (copias if en_archivo else cambios)[tipo_nuevo].append(r['id'])
+    
+    actualizados = 0
+    if aplicar:
+        admin_client = get_admin_client()
+        for tipo_nuevo in cambios:
+            ids = cambios[tipo_nuevo] + copias[tipo_nuevo]
+            for i in range(0, len(ids), tamano_lote):
+                lote = ids[i:i + tamano_lote]
+                # Fijar un valor es idempotente: el lote se puede reintentar
+                ejecutar(admin_client.table('tiempos_descanso').update({'tipo': tipo_nuevo}).in_('id', lote),
+                         'reporte', idempotente=True)
+            actualizados += len(cambios[tipo_nuevo])
+    
+    # Meses archivados: se reescriben sus archivos
+    archivado = archivo_historico.reclasificar(*rango_archivo, tipo_por_registro, aplicar=aplicar) \
+        if rango_archivo else {'revisados': 0, 'a_descanso': 0, 'a_comida': 0, 'actualizados': 0}
+    
+    print(f"📐 Reclasificación {fecha_inicio} a {fecha_fin}: {revisados + archivado['revisados']} revisados, "
+          f"{sum(len(ids) for ids in cambios.values()) + archivado['a_descanso'] + archivado['a_comida']} con cambio, "
+          f"{actualizados + archivado['actualizados']} actualizados")
+    
+    return {
+        'version_politicas': version_politicas(),
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'revisados': revisados + archivado['revisados'],
+        'a_descanso': len(cambios['DESCANSO']) + archivado['a_descanso'],
+        'a_comida': len(cambios['COMIDA']) + archivado['a_comida'],
+        'actualizados': actualizados + archivado['actualizados'],
+        'simulacion': not aplicar
+    }
+
+_archivado_lock = threading.Lock()
+
+def archivar_historial(aplicar: bool = False, hoy: Optional[date] = None, tamano_lote: int = 500) -> Dict[str, Any]:
+    """
+    Copia los meses cerrados de tiempos_descanso al archivo histórico
+    
+    Se archivan los meses anteriores a archivo_historico.limite_archivable()
+    (el mes actual y ARCHIVE_HOT_MONTHS anteriores quedan solo en la tabla), del
+    más antiguo al más reciente para que los meses archivados sean contiguos.
+    Por cada mes: se leen sus registros, se escribe y verifica el archivo y se
+    registra en el manifiesto (desde ese momento las consultas del mes van al
+    archivo). Las filas quedan en la tabla y un mes ya copiado no se vuelve a
+    leer.
+    
+    Solo con ARCHIVE_PURGE=true (y ARCHIVE_DIR persistente) se borran además de
+    la tabla por lotes de IDs, y recién después de verificar el archivo. Si el
+    borrado falla, el mes queda pendiente de purga y se reintenta en la
+    siguiente ejecución.
+    
+    Args:
+        aplicar: Si False solo informa qué se copiaría (simulación)
+        hoy: Fecha de referencia (por defecto hoy)
+        tamano_lote: Cantidad de IDs por DELETE
+        
+    Returns:
+        Dict con limite, meses (mes, registros, en_archivo), purga y movidos
+        (registros borrados de la tabla)
+        
+    Raises:
+        RuntimeError: Si falta pyarrow, la purga está habilitada y ARCHIVE_DIR
+            no es persistente (al aplicar) o ya hay un archivado en curso
+    """
+    if not archivo_historico.PYARROW_DISPONIBLE:
+        raise RuntimeError("Archivo histórico no disponible: instalar pyarrow")
+    purgar = archivo_historico.ARCHIVO_PURGAR
+    if aplicar and purgar:
+        # Un mes purgado ya no está en la BD: sin disco persistente se perdería
+        motivo = archivo_historico.verificar_persistencia()
+        if motivo:
+            raise RuntimeError(f"Archivado rechazado: {motivo}")
+    if not _archivado_lock.acquire(blocking=False):
+        raise RuntimeError("Ya hay un archivado en curso")
+    
+    try:
+        limite = archivo_historico.limite_archivable(hoy)
+        respuesta = ejecutar(get_client().table('tiempos_descanso').select('fecha')
+                             .lt('fecha', limite.isoformat()).order('fecha').limit(1), 'reporte')
+        mas_antiguo = date.fromisoformat(respuesta.data[0]['fecha']) if respuesta.data else None
+        corte = archivo_historico.corte()
+        
+        # Desde el corte (meses nuevos), o antes si quedan meses sin copiar o sin purgar
+        candidatos = [d for d in (mas_antiguo, corte) if d is not None]
+        meses = archivo_historico.meses_entre(min(candidatos), limite - timedelta(days=1)) if candidatos else []
+        
+        resumen = []
+        movidos = 0
+        for mes in meses:
+            archivado = archivo_historico.meses_archivados().get(mes)
+            if archivado and not purgar:
+                # Ya copiado; sus filas se conservan en la tabla
+                continue
+            inicio_mes, fin_mes = archivo_historico.limites_mes(mes)
+            registros = list(_iterar_tabla(inicio_mes.isoformat(), fin_mes.isoformat(),
+                                           '*, usuarios(nombre, codigo, turno)', False, 1000, None))
+            if not registros and archivado and archivado.get('purgado'):
+                continue
+            
+            detalle = {'mes': mes, 'registros': len(registros)}
+            if aplicar:
+                detalle['en_archivo'] = archivo_historico.archivar_mes(mes, registros)['registros']
+            if aplicar and purgar:
+                ids = [r['id'] for r in registros]
+                admin_client = get_admin_client()
+                for i in range(0, len(ids), tamano_lote):
+                    # Borrar por IDs ya archivados es idempotente: el lote se puede reintentar
+                    ejecutar(admin_client.table('tiempos_descanso').delete().in_('id', ids[i:i + tamano_lote]),
+                             'reporte', idempotente=True)
+                archivo_historico.marcar_purgado(mes)
+                movidos += len(ids)
+            resumen.append(detalle)
+        
+        print(f"🗄️ Archivado {'aplicado' if aplicar else 'simulado'} hasta {limite}: "
+              f"{len(resumen)} meses, {sum(d['registros'] for d in resumen)} registros, "
+              f"{movidos} borrados de la tabla")
+        
+        return {
+            'limite': limite.isoformat(),
+            'meses': resumen,
+            'purga': purgar,
+            'movidos': movidos,
+            'simulacion': not aplicar
+        }
+    finally:
+        _archivado_lock.release()
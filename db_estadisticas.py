@@ -0,0 +1,139 @@
+"""
+Módulo de Estadísticas de Tablas
+================================
+
+Conteos de filas para /status y las rutas de debug sin descargar las tablas.
+
+Cada conteo es una consulta que trae como máximo una fila y pide a PostgREST
+el total en la cabecera Content-Range (count='exact' o 'planned'). La tabla
+histórica (tiempos_descanso) usa por defecto el conteo 'planned' (estimación
+del planificador de Postgres, O(1)); las tablas chicas usan 'exact'.
+
+El resultado se guarda en memoria ESTADISTICAS_TTL_SEGUNDOS, así que un monitor
+de disponibilidad que consulta /status cada pocos segundos no genera consultas
+adicionales.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from db_core import get_client
+from db_resiliencia import consultas_paralelas
+from time_utils import get_current_time
+
+# Configuración
+ESTADISTICAS_TTL_SEGUNDOS = int(os.getenv('ESTADISTICAS_TTL_SEGUNDOS', '60'))
+CONTEO_HISTORICO = os.getenv('ESTADISTICAS_CONTEO_HISTORICO', 'planned')
+
+# Método de conteo por tabla
+METODOS_CONTEO = {
+    'usuarios': 'exact',
+    'descansos': 'exact',
+    'tiempos_descanso': CONTEO_HISTORICO,
+    'administradores': 'exact'
+}
+
+# Filas de muestra incluidas en el resumen
+MUESTRA_USUARIOS = 3
+MUESTRA_DESCANSOS = 10
+
+_lock = threading.Lock()
+_cache: Optional[Dict[str, Any]] = None
+_cache_momento = 0.0
+
+def consulta_conteo(tabla: str, metodo: Optional[str] = None, cliente=None):
+    """
+    Construye la consulta de conteo de una tabla (sin ejecutarla)
+
+    Args:
+        tabla: Nombre de la tabla
+        metodo: 'exact', 'planned' o 'estimated' (por defecto el de METODOS_CONTEO)
+        cliente: Cliente a usar (por defecto el público)
+
+    Returns:
+        Consulta de postgrest; el total queda en response.count
+    """
+    metodo = metodo or METODOS_CONTEO.get(tabla, 'exact')
+    return (cliente or get_client()).table(tabla).select('id', count=metodo).limit(1)
+
+def contar_filas(tabla: str, metodo: Optional[str] = None) -> Optional[int]:
+    """
+    Cuenta las filas de una tabla sin traerlas
+
+    Args:
+        tabla: Nombre de la tabla
+        metodo: 'exact', 'planned' o 'estimated'
+
+    Returns:
+        int con el total, o None si la consulta falló
+    """
+    try:
+        return consultas_paralelas({tabla: consulta_conteo(tabla, metodo)})[tabla].count
+    except Exception as e:
+        print(f"❌ Error contando filas de {tabla}: {e}")
+        return None
+
+def _calcular_estadisticas() -> Dict[str, Any]:
+    client = get_client()
+    consultas = {tabla: consulta_conteo(tabla, cliente=client) for tabla in METODOS_CONTEO}
+    consultas['muestra_usuarios'] = client.table('usuarios').select('*').limit(MUESTRA_USUARIOS)
+    consultas['muestra_descansos'] = client.table('descansos').select('*').limit(MUESTRA_DESCANSOS)
+
+    respuestas = consultas_paralelas(consultas, capturar_errores=True)
+
+    conteos = {}
+    errores = {}
+    for tabla in METODOS_CONTEO:
+        respuesta = respuestas[tabla]
+        if isinstance(respuesta, Exception):
+            conteos[tabla] = None
+            errores[tabla] = str(respuesta)
+        else:
+            conteos[tabla] = respuesta.count
+
+    def _muestra(nombre):
+        respuesta = respuestas[nombre]
+        return [] if isinstance(respuesta, Exception) else (respuesta.data or [])
+
+    return {
+        'tablas': conteos,
+        'metodos': dict(METODOS_CONTEO),
+        'errores': errores,
+        'usuarios_muestra': _muestra('muestra_usuarios'),
+        'descansos_activos_muestra': _muestra('muestra_descansos'),
+        'calculado': get_current_time().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def estadisticas_tablas(forzar: bool = False) -> Dict[str, Any]:
+    """
+    Conteos de filas por tabla y muestras, con caché en memoria
+
+    Args:
+        forzar: Si True recalcula aunque la caché esté vigente
+
+    Returns:
+        Dict con 'tablas' (conteos), 'metodos', 'errores', muestras,
+        'calculado' y 'edad_segundos'
+    """
+    global _cache, _cache_momento
+
+    if forzar or _cache is None or time.monotonic() - _cache_momento > ESTADISTICAS_TTL_SEGUNDOS:
+        with _lock:
+            # Otro hilo pudo recalcularlas mientras se esperaba el lock
+            if forzar or _cache is None or time.monotonic() - _cache_momento > ESTADISTICAS_TTL_SEGUNDOS:
+                estadisticas = _calcular_estadisticas()
+                # Si todos los conteos fallaron se conserva el último resultado bueno
+                if _cache is None or any(n is not None for n in estadisticas['tablas'].values()):
+                    _cache = estadisticas
+                _cache_momento = time.monotonic()
+
+    resultado = dict(_cache)
+    resultado['edad_segundos'] = round(time.monotonic() - _cache_momento, 1)
+    return resultado
+
+def invalidar_estadisticas():
+    """Descarta la caché de estadísticas"""
+    global _cache
+    _cache = None
@@ -0,0 +1,393 @@
+"""
+Resiliencia de las Llamadas a Supabase
+======================================
+
+Capa alrededor de execute() para que un Supabase lento o caído no bloquee los
+workers ni se confunda con "Usuario no encontrado":
+
+- Plazos por clase de operación (kiosco, lectura, escritura, reporte): el plazo
+  cubre todos los intentos y se aplica como timeout HTTP de cada intento.
+- Reintentos con jitter solo para lecturas idempotentes; las escrituras nunca
+  se reintentan (un insert que llegó pero cuya respuesta se perdió no debe
+  duplicarse).
+- Circuit breaker: tras DB_BREAKER_FALLOS fallas de infraestructura seguidas
+  el circuito se abre y las llamadas fallan al instante durante
+  DB_BREAKER_ESPERA segundos; después se deja pasar una llamada de prueba.
+  Mientras está abierto, los módulos db_* responden desde las cachés locales
+  (directorio de usuarios y snapshot de descansos activos).
+- limite_latencia(): techo de latencia para un bloque completo (la petición del
+  kiosco), que recorta el plazo de cada llamada hecha dentro.
+- consultas_paralelas(): lanza lecturas independientes de una misma página en
+  un pool de hilos, de modo que la latencia es la de la consulta más lenta y no
+  la suma de todas.
+
+Solo cuentan como fallas los errores de infraestructura (timeouts, errores de
+red, respuestas 5xx); un error de PostgREST por datos inválidos se propaga sin
+abrir el circuito.
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+
+from db_core import timeout_llamada
+
+# Plazo total por clase de operación (segundos)
+PLAZOS = {
+    'kiosco': float(os.getenv('DB_DEADLINE_KIOSCO', '2')),
+    'lectura': float(os.getenv('DB_DEADLINE_LECTURA', '5')),
+    'escritura': float(os.getenv('DB_DEADLINE_ESCRITURA', '5')),
+    'reporte': float(os.getenv('DB_DEADLINE_REPORTE', '30'))
+}
+
+# Clases cuyas operaciones son lecturas idempotentes (se pueden reintentar)
+CLASES_IDEMPOTENTES = ('kiosco', 'lectura', 'reporte')
+
+REINTENTOS = int(os.getenv('DB_REINTENTOS', '2'))
+ESPERA_BASE_REINTENTO = 0.1
+ESPERA_MAX_REINTENTO = 1.0
+
+BREAKER_FALLOS = int(os.getenv('DB_BREAKER_FALLOS', '5'))
+BREAKER_ESPERA = float(os.getenv('DB_BREAKER_ESPERA', '30'))
+
+# Techo de latencia de una petición del kiosco (segundos)
+LATENCIA_MAX_KIOSCO = float(os.getenv('KIOSCO_LATENCIA_MAX', '3'))
+
+# Hilos para consultas en paralelo (por worker)
+PARALELO_MAX = int(os.getenv('DB_PARALELO_MAX', '8'))
+
+# Tiempo mínimo que vale la pena darle a un intento
+PLAZO_MINIMO = 0.05
+
+ERRORES_INFRAESTRUCTURA = (httpx.TransportError, httpx.HTTPStatusError)
+
+class ServicioNoDisponible(Exception):
+    """Supabase no está disponible: circuito abierto o plazo agotado"""
+
+class _CircuitBreaker:
+    """Circuito cerrado -> abierto tras N fallas -> semiabierto tras la espera"""
+
+    def __init__(self, fallos_maximos: int, espera: float):
+        self.fallos_maximos = fallos_maximos
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._estado = 'cerrado'
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._aperturas = 0
+        self._rechazadas = 0
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._estado == 'cerrado':
+                return True
+            if self._estado == 'abierto' and time.monotonic() - self._abierto_desde >= self.espera:
+                self._estado = 'semiabierto'
+            if self._estado == 'semiabierto' and not self._prueba_en_curso:
+                # Una sola llamada de prueba a la vez
+                self._prueba_en_curso = True
+                return True
+            self._rechazadas += 1
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._estado != 'cerrado':
+                print("✅ Circuito de Supabase cerrado: el servicio respondió")
+            self._estado = 'cerrado'
+            self._fallos = 0
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba_en_curso = False
+            if self._estado == 'semiabierto' or (self._estado == 'cerrado' and self._fallos >= self.fallos_maximos):
+                self._estado = 'abierto'
+                self._abierto_desde = time.monotonic()
+                self._aperturas += 1
+                print(f"🚫 Circuito de Supabase abierto tras {self._fallos} fallas; "
+                      f"se usarán las cachés locales por {self.espera:.0f}s")
+
+    def liberar_prueba(self):
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def estado(self) -> Dict:
+        with self._lock:
+            restante = 0.0
+            if self._estado == 'abierto':
+                restante = max(0.0, self.espera - (time.monotonic() - self._abierto_desde))
+            return {
+                'estado': self._estado,
+                'fallos_consecutivos': self._fallos,
+                'aperturas': self._aperturas,
+                'rechazadas': self._rechazadas,
+                'segundos_para_reintento': round(restante, 1),
+                'umbral_fallos': self.fallos_maximos,
+                'espera_segundos': self.espera
+            }
+
+_breaker = _CircuitBreaker(BREAKER_FALLOS, BREAKER_ESPERA)
+
+# Fin absoluto (time.monotonic) del bloque limite_latencia actual
+_fin_bloque: contextvars.ContextVar = contextvars.ContextVar('fin_bloque', default=None)
+
+# Estado mutable del bloque limite_latencia actual: {'degradado': bool}
+# (mutable para que las tareas asyncio hijas puedan marcarlo)
+_estado_bloque: contextvars.ContextVar = contextvars.ContextVar('estado_bloque', default=None)
+
+def _es_falla_infraestructura(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, ERRORES_INFRAESTRUCTURA)
+
+def _marcar_degradado():
+    estado = _estado_bloque.get()
+    if estado is not None:
+        estado['degradado'] = True
+
+def _plazo_final(clase: str) -> float:
+    fin = time.monotonic() + PLAZOS.get(clase, PLAZOS['lectura'])
+    fin_bloque = _fin_bloque.get()
+    if fin_bloque is not None:
+        fin = min(fin, fin_bloque)
+    return fin
+
+def _preparar_intento(clase: str, fin: float) -> float:
+    """Tiempo disponible para el intento; falla al instante si no hay plazo o el circuito está abierto"""
+    restante = fin - time.monotonic()
+    if restante < PLAZO_MINIMO:
+        _marcar_degradado()
+        raise ServicioNoDisponible(f"Plazo agotado para operación '{clase}'")
+
+    if not _breaker.permitir():
+        _marcar_degradado()
+        raise ServicioNoDisponible("Circuito abierto: Supabase no disponible")
+    return restante
+
+def _registrar_error(error: Exception, clase: str, intento: int, intentos: int, fin: float) -> float:
+    """Registra la falla y devuelve la espera antes del próximo intento (o propaga)"""
+    if not _es_falla_infraestructura(error):
+        # Error de datos (400/409...): el servicio respondió
+        _breaker.registrar_exito()
+        raise error
+
+    _breaker.registrar_fallo()
+    _marcar_degradado()
+    print(f"⚠️ Falla de Supabase en operación '{clase}' (intento {intento + 1}/{intentos}): "
+          f"{type(error).__name__}")
+    if intento + 1 >= intentos:
+        raise ServicioNoDisponible(str(error)) from error
+
+    # Backoff exponencial con jitter completo, sin pasar el plazo
+    espera = random.uniform(0, min(ESPERA_MAX_REINTENTO, ESPERA_BASE_REINTENTO * 2 ** intento))
+    return max(0.0, min(espera, fin - time.monotonic() - PLAZO_MINIMO))
+
+def ejecutar(consulta: Any, clase: str = 'lectura', idempotente: Optional[bool] = None) -> Any:
+    """
+    Ejecuta una consulta de postgrest con plazo, reintentos y circuit breaker
+
+    Ejemplo:
+        response = ejecutar(client.table('usuarios').select('*').eq('id', 5), 'kiosco')
+
+    Args:
+        consulta: Consulta construida (sin llamar a execute())
+        clase: 'kiosco', 'lectura', 'escritura' o 'reporte'
+        idempotente: Si se puede reintentar (por defecto, según la clase)
+
+    Returns:
+        La respuesta de execute()
+
+    Raises:
+        ServicioNoDisponible: Si el circuito está abierto o se agotó el plazo
+    """
+    if idempotente is None:
+        idempotente = clase in CLASES_IDEMPOTENTES
+
+    fin = _plazo_final(clase)
+    intentos = 1 + (REINTENTOS if idempotente else 0)
+    for intento in range(intentos):
+        restante = _preparar_intento(clase, fin)
+        try:
+            with timeout_llamada(restante):
+                respuesta = consulta.execute()
+        except Exception as e:
+            time.sleep(_registrar_error(e, clase, intento, intentos, fin))
+            continue
+        except BaseException:
+            _breaker.liberar_prueba()
+            raise
+
+        _breaker.registrar_exito()
+        return respuesta
+
+async def ejecutar_async(consulta: Any, clase: str = 'lectura', idempotente: Optional[bool] = None) -> Any:
+    """
+    Variante de ejecutar() para consultas del cliente asíncrono (ver db_async)
+
+    Comparte plazos, circuit breaker y techo de latencia con la versión síncrona.
+
+    Args:
+        consulta: Consulta asíncrona construida (sin llamar a execute())
+        clase: 'kiosco', 'lectura', 'escritura' o 'reporte'
+        idempotente: Si se puede reintentar (por defecto, según la clase)
+
+    Returns:
+        La respuesta de execute()
+
+    Raises:
+        ServicioNoDisponible: Si el circuito está abierto o se agotó el plazo
+    """
+    if idempotente is None:
+        idempotente = clase in CLASES_IDEMPOTENTES
+
+    fin = _plazo_final(clase)
+    intentos = 1 + (REINTENTOS if idempotente else 0)
+    for intento in range(intentos):
+        restante = _preparar_intento(clase, fin)
+        try:
+            with timeout_llamada(restante):
+                respuesta = await consulta.execute()
+        except Exception as e:
+            await asyncio.sleep(_registrar_error(e, clase, intento, intentos, fin))
+            continue
+        except BaseException:
+            # Incluye la cancelación de la tarea
+            _breaker.liberar_prueba()
+            raise
+
+        _breaker.registrar_exito()
+        return respuesta
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PARALELO_MAX, thread_name_prefix='consulta_db')
+    return _executor
+
+def consultas_paralelas(consultas: Dict[str, Any], clase: str = 'lectura',
+                        capturar_errores: bool = False) -> Dict[str, Any]:
+    """
+    Ejecuta consultas independientes en paralelo (cada una con ejecutar())
+
+    Ejemplo:
+        r = consultas_paralelas({
+            'usuarios': client.table('usuarios').select('*'),
+            'descansos': client.table('descansos').select('*')
+        })
+        r['usuarios'].data
+
+    Args:
+        consultas: Dict nombre -> consulta construida (sin llamar a execute())
+        clase: Clase de operación (plazo) de todas las consultas
+        capturar_errores: Si True, una consulta que falla deja su excepción como
+            resultado en vez de propagarla
+
+    Returns:
+        Dict nombre -> respuesta (o excepción si capturar_errores)
+    """
+    if len(consultas) <= 1:
+        resultados = {}
+        for nombre, consulta in consultas.items():
+            try:
+                resultados[nombre] = ejecutar(consulta, clase)
+            except Exception as e:
+                if not capturar_errores:
+                    raise
+                resultados[nombre] = e
+        return resultados
+
+    # Cada hilo recibe una copia del contexto: hereda el techo de latencia y el
+    # estado del bloque (limite_latencia / servicio_degradado)
+    executor = _get_executor()
+    futuros = {nombre: executor.submit(contextvars.copy_context().run, ejecutar, consulta, clase)
+               for nombre, consulta in consultas.items()}
+
+    resultados = {}
+    primer_error = None
+    for nombre, futuro in futuros.items():
+        try:
+            resultados[nombre] = futuro.result()
+        except Exception as e:
+            if capturar_errores:
+                resultados[nombre] = e
+            elif primer_error is None:
+                primer_error = e
+
+    if primer_error is not None:
+        raise primer_error
+    return resultados
+
+@contextmanager
+def limite_latencia(segundos: float = LATENCIA_MAX_KIOSCO) -> Iterator[None]:
+    """
+    Techo de latencia para todas las llamadas hechas dentro del bloque
+
+    Args:
+        segundos: Tiempo máximo total del bloque
+    """
+    token_fin = _fin_bloque.set(time.monotonic() + segundos)
+    token_estado = _estado_bloque.set({'degradado': False})
+    try:
+        yield
+    finally:
+        _fin_bloque.reset(token_fin)
+        _estado_bloque.reset(token_estado)
+
+def con_limite_latencia(segundos: float = LATENCIA_MAX_KIOSCO):
+    """Decorador: aplica limite_latencia() a toda la función (vistas del kiosco)"""
+    def decorador(f):
+        @wraps(f)
+        def envoltura(*args, **kwargs):
+            with limite_latencia(segundos):
+                return f(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def servicio_degradado() -> bool:
+    """
+    Indica si alguna llamada del bloque actual falló por infraestructura
+
+    Sirve para distinguir "no encontrado" de "no se pudo consultar".
+
+    Returns:
+        bool: True si hubo fallas, circuito abierto o plazo agotado
+    """
+    estado = _estado_bloque.get()
+    return bool(estado and estado['degradado'])
+
+def circuito_abierto() -> bool:
+    """
+    Returns:
+        bool: True si las llamadas están fallando al instante
+    """
+    return _breaker.estado()['estado'] == 'abierto'
+
+def estado_resiliencia() -> Dict:
+    """
+    Estado del circuit breaker y configuración de plazos
+
+    Returns:
+        Dict con estado del circuito, plazos, reintentos y techo del kiosco
+    """
+    estado = _breaker.estado()
+    estado['plazos'] = dict(PLAZOS)
+    estado['reintentos'] = REINTENTOS
+    estado['latencia_max_kiosco'] = LATENCIA_MAX_KIOSCO
+    return estado
@@ -5,9 +5,63 @@ Módulo de Gestión de Usuarios
 Maneja todas las operaciones relacionadas con usuarios en la base de datos.
 """
 
+import bisect
+import hashlib
+import os
+import threading
+import time
 import traceback
+import unicodedata
 from typing import Dict, List, Optional, Any, Tuple
 from db_core import get_client, get_admin_client
+from db_resiliencia import ejecutar, ServicioNoDisponible
+
+# Turnos permitidos por la restricción usuarios_turno_check
+TURNOS_VALIDOS = ('Full', 'Part Time', 'Llamado')
+
+# Directorio de usuarios en memoria (precargado al arrancar, se refresca al expirar)
+DIRECTORIO_TTL_SEGUNDOS = int(os.getenv('DIRECTORIO_TTL_SEGUNDOS', '300'))
+_directorio: Dict[Any, Dict] = {}
+_directorio_cargado: Optional[float] = None
+_directorio_lock = threading.Lock()
+
+# Filas por petición al cargar el directorio (el max-rows por defecto de
+# PostgREST es 1000: una consulta sin paginar trunca la tabla en silencio)
+TAMANO_PAGINA_DIRECTORIO = 1000
+
+# Listado paginado del directorio (pantalla Base de Datos)
+USUARIOS_POR_PAGINA = int(os.getenv('USUARIOS_POR_PAGINA', '50'))
+MAX_POR_PAGINA = 200
+
+# Índices de búsqueda, reconstruidos junto con el directorio:
+# - _ordenados: usuarios ordenados por nombre (el listado sin filtro es un slice)
+# - _claves_busqueda: lista ordenada de (clave, posición en _ordenados), con una
+#   clave por palabra del nombre, el código y la tarjeta; un prefijo se resuelve
+#   con bisect sin recorrer todos los usuarios
+_ordenados: List[Dict] = []
+_claves_busqueda: List[Tuple[str, int]] = []
+
+# Índices únicos por código (en mayúsculas) y por tarjeta. La pasada de tarjeta
+# toma la primera coincidencia, así que una tarjeta repetida es ambigua: se
+# rechaza al crear/editar y las ya existentes se reportan en _duplicados.
+# La restricción UNIQUE de la base de datos sigue siendo el árbitro final:
+#   ALTER TABLE usuarios ADD CONSTRAINT usuarios_codigo_key UNIQUE (codigo);
+#   ALTER TABLE usuarios ADD CONSTRAINT usuarios_tarjeta_key UNIQUE (tarjeta);
+_por_codigo: Dict[str, Dict] = {}
+_por_tarjeta: Dict[str, Dict] = {}
+_duplicados: Dict[str, Dict[str, List[Dict]]] = {'codigo': {}, 'tarjeta': {}}
+
+# Si la última carga trajo todas las filas de la tabla: sin eso un código o
+# tarjeta ausente del directorio no significa que esté libre
+_directorio_completo = False
+_total_tabla: Optional[int] = None
+
+# (directorio, hash) del último huella_directorio; el directorio se reemplaza
+# entero al cambiar, así que basta comparar la identidad
+_huella_cache: Tuple[Optional[Dict], str] = (None, '')
+
+class DirectorioIncompleto(Exception):
+    """El directorio en memoria no tiene todos los usuarios de la tabla"""
 
 def buscar_usuario_por_tarjeta(numero_tarjeta: str) -> Optional[Dict]:
     """
@@ -21,15 +75,20 @@ def buscar_usuario_por_tarjeta(numero_tarjeta: str) -> Optional[Dict]:
     """
     try:
         client = get_client()
-        response = client.table('usuarios').select('*').eq('tarjeta', numero_tarjeta).execute()
+        response = ejecutar(client.table('usuarios').select('*').eq('tarjeta', numero_tarjeta), 'kiosco')
         
         if response.data and len(response.data) > 0:
+            if len(response.data) > 1:
+                print(f"⚠️ Tarjeta {numero_tarjeta} asignada a {len(response.data)} usuarios; se usa {response.data[0]['nombre']}")
             print(f"✅ Usuario encontrado por tarjeta: {response.data[0]['nombre']}")
             return response.data[0]
         
         print(f"❌ No se encontró usuario con tarjeta: {numero_tarjeta}")
         return None
         
+    except ServicioNoDisponible as e:
+        print(f"⚠️ Supabase no disponible ({e}); buscando tarjeta en el directorio local")
+        return _buscar_en_directorio('tarjeta', numero_tarjeta)
     except Exception as e:
         print(f"❌ Error buscando usuario por tarjeta: {e}")
         traceback.print_exc()
@@ -47,7 +106,7 @@ def buscar_usuario_por_codigo(codigo_empleado: str) -> Optional[Dict]:
     """
     try:
         client = get_client()
-        response = client.table('usuarios').select('*').eq('codigo', codigo_empleado.upper()).execute()
+        response = ejecutar(client.table('usuarios').select('*').eq('codigo', codigo_empleado.upper()), 'kiosco')
         
         if response.data and len(response.data) > 0:
             print(f"✅ Usuario encontrado por código: {response.data[0]['nombre']}")
@@ -56,6 +115,9 @@ def buscar_usuario_por_codigo(codigo_empleado: str) -> Optional[Dict]:
         print(f"❌ No se encontró usuario con código: {codigo_empleado}")
         return None
         
+    except ServicioNoDisponible as e:
+        print(f"⚠️ Supabase no disponible ({e}); buscando código en el directorio local")
+        return _buscar_en_directorio('codigo', codigo_empleado.upper())
     except Exception as e:
         print(f"❌ Error buscando usuario por código: {e}")
         traceback.print_exc()
@@ -95,7 +157,7 @@ def obtener_todos_los_usuarios() -> List[Dict]:
     """
     try:
         client = get_client()
-        response = client.table('usuarios').select('*').order('nombre').execute()
+        response = ejecutar(client.table('usuarios').select('*').order('nombre'))
         
         if response.data:
             print(f"✅ Obtenidos {len(response.data)} usuarios")
@@ -104,6 +166,9 @@ def obtener_todos_los_usuarios() -> List[Dict]:
         print("ℹ️ No hay usuarios registrados")
         return []
         
+    except ServicioNoDisponible as e:
+        print(f"⚠️ Supabase no disponible ({e}); usando el directorio local")
+        return sorted(_directorio.values(), key=lambda u: u.get('nombre') or '')
     except Exception as e:
         print(f"❌ Error obteniendo usuarios: {e}")
         traceback.print_exc()
@@ -121,13 +186,16 @@ def obtener_usuario_por_id(usuario_id: str) -> Optional[Dict]:
     """
     try:
         client = get_client()
-        response = client.table('usuarios').select('*').eq('id', usuario_id).execute()
+        response = ejecutar(client.table('usuarios').select('*').eq('id', usuario_id))
         
         if response.data and len(response.data) > 0:
             return response.data[0]
         
         return None
         
+    except ServicioNoDisponible as e:
+        print(f"⚠️ Supabase no disponible ({e}); usando el directorio local")
+        return _directorio.get(usuario_id)
     except Exception as e:
         print(f"❌ Error obteniendo usuario por ID: {e}")
         traceback.print_exc()
@@ -143,19 +211,24 @@ def crear_usuario(datos_usuario: Dict) -> Tuple[bool, str]:
     Returns:
         Tupla (éxito, mensaje)
     """
+    duplicado = verificar_unicidad(datos_usuario.get('codigo'), datos_usuario.get('tarjeta'))
+    if duplicado:
+        return False, duplicado
+    
     try:
         admin_client = get_admin_client()
-        response = admin_client.table('usuarios').insert(datos_usuario).execute()
+        response = ejecutar(admin_client.table('usuarios').insert(datos_usuario), 'escritura')
         
         if response.data:
             print(f"✅ Usuario creado: {datos_usuario.get('nombre', 'N/A')}")
+            registrar_usuario_en_directorio(response.data[0])
             return True, "Usuario creado exitosamente"
         
         return False, "Error al crear usuario"
         
     except Exception as e:
         print(f"❌ Error creando usuario: {e}")
-        return False, f"Error: {str(e)}"
+        return False, mensaje_violacion_unicidad(e) or f"Error: {str(e)}"
 
 def actualizar_usuario(usuario_id: str, datos_actualizados: Dict) -> Tuple[bool, str]:
     """
@@ -168,19 +241,24 @@ def actualizar_usuario(usuario_id: str, datos_actualizados: Dict) -> Tuple[bool,
     Returns:
         Tupla (éxito, mensaje)
     """
+    duplicado = verificar_unicidad(datos_actualizados.get('codigo'), datos_actualizados.get('tarjeta'), usuario_id)
+    if duplicado:
+        return False, duplicado
+    
     try:
         admin_client = get_admin_client()
-        response = admin_client.table('usuarios').update(datos_actualizados).eq('id', usuario_id).execute()
+        response = ejecutar(admin_client.table('usuarios').update(datos_actualizados).eq('id', usuario_id), 'escritura')
         
         if response.data:
             print(f"✅ Usuario actualizado: ID {usuario_id}")
+            registrar_usuario_en_directorio(response.data[0])
             return True, "Usuario actualizado exitosamente"
         
         return False, "Error al actualizar usuario"
         
     except Exception as e:
         print(f"❌ Error actualizando usuario: {e}")
-        return False, f"Error: {str(e)}"
+        return False, mensaje_violacion_unicidad(e) or f"Error: {str(e)}"
 
 def eliminar_usuario(usuario_id: str) -> Tuple[bool, str]:
     """
@@ -194,11 +272,451 @@ def eliminar_usuario(usuario_id: str) -> Tuple[bool, str]:
     """
     try:
         admin_client = get_admin_client()
-        response = admin_client.table('usuarios').delete().eq('id', usuario_id).execute()
+        response = ejecutar(admin_client.table('usuarios').delete().eq('id', usuario_id), 'escritura')
         
         print(f"✅ Usuario eliminado: ID {usuario_id}")
+        quitar_usuario_del_directorio(usuario_id)
         return True, "Usuario eliminado exitosamente"
         
     except Exception as e:
         print(f"❌ Error eliminando usuario: {e}")
-        return False, f"Error: {str(e)}"
\ No newline at end of file
+        return False, f"Error: {str(e)}"
+
+def precargar_directorio_usuarios() -> int:
+    """
+    Carga todos los usuarios en el directorio en memoria
+    
+    Returns:
+        int: Cantidad de usuarios cargados, o -1 si la consulta falló
+    """
+    try:
+        client = get_client()
+        usuarios = []
+        total = None
+        
+        while True:
+            # Orden estable por id para que el paginado no repita ni salte filas
+            query = client.table('usuarios').select('*', count='exact' if total is None else None)
+            response = ejecutar(query.order('id').range(len(usuarios), len(usuarios) + TAMANO_PAGINA_DIRECTORIO - 1))
+            pagina = response.data or []
+            if total is None:
+                total = getattr(response, 'count', None)
+            usuarios.extend(pagina)
+            if pagina_final_directorio(pagina, len(usuarios), total):
+                break
+        
+        return guardar_directorio_usuarios(usuarios, total)
+        
+    except Exception as e:
+        print(f"❌ Error precargando directorio de usuarios: {e}")
+        return -1
+
+def pagina_final_directorio(pagina: List[Dict], cargados: int, total: Optional[int]) -> bool:
+    """
+    Indica si la carga paginada del directorio terminó (compartido con db_async)
+    
+    Con el conteo exacto se sigue hasta cubrirlo, aunque el servidor devuelva
+    páginas más cortas que TAMANO_PAGINA_DIRECTORIO por su propio max-rows.
+    
+    Args:
+        pagina: Filas de la última página
+        cargados: Filas acumuladas hasta ahora
+        total: Conteo exacto de la tabla (None si no vino)
+        
+    Returns:
+        bool: True si no hay más páginas
+    """
+    if not pagina:
+        return True
+    if total is not None:
+        return cargados >= total
+    return len(pagina) < TAMANO_PAGINA_DIRECTORIO
+
+def guardar_directorio_usuarios(usuarios: List[Dict], total: Optional[int] = None) -> int:
+    """
+    Reemplaza el directorio en memoria (lo usa también la carga asíncrona de db_async)
+    
+    Args:
+        usuarios: Lista completa de usuarios
+        total: Conteo exacto de la tabla, si se obtuvo
+        
+    Returns:
+        int: Cantidad de usuarios cargados
+    """
+    global _directorio_completo, _total_tabla
+    completo = total is None or len(usuarios) >= total
+    with _directorio_lock:
+        _indexar_directorio(usuarios, time.monotonic())
+        _directorio_completo = completo
+        _total_tabla = total
+    
+    print(f"📇 Directorio de usuarios precargado: {len(usuarios)} usuarios")
+    if not completo:
+        print(f"⚠️ Directorio incompleto: {len(usuarios)} de {total} usuarios; "
+              "la unicidad se verificará contra la base de datos")
+    duplicados = _duplicados
+    for campo, descripcion in (('codigo', 'Código {} repetido'), ('tarjeta', 'Tarjeta {} repetida')):
+        for valor, usuarios_repetidos in duplicados[campo].items():
+            nombres = ', '.join(u.get('nombre', '?') for u in usuarios_repetidos)
+            print(f"⚠️ {descripcion.format(valor)} en {len(usuarios_repetidos)} usuarios: {nombres}")
+    return len(usuarios)
+
+def _indexar_directorio(usuarios: List[Dict], cargado: Optional[float]):
+    """Reemplaza el directorio y todos sus índices (llamar con _directorio_lock tomado)"""
+    global _directorio, _directorio_cargado, _ordenados, _claves_busqueda, _por_codigo, _por_tarjeta, _duplicados
+    
+    ordenados = sorted(usuarios, key=lambda u: normalizar_busqueda(u.get('nombre')))
+    claves = []
+    for posicion, usuario in enumerate(ordenados):
+        for palabra in set(normalizar_busqueda(usuario.get('nombre')).split()):
+            claves.append((palabra, posicion))
+        for campo in ('codigo', 'tarjeta'):
+            if usuario.get(campo):
+                claves.append((normalizar_busqueda(usuario[campo]), posicion))
+    claves.sort()
+    
+    unicos = {'codigo': {}, 'tarjeta': {}}
+    duplicados = {'codigo': {}, 'tarjeta': {}}
+    for usuario in usuarios:
+        for campo, clave in (('codigo', _clave_codigo(usuario.get('codigo'))), ('tarjeta', _clave_tarjeta(usuario.get('tarjeta')))):
+            if not clave:
+                continue
+            if clave in unicos[campo]:
+                duplicados[campo].setdefault(clave, [unicos[campo][clave]]).append(usuario)
+            else:
+                unicos[campo][clave] = usuario
+    
+    _directorio = {u['id']: u for u in usuarios}
+    _ordenados = ordenados
+    _claves_busqueda = claves
+    _por_codigo = unicos['codigo']
+    _por_tarjeta = unicos['tarjeta']
+    _duplicados = duplicados
+    _directorio_cargado = cargado
+
+def _clave_codigo(codigo: Any) -> str:
+    return str(codigo or '').strip().upper()
+
+def _clave_tarjeta(tarjeta: Any) -> str:
+    return str(tarjeta or '').strip()
+
+def registrar_usuario_en_directorio(usuario: Dict):
+    """
+    Agrega o reemplaza un usuario en el directorio tras crearlo o editarlo,
+    sin recargar la tabla (conserva el momento de carga, así que el TTL sigue
+    trayendo los cambios hechos desde otros workers)
+    
+    Args:
+        usuario: Fila devuelta por el insert/update (con 'id')
+    """
+    with _directorio_lock:
+        if _directorio_cargado is None:
+            return
+        usuarios = dict(_directorio)
+        usuarios[usuario['id']] = usuario
+        _indexar_directorio(list(usuarios.values()), _directorio_cargado)
+
+def quitar_usuario_del_directorio(usuario_id: Any):
+    """
+    Quita un usuario eliminado del directorio sin recargar la tabla
+    
+    Args:
+        usuario_id: ID del usuario (acepta el ID como texto, tal como llega de un formulario)
+    """
+    with _directorio_lock:
+        if _directorio_cargado is None:
+            return
+        usuarios = [u for u in _directorio.values() if str(u['id']) != str(usuario_id)]
+        _indexar_directorio(usuarios, _directorio_cargado)
+
+def verificar_unicidad(codigo: str, tarjeta: str, usuario_id: Any = None) -> Optional[str]:
+    """
+    Revisa en memoria que el código y la tarjeta no pertenezcan a otro usuario
+    
+    Args:
+        codigo: Código del usuario a crear/editar
+        tarjeta: Número de tarjeta
+        usuario_id: ID del usuario que se edita (None al crear)
+        
+    Returns:
+        Mensaje de error para mostrar, o None si ambos están libres
+    """
+    if not directorio_vigente():
+        precargar_directorio_usuarios()
+    if not _directorio_completo:
+        return _verificar_unicidad_en_bd(codigo, tarjeta, usuario_id)
+    
+    for campo, titular in (('código', _por_codigo.get(_clave_codigo(codigo))),
+                           ('tarjeta', _por_tarjeta.get(_clave_tarjeta(tarjeta)))):
+        if titular and (usuario_id is None or str(titular['id']) != str(usuario_id)):
+            valor = codigo if campo == 'código' else tarjeta
+            return f"Ya existe un usuario con {campo} {valor}: {titular.get('nombre')} ({titular.get('codigo')})"
+    return None
+
+def _verificar_unicidad_en_bd(codigo: str, tarjeta: str, usuario_id: Any = None) -> Optional[str]:
+    """verificar_unicidad contra la tabla, cuando el directorio no está completo"""
+    print(f"⚠️ Directorio incompleto ({len(_directorio)} de {_total_tabla} usuarios); "
+          f"verificando código {codigo} y tarjeta {tarjeta} en la base de datos")
+    try:
+        client = get_client()
+        for campo, columna, valor in (('código', 'codigo', _clave_codigo(codigo)), ('tarjeta', 'tarjeta', _clave_tarjeta(tarjeta))):
+            if not valor:
+                continue
+            response = ejecutar(client.table('usuarios').select('id, nombre, codigo').eq(columna, valor))
+            for titular in response.data or []:
+                if usuario_id is None or str(titular['id']) != str(usuario_id):
+                    return f"Ya existe un usuario con {campo} {valor}: {titular.get('nombre')} ({titular.get('codigo')})"
+        return None
+    except Exception as e:
+        print(f"❌ Error verificando unicidad en la base de datos: {e}")
+        return "No se pudo verificar que el código y la tarjeta estén libres; intente nuevamente"
+
+def mensaje_violacion_unicidad(error: Exception) -> Optional[str]:
+    """
+    Traduce un rechazo de la restricción UNIQUE de la base de datos (caso en que
+    el directorio de este worker estaba desactualizado)
+    
+    Args:
+        error: Excepción del insert/update
+        
+    Returns:
+        Mensaje para mostrar, o None si el error no es de unicidad
+    """
+    texto = str(error)
+    if '23505' not in texto and 'duplicate key' not in texto:
+        return None
+    invalidar_directorio_usuarios()
+    campo = 'esa tarjeta' if 'tarjeta' in texto else 'ese código' if 'codigo' in texto else 'ese código o tarjeta'
+    return f"Ya existe otro usuario con {campo} (registrado recientemente)"
+
+def directorio_vigente() -> bool:
+    """
+    Returns:
+        bool: True si el directorio está cargado y no expiró
+    """
+    return _directorio_cargado is not None and time.monotonic() - _directorio_cargado <= DIRECTORIO_TTL_SEGUNDOS
+
+def obtener_usuario_directorio(usuario_id: Any) -> Optional[Dict]:
+    """
+    Busca un usuario por ID en el directorio en memoria
+    
+    Si el directorio expiró se recarga con una sola consulta; si la recarga
+    falla se siguen usando los datos anteriores.
+    
+    Args:
+        usuario_id: ID del usuario
+        
+    Returns:
+        Dict con datos del usuario o None si no está en el directorio
+    """
+    if not directorio_vigente():
+        precargar_directorio_usuarios()
+    return _directorio.get(usuario_id)
+
+def obtener_directorio_usuarios() -> Dict[Any, Dict]:
+    """
+    Instantánea del directorio en memoria {id: usuario}, para resolver muchos
+    usuarios con una sola recarga como máximo (si la recarga falla se usan los
+    datos anteriores)
+    
+    Returns:
+        Dict de solo lectura: se reemplaza entero al recargar o modificar el directorio
+    """
+    if not directorio_vigente():
+        precargar_directorio_usuarios()
+    return _directorio
+
+def huella_directorio() -> str:
+    """
+    Hash de los datos de usuario que aparecen en los reportes (nombre, código y
+    turno): cambia con un renombre o una reasignación de turno
+    
+    Returns:
+        str: SHA-256 (hex) del directorio vigente
+    """
+    global _huella_cache
+    directorio = obtener_directorio_usuarios()
+    if _huella_cache[0] is not directorio:
+        sha = hashlib.sha256()
+        for usuario_id in sorted(directorio, key=str):
+            u = directorio[usuario_id]
+            sha.update(f"{usuario_id}|{u.get('nombre')}|{u.get('codigo')}|{u.get('turno')}\n".encode('utf-8'))
+        _huella_cache = (directorio, sha.hexdigest())
+    return _huella_cache[1]
+
+def buscar_usuario_en_directorio(campo: str, valor: Any) -> Optional[Dict]:
+    """
+    Busca un usuario por un campo (nombre, código, tarjeta) en el directorio en memoria
+    
+    Args:
+        campo: Nombre de la columna
+        valor: Valor buscado
+        
+    Returns:
+        Dict con datos del usuario o None si no está en el directorio
+    """
+    if not directorio_vigente():
+        precargar_directorio_usuarios()
+    return _buscar_en_directorio(campo, valor)
+
+def indice_usuarios() -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Índices únicos por código y por tarjeta del directorio en memoria
+    
+    Returns:
+        Tupla (por_codigo, por_tarjeta); los códigos en mayúsculas. Son de solo
+        lectura: se reemplazan enteros al recargar el directorio
+        
+    Raises:
+        DirectorioIncompleto: Si el directorio no pudo cargar todos los usuarios
+            (un código ausente no significaría que sea nuevo)
+    """
+    if not directorio_vigente():
+        precargar_directorio_usuarios()
+    if not _directorio_completo:
+        cargados = f"{len(_directorio)} de {_total_tabla}" if _total_tabla is not None else "no se pudieron cargar los"
+        raise DirectorioIncompleto(f"El directorio de usuarios está incompleto ({cargados} usuarios); reintentar más tarde")
+    return _por_codigo, _por_tarjeta
+
+def normalizar_busqueda(texto: Any) -> str:
+    """Texto en minúsculas y sin tildes, para comparar nombres, códigos y tarjetas"""
+    sin_tildes = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sin_tildes.lower().split())
+
+def _posiciones_con_prefijo(claves: List[Tuple[str, int]], prefijo: str) -> set:
+    posiciones = set()
+    i = bisect.bisect_left(claves, (prefijo, -1))
+    while i < len(claves) and claves[i][0].startswith(prefijo):
+        posiciones.add(claves[i][1])
+        i += 1
+    return posiciones
+
+def listar_usuarios_directorio(termino: str = '', pagina: int = 1, por_pagina: int = USUARIOS_POR_PAGINA) -> Dict:
+    """
+    Página del directorio ordenado por nombre, filtrado por prefijo
+    
+    Cada palabra del término debe ser prefijo de una palabra del nombre, del
+    código o de la tarjeta ('gonz', 'ana gon', 'A1', '1234'). Se resuelve con
+    los índices en memoria: sin consultas salvo la recarga del directorio
+    cuando expiró.
+    
+    Args:
+        termino: Texto buscado (vacío = todos)
+        pagina: Número de página, desde 1
+        por_pagina: Usuarios por página (máximo MAX_POR_PAGINA)
+        
+    Returns:
+        Dict con usuarios, total, pagina, paginas, por_pagina, termino,
+        disponible (False si el directorio nunca pudo cargarse) y completo
+    """
+    if not directorio_vigente():
+        precargar_directorio_usuarios()
+    
+    ordenados, claves = _ordenados, _claves_busqueda
+    por_pagina = max(1, min(por_pagina, MAX_POR_PAGINA))
+    palabras = normalizar_busqueda(termino).split()
+    
+    if palabras:
+        coincidencias = None
+        for palabra in palabras:
+            posiciones = _posiciones_con_prefijo(claves, palabra)
+            coincidencias = posiciones if coincidencias is None else coincidencias & posiciones
+            if not coincidencias:
+                break
+        seleccion = sorted(coincidencias)
+    else:
+        seleccion = None
+    
+    total = len(seleccion) if seleccion is not None else len(ordenados)
+    paginas = max(1, -(-total // por_pagina))
+    pagina = max(1, min(pagina, paginas))
+    inicio = (pagina - 1) * por_pagina
+    if seleccion is None:
+        usuarios = ordenados[inicio:inicio + por_pagina]
+    else:
+        usuarios = [ordenados[p] for p in seleccion[inicio:inicio + por_pagina]]
+    
+    return {
+        'usuarios': usuarios,
+        'total': total,
+        'pagina': pagina,
+        'paginas': paginas,
+        'por_pagina': por_pagina,
+        'termino': termino,
+        'disponible': _directorio_cargado is not None or bool(ordenados),
+        'completo': _directorio_completo
+    }
+
+def crear_usuarios_lote(usuarios: List[Dict]) -> List[Dict]:
+    """
+    Inserta varios usuarios en una sola petición
+    
+    Args:
+        usuarios: Lista de dicts (nombre, tarjeta, turno, codigo)
+        
+    Returns:
+        Lista de usuarios creados
+        
+    Raises:
+        Exception: Si la inserción falla (el lote completo se rechaza)
+    """
+    response = ejecutar(get_admin_client().table('usuarios').insert(usuarios), 'escritura')
+    return response.data or []
+
+def actualizar_usuarios_lote(usuarios: List[Dict]) -> List[Dict]:
+    """
+    Actualiza varios usuarios existentes en una sola petición (upsert por id)
+    
+    Args:
+        usuarios: Lista de dicts que incluyen 'id'
+        
+    Returns:
+        Lista de usuarios actualizados
+        
+    Raises:
+        Exception: Si la actualización falla (el lote completo se rechaza)
+    """
+    # Upsert por clave primaria: idempotente, se puede reintentar
+    response = ejecutar(get_admin_client().table('usuarios').upsert(usuarios, on_conflict='id'), 'escritura', idempotente=True)
+    return response.data or []
+
+def estado_directorio() -> Dict:
+    """
+    Estado del directorio en memoria (para los chequeos de salud)
+    
+    Returns:
+        Dict con cargado, usuarios, completo (y total de la tabla), edad en
+        segundos, vigente y la cantidad de códigos y tarjetas repetidos
+    """
+    cargado = _directorio_cargado
+    return {
+        'cargado': cargado is not None,
+        'usuarios': len(_directorio),
+        'completo': _directorio_completo,
+        'total_tabla': _total_tabla,
+        'edad_segundos': round(time.monotonic() - cargado, 1) if cargado is not None else None,
+        'vigente': directorio_vigente(),
+        'codigos_repetidos': len(_duplicados['codigo']),
+        'tarjetas_repetidas': len(_duplicados['tarjeta'])
+    }
+
+def invalidar_directorio_usuarios():
+    """Marca el directorio como expirado (tras crear, editar o eliminar usuarios)"""
+    global _directorio_cargado
+    _directorio_cargado = None
+
+def _buscar_en_directorio(campo: str, valor: Any) -> Optional[Dict]:
+    """Búsqueda de respaldo en el directorio en memoria (sin consultar Supabase)"""
+    indice = {'codigo': (_por_codigo, _clave_codigo), 'tarjeta': (_por_tarjeta, _clave_tarjeta)}.get(campo)
+    if indice is not None:
+        usuario = indice[0].get(indice[1](valor))
+        if usuario:
+            print(f"📇 Usuario encontrado en el directorio local: {usuario['nombre']}")
+        return usuario
+    
+    valor = str(valor)
+    for usuario in list(_directorio.values()):
+        if usuario.get(campo) is not None and str(usuario.get(campo)) == valor:
+            print(f"📇 Usuario encontrado en el directorio local: {usuario['nombre']}")
+            return usuario
+    return None
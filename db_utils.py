@@ -7,16 +7,54 @@ Importa y expone funciones de módulos especializados.
 
 Estructura modular:
 - db_core: Inicialización y clientes base
+- db_resiliencia: Plazos, reintentos y circuit breaker de las llamadas
+- db_estadisticas: Conteos de filas cacheados para /status y debug
 - db_usuarios: Gestión de usuarios
 - db_descansos: Gestión de descansos y tiempos
 - db_admin: Gestión de administradores
+
+Las versiones asíncronas de las funciones del kiosco (buscar_usuario_inteligente,
+obtener_descanso_activo, crear_descanso, cerrar_descanso y
+obtener_todos_descansos_activos) están en db_async, para el servidor ASGI.
 """
 
 # Importar funciones de inicialización
-from db_core import initialize_db_clients, get_client, get_admin_client
+from db_core import (
+    initialize_db_clients,
+    get_client,
+    get_admin_client,
+    verificar_conexion,
+    estado_conexion,
+    timeout_llamada,
+    metricas_conexion,
+    estado_pool,
+    cerrar_conexiones
+)
+
+# Importar capa de resiliencia (plazos, reintentos, circuit breaker)
+from db_resiliencia import (
+    ejecutar,
+    ServicioNoDisponible,
+    limite_latencia,
+    con_limite_latencia,
+    consultas_paralelas,
+    servicio_degradado,
+    circuito_abierto,
+    estado_resiliencia
+)
+
+# Importar estadísticas de tablas (conteos sin descargar filas)
+from db_estadisticas import (
+    consulta_conteo,
+    contar_filas,
+    estadisticas_tablas,
+    invalidar_estadisticas
+)
 
 # Importar funciones de usuarios
 from db_usuarios import (
+    TURNOS_VALIDOS,
+    USUARIOS_POR_PAGINA,
     buscar_usuario_por_tarjeta,
     buscar_usuario_por_codigo,
     buscar_usuario_inteligente,
@@ -24,7 +62,24 @@ from db_usuarios import (
     obtener_usuario_por_id,
     crear_usuario,
     actualizar_usuario,
-    eliminar_usuario
+    eliminar_usuario,
+    precargar_directorio_usuarios,
+    obtener_usuario_directorio,
+    obtener_directorio_usuarios,
+    huella_directorio,
+    buscar_usuario_en_directorio,
+    indice_usuarios,
+    verificar_unicidad,
+    mensaje_violacion_unicidad,
+    registrar_usuario_en_directorio,
+    quitar_usuario_del_directorio,
+    normalizar_busqueda,
+    listar_usuarios_directorio,
+    crear_usuarios_lote,
+    actualizar_usuarios_lote,
+    estado_directorio,
+    invalidar_directorio_usuarios,
+    DirectorioIncompleto
 )
 
 # Importar funciones de descansos
@@ -33,13 +88,21 @@ from db_descansos import (
     crear_descanso,
     obtener_todos_descansos_activos,
     cerrar_descanso,
-    obtener_registros_periodo
+    obtener_registros_periodo,
+    iterar_registros_periodo,
+    recalcular_tipos_periodo,
+    huella_periodo,
+    archivar_historial,
+    precargar_descansos_activos,
+    obtener_snapshot_descansos_activos
 )
 
 # Importar funciones de administradores
 from db_admin import (
     buscar_administrador,
-    obtener_administrador_por_id
+    obtener_administrador_por_id,
+    obtener_administrador_por_usuario,
+    actualizar_clave_administrador
 )
 
 # Exportar todas las funciones para que estén disponibles
@@ -48,8 +111,32 @@ __all__ = [
     'initialize_db_clients',
     'get_client',
     'get_admin_client',
+    'verificar_conexion',
+    'estado_conexion',
+    'timeout_llamada',
+    'metricas_conexion',
+    'estado_pool',
+    'cerrar_conexiones',
+    
+    # Resiliencia
+    'ejecutar',
+    'ServicioNoDisponible',
+    'limite_latencia',
+    'con_limite_latencia',
+    'consultas_paralelas',
+    'servicio_degradado',
+    'circuito_abierto',
+    'estado_resiliencia',
+    
+    # Estadísticas
+    'consulta_conteo',
+    'contar_filas',
+    'estadisticas_tablas',
+    'invalidar_estadisticas',
     
     # Usuarios
+    'TURNOS_VALIDOS',
+    'USUARIOS_POR_PAGINA',
     'buscar_usuario_por_tarjeta',
     'buscar_usuario_por_codigo',
     'buscar_usuario_inteligente',
@@ -58,6 +145,23 @@ __all__ = [
     'crear_usuario',
     'actualizar_usuario',
     'eliminar_usuario',
+    'precargar_directorio_usuarios',
+    'obtener_usuario_directorio',
+    'obtener_directorio_usuarios',
+    'huella_directorio',
+    'buscar_usuario_en_directorio',
+    'indice_usuarios',
+    'verificar_unicidad',
+    'mensaje_violacion_unicidad',
+    'registrar_usuario_en_directorio',
+    'quitar_usuario_del_directorio',
+    'normalizar_busqueda',
+    'listar_usuarios_directorio',
+    'crear_usuarios_lote',
+    'actualizar_usuarios_lote',
+    'estado_directorio',
+    'invalidar_directorio_usuarios',
+    'DirectorioIncompleto',
     
     # Descansos
     'obtener_descanso_activo',
@@ -66,10 +170,18 @@ __all__ = [
     'cerrar_descanso',
     'cerrar_descanso_completo',
     'obtener_registros_periodo',
+    'iterar_registros_periodo',
+    'recalcular_tipos_periodo',
+    'huella_periodo',
+    'archivar_historial',
+    'precargar_descansos_activos',
+    'obtener_snapshot_descansos_activos',
     
     # Administradores
     'buscar_administrador',
-    'obtener_administrador_por_id'
+    'obtener_administrador_por_id',
+    'obtener_administrador_por_usuario',
+    'actualizar_clave_administrador'
 ]
 
 # Información del módulo
@@ -86,6 +198,8 @@ def get_module_info():
         'descripcion': 'Utilidades modularizadas de base de datos',
         'modulos': [
             'db_core - Inicialización y clientes',
+            'db_resiliencia - Plazos, reintentos y circuit breaker',
+            'db_estadisticas - Conteos de filas cacheados',
             'db_usuarios - Gestión de usuarios',
             'db_descansos - Gestión de descansos',
             'db_admin - Gestión de administradores'
@@ -137,5 +251,3 @@ def test_connectivity():
         results['mensaje'] = f'Error en prueba de conectividad: {str(e)}'
     
     return results
-
-print("✅ Módulo db_utils v2.0 cargado - Estructura modular activa")
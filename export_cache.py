@@ -0,0 +1,303 @@
+"""
+Caché de Exportaciones y Compresión de Respuestas
+=================================================
+
+Los períodos ya cerrados (fecha_fin anterior a ayer: un descanso que cruza la
+medianoche se registra después en el día en que empezó) casi no cambian, así
+que sus exportaciones se generan una sola vez y se guardan en disco,
+direccionadas por el SHA-256 de su contenido. La clave del índice incluye una
+huella de los datos (cantidad e ID máximo de registros del rango y hash de
+nombre/código/turno de los usuarios), de modo que un registro tardío, un
+renombre o un cambio de turno generan la exportación de nuevo:
+
+- <sha256>.<ext>           archivo exportado
+- <sha256>.<ext>.gz/.zst   variantes comprimidas (se crean al primer uso)
+- idx_<clave>.json         índice parámetros + huella -> sha256
+- ultimo_<clave>.json      última exportación generada para los parámetros
+
+Si la huella no se puede calcular (Supabase caído o con timeouts), se sirve
+la última exportación generada para esos parámetros en modo degradado en
+lugar de fallar la descarga.
+
+El hash del contenido sirve como ETag fuerte, lo que permite responder 304 a
+las descargas repetidas. Además se ofrece compresión gzip/zstd según el
+Accept-Encoding del cliente para los formatos que no vienen ya comprimidos.
+
+zstd requiere el paquete zstandard; si no está instalado solo se usa gzip.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from typing import BinaryIO, Dict, Iterator, Optional
+
+try:
+    import zstandard
+    ZSTD_DISPONIBLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_DISPONIBLE = False
+
+from export_utils import extension_exportacion, generar_exportacion
+from db_descansos import huella_periodo
+from db_usuarios import huella_directorio
+from politicas import version_politicas
+from time_utils import get_current_time
+
+# Configuración
+CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'breaktime_export_cache'))
+CACHE_DIAS = int(os.getenv('EXPORT_CACHE_DAYS', '30'))
+
+# Versión del formato de los reportes: cambiarla invalida la caché
+VERSION_CACHE = '1'
+
+# Formatos que ya vienen comprimidos y no ganan nada con gzip/zstd
+FORMATOS_COMPRIMIDOS = ('excel', 'parquet', 'zip')
+
+# Extensión de archivo por codificación
+EXTENSIONES_CODIFICACION = {
+    'zstd': 'zst',
+    'gzip': 'gz'
+}
+
+TAMANO_BLOQUE = 64 * 1024
+
+_lock = threading.Lock()
+
+def es_periodo_cerrado(fecha_fin: str) -> bool:
+    """
+    Indica si el período termina antes de ayer (hora de Punta Arenas)
+
+    Ayer no cuenta como cerrado: la fecha de un registro es la del inicio del
+    descanso, así que uno empezado antes de la medianoche llega a ayer al cerrarse.
+
+    Args:
+        fecha_fin: Fecha de fin del período (ISO)
+
+    Returns:
+        bool: True si ya no pueden llegar registros nuevos al período
+    """
+    try:
+        return date.fromisoformat(fecha_fin) < get_current_time().date() - timedelta(days=1)
+    except (TypeError, ValueError):
+        return False
+
+def codificacion_preferida(accept_encoding: str, formato: str) -> Optional[str]:
+    """
+    Elige la codificación de transferencia para una exportación
+
+    Args:
+        accept_encoding: Cabecera Accept-Encoding del cliente
+        formato: Formato de la exportación
+
+    Returns:
+        'zstd', 'gzip' o None si no conviene comprimir
+    """
+    if formato in FORMATOS_COMPRIMIDOS or not accept_encoding:
+        return None
+
+    aceptadas = set()
+    for parte in accept_encoding.lower().split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        if parametros.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        aceptadas.add(nombre.strip())
+
+    if ZSTD_DISPONIBLE and 'zstd' in aceptadas:
+        return 'zstd'
+    if 'gzip' in aceptadas:
+        return 'gzip'
+    return None
+
+def _clave_parametros(tipo: str, fecha_inicio: str, fecha_fin: str, formato: str) -> str:
+    # Incluye la versión de las políticas: si RR.HH. cambia un límite, el reporte se regenera
+    texto = f"{VERSION_CACHE}|{version_politicas()}|{tipo}|{formato}|{fecha_inicio}|{fecha_fin}"
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def _clave_indice(clave_parametros: str, fecha_inicio: str, fecha_fin: str) -> str:
+    # Agrega la huella de los registros del rango y de los usuarios (consulta a la BD)
+    texto = f"{clave_parametros}|{huella_periodo(fecha_inicio, fecha_fin)}|{huella_directorio()}"
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def _ruta_indice(clave: str, prefijo: str = 'idx') -> str:
+    return os.path.join(CACHE_DIR, f"{prefijo}_{clave}.json")
+
+def _leer_indice(clave: str, prefijo: str = 'idx') -> Optional[Dict]:
+    try:
+        with open(_ruta_indice(clave, prefijo), 'r', encoding='utf-8') as f:
+            entrada = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not os.path.exists(entrada.get('ruta', '')):
+        return None
+    return entrada
+
+def _escribir_indice(clave: str, entrada: Dict, prefijo: str = 'idx'):
+    temporal = f"{_ruta_indice(clave, prefijo)}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(entrada, f)
+    os.replace(temporal, _ruta_indice(clave, prefijo))
+
+def obtener_exportacion_cacheada(tipo: str, fecha_inicio: str, fecha_fin: str, formato: str) -> Dict:
+    """
+    Devuelve la exportación de un período cerrado, generándola si no está en caché
+
+    Args:
+        tipo: Tipo de reporte
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        formato: Formato de la exportación
+
+    Returns:
+        Dict con 'ruta', 'etag' (sha256 del contenido), 'tamano' y 'modificado'
+
+    Raises:
+        Exception: Si la huella de los datos no se puede calcular y no hay una
+            exportación anterior de los mismos parámetros para servir
+    """
+    clave_parametros = _clave_parametros(tipo, fecha_inicio, fecha_fin, formato)
+    try:
+        clave = _clave_indice(clave_parametros, fecha_inicio, fecha_fin)
+    except Exception as e:
+        entrada = _leer_indice(clave_parametros, 'ultimo')
+        if not entrada:
+            raise
+        print(f"⚠️ No se pudo verificar la huella de los datos ({e}); "
+              f"sirviendo la última exportación cacheada: {entrada['etag'][:12]}")
+        return entrada
+
+    entrada = _leer_indice(clave)
+    if entrada:
+        ultima = _leer_indice(clave_parametros, 'ultimo')
+        if not ultima or ultima['etag'] != entrada['etag']:
+            _escribir_indice(clave_parametros, entrada, 'ultimo')
+        print(f"♻️ Exportación servida desde caché: {entrada['etag'][:12]}")
+        return entrada
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    limpiar_cache()
+
+    # Generar en un temporal dentro del mismo directorio y calcular el hash
+    descriptor, temporal = tempfile.mkstemp(dir=CACHE_DIR, suffix='.part')
+    try:
+        with os.fdopen(descriptor, 'w+b') as archivo:
+            generar_exportacion(tipo, fecha_inicio, fecha_fin, archivo, formato)
+            archivo.seek(0)
+            sha = hashlib.sha256()
+            for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+                sha.update(bloque)
+
+        etag = sha.hexdigest()
+        ruta = os.path.join(CACHE_DIR, f"{etag}.{extension_exportacion(formato)}")
+        if os.path.exists(ruta):
+            os.remove(temporal)
+        else:
+            os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    entrada = {
+        'ruta': ruta,
+        'etag': etag,
+        'tamano': os.path.getsize(ruta),
+        'modificado': os.path.getmtime(ruta)
+    }
+
+    _escribir_indice(clave, entrada)
+    _escribir_indice(clave_parametros, entrada, 'ultimo')
+
+    print(f"💾 Exportación guardada en caché: {etag[:12]} ({entrada['tamano']} bytes)")
+    return entrada
+
+def obtener_variante_comprimida(entrada: Dict, codificacion: str) -> Dict:
+    """
+    Devuelve (creándola si hace falta) la variante comprimida de una exportación cacheada
+
+    Args:
+        entrada: Resultado de obtener_exportacion_cacheada
+        codificacion: 'gzip' o 'zstd'
+
+    Returns:
+        Dict con 'ruta', 'etag' (distinto por codificación), 'tamano' y 'modificado'
+    """
+    extension = EXTENSIONES_CODIFICACION[codificacion]
+    ruta = f"{entrada['ruta']}.{extension}"
+
+    if not os.path.exists(ruta):
+        with _lock:
+            if not os.path.exists(ruta):
+                temporal = f"{ruta}.part"
+                with open(entrada['ruta'], 'rb') as origen, open(temporal, 'wb') as destino:
+                    for bloque in iterar_comprimido(origen, codificacion):
+                        destino.write(bloque)
+                os.replace(temporal, ruta)
+
+    return {
+        'ruta': ruta,
+        'etag': f"{entrada['etag']}-{extension}",
+        'tamano': os.path.getsize(ruta),
+        'modificado': entrada['modificado']
+    }
+
+def _compresor(codificacion: str):
+    if codificacion == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compressobj()
+    # wbits=31: formato gzip (cabecera + CRC)
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+def iterar_comprimido(archivo: BinaryIO, codificacion: str, cerrar: bool = False) -> Iterator[bytes]:
+    """
+    Comprime un archivo en streaming
+
+    Args:
+        archivo: Archivo binario abierto para lectura
+        codificacion: 'gzip' o 'zstd'
+        cerrar: Si True cierra el archivo al terminar
+
+    Yields:
+        bytes: Bloques comprimidos
+    """
+    compresor = _compresor(codificacion)
+    try:
+        for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+            datos = compresor.compress(bloque)
+            if datos:
+                yield datos
+        yield compresor.flush()
+    finally:
+        if cerrar:
+            archivo.close()
+
+def limpiar_cache() -> int:
+    """
+    Elimina archivos de la caché no usados en los últimos EXPORT_CACHE_DAYS días
+
+    Returns:
+        int: Cantidad de archivos eliminados
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    limite = time.time() - CACHE_DIAS * 86400
+    eliminados = 0
+
+    for nombre in os.listdir(CACHE_DIR):
+        ruta = os.path.join(CACHE_DIR, nombre)
+        try:
+            if max(os.path.getmtime(ruta), os.path.getatime(ruta)) < limite:
+                os.remove(ruta)
+                eliminados += 1
+        except OSError:
+            continue
+
+    if eliminados:
+        print(f"🧹 Caché de exportaciones: {eliminados} archivos eliminados")
+    return eliminados
@@ -0,0 +1,205 @@
+"""
+Exportación Columnar (Parquet / Arrow IPC)
+==========================================
+
+Escribe los reportes en formatos columnares con tipos reales (date, time, int)
+para herramientas de análisis, en lugar del CSV localizado con punto y coma.
+
+La escritura es por lotes: las filas se acumulan hasta TAMANO_GRUPO y se
+vuelcan como un row group (Parquet) o record batch (Arrow IPC), por lo que la
+memoria usada no crece con el tamaño del período exportado.
+
+Requiere pyarrow; si no está instalado, PYARROW_DISPONIBLE es False y
+generar_columnar() lanza RuntimeError.
+"""
+
+import os
+from datetime import time
+from typing import BinaryIO, Dict, Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_DISPONIBLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_DISPONIBLE = False
+
+from export_utils import (
+    ExportadorEstadisticas,
+    ExportadorResumen,
+    calcular_fila_completo
+)
+
+# Formatos columnares soportados
+FORMATOS_COLUMNARES = ('parquet', 'arrow')
+
+# Filas por row group / record batch
+TAMANO_GRUPO = int(os.getenv('EXPORT_ROW_GROUP_SIZE', '50000'))
+
+def _esquemas() -> Dict[str, 'pa.Schema']:
+    """Esquemas por tipo de reporte (se construyen solo si hay pyarrow)"""
+    return {
+        'completo': pa.schema([
+            ('id', pa.int64()),
+            ('usuario_id', pa.int64()),
+            ('fecha', pa.date32()),
+            ('dia_semana', pa.int8()),  # ISO: 1 = lunes, 7 = domingo
+            ('nombre', pa.string()),
+            ('codigo', pa.string()),
+            ('turno', pa.string()),
+            ('tipo', pa.string()),
+            ('hora_entrada', pa.time64('us')),
+            ('hora_salida', pa.time64('us')),
+            ('duracion_minutos', pa.int32()),
+            ('exceso_minutos', pa.int32()),
+            ('estado', pa.string()),
+            ('observaciones', pa.string())
+        ]),
+        'resumen': pa.schema([
+            ('nombre', pa.string()),
+            ('codigo', pa.string()),
+            ('turno', pa.string()),
+            ('dias_activos', pa.int32()),
+            ('total_descansos', pa.int32()),
+            ('total_comidas', pa.int32()),
+            ('tiempo_descansos_minutos', pa.int32()),
+            ('tiempo_comidas_minutos', pa.int32()),
+            ('tiempo_total_horas', pa.float64()),
+            ('promedio_descanso_minutos', pa.float64()),
+            ('promedio_comida_minutos', pa.float64()),
+            ('exceso_descansos_minutos', pa.int32()),
+            ('exceso_comidas_minutos', pa.int32()),
+            ('exceso_total_minutos', pa.int32()),
+            ('eficiencia_porcentaje', pa.float64()),
+            ('estado', pa.string())
+        ]),
+        'estadisticas': pa.schema([
+            ('fecha', pa.date32()),
+            ('dia_semana', pa.int8()),
+            ('descansos', pa.int32()),
+            ('comidas', pa.int32()),
+            ('total', pa.int32()),
+            ('usuarios_unicos', pa.int32())
+        ])
+    }
+
+def _parse_hora(valor) -> Optional[time]:
+    """Convierte 'HH:MM:SS[.ffffff]' a time; None si no es válido"""
+    try:
+        return time.fromisoformat(valor)
+    except (TypeError, ValueError):
+        return None
+
+class EscritorColumnar:
+    """Acumula filas por columna y las vuelca en lotes de tamaño fijo"""
+
+    def __init__(self, destino: BinaryIO, esquema, formato: str = 'parquet', tamano_grupo: Optional[int] = None):
+        self.esquema = esquema
+        self.tamano_grupo = tamano_grupo or TAMANO_GRUPO
+        self.columnas: List[list] = [[] for _ in esquema]
+        self.filas_pendientes = 0
+        self.filas_escritas = 0
+
+        if formato == 'arrow':
+            self._writer = pa.ipc.new_file(destino, esquema)
+        else:
+            self._writer = pq.ParquetWriter(destino, esquema, compression='zstd')
+
+    def agregar(self, fila: list):
+        for columna, valor in zip(self.columnas, fila):
+            columna.append(valor)
+        self.filas_pendientes += 1
+        if self.filas_pendientes >= self.tamano_grupo:
+            self._volcar()
+
+    def _volcar(self):
+        if not self.filas_pendientes:
+            return
+        lote = pa.record_batch(
+            [pa.array(valores, type=campo.type) for valores, campo in zip(self.columnas, self.esquema)],
+            schema=self.esquema
+        )
+        if isinstance(self._writer, pq.ParquetWriter):
+            self._writer.write_table(pa.Table.from_batches([lote]))
+        else:
+            self._writer.write_batch(lote)
+        self.filas_escritas += self.filas_pendientes
+        self.columnas = [[] for _ in self.esquema]
+        self.filas_pendientes = 0
+
+    def cerrar(self):
+        self._volcar()
+        self._writer.close()
+
+def generar_columnar(tipo: str, registros: Iterable[Dict], destino: BinaryIO,
+                     fecha_inicio: str, fecha_fin: str, formato: str = 'parquet') -> int:
+    """
+    Genera un reporte en formato Parquet o Arrow IPC
+
+    Args:
+        tipo: 'completo', 'resumen' o 'estadisticas' (por día)
+        registros: Iterable de registros de tiempos_descanso
+        destino: Archivo binario abierto para escritura
+        fecha_inicio: Fecha de inicio del período
+        fecha_fin: Fecha de fin del período
+        formato: 'parquet' o 'arrow'
+
+    Returns:
+        int: Cantidad de registros procesados
+    """
+    if not PYARROW_DISPONIBLE:
+        raise RuntimeError("Exportación columnar no disponible: instalar pyarrow")
+
+    esquema = _esquemas().get(tipo, _esquemas()['completo'])
+    escritor = EscritorColumnar(destino, esquema, formato)
+    procesados = 0
+
+    try:
+        if tipo == 'resumen':
+            agregador = ExportadorResumen(None)
+            for r in registros:
+                agregador.procesar(r)
+                procesados += 1
+            for fila in agregador.filas():
+                escritor.agregar(fila)
+
+        elif tipo == 'estadisticas':
+            agregador = ExportadorEstadisticas(None, fecha_inicio, fecha_fin)
+            for r in registros:
+                agregador.procesar(r)
+                procesados += 1
+            for fecha_obj, descansos, comidas, total, usuarios_unicos in agregador.filas_por_dia():
+                escritor.agregar([fecha_obj, fecha_obj.isoweekday(), descansos, comidas, total, usuarios_unicos])
+
+        else:
+            for r in registros:
+                procesados += 1
+                try:
+                    fila = calcular_fila_completo(r)
+                except Exception as e_row:
+                    print(f"⚠️ Error procesando registro ID {r.get('id', 'desconocido')}: {e_row}")
+                    continue
+
+                escritor.agregar([
+                    fila['id'],
+                    fila['usuario_id'],
+                    fila['fecha'],
+                    fila['fecha'].isoweekday(),
+                    fila['nombre'],
+                    fila['codigo'],
+                    fila['turno'],
+                    fila['tipo'],
+                    _parse_hora(fila['inicio']),
+                    _parse_hora(fila['fin']),
+                    fila['duracion'],
+                    fila['exceso'],
+                    fila['estado'],
+                    fila['observaciones']
+                ])
+    finally:
+        escritor.cerrar()
+
+    print(f"📊 Exportación columnar {tipo} ({formato}): {procesados} registros, {escritor.filas_escritas} filas")
+    return procesados
@@ -0,0 +1,250 @@
+"""
+Cola de Trabajos de Exportación
+===============================
+
+Ejecuta las exportaciones en un pool de hilos para que los reportes grandes no
+bloqueen al worker que atiende la petición.
+
+Flujo:
+1. enviar_exportacion() crea (o reutiliza) un trabajo y devuelve su ID
+2. Un hilo del pool genera el archivo por páginas en el directorio de spool
+3. obtener_trabajo() permite consultar el progreso
+4. Cuando el estado es 'listo', el archivo se descarga desde ruta_archivo
+
+El estado de cada trabajo se guarda además como JSON junto al archivo, de modo
+que cualquier worker de gunicorn puede responder la consulta o la descarga.
+Los artefactos se eliminan al superar EXPORT_TTL_MINUTES.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from export_utils import extension_exportacion, generar_exportacion, nombre_archivo_exportacion
+from perfilador import perfilar
+
+# Configuración
+SPOOL_DIR = os.getenv('EXPORT_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'breaktime_exports'))
+MAX_WORKERS = int(os.getenv('EXPORT_WORKERS', '2'))
+TTL_SEGUNDOS = int(os.getenv('EXPORT_TTL_MINUTES', '60')) * 60
+
+# Estados posibles de un trabajo
+ESTADO_PENDIENTE = 'pendiente'
+ESTADO_PROCESANDO = 'procesando'
+ESTADO_LISTO = 'listo'
+ESTADO_ERROR = 'error'
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_trabajos: Dict[str, Dict] = {}
+# Trabajos en curso por clave de parámetros (deduplicación)
+_en_curso: Dict[str, str] = {}
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Crea el pool de hilos la primera vez que se necesita"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='exportacion')
+    return _executor
+
+def _clave_trabajo(tipo: str, fecha_inicio: str, fecha_fin: str, formato: str) -> str:
+    """Clave que identifica peticiones idénticas"""
+    return hashlib.sha1(f"{tipo}|{formato}|{fecha_inicio}|{fecha_fin}".encode('utf-8')).hexdigest()
+
+def _ruta_meta(trabajo_id: str) -> str:
+    return os.path.join(SPOOL_DIR, f"{trabajo_id}.json")
+
+def _guardar_meta(trabajo: Dict):
+    """Persiste el estado del trabajo de forma atómica"""
+    ruta = _ruta_meta(trabajo['id'])
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(trabajo, f)
+    os.replace(temporal, ruta)
+
+def _actualizar(trabajo_id: str, **cambios):
+    with _lock:
+        trabajo = _trabajos.get(trabajo_id)
+        if trabajo is None:
+            return
+        trabajo.update(cambios)
+        copia = dict(trabajo)
+    _guardar_meta(copia)
+
+def _ejecutar(trabajo_id: str):
+    """Genera el archivo de un trabajo (se ejecuta en el pool)"""
+    with _lock:
+        trabajo = dict(_trabajos[trabajo_id])
+
+    print(f"📦 Iniciando exportación {trabajo_id}: {trabajo['tipo']} {trabajo['fecha_inicio']} a {trabajo['fecha_fin']}")
+    _actualizar(trabajo_id, estado=ESTADO_PROCESANDO, iniciado=time.time())
+
+    ruta = trabajo['ruta_archivo']
+    parcial = f"{ruta}.part"
+
+    def progreso(procesados, total):
+        _actualizar(trabajo_id, procesados=procesados, total=total)
+
+    try:
+        with open(parcial, 'wb') as destino, perfilar(f"exportacion {trabajo['tipo']} {trabajo['formato']}", trabajo_id=trabajo_id):
+            procesados = generar_exportacion(trabajo['tipo'], trabajo['fecha_inicio'], trabajo['fecha_fin'],
+                                             destino, trabajo['formato'], progreso=progreso)
+        os.replace(parcial, ruta)
+
+        _actualizar(trabajo_id,
+                    estado=ESTADO_LISTO,
+                    procesados=procesados,
+                    tamano_bytes=os.path.getsize(ruta),
+                    terminado=time.time())
+        print(f"✅ Exportación {trabajo_id} lista ({procesados} registros)")
+
+    except Exception as e:
+        print(f"❌ Error en exportación {trabajo_id}: {e}")
+        traceback.print_exc()
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        _actualizar(trabajo_id, estado=ESTADO_ERROR, error=str(e), terminado=time.time())
+
+    finally:
+        with _lock:
+            if _en_curso.get(trabajo['clave']) == trabajo_id:
+                del _en_curso[trabajo['clave']]
+
+def enviar_exportacion(tipo: str, fecha_inicio: str, fecha_fin: str, formato: str = 'csv') -> Dict:
+    """
+    Encola una exportación o reutiliza una idéntica que ya esté en curso
+
+    Args:
+        tipo: 'completo', 'resumen' o 'estadisticas'
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        formato: Formato de salida
+
+    Returns:
+        Dict con el estado del trabajo
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    limpiar_expirados()
+
+    clave = _clave_trabajo(tipo, fecha_inicio, fecha_fin, formato)
+
+    with _lock:
+        existente = _en_curso.get(clave)
+        if existente and existente in _trabajos:
+            print(f"♻️ Reutilizando exportación en curso: {existente}")
+            return dict(_trabajos[existente])
+
+        trabajo_id = uuid.uuid4().hex
+        trabajo = {
+            'id': trabajo_id,
+            'clave': clave,
+            'tipo': tipo,
+            'formato': formato,
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'estado': ESTADO_PENDIENTE,
+            'procesados': 0,
+            'total': None,
+            'nombre_archivo': nombre_archivo_exportacion(tipo, fecha_inicio, fecha_fin, formato),
+            'ruta_archivo': os.path.join(SPOOL_DIR, f"{trabajo_id}.{extension_exportacion(formato)}"),
+            'tamano_bytes': 0,
+            'error': None,
+            'creado': time.time(),
+            'iniciado': None,
+            'terminado': None
+        }
+        _trabajos[trabajo_id] = trabajo
+        _en_curso[clave] = trabajo_id
+        copia = dict(trabajo)
+
+    _guardar_meta(copia)
+    _get_executor().submit(_ejecutar, trabajo_id)
+    print(f"📥 Exportación encolada: {trabajo_id}")
+    return copia
+
+def obtener_trabajo(trabajo_id: str) -> Optional[Dict]:
+    """
+    Obtiene el estado de un trabajo de exportación
+
+    Busca primero en memoria y luego en el spool, por si el trabajo fue creado
+    por otro worker.
+
+    Args:
+        trabajo_id: ID del trabajo
+
+    Returns:
+        Dict con el estado del trabajo o None si no existe o expiró
+    """
+    # Evitar rutas arbitrarias: los IDs son hex de uuid4
+    if not trabajo_id or not all(c in '0123456789abcdef' for c in trabajo_id):
+        return None
+
+    with _lock:
+        if trabajo_id in _trabajos:
+            return dict(_trabajos[trabajo_id])
+
+    try:
+        with open(_ruta_meta(trabajo_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def limpiar_expirados() -> int:
+    """
+    Elimina los artefactos y estados de trabajos más antiguos que el TTL
+
+    Returns:
+        int: Cantidad de archivos eliminados
+    """
+    if not os.path.isdir(SPOOL_DIR):
+        return 0
+
+    limite = time.time() - TTL_SEGUNDOS
+    eliminados = 0
+
+    for nombre in os.listdir(SPOOL_DIR):
+        ruta = os.path.join(SPOOL_DIR, nombre)
+        try:
+            # Los .part pertenecen a trabajos en curso; solo se borran si quedaron huérfanos
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+                eliminados += 1
+        except OSError:
+            continue
+
+    if eliminados:
+        with _lock:
+            for trabajo_id in [t for t, d in _trabajos.items()
+                               if d['estado'] in (ESTADO_LISTO, ESTADO_ERROR) and not os.path.exists(_ruta_meta(t))]:
+                del _trabajos[trabajo_id]
+        print(f"🧹 Exportaciones expiradas eliminadas: {eliminados} archivos")
+
+    return eliminados
+
+def resumen_trabajos() -> Dict:
+    """
+    Backlog de exportaciones de este worker (para /ready y /health)
+
+    Returns:
+        Dict con pendientes, procesando, antigüedad del pendiente más viejo y workers
+    """
+    ahora = time.time()
+    with _lock:
+        pendientes = [t for t in _trabajos.values() if t['estado'] == ESTADO_PENDIENTE]
+        procesando = sum(1 for t in _trabajos.values() if t['estado'] == ESTADO_PROCESANDO)
+
+    return {
+        'pendientes': len(pendientes),
+        'procesando': procesando,
+        'espera_max_segundos': round(max((ahora - t['creado'] for t in pendientes), default=0.0), 1),
+        'workers': MAX_WORKERS
+    }
@@ -0,0 +1,628 @@
+"""
+Utilidades de Exportación de Reportes
+=====================================
+
+Genera los reportes exportables (completo, resumen y estadísticas) sin depender
+del contexto de Flask, para poder usarlos tanto en la descarga directa como en
+los trabajos de exportación en segundo plano.
+
+Cada reporte se implementa como un exportador con la interfaz:
+- procesar(registro): consume un registro de tiempos_descanso
+- finalizar(): escribe las filas pendientes (resúmenes, totales)
+
+Así los registros se procesan a medida que llegan desde la base de datos,
+sin mantener el período completo en memoria.
+"""
+
+import csv
+import io
+import tempfile
+import zipfile
+from datetime import date, datetime
+from typing import BinaryIO, Callable, Dict, Generator, Iterable, Optional
+
+from db_descansos import iterar_registros_periodo
+from politicas import obtener_politica
+import metricas
+
+# Tipos de reporte soportados ('paquete' = los tres reportes en un ZIP)
+TIPOS_REPORTE = ('completo', 'resumen', 'estadisticas', 'paquete')
+
+# Formatos de archivo soportados
+# (excel requiere XlsxWriter, ver export_xlsx; parquet/arrow requieren pyarrow, ver export_columnar)
+FORMATOS_EXPORTACION = ('csv', 'excel', 'parquet', 'arrow')
+
+# Tipos MIME por formato
+MIMETYPES_EXPORTACION = {
+    'csv': 'text/csv; charset=utf-8',
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'zip': 'application/zip'
+}
+
+# Extensión de archivo por formato
+EXTENSIONES_EXPORTACION = {
+    'csv': 'csv',
+    'excel': 'xlsx',
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+    'zip': 'zip'
+}
+
+# Bloque mínimo a acumular antes de entregar datos del ZIP en streaming
+TAMANO_BLOQUE_ZIP = 64 * 1024
+
+CABECERA_COMPLETO = [
+    'Fecha',
+    'Día de la Semana',
+    'Nombre Completo',
+    'Código',
+    'Turno',
+    'Tipo de Descanso',
+    'Hora Entrada',
+    'Hora Salida',
+    'Duración (minutos)',
+    'Duración (horas)',
+    'Exceso (minutos)',
+    'Estado',
+    'Observaciones'
+]
+
+CABECERA_RESUMEN = [
+    'Nombre',
+    'Código',
+    'Turno',
+    'Días Activos',
+    'Total Descansos',
+    'Total Comidas',
+    'Tiempo Total Descansos (min)',
+    'Tiempo Total Comidas (min)',
+    'Tiempo Total (horas)',
+    'Promedio Descanso (min)',
+    'Promedio Comida (min)',
+    'Exceso Descansos (min)',
+    'Exceso Comidas (min)',
+    'Exceso Total (min)',
+    'Eficiencia (%)',
+    'Estado General'
+]
+
+def calcular_fila_completo(r: Dict) -> Dict:
+    """
+    Calcula los valores tipados de un registro para el reporte completo
+
+    Args:
+        r: Registro de tiempos_descanso con el JOIN de usuarios
+
+    Returns:
+        Dict con fecha (date), datos del usuario, duración, exceso, estado y observaciones
+    """
+    fecha_obj = datetime.fromisoformat(r['fecha'])
+    usuario_data = r.get('usuarios', {})
+    duracion = r.get('duracion_minutos', 0)
+    tipo = r.get('tipo', 'DESCANSO')
+
+    # Calcular exceso y estado según la política del turno
+    politica = obtener_politica(usuario_data.get('turno'))
+    exceso = politica.exceso(tipo, duracion)
+    estado = politica.estado_registro(exceso)
+
+    # Observaciones
+    observaciones = []
+    if exceso > 0:
+        observaciones.append(f'Excedió {exceso} min del límite')
+    if duracion < politica.duracion_corta:
+        observaciones.append('Duración muy corta')
+
+    return {
+        'id': r.get('id'),
+        'usuario_id': r.get('usuario_id'),
+        'fecha': fecha_obj.date(),
+        'nombre': usuario_data.get('nombre', 'Usuario Desconocido'),
+        'codigo': usuario_data.get('codigo', 'N/A'),
+        'turno': usuario_data.get('turno', 'N/A'),
+        'tipo': tipo,
+        'inicio': r.get('inicio', 'N/A'),
+        'fin': r.get('fin', 'N/A'),
+        'duracion': duracion,
+        'exceso': exceso,
+        'estado': estado,
+        'observaciones': '; '.join(observaciones) if observaciones else 'Sin observaciones'
+    }
+
+class ExportadorCompleto:
+    """Exporta todos los registros detallados, una fila por descanso"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.writer.writerow(CABECERA_COMPLETO)
+
+    def procesar(self, r: Dict):
+        try:
+            fila = calcular_fila_completo(r)
+            fecha_obj = fila['fecha']
+
+            self.writer.writerow([
+                fecha_obj.strftime('%d/%m/%Y'),
+                fecha_obj.strftime('%A').capitalize(),
+                fila['nombre'],
+                fila['codigo'],
+                fila['turno'],
+                fila['tipo'],
+                fila['inicio'],
+                fila['fin'],
+                fila['duracion'],
+                round(fila['duracion'] / 60, 2),
+                fila['exceso'],
+                fila['estado'],
+                fila['observaciones']
+            ])
+
+        except Exception as e_row:
+            print(f"⚠️ Error procesando registro ID {r.get('id', 'desconocido')}: {e_row}")
+
+    def finalizar(self):
+        pass
+
+class ExportadorResumen:
+    """Exporta el resumen por usuario del período"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.stats_usuarios = {}
+
+    def procesar(self, r: Dict):
+        try:
+            usuario_data = r.get('usuarios', {})
+            usuario_nombre = usuario_data.get('nombre', 'Usuario Desconocido')
+
+            if usuario_nombre not in self.stats_usuarios:
+                self.stats_usuarios[usuario_nombre] = {
+                    'codigo': usuario_data.get('codigo', 'N/A'),
+                    'turno': usuario_data.get('turno', 'N/A'),
+                    'total_descansos': 0,
+                    'total_comidas': 0,
+                    'tiempo_descansos': 0,
+                    'tiempo_comidas': 0,
+                    'exceso_descansos': 0,
+                    'exceso_comidas': 0,
+                    'dias_activos': set()
+                }
+
+            stats = self.stats_usuarios[usuario_nombre]
+            tipo = r.get('tipo', 'DESCANSO')
+            duracion = r.get('duracion_minutos', 0)
+            fecha = r.get('fecha', '')
+
+            # Actualizar estadísticas
+            politica = obtener_politica(stats['turno'])
+            if tipo == 'DESCANSO':
+                stats['total_descansos'] += 1
+                stats['tiempo_descansos'] += duracion
+                stats['exceso_descansos'] += politica.exceso(tipo, duracion)
+            else:
+                stats['total_comidas'] += 1
+                stats['tiempo_comidas'] += duracion
+                stats['exceso_comidas'] += politica.exceso(tipo, duracion)
+
+            stats['dias_activos'].add(fecha)
+
+        except Exception as e_user:
+            print(f"⚠️ Error procesando usuario en registro: {e_user}")
+
+    def filas(self):
+        """Genera las filas del resumen (valores tipados, mismo orden que CABECERA_RESUMEN)"""
+        for nombre, stats in self.stats_usuarios.items():
+            try:
+                # Convertir set a conteo
+                dias_activos = len(stats['dias_activos'])
+
+                # Calcular promedios
+                promedio_descanso = round(stats['tiempo_descansos'] / stats['total_descansos'], 1) if stats['total_descansos'] > 0 else 0
+                promedio_comida = round(stats['tiempo_comidas'] / stats['total_comidas'], 1) if stats['total_comidas'] > 0 else 0
+
+                # Tiempo total
+                tiempo_total_min = stats['tiempo_descansos'] + stats['tiempo_comidas']
+                tiempo_total_horas = round(tiempo_total_min / 60, 2)
+
+                # Exceso total
+                exceso_total = stats['exceso_descansos'] + stats['exceso_comidas']
+
+                # Eficiencia (menos exceso = más eficiente)
+                politica = obtener_politica(stats['turno'])
+                tiempo_esperado = (stats['total_descansos'] * politica.limite_descanso) + (stats['total_comidas'] * politica.limite_comida)
+                eficiencia = round((tiempo_esperado / tiempo_total_min * 100), 1) if tiempo_total_min > 0 else 100
+
+                # Estado general
+                estado = politica.estado_resumen(exceso_total)
+
+                yield [
+                    nombre,
+                    stats['codigo'],
+                    stats['turno'],
+                    dias_activos,
+                    stats['total_descansos'],
+                    stats['total_comidas'],
+                    stats['tiempo_descansos'],
+                    stats['tiempo_comidas'],
+                    tiempo_total_horas,
+                    promedio_descanso,
+                    promedio_comida,
+                    stats['exceso_descansos'],
+                    stats['exceso_comidas'],
+                    exceso_total,
+                    eficiencia,
+                    estado
+                ]
+
+            except Exception as e_summary:
+                print(f"⚠️ Error creando resumen para {nombre}: {e_summary}")
+
+    def finalizar(self):
+        self.writer.writerow(CABECERA_RESUMEN)
+        for fila in self.filas():
+            self.writer.writerow(fila)
+
+class ExportadorEstadisticas:
+    """Exporta las estadísticas generales y por día del período"""
+
+    def __init__(self, writer, fecha_inicio: str, fecha_fin: str):
+        self.writer = writer
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.total_registros = 0
+        self.total_descansos = 0
+        self.total_comidas = 0
+        self.tiempo_total_descansos = 0
+        self.tiempo_total_comidas = 0
+        self.stats_por_dia = {}
+
+    def procesar(self, r: Dict):
+        self.total_registros += 1
+        if r.get('tipo') == 'DESCANSO':
+            self.total_descansos += 1
+            self.tiempo_total_descansos += r.get('duracion_minutos', 0)
+        elif r.get('tipo') == 'COMIDA':
+            self.total_comidas += 1
+            self.tiempo_total_comidas += r.get('duracion_minutos', 0)
+
+        # Agrupar por fecha
+        try:
+            fecha = r.get('fecha', '')
+            if fecha not in self.stats_por_dia:
+                self.stats_por_dia[fecha] = {
+                    'descansos': 0,
+                    'comidas': 0,
+                    'usuarios': set()
+                }
+
+            tipo = r.get('tipo', 'DESCANSO')
+            usuario_data = r.get('usuarios', {})
+            usuario_nombre = usuario_data.get('nombre', 'Desconocido')
+
+            if tipo == 'DESCANSO':
+                self.stats_por_dia[fecha]['descansos'] += 1
+            else:
+                self.stats_por_dia[fecha]['comidas'] += 1
+
+            self.stats_por_dia[fecha]['usuarios'].add(usuario_nombre)
+
+        except Exception as e_day:
+            print(f"⚠️ Error procesando día: {e_day}")
+
+    def secciones(self):
+        """
+        Secciones del reporte como (título, filas)
+
+        Las filas de la sección por día incluyen la cabecera y usan fecha tipada
+        (date); cada formato decide cómo presentarla.
+        """
+        yield 'ESTADÍSTICAS GENERALES', [
+            ['Período', f'{self.fecha_inicio} a {self.fecha_fin}']
+        ]
+
+        yield 'RESUMEN GENERAL', [
+            ['Total de registros', self.total_registros],
+            ['Total descansos', self.total_descansos],
+            ['Total comidas', self.total_comidas],
+            ['Tiempo total descansos (min)', self.tiempo_total_descansos],
+            ['Tiempo total comidas (min)', self.tiempo_total_comidas],
+            ['Tiempo total (horas)', round((self.tiempo_total_descansos + self.tiempo_total_comidas) / 60, 2)]
+        ]
+
+        yield 'PROMEDIOS', [
+            ['Promedio descanso (min)', round(self.tiempo_total_descansos / self.total_descansos, 1) if self.total_descansos > 0 else 0],
+            ['Promedio comida (min)', round(self.tiempo_total_comidas / self.total_comidas, 1) if self.total_comidas > 0 else 0]
+        ]
+
+        yield 'ESTADÍSTICAS POR DÍA', self._filas_seccion_dias()
+
+    def _filas_seccion_dias(self):
+        yield ['Fecha', 'Día', 'Descansos', 'Comidas', 'Total', 'Usuarios Únicos']
+        for fecha_obj, descansos, comidas, total, usuarios_unicos in self.filas_por_dia():
+            yield [
+                fecha_obj,
+                fecha_obj.strftime('%A').capitalize(),
+                descansos,
+                comidas,
+                total,
+                usuarios_unicos
+            ]
+
+    def finalizar(self):
+        # Secciones separadas por una fila vacía
+        for i, (titulo, filas) in enumerate(self.secciones()):
+            if i > 0:
+                self.writer.writerow([])
+            self.writer.writerow([titulo])
+            for fila in filas:
+                if fila and isinstance(fila[0], date):
+                    fila = [fila[0].strftime('%d/%m/%Y')] + fila[1:]
+                self.writer.writerow(fila)
+
+    def filas_por_dia(self):
+        """Genera (fecha, descansos, comidas, total, usuarios únicos) ordenado por fecha"""
+        for fecha in sorted(self.stats_por_dia.keys()):
+            try:
+                fecha_obj = datetime.fromisoformat(fecha).date()
+                stats = self.stats_por_dia[fecha]
+
+                yield (
+                    fecha_obj,
+                    stats['descansos'],
+                    stats['comidas'],
+                    stats['descansos'] + stats['comidas'],
+                    len(stats['usuarios'])
+                )
+
+            except Exception as e_day_write:
+                print(f"⚠️ Error escribiendo día {fecha}: {e_day_write}")
+
+def crear_exportador(tipo: str, writer, fecha_inicio: str, fecha_fin: str):
+    """
+    Crea el exportador correspondiente al tipo de reporte
+
+    Args:
+        tipo: 'completo', 'resumen' o 'estadisticas'
+        writer: Objeto con método writerow (p. ej. csv.writer)
+        fecha_inicio: Fecha de inicio del período
+        fecha_fin: Fecha de fin del período
+
+    Returns:
+        Exportador con métodos procesar() y finalizar()
+    """
+    if tipo == 'estadisticas':
+        return ExportadorEstadisticas(writer, fecha_inicio, fecha_fin)
+    elif tipo == 'resumen':
+        return ExportadorResumen(writer)
+    return ExportadorCompleto(writer)
+
+def nombre_archivo_exportacion(tipo: str, fecha_inicio: str, fecha_fin: str, formato: str = 'csv') -> str:
+    """
+    Nombre de archivo de descarga para un reporte
+
+    Returns:
+        str: Nombre de archivo con extensión
+    """
+    prefijos = {
+        'completo': 'descansos_completo',
+        'resumen': 'resumen_usuarios',
+        'estadisticas': 'estadisticas',
+        'paquete': 'reportes'
+    }
+    return f"{prefijos.get(tipo, prefijos['completo'])}_{fecha_inicio}_{fecha_fin}.{extension_exportacion(formato)}"
+
+def normalizar_formato(formato: Optional[str], tipo: Optional[str] = None) -> str:
+    """
+    Normaliza el parámetro formato de la petición
+
+    Los formatos desconocidos se exportan como CSV (comportamiento histórico).
+    El paquete siempre es un ZIP con los tres reportes en CSV.
+
+    Returns:
+        str: Uno de FORMATOS_EXPORTACION, o 'zip' para el paquete
+    """
+    if tipo == 'paquete':
+        return 'zip'
+    formato = (formato or 'csv').strip().lower()
+    return formato if formato in FORMATOS_EXPORTACION else 'csv'
+
+def extension_exportacion(formato: str = 'csv') -> str:
+    """Extensión de archivo de un formato de exportación"""
+    return EXTENSIONES_EXPORTACION.get(formato, EXTENSIONES_EXPORTACION['csv'])
+
+def mimetype_exportacion(formato: str = 'csv') -> str:
+    """Tipo MIME de un formato de exportación"""
+    return MIMETYPES_EXPORTACION.get(formato, MIMETYPES_EXPORTACION['csv'])
+
+class _BufferZip:
+    """Destino no posicionable para zipfile: acumula lo escrito hasta que se vacía"""
+
+    def __init__(self):
+        self._partes = []
+        self.pendiente = 0
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        self.pendiente += len(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b''.join(self._partes)
+        self._partes = []
+        self.pendiente = 0
+        return datos
+
+def fecha_contenido(fecha_fin: str) -> datetime:
+    """
+    Marca de tiempo fija para los metadatos de un reporte
+
+    Las exportaciones de períodos cerrados se cachean por su sha256 (ETag), así
+    que el archivo no puede depender de la hora en que se generó: las fechas
+    internas del ZIP y del XLSX se toman del último día del período.
+
+    Args:
+        fecha_fin: Fecha de fin del período (ISO)
+
+    Returns:
+        datetime: Medianoche de fecha_fin
+    """
+    return datetime.fromisoformat(fecha_fin[:10])
+
+def _abrir_entrada_csv(zf: zipfile.ZipFile, nombre: str, fecha: datetime):
+    """Abre una entrada CSV del ZIP y devuelve (wrapper de texto, csv.writer)"""
+    entrada = zipfile.ZipInfo(nombre, date_time=fecha.timetuple()[:6])
+    entrada.compress_type = zipfile.ZIP_DEFLATED
+    texto = io.TextIOWrapper(zf.open(entrada, 'w'), encoding='utf-8-sig', newline='')
+    return texto, csv.writer(texto, delimiter=';', quotechar='"')
+
+def iterar_paquete_zip(fecha_inicio: str, fecha_fin: str,
+                       registros: Optional[Iterable[Dict]] = None,
+                       progreso: Optional[Callable[[int, Optional[int]], None]] = None) -> Generator[bytes, None, int]:
+    """
+    Genera en streaming un ZIP con los reportes completo, resumen y estadísticas
+
+    Los registros del período se leen una sola vez y alimentan a los tres
+    exportadores en la misma pasada. El reporte completo se comprime a medida
+    que llegan las páginas; resumen y estadísticas (agregados pequeños por
+    usuario y por día) se escriben al final.
+
+    Args:
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        registros: Registros a exportar (si es None se leen paginados de la BD)
+        progreso: Callback opcional (procesados, total)
+
+    Yields:
+        bytes: Bloques consecutivos del archivo ZIP
+
+    Returns:
+        int: Cantidad de registros procesados (valor de StopIteration)
+    """
+    if registros is None:
+        registros = iterar_registros_periodo(fecha_inicio, fecha_fin, ordenar=True, progreso=progreso)
+
+    buffer = _BufferZip()
+    procesados = 0
+    fecha = fecha_contenido(fecha_fin)
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        texto, writer = _abrir_entrada_csv(zf, nombre_archivo_exportacion('completo', fecha_inicio, fecha_fin), fecha)
+        completo = ExportadorCompleto(writer)
+        resumen = ExportadorResumen(None)
+        estadisticas = ExportadorEstadisticas(None, fecha_inicio, fecha_fin)
+
+        for r in registros:
+            completo.procesar(r)
+            resumen.procesar(r)
+            estadisticas.procesar(r)
+            procesados += 1
+
+            if buffer.pendiente >= TAMANO_BLOQUE_ZIP:
+                yield buffer.vaciar()
+
+        completo.finalizar()
+        texto.close()
+
+        for tipo, exportador in (('resumen', resumen), ('estadisticas', estadisticas)):
+            texto, exportador.writer = _abrir_entrada_csv(zf, nombre_archivo_exportacion(tipo, fecha_inicio, fecha_fin), fecha)
+            exportador.finalizar()
+            texto.close()
+
+    print(f"📦 Paquete de reportes generado: {procesados} registros")
+    yield buffer.vaciar()
+    return procesados
+
+def generar_exportacion(tipo: str, fecha_inicio: str, fecha_fin: str, destino: BinaryIO,
+                        formato: str = 'csv',
+                        registros: Optional[Iterable[Dict]] = None,
+                        progreso: Optional[Callable[[int, Optional[int]], None]] = None) -> int:
+    """
+    Genera un reporte y lo escribe en un archivo binario
+
+    Registra en las métricas el tiempo de generación y los bytes escritos.
+
+    Args:
+        tipo: 'completo', 'resumen', 'estadisticas' o 'paquete'
+        fecha_inicio: Fecha de inicio del período (ISO)
+        fecha_fin: Fecha de fin del período (ISO)
+        destino: Archivo binario abierto para escritura
+        formato: 'csv', 'excel', 'parquet' o 'arrow'
+        registros: Registros a exportar (si es None se leen paginados de la BD)
+        progreso: Callback opcional (procesados, total)
+
+    Returns:
+        int: Cantidad de registros procesados
+    """
+    inicio = destino.tell() if destino.seekable() else None
+    with metricas.medir_reporte(tipo, formato):
+        procesados = _escribir_exportacion(tipo, fecha_inicio, fecha_fin, destino, formato, registros, progreso)
+    if inicio is not None:
+        metricas.registrar_exportacion(tipo, formato, destino.tell() - inicio)
+    return procesados
+
+def _escribir_exportacion(tipo: str, fecha_inicio: str, fecha_fin: str, destino: BinaryIO, formato: str,
+                          registros: Optional[Iterable[Dict]],
+                          progreso: Optional[Callable[[int, Optional[int]], None]]) -> int:
+    if tipo == 'paquete':
+        generador = iterar_paquete_zip(fecha_inicio, fecha_fin, registros, progreso)
+        while True:
+            try:
+                destino.write(next(generador))
+            except StopIteration as fin:
+                return fin.value
+
+    if registros is None:
+        registros = iterar_registros_periodo(fecha_inicio, fecha_fin,
+                                             ordenar=(tipo == 'completo'),
+                                             progreso=progreso)
+
+    if formato in ('parquet', 'arrow'):
+        from export_columnar import generar_columnar
+        return generar_columnar(tipo, registros, destino, fecha_inicio, fecha_fin, formato)
+
+    if formato == 'excel':
+        from export_xlsx import generar_xlsx
+        return generar_xlsx(tipo, registros, destino, fecha_inicio, fecha_fin)
+
+    # UTF-8 con BOM para Excel; newline='' como exige el módulo csv
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    try:
+        writer = csv.writer(texto, delimiter=';', quotechar='"')
+        exportador = crear_exportador(tipo, writer, fecha_inicio, fecha_fin)
+
+        procesados = 0
+        for r in registros:
+            exportador.procesar(r)
+            procesados += 1
+        exportador.finalizar()
+        texto.flush()
+    finally:
+        # No cerrar el destino, solo desacoplar el wrapper de texto
+        texto.detach()
+
+    print(f"📊 Exportación {tipo} generada: {procesados} registros")
+    return procesados
+
+def generar_exportacion_archivo(tipo: str, fecha_inicio: str, fecha_fin: str, formato: str = 'csv') -> BinaryIO:
+    """
+    Genera un reporte en un archivo temporal
+
+    El archivo se elimina al cerrarse; se devuelve posicionado al inicio para
+    enviarlo directamente en la respuesta sin cargarlo en memoria.
+
+    Returns:
+        Archivo temporal binario con el contenido del reporte
+    """
+    archivo = tempfile.TemporaryFile()
+    try:
+        generar_exportacion(tipo, fecha_inicio, fecha_fin, archivo, formato)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
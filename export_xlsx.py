@@ -0,0 +1,150 @@
+"""
+Exportación a Excel (XLSX)
+==========================
+
+Genera los reportes como libros XLSX nativos cuando se pide formato=excel.
+
+Usa xlsxwriter en modo constant_memory: cada fila se escribe y se libera
+inmediatamente (los datos de la hoja van a un archivo temporal), de modo que
+la memoria del worker no crece con la cantidad de registros. Por la misma
+razón las filas deben escribirse en orden, una hoja a la vez.
+
+Las fechas se escriben como celdas de fecha reales y los números como números,
+sin los problemas de separador del CSV. Las estadísticas van en una hoja por
+sección.
+
+Requiere xlsxwriter; si no está instalado, XLSXWRITER_DISPONIBLE es False y
+generar_xlsx() lanza RuntimeError.
+"""
+
+import tempfile
+from datetime import date
+from typing import BinaryIO, Dict, Iterable
+
+try:
+    import xlsxwriter
+    XLSXWRITER_DISPONIBLE = True
+except ImportError:
+    xlsxwriter = None
+    XLSXWRITER_DISPONIBLE = False
+
+from export_utils import (
+    CABECERA_COMPLETO,
+    CABECERA_RESUMEN,
+    ExportadorEstadisticas,
+    ExportadorResumen,
+    calcular_fila_completo,
+    fecha_contenido
+)
+
+# Nombres de hoja (máximo 31 caracteres) por sección de estadísticas
+HOJAS_ESTADISTICAS = {
+    'ESTADÍSTICAS GENERALES': 'General',
+    'RESUMEN GENERAL': 'Resumen',
+    'PROMEDIOS': 'Promedios',
+    'ESTADÍSTICAS POR DÍA': 'Por día'
+}
+
+class HojaXlsx:
+    """Escribe filas secuenciales en una hoja, con fechas como celdas de fecha"""
+
+    def __init__(self, libro, nombre: str, formato_fecha, formato_cabecera=None):
+        self.hoja = libro.add_worksheet(nombre)
+        self.formato_fecha = formato_fecha
+        self.formato_cabecera = formato_cabecera
+        self.fila = 0
+
+    def writerow(self, valores: list, cabecera: bool = False):
+        for columna, valor in enumerate(valores):
+            if isinstance(valor, date):
+                self.hoja.write_datetime(self.fila, columna, valor, self.formato_fecha)
+            elif cabecera and self.formato_cabecera is not None:
+                self.hoja.write(self.fila, columna, valor, self.formato_cabecera)
+            else:
+                self.hoja.write(self.fila, columna, valor)
+        self.fila += 1
+
+def generar_xlsx(tipo: str, registros: Iterable[Dict], destino: BinaryIO,
+                 fecha_inicio: str, fecha_fin: str) -> int:
+    """
+    Genera un reporte en formato XLSX
+
+    Args:
+        tipo: 'completo', 'resumen' o 'estadisticas'
+        registros: Iterable de registros de tiempos_descanso
+        destino: Archivo binario abierto para escritura
+        fecha_inicio: Fecha de inicio del período
+        fecha_fin: Fecha de fin del período
+
+    Returns:
+        int: Cantidad de registros procesados
+    """
+    if not XLSXWRITER_DISPONIBLE:
+        raise RuntimeError("Exportación a Excel no disponible: instalar XlsxWriter")
+
+    libro = xlsxwriter.Workbook(destino, {
+        'constant_memory': True,
+        'tmpdir': tempfile.gettempdir()
+    })
+    # Fecha de creación fija para que el libro sea idéntico en cada generación
+    libro.set_properties({'created': fecha_contenido(fecha_fin)})
+    formato_fecha = libro.add_format({'num_format': 'dd/mm/yyyy'})
+    formato_cabecera = libro.add_format({'bold': True})
+    procesados = 0
+
+    try:
+        if tipo == 'resumen':
+            agregador = ExportadorResumen(None)
+            for r in registros:
+                agregador.procesar(r)
+                procesados += 1
+
+            hoja = HojaXlsx(libro, 'Resumen', formato_fecha, formato_cabecera)
+            hoja.writerow(CABECERA_RESUMEN, cabecera=True)
+            for fila in agregador.filas():
+                hoja.writerow(fila)
+
+        elif tipo == 'estadisticas':
+            agregador = ExportadorEstadisticas(None, fecha_inicio, fecha_fin)
+            for r in registros:
+                agregador.procesar(r)
+                procesados += 1
+
+            for titulo, filas in agregador.secciones():
+                hoja = HojaXlsx(libro, HOJAS_ESTADISTICAS.get(titulo, titulo[:31]), formato_fecha, formato_cabecera)
+                hoja.writerow([titulo], cabecera=True)
+                for fila in filas:
+                    hoja.writerow(fila)
+
+        else:
+            hoja = HojaXlsx(libro, 'Registros', formato_fecha, formato_cabecera)
+            hoja.writerow(CABECERA_COMPLETO, cabecera=True)
+
+            for r in registros:
+                procesados += 1
+                try:
+                    fila = calcular_fila_completo(r)
+                except Exception as e_row:
+                    print(f"⚠️ Error procesando registro ID {r.get('id', 'desconocido')}: {e_row}")
+                    continue
+
+                hoja.writerow([
+                    fila['fecha'],
+                    fila['fecha'].strftime('%A').capitalize(),
+                    fila['nombre'],
+                    fila['codigo'],
+                    fila['turno'],
+                    fila['tipo'],
+                    fila['inicio'],
+                    fila['fin'],
+                    fila['duracion'],
+                    round(fila['duracion'] / 60, 2),
+                    fila['exceso'],
+                    fila['estado'],
+                    fila['observaciones']
+                ])
+    finally:
+        libro.close()
+
+    print(f"📊 Exportación Excel {tipo}: {procesados} registros")
+    return procesados
@@ -0,0 +1,28 @@
+"""
+Configuración de gunicorn
+=========================
+
+Prepara el directorio de métricas multiproceso de Prometheus
+(PROMETHEUS_MULTIPROC_DIR): se vacía al arrancar el master para no mezclar
+valores de un despliegue anterior, y cada worker que termina se marca como
+muerto para que sus gauges 'live*' dejen de agregarse.
+"""
+
+import glob
+import os
+
+def on_starting(server):
+    directorio = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        for archivo in glob.glob(os.path.join(directorio, '*.db')):
+            os.remove(archivo)
+        print(f"📈 Métricas multiproceso en {directorio}")
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(worker.pid)
+        except ImportError:
+            pass
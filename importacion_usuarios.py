@@ -0,0 +1,452 @@
+"""
+Importación Masiva de Usuarios
+==============================
+
+Alta o actualización de muchos asistentes desde un archivo CSV o XLSX, sin una
+consulta de existencia por fila:
+
+1. Se leen las filas y se normalizan las columnas (nombre, tarjeta, turno,
+   codigo; los encabezados aceptan mayúsculas, tildes y algunos alias).
+2. Cada fila se valida en memoria: campos obligatorios, turno dentro de
+   TURNOS_VALIDOS, y códigos/tarjetas duplicados dentro del archivo o ya
+   usados por otro asistente (índice en memoria del directorio de usuarios).
+3. Las filas válidas se escriben por lotes de IMPORT_CHUNK_SIZE: las de código
+   nuevo con un insert y las de código existente con un upsert por id. Si un
+   lote falla, sus filas se reintentan una por una para reportar el error
+   exacto de cada una.
+
+Con dry_run=True se ejecutan los pasos 1 y 2 y se devuelve el mismo reporte
+sin escribir nada.
+
+Reasignación masiva (reasignar_usuarios): una lista de cambios codigo →
+tarjeta/turno, p. ej. al reemitir un lote de credenciales. La unicidad de las
+tarjetas se revisa contra el estado final (así dos asistentes pueden
+intercambiar tarjetas en el mismo lote), se escribe con los mismos upserts
+por lotes y el directorio de usuarios se invalida una sola vez al final.
+
+Con la restricción UNIQUE (tarjeta) de la base de datos (no diferible, se
+revisa fila por fila) un intercambio o una cadena de tarjetas no se puede
+escribir de una vez: primero se "estacionan" en un valor temporal
+(TMP-<id>) las tarjetas que otro asistente del lote va a recibir y después se
+asignan las definitivas. Si una asignación falla, se intenta devolver la
+tarjeta anterior.
+"""
+
+import csv
+import io
+import os
+import unicodedata
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import openpyxl
+    OPENPYXL_DISPONIBLE = True
+except ImportError:
+    openpyxl = None
+    OPENPYXL_DISPONIBLE = False
+
+from db_usuarios import (TURNOS_VALIDOS, actualizar_usuarios_lote, crear_usuarios_lote, indice_usuarios,
+                         invalidar_directorio_usuarios)
+
+# Configuración
+TAMANO_LOTE = int(os.getenv('IMPORT_CHUNK_SIZE', '300'))
+MAX_FILAS = int(os.getenv('IMPORT_MAX_ROWS', '5000'))
+
+COLUMNAS = ('nombre', 'tarjeta', 'turno', 'codigo')
+
+# Tarjeta temporal mientras se escribe un intercambio (única por usuario)
+PREFIJO_TARJETA_TEMPORAL = 'TMP-'
+
+# Encabezados aceptados (normalizados: minúsculas, sin tildes ni espacios extra)
+ALIAS_COLUMNAS = {
+    'nombre': 'nombre', 'nombre completo': 'nombre', 'asistente': 'nombre',
+    'tarjeta': 'tarjeta', 'numero de tarjeta': 'tarjeta', 'n tarjeta': 'tarjeta',
+    'turno': 'turno', 'tipo de turno': 'turno',
+    'codigo': 'codigo', 'codigo asistente': 'codigo', 'cod': 'codigo'
+}
+
+# Turnos escritos de otra forma en las planillas
+_TURNOS_NORMALIZADOS = {t.lower().replace(' ', ''): t for t in TURNOS_VALIDOS}
+
+def _normalizar_texto(valor: str) -> str:
+    sin_tildes = unicodedata.normalize('NFKD', valor).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sin_tildes.lower().replace('°', '').replace('.', ' ').split())
+
+def normalizar_turno(turno: str) -> Optional[str]:
+    """
+    Convierte un turno escrito a mano al valor permitido
+
+    Args:
+        turno: Texto de la planilla (p. ej. 'part time', 'PART-TIME', 'full')
+
+    Returns:
+        Valor de TURNOS_VALIDOS o None si no corresponde a ninguno
+    """
+    clave = _normalizar_texto(turno or '').replace(' ', '').replace('-', '').replace('_', '')
+    return _TURNOS_NORMALIZADOS.get(clave)
+
+def _texto_celda(valor) -> str:
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        # Excel guarda las tarjetas numéricas como float
+        valor = int(valor)
+    return str(valor).strip()
+
+def _filas_csv(contenido: bytes) -> Iterator[List[str]]:
+    texto = contenido.decode('utf-8-sig', errors='replace')
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=';,\t')
+    except csv.Error:
+        # Mismo separador que las exportaciones del sistema
+        dialecto = None
+    if dialecto is None:
+        yield from csv.reader(io.StringIO(texto), delimiter=';')
+    else:
+        yield from csv.reader(io.StringIO(texto), dialecto)
+
+def _filas_xlsx(contenido: bytes) -> Iterator[List[str]]:
+    if not OPENPYXL_DISPONIBLE:
+        raise ValueError("Para importar XLSX instale openpyxl (o exporte la planilla como CSV)")
+    libro = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        for fila in libro.active.iter_rows(values_only=True):
+            yield [_texto_celda(v) for v in fila]
+    finally:
+        libro.close()
+
+def leer_archivo(archivo: BinaryIO, nombre_archivo: str) -> List[Tuple[int, Dict[str, str]]]:
+    """
+    Lee un CSV o XLSX de asistentes
+
+    Args:
+        archivo: Archivo binario subido
+        nombre_archivo: Nombre original (para distinguir CSV de XLSX)
+
+    Returns:
+        Lista de (número de fila en el archivo, dict con las columnas)
+
+    Raises:
+        ValueError: Si el formato no es soportado, faltan columnas o hay demasiadas filas
+    """
+    contenido = archivo.read()
+    extension = os.path.splitext(nombre_archivo or '')[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        filas = _filas_xlsx(contenido)
+    elif extension in ('.csv', '.txt', ''):
+        filas = _filas_csv(contenido)
+    else:
+        raise ValueError(f"Formato no soportado: {extension} (use CSV o XLSX)")
+
+    encabezados = None
+    registros = []
+    for numero, fila in enumerate(filas, start=1):
+        valores = [_texto_celda(v) for v in fila]
+        if not any(valores):
+            continue
+        if encabezados is None:
+            encabezados = [ALIAS_COLUMNAS.get(_normalizar_texto(v)) for v in valores]
+            faltantes = [c for c in COLUMNAS if c not in encabezados]
+            if faltantes:
+                raise ValueError(f"Faltan columnas: {', '.join(faltantes)} (se esperan {', '.join(COLUMNAS)})")
+            continue
+        if len(registros) >= MAX_FILAS:
+            raise ValueError(f"El archivo supera el máximo de {MAX_FILAS} filas")
+        registros.append((numero, {
+            columna: valor for columna, valor in zip(encabezados, valores) if columna
+        }))
+    return registros
+
+def validar_filas(registros: List[Tuple[int, Dict[str, str]]]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Valida las filas en memoria contra el índice de usuarios existentes
+
+    Args:
+        registros: Salida de leer_archivo
+
+    Returns:
+        Tupla (nuevos, actualizaciones, errores). Nuevos y actualizaciones llevan
+        'fila' y los datos a escribir (las actualizaciones, además, el 'id').
+    """
+    por_codigo, por_tarjeta = indice_usuarios()
+    codigos_archivo: Dict[str, int] = {}
+    tarjetas_archivo: Dict[str, int] = {}
+    nuevos, actualizaciones, errores = [], [], []
+
+    for numero, datos in registros:
+        nombre = ' '.join((datos.get('nombre') or '').split())
+        tarjeta = (datos.get('tarjeta') or '').strip()
+        codigo = (datos.get('codigo') or '').strip().upper()
+        turno_original = (datos.get('turno') or '').strip()
+
+        def error(mensaje):
+            errores.append({'fila': numero, 'codigo': codigo, 'nombre': nombre, 'error': mensaje})
+
+        faltantes = [c for c, v in (('nombre', nombre), ('tarjeta', tarjeta), ('turno', turno_original), ('codigo', codigo)) if not v]
+        if faltantes:
+            error(f"Campos obligatorios vacíos: {', '.join(faltantes)}")
+            continue
+
+        turno = normalizar_turno(turno_original)
+        if turno is None:
+            error(f"Turno '{turno_original}' no válido (use {', '.join(TURNOS_VALIDOS)})")
+            continue
+
+        if codigo in codigos_archivo:
+            error(f"Código {codigo} repetido en el archivo (fila {codigos_archivo[codigo]})")
+            continue
+        if tarjeta in tarjetas_archivo:
+            error(f"Tarjeta {tarjeta} repetida en el archivo (fila {tarjetas_archivo[tarjeta]})")
+            continue
+
+        existente = por_codigo.get(codigo)
+        titular_tarjeta = por_tarjeta.get(tarjeta)
+        if titular_tarjeta and (existente is None or titular_tarjeta['id'] != existente['id']):
+            error(f"Tarjeta {tarjeta} ya asignada a {titular_tarjeta['nombre']} ({titular_tarjeta.get('codigo')})")
+            continue
+
+        codigos_archivo[codigo] = numero
+        tarjetas_archivo[tarjeta] = numero
+        usuario = {'nombre': nombre, 'tarjeta': tarjeta, 'turno': turno, 'codigo': codigo}
+
+        if existente is None:
+            nuevos.append({'fila': numero, **usuario})
+        elif any(str(existente.get(c) or '') != usuario[c] for c in COLUMNAS):
+            actualizaciones.append({'fila': numero, 'id': existente['id'], **usuario})
+        # Sin cambios: no se escribe
+
+    return nuevos, actualizaciones, errores
+
+def _escribir_por_lotes(filas: List[Dict], escribir, errores: List[Dict]) -> int:
+    """Escribe filas en lotes; si un lote falla, reintenta fila por fila para aislar el error"""
+    escritas = 0
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        lote = filas[inicio:inicio + TAMANO_LOTE]
+        datos = [{k: v for k, v in f.items() if k != 'fila'} for f in lote]
+        try:
+            escribir(datos)
+            escritas += len(lote)
+            continue
+        except Exception as e:
+            print(f"⚠️ Lote de {len(lote)} filas rechazado ({e}); reintentando fila por fila")
+
+        for fila, dato in zip(lote, datos):
+            try:
+                escribir([dato])
+                escritas += 1
+            except Exception as e:
+                mensaje = str(e)
+                if 'usuarios_turno_check' in mensaje:
+                    mensaje = f"Turno '{dato['turno']}' rechazado por la base de datos"
+                errores.append({'fila': fila['fila'], 'codigo': dato['codigo'], 'nombre': dato['nombre'], 'error': mensaje})
+    return escritas
+
+def importar_usuarios(archivo: BinaryIO, nombre_archivo: str, dry_run: bool = False) -> Dict:
+    """
+    Importa asistentes desde un CSV o XLSX
+
+    Args:
+        archivo: Archivo binario subido
+        nombre_archivo: Nombre original del archivo
+        dry_run: Si True solo valida y reporta, sin escribir
+
+    Returns:
+        Dict con total, nuevos, actualizados, sin_cambios, errores (lista por
+        fila, ordenada) y dry_run
+
+    Raises:
+        ValueError: Si el archivo no se puede leer (formato, columnas, tamaño)
+        DirectorioIncompleto: Si el directorio no tiene todos los usuarios (no
+            se podría distinguir un código existente de uno nuevo)
+    """
+    registros = leer_archivo(archivo, nombre_archivo)
+    nuevos, actualizaciones, errores = validar_filas(registros)
+    sin_cambios = len(registros) - len(nuevos) - len(actualizaciones) - len(errores)
+
+    print(f"📥 Importación de {nombre_archivo}: {len(registros)} filas, {len(nuevos)} nuevas, "
+          f"{len(actualizaciones)} a actualizar, {len(errores)} con errores{' (dry-run)' if dry_run else ''}")
+
+    if dry_run:
+        creados, actualizados = len(nuevos), len(actualizaciones)
+    else:
+        creados = _escribir_por_lotes(nuevos, crear_usuarios_lote, errores)
+        actualizados = _escribir_por_lotes(actualizaciones, actualizar_usuarios_lote, errores)
+        if creados or actualizados:
+            invalidar_directorio_usuarios()
+
+    return {
+        'archivo': nombre_archivo,
+        'total': len(registros),
+        'nuevos': creados,
+        'actualizados': actualizados,
+        'sin_cambios': sin_cambios,
+        'errores': sorted(errores, key=lambda e: e['fila']),
+        'dry_run': dry_run
+    }
+
+def validar_cambios(cambios: List[Any]) -> Tuple[List[Dict], List[Dict], int]:
+    """
+    Valida en memoria una lista de cambios de tarjeta/turno por código
+
+    Args:
+        cambios: Lista de dicts con 'codigo' y al menos 'tarjeta' o 'turno'
+
+    Returns:
+        Tupla (actualizaciones, errores, sin_cambios). Las actualizaciones llevan
+        'fila' (posición en la lista, desde 1), los datos completos del usuario y
+        la tarjeta/turno anteriores.
+    """
+    por_codigo, por_tarjeta = indice_usuarios()
+    por_id = {u['id']: u for u in list(por_codigo.values()) + list(por_tarjeta.values())}
+    codigos_lista: Dict[str, int] = {}
+    candidatos, errores = [], []
+    sin_cambios = 0
+
+    for numero, cambio in enumerate(cambios, start=1):
+        if not isinstance(cambio, dict):
+            errores.append({'fila': numero, 'codigo': '', 'nombre': '', 'error': 'Cada cambio debe ser un objeto'})
+            continue
+        codigo = str(cambio.get('codigo') or '').strip().upper()
+        existente = por_codigo.get(codigo)
+
+        def error(mensaje):
+            errores.append({'fila': numero, 'codigo': codigo, 'nombre': existente['nombre'] if existente else '',
+                            'error': mensaje})
+
+        tarjeta = str(cambio.get('tarjeta') or '').strip()
+        turno_original = str(cambio.get('turno') or '').strip()
+        if not codigo:
+            error("Falta el código")
+            continue
+        if existente is None:
+            error(f"No existe un asistente con código {codigo}")
+            continue
+        if codigo in codigos_lista:
+            error(f"Código {codigo} repetido en la lista (fila {codigos_lista[codigo]})")
+            continue
+        if not tarjeta and not turno_original:
+            error("Indique la tarjeta nueva, el turno nuevo o ambos")
+            continue
+        turno = normalizar_turno(turno_original) if turno_original else existente.get('turno')
+        if turno is None:
+            error(f"Turno '{turno_original}' no válido (use {', '.join(TURNOS_VALIDOS)})")
+            continue
+        codigos_lista[codigo] = numero
+
+        tarjeta_anterior = str(existente.get('tarjeta') or '')
+        tarjeta = tarjeta or tarjeta_anterior
+        if tarjeta == tarjeta_anterior and turno == existente.get('turno'):
+            sin_cambios += 1
+            continue
+        candidatos.append({
+            'fila': numero, 'id': existente['id'], 'nombre': existente['nombre'], 'codigo': existente['codigo'],
+            'tarjeta': tarjeta, 'turno': turno,
+            'tarjeta_anterior': tarjeta_anterior, 'turno_anterior': existente.get('turno')
+        })
+
+    # Unicidad de tarjetas en el estado final: descartar los cambios en conflicto
+    # y repetir, porque un cambio descartado deja su tarjeta anterior ocupada
+    tarjeta_de = {uid: str(u['tarjeta']) for uid, u in por_id.items() if u.get('tarjeta')}
+    while True:
+        final = {**tarjeta_de, **{c['id']: c['tarjeta'] for c in candidatos}}
+        titulares: Dict[str, List] = {}
+        for uid, tarjeta in final.items():
+            titulares.setdefault(tarjeta, []).append(uid)
+        en_conflicto = [c for c in candidatos
+                        if c['tarjeta'] != c['tarjeta_anterior'] and len(titulares[c['tarjeta']]) > 1]
+        if not en_conflicto:
+            break
+        for c in en_conflicto:
+            otros = ', '.join(f"{por_id[uid]['nombre']} ({por_id[uid].get('codigo')})"
+                              for uid in titulares[c['tarjeta']] if uid != c['id'])
+            errores.append({'fila': c['fila'], 'codigo': c['codigo'], 'nombre': c['nombre'],
+                            'error': f"Tarjeta {c['tarjeta']} quedaría asignada también a {otros}"})
+        candidatos = [c for c in candidatos if c not in en_conflicto]
+
+    return candidatos, errores, sin_cambios
+
+def _estacionar_tarjetas(actualizaciones: List[Dict], errores: List[Dict]) -> List[Dict]:
+    """
+    Fase 1 de un intercambio: mueve a PREFIJO_TARJETA_TEMPORAL las tarjetas
+    actuales que otro asistente del lote va a recibir, para que la fase 2 no
+    choque con UNIQUE (tarjeta)
+
+    Returns:
+        Cambios cuya tarjeta quedó estacionada
+    """
+    nuevas = {c['tarjeta'] for c in actualizaciones}
+    pendientes = [c for c in actualizaciones
+                  if c['tarjeta_anterior'] and c['tarjeta_anterior'] != c['tarjeta'] and c['tarjeta_anterior'] in nuevas]
+    if not pendientes:
+        return []
+
+    filas = [{'fila': c['fila'], 'id': c['id'], 'nombre': c['nombre'], 'codigo': c['codigo'],
+              'tarjeta': f"{PREFIJO_TARJETA_TEMPORAL}{c['id']}", 'turno': c['turno_anterior']} for c in pendientes]
+    antes = len(errores)
+    _escribir_por_lotes(filas, actualizar_usuarios_lote, errores)
+    fallidas = {e['codigo'] for e in errores[antes:]}
+    print(f"🪪 Intercambio de tarjetas: {len(pendientes) - len(fallidas)} estacionadas temporalmente")
+    return [c for c in pendientes if c['codigo'] not in fallidas]
+
+def _restaurar_tarjetas(estacionadas: List[Dict], fallidas: set, errores: List[Dict]):
+    """Devuelve la tarjeta anterior a los asistentes estacionados cuya asignación falló"""
+    for c in estacionadas:
+        if c['codigo'] not in fallidas:
+            continue
+        try:
+            actualizar_usuarios_lote([{'id': c['id'], 'nombre': c['nombre'], 'codigo': c['codigo'],
+                                       'tarjeta': c['tarjeta_anterior'], 'turno': c['turno_anterior']}])
+        except Exception as e:
+            print(f"❌ No se pudo devolver la tarjeta {c['tarjeta_anterior']} a {c['codigo']}: {e}")
+            errores.append({'fila': c['fila'], 'codigo': c['codigo'], 'nombre': c['nombre'],
+                            'error': f"Quedó con la tarjeta temporal {PREFIJO_TARJETA_TEMPORAL}{c['id']}; "
+                                     f"reasignar la tarjeta {c['tarjeta_anterior']} manualmente"})
+
+def reasignar_usuarios(cambios: List[Any], dry_run: bool = False) -> Dict:
+    """
+    Aplica en lote cambios de tarjeta y/o turno identificados por código
+
+    Args:
+        cambios: Lista de dicts {'codigo', 'tarjeta'?, 'turno'?}
+        dry_run: Si True solo valida y reporta, sin escribir
+
+    Returns:
+        Dict con total, actualizados, sin_cambios, errores (lista por posición),
+        cambios (detalle de lo aplicado o a aplicar) y dry_run
+
+    Raises:
+        ValueError: Si la lista supera IMPORT_MAX_ROWS
+        DirectorioIncompleto: Si el directorio no tiene todos los usuarios
+    """
+    if len(cambios) > MAX_FILAS:
+        raise ValueError(f"La lista supera el máximo de {MAX_FILAS} cambios")
+
+    actualizaciones, errores, sin_cambios = validar_cambios(cambios)
+    print(f"🪪 Reasignación masiva: {len(cambios)} cambios, {len(actualizaciones)} a aplicar, "
+          f"{len(errores)} con errores{' (dry-run)' if dry_run else ''}")
+
+    detalle = [{k: c[k] for k in ('codigo', 'nombre', 'tarjeta_anterior', 'tarjeta', 'turno_anterior', 'turno')}
+               for c in actualizaciones]
+    if dry_run:
+        actualizados = len(actualizaciones)
+    else:
+        fallidas = len(errores)
+        estacionadas = _estacionar_tarjetas(actualizaciones, errores)
+        filas = [{k: c[k] for k in ('fila', 'id') + COLUMNAS} for c in actualizaciones]
+        antes_de_asignar = len(errores)
+        actualizados = _escribir_por_lotes(filas, actualizar_usuarios_lote, errores)
+        _restaurar_tarjetas(estacionadas, {e['codigo'] for e in errores[antes_de_asignar:]}, errores)
+        rechazadas = {e['codigo'] for e in errores[fallidas:]}
+        detalle = [d for d in detalle if d['codigo'] not in rechazadas]
+        if actualizados or estacionadas:
+            # Una sola invalidación para todo el lote (el kiosco recarga el directorio una vez)
+            invalidar_directorio_usuarios()
+
+    return {
+        'total': len(cambios),
+        'actualizados': actualizados,
+        'sin_cambios': sin_cambios,
+        'errores': sorted(errores, key=lambda e: e['fila']),
+        'cambios': detalle,
+        'dry_run': dry_run
+    }
@@ -0,0 +1,169 @@
+"""
+Métricas de Operación (Prometheus)
+==================================
+
+Contadores e histogramas de bajo costo para planificar capacidad con datos
+reales, expuestos en formato de texto en /metrics:
+
+- breaktime_pasadas_total{resultado}: pasadas de tarjeta por resultado
+  (entrada, salida, no_encontrado, formato_invalido, sin_conexion, error)
+- breaktime_kiosco_etapa_segundos{etapa}: latencia por etapa del kiosco
+  (parseo, busqueda, descanso_activo, apertura, cierre)
+- breaktime_descansos_activos: descansos abiertos en la última lectura
+- breaktime_reporte_segundos{tipo,formato}: tiempo de generación de reportes
+- breaktime_exportacion_bytes{tipo,formato}: tamaño de las exportaciones
+
+Con varios workers de gunicorn cada proceso escribe sus valores en
+PROMETHEUS_MULTIPROC_DIR (debe definirse antes de arrancar) y /metrics
+agrega los archivos de todos los workers; gunicorn.conf.py limpia el
+directorio al arrancar y marca los workers que terminan.
+
+prometheus_client es opcional: si no está instalado las funciones de registro
+no hacen nada y /metrics responde que las métricas no están disponibles.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Tuple
+
+# Configuración
+DIRECTORIO_MULTIPROCESO = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# prometheus_client lee el directorio al importarse; debe existir
+if DIRECTORIO_MULTIPROCESO:
+    os.makedirs(DIRECTORIO_MULTIPROCESO, exist_ok=True)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client import multiprocess
+    PROMETHEUS_DISPONIBLE = True
+except ImportError:
+    PROMETHEUS_DISPONIBLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+RESULTADOS_PASADA = ('entrada', 'salida', 'no_encontrado', 'formato_invalido', 'sin_conexion', 'error')
+ETAPAS_KIOSCO = ('parseo', 'busqueda', 'descanso_activo', 'apertura', 'cierre')
+
+# Buckets pensados para llamadas HTTP a Supabase (ms a pocos segundos)
+BUCKETS_ETAPA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0)
+BUCKETS_REPORTE = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+if PROMETHEUS_DISPONIBLE:
+    _pasadas = Counter('breaktime_pasadas', 'Pasadas de tarjeta en el kiosco por resultado', ['resultado'])
+    _etapas = Histogram('breaktime_kiosco_etapa_segundos', 'Latencia por etapa del kiosco',
+                        ['etapa'], buckets=BUCKETS_ETAPA)
+    _descansos_activos = Gauge('breaktime_descansos_activos', 'Descansos abiertos en la última lectura',
+                               multiprocess_mode='livemostrecent')
+    _reportes = Histogram('breaktime_reporte_segundos', 'Tiempo de generación de reportes',
+                          ['tipo', 'formato'], buckets=BUCKETS_REPORTE)
+    _exportacion_bytes = Histogram('breaktime_exportacion_bytes', 'Tamaño de las exportaciones generadas',
+                                   ['tipo', 'formato'], buckets=BUCKETS_BYTES)
+
+    # Hijos con etiquetas fijas resueltos una sola vez (evita el lookup por pasada)
+    _pasadas_por_resultado = {r: _pasadas.labels(resultado=r) for r in RESULTADOS_PASADA}
+    _etapas_por_nombre = {e: _etapas.labels(etapa=e) for e in ETAPAS_KIOSCO}
+
+def registrar_pasada(resultado: str):
+    """
+    Cuenta una pasada de tarjeta
+
+    Args:
+        resultado: Uno de RESULTADOS_PASADA
+    """
+    if PROMETHEUS_DISPONIBLE:
+        _pasadas_por_resultado[resultado].inc()
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """
+    Mide la duración de una etapa del kiosco (uno de ETAPAS_KIOSCO)
+
+    Uso:
+        with medir_etapa('busqueda'):
+            usuario = buscar_usuario_inteligente(entrada)
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if PROMETHEUS_DISPONIBLE:
+            _etapas_por_nombre[etapa].observe(time.perf_counter() - inicio)
+
+def actualizar_descansos_activos(cantidad: int):
+    """
+    Actualiza el gauge de descansos abiertos
+
+    Args:
+        cantidad: Descansos activos en la última lectura
+    """
+    if PROMETHEUS_DISPONIBLE:
+        _descansos_activos.set(cantidad)
+
+@contextmanager
+def medir_reporte(tipo: str, formato: str):
+    """
+    Mide la generación de un reporte (también sirve como decorador de una ruta)
+
+    Args:
+        tipo: Tipo de reporte ('completo', 'resumen', 'pagina', ...)
+        formato: Formato de salida ('csv', 'excel', 'html', ...)
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if PROMETHEUS_DISPONIBLE:
+            _reportes.labels(tipo=tipo, formato=formato).observe(time.perf_counter() - inicio)
+
+def registrar_exportacion(tipo: str, formato: str, bytes_generados: int):
+    """
+    Registra el tamaño de una exportación generada
+
+    Args:
+        tipo: Tipo de reporte
+        formato: Formato de salida
+        bytes_generados: Tamaño del archivo en bytes
+    """
+    if PROMETHEUS_DISPONIBLE:
+        _exportacion_bytes.labels(tipo=tipo, formato=formato).observe(bytes_generados)
+
+def medir_flujo(fragmentos: Iterable[bytes], tipo: str, formato: str) -> Iterator[bytes]:
+    """
+    Envuelve una exportación enviada en streaming: al terminar registra su
+    duración y los bytes enviados
+
+    Args:
+        fragmentos: Generador de bytes de la exportación
+        tipo: Tipo de reporte
+        formato: Formato de salida
+
+    Yields:
+        Los mismos fragmentos
+    """
+    total = 0
+    with medir_reporte(tipo, formato):
+        for fragmento in fragmentos:
+            total += len(fragmento)
+            yield fragmento
+    registrar_exportacion(tipo, formato, total)
+
+def exponer_metricas() -> Tuple[Optional[bytes], str]:
+    """
+    Genera el texto de /metrics (agregando todos los workers si hay directorio multiproceso)
+
+    Returns:
+        Tupla (cuerpo, content_type); cuerpo es None si prometheus_client no está instalado
+    """
+    if not PROMETHEUS_DISPONIBLE:
+        return None, CONTENT_TYPE_LATEST
+
+    if DIRECTORIO_MULTIPROCESO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
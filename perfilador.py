@@ -0,0 +1,276 @@
+"""
+Perfilador por Muestreo de Peticiones Lentas
+============================================
+
+Cuando /reportes o una exportación tarda, permite ver si el tiempo se fue en
+la red (httpx), en decodificar el JSON de PostgREST, en los bucles de
+agregación o en renderizar Jinja.
+
+Funcionamiento (opt-in con PROFILER_ENABLED=true):
+1. Al empezar una petición Flask se registra el hilo que la atiende.
+2. Un único hilo muestreador toma la pila de esos hilos cada
+   PROFILER_INTERVAL_MS con sys._current_frames() y acumula pilas idénticas.
+3. Al terminar, si la petición superó PROFILER_THRESHOLD_MS, las pilas se
+   guardan en formato "collapsed" (una línea "f1;f2;f3 N" por pila, lo que
+   leen flamegraph.pl, speedscope o inferno) junto a un JSON con el resumen
+   por categoría (red, json, plantillas, espera_paralela, aplicacion).
+   Si fue rápida, se descartan.
+
+Sin peticiones en curso el muestreador queda dormido esperando un evento, y
+con el perfilador deshabilitado no se registra ningún hook.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Configuración
+HABILITADO = os.getenv('PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'si', 'sí')
+UMBRAL_MS = float(os.getenv('PROFILER_THRESHOLD_MS', '1000'))
+INTERVALO_SEGUNDOS = float(os.getenv('PROFILER_INTERVAL_MS', '10')) / 1000
+PERFILES_DIR = os.getenv('PROFILER_DIR', os.path.join(tempfile.gettempdir(), 'breaktime_perfiles'))
+MAX_PERFILES = int(os.getenv('PROFILER_MAX_PROFILES', '50'))
+
+# Profundidad máxima de pila muestreada
+PROFUNDIDAD_MAX = 128
+
+# Categorías: se asigna la del primer frame (desde la hoja) cuyo archivo coincide
+CATEGORIAS = (
+    ('red', ('httpx', 'httpcore', 'h2', 'h11', 'ssl.py', 'socket.py', 'selectors.py')),
+    ('json', ('json', 'postgrest')),
+    ('plantillas', ('jinja2', 'markupsafe')),
+)
+
+# Si ningún frame coincide pero el hilo espera futuros (consultas_paralelas),
+# el tiempo se fue esperando consultas que corren en otros hilos
+CATEGORIA_ESPERA = ('espera_paralela', ('concurrent' + os.sep + 'futures',))
+
+_lock = threading.Lock()
+_activos: Dict[int, Dict] = {}
+_hay_activos = threading.Event()
+_muestreador: Optional[threading.Thread] = None
+
+def _nombre_frame(codigo) -> str:
+    modulo = os.path.splitext(os.path.basename(codigo.co_filename))[0]
+    return f"{modulo}.{codigo.co_name}:{codigo.co_firstlineno}"
+
+def _categoria(pila: Tuple[Tuple[str, str], ...]) -> str:
+    for archivo, _ in reversed(pila):
+        for categoria, patrones in CATEGORIAS:
+            if any(p in archivo for p in patrones):
+                return categoria
+    categoria, patrones = CATEGORIA_ESPERA
+    if any(p in archivo for archivo, _ in pila for p in patrones):
+        return categoria
+    return 'aplicacion'
+
+def _muestrear():
+    """Bucle del hilo muestreador"""
+    propio = threading.get_ident()
+    while True:
+        _hay_activos.wait()
+        time.sleep(INTERVALO_SEGUNDOS)
+
+        with _lock:
+            objetivos = list(_activos.items())
+        if not objetivos:
+            continue
+
+        frames = sys._current_frames()
+        pilas = []
+        for tid, perfil in objetivos:
+            frame = frames.get(tid)
+            if frame is None or tid == propio:
+                continue
+            pila = []
+            while frame is not None and len(pila) < PROFUNDIDAD_MAX:
+                pila.append((frame.f_code.co_filename, _nombre_frame(frame.f_code)))
+                frame = frame.f_back
+            pila.reverse()
+            pilas.append((tid, perfil, tuple(pila)))
+
+        # Sumar bajo el lock y solo si el perfil sigue activo: terminar_perfil lo
+        # quita bajo el mismo lock antes de recorrer sus muestras para guardarlo
+        with _lock:
+            for tid, perfil, pila in pilas:
+                if _activos.get(tid) is perfil:
+                    perfil['muestras'][pila] += 1
+
+def _asegurar_muestreador():
+    global _muestreador
+    if _muestreador is None:
+        with _lock:
+            if _muestreador is None:
+                _muestreador = threading.Thread(target=_muestrear, name='perfilador', daemon=True)
+                _muestreador.start()
+
+def iniciar_perfil(etiqueta: str, **datos):
+    """
+    Empieza a muestrear el hilo actual
+
+    Args:
+        etiqueta: Descripción corta (p. ej. 'GET /reportes')
+        **datos: Datos adicionales que se guardan en el resumen
+    """
+    _asegurar_muestreador()
+    with _lock:
+        _activos[threading.get_ident()] = {
+            'etiqueta': etiqueta,
+            'datos': datos,
+            'inicio': time.perf_counter(),
+            'muestras': Counter()
+        }
+        _hay_activos.set()
+
+def terminar_perfil(**datos) -> Optional[str]:
+    """
+    Deja de muestrear el hilo actual y guarda el perfil si superó el umbral
+
+    Args:
+        **datos: Datos adicionales (p. ej. código de estado)
+
+    Returns:
+        ID del perfil guardado, o None si fue rápido o no había perfil en curso
+    """
+    with _lock:
+        perfil = _activos.pop(threading.get_ident(), None)
+        if not _activos:
+            _hay_activos.clear()
+    if perfil is None:
+        return None
+
+    duracion_ms = (time.perf_counter() - perfil['inicio']) * 1000
+    if duracion_ms < UMBRAL_MS or not perfil['muestras']:
+        return None
+
+    perfil['datos'].update(datos)
+    try:
+        return _guardar_perfil(perfil, duracion_ms)
+    except Exception as e:
+        print(f"❌ Error guardando perfil de '{perfil['etiqueta']}': {e}")
+        return None
+
+@contextmanager
+def perfilar(etiqueta: str, **datos):
+    """
+    Perfila un bloque fuera de una petición (p. ej. un trabajo de exportación)
+
+    Uso:
+        with perfilar('exportacion completo'):
+            generar_exportacion(...)
+    """
+    if not HABILITADO:
+        yield
+        return
+    iniciar_perfil(etiqueta, **datos)
+    try:
+        yield
+    finally:
+        terminar_perfil()
+
+def _guardar_perfil(perfil: Dict, duracion_ms: float) -> str:
+    os.makedirs(PERFILES_DIR, exist_ok=True)
+    perfil_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    categorias = Counter()
+    lineas = []
+    for pila, cantidad in perfil['muestras'].most_common():
+        categorias[_categoria(pila)] += cantidad
+        lineas.append(f"{';'.join(nombre for _, nombre in pila)} {cantidad}")
+
+    total = sum(categorias.values())
+    resumen = {
+        'id': perfil_id,
+        'etiqueta': perfil['etiqueta'],
+        'duracion_ms': round(duracion_ms, 1),
+        'muestras': total,
+        'intervalo_ms': INTERVALO_SEGUNDOS * 1000,
+        'categorias': {c: round(n / total * 100, 1) for c, n in categorias.most_common()},
+        'creado': time.time(),
+        **perfil['datos']
+    }
+
+    with open(os.path.join(PERFILES_DIR, f"{perfil_id}.folded"), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lineas) + '\n')
+    with open(os.path.join(PERFILES_DIR, f"{perfil_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(resumen, f)
+
+    print(f"🐢 Perfil {perfil_id}: {perfil['etiqueta']} tardó {duracion_ms:.0f} ms ({resumen['categorias']})")
+    _podar_perfiles()
+    return perfil_id
+
+def _podar_perfiles():
+    """Conserva solo los MAX_PERFILES más recientes"""
+    resumenes = sorted(f for f in os.listdir(PERFILES_DIR) if f.endswith('.json'))
+    for nombre in resumenes[:max(0, len(resumenes) - MAX_PERFILES)]:
+        for extension in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(PERFILES_DIR, nombre[:-5] + extension))
+            except OSError:
+                pass
+
+def listar_perfiles(limite: int = 50) -> List[Dict]:
+    """
+    Resúmenes de los perfiles guardados, del más reciente al más antiguo
+
+    Args:
+        limite: Cantidad máxima a devolver
+
+    Returns:
+        Lista de dicts con id, etiqueta, duracion_ms, muestras y categorias
+    """
+    if not os.path.isdir(PERFILES_DIR):
+        return []
+
+    perfiles = []
+    for nombre in sorted((f for f in os.listdir(PERFILES_DIR) if f.endswith('.json')), reverse=True)[:limite]:
+        try:
+            with open(os.path.join(PERFILES_DIR, nombre), encoding='utf-8') as f:
+                perfiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return perfiles
+
+def ruta_perfil(perfil_id: str) -> Optional[str]:
+    """
+    Ruta del archivo de pilas de un perfil
+
+    Args:
+        perfil_id: ID devuelto por listar_perfiles
+
+    Returns:
+        Ruta del archivo .folded, o None si no existe o el ID no es válido
+    """
+    if not perfil_id or os.path.basename(perfil_id) != perfil_id or perfil_id.startswith('.'):
+        return None
+    ruta = os.path.join(PERFILES_DIR, f"{perfil_id}.folded")
+    return ruta if os.path.exists(ruta) else None
+
+def instalar(app):
+    """
+    Registra los hooks de perfilado en la aplicación Flask (solo si está habilitado)
+
+    Args:
+        app: Aplicación Flask
+    """
+    if not HABILITADO:
+        return
+
+    from flask import request
+
+    @app.before_request
+    def _iniciar_perfil_peticion():
+        iniciar_perfil(f"{request.method} {request.path}", ruta=request.full_path.rstrip('?'), metodo=request.method)
+
+    @app.teardown_request
+    def _terminar_perfil_peticion(error=None):
+        terminar_perfil(error=str(error) if error else None)
+
+    print(f"🐢 Perfilador activo: peticiones de más de {UMBRAL_MS:.0f} ms se guardan en {PERFILES_DIR}")
@@ -0,0 +1,241 @@
+"""
+Políticas de Descanso
+=====================
+
+Centraliza los límites que antes estaban repartidos como literales
+(30 min para COMIDA vs DESCANSO, 20/40 de límite, 30/60/120 para el estado del
+resumen) y permite configurarlos por sitio y por turno sin tocar código.
+
+La configuración se lee de un JSON (POLITICAS_FILE, por defecto
+politicas.json junto a la app; ver politicas.example.json):
+
+    {
+      "default": {"limite_comida": 40},
+      "turnos": {"Part Time": {"limite_comida": 30}},
+      "sitios": {
+        "otro_sitio": {"default": {...}, "turnos": {"Full": {...}}}
+      }
+    }
+
+Cada combinación (sitio, turno) se compila una vez en tablas de consulta por
+minuto de duración. El archivo se vuelve a leer cuando cambia, de modo que RR.HH.
+puede ajustar una regla sin redeploy; los reportes se recalculan a partir de las
+duraciones guardadas.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Configuración
+POLITICAS_FILE = os.getenv('POLITICAS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'politicas.json'))
+SITIO = os.getenv('SITIO', 'default')
+
+# Cada cuánto se revisa si el archivo de políticas cambió (segundos)
+INTERVALO_RECARGA = 30
+
+# Duración máxima cubierta por las tablas de consulta (minutos)
+MAX_MINUTOS_TABLA = 24 * 60
+
+# Valores por defecto (los que usaba el sistema originalmente)
+POLITICA_DEFAULT = {
+    'umbral_comida': 30,        # Duración desde la que un descanso cerrado es COMIDA
+    'limite_descanso': 20,      # Límite de un DESCANSO
+    'limite_comida': 40,        # Límite de una COMIDA
+    'duracion_corta': 5,        # Bajo esta duración se marca "Duración muy corta"
+    'niveles_registro': [[30, 'EXCESO ALTO'], [0, 'CON EXCESO']],
+    'estado_registro_normal': 'NORMAL',
+    'niveles_resumen': [[120, 'CRÍTICO'], [60, 'ALTO EXCESO'], [30, 'MODERADO EXCESO'], [0, 'LEVE EXCESO']],
+    'estado_resumen_normal': 'ÓPTIMO'
+}
+
+class PoliticaDescanso:
+    """Política compilada: límites y tablas de consulta por minuto de duración"""
+
+    __slots__ = ('config', 'umbral_comida', 'limite_descanso', 'limite_comida', 'duracion_corta',
+                 '_niveles_registro', '_estado_registro_normal', '_niveles_resumen', '_estado_resumen_normal',
+                 '_tipos', '_excesos_descanso', '_excesos_comida')
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.umbral_comida = int(config['umbral_comida'])
+        self.limite_descanso = int(config['limite_descanso'])
+        self.limite_comida = int(config['limite_comida'])
+        self.duracion_corta = int(config['duracion_corta'])
+
+        # Niveles ordenados de mayor a menor umbral
+        self._niveles_registro = sorted(((int(u), e) for u, e in config['niveles_registro']), reverse=True)
+        self._estado_registro_normal = config['estado_registro_normal']
+        self._niveles_resumen = sorted(((int(u), e) for u, e in config['niveles_resumen']), reverse=True)
+        self._estado_resumen_normal = config['estado_resumen_normal']
+
+        # Tablas de consulta indexadas por duración en minutos
+        minutos = range(MAX_MINUTOS_TABLA + 1)
+        self._tipos = tuple('COMIDA' if m >= self.umbral_comida else 'DESCANSO' for m in minutos)
+        self._excesos_descanso = tuple(max(0, m - self.limite_descanso) for m in minutos)
+        self._excesos_comida = tuple(max(0, m - self.limite_comida) for m in minutos)
+
+    def tipo_por_duracion(self, duracion: int) -> str:
+        """Tipo con que se guarda un descanso cerrado según su duración"""
+        if 0 <= duracion <= MAX_MINUTOS_TABLA:
+            return self._tipos[duracion]
+        return 'COMIDA' if duracion >= self.umbral_comida else 'DESCANSO'
+
+    def limite(self, tipo: str) -> int:
+        """Límite en minutos para un tipo de descanso"""
+        return self.limite_comida if tipo == 'COMIDA' else self.limite_descanso
+
+    def exceso(self, tipo: str, duracion: int) -> int:
+        """Minutos por sobre el límite del tipo"""
+        if 0 <= duracion <= MAX_MINUTOS_TABLA:
+            return (self._excesos_comida if tipo == 'COMIDA' else self._excesos_descanso)[duracion]
+        return max(0, duracion - self.limite(tipo))
+
+    def tipo_probable(self, transcurrido: int) -> str:
+        """Tipo probable de un descanso activo (pasado el límite de DESCANSO se asume COMIDA)"""
+        return 'COMIDA' if transcurrido >= self.limite_descanso else 'DESCANSO'
+
+    def maximo_probable(self, transcurrido: int) -> int:
+        """Máximo aplicable a un descanso activo según su tipo probable"""
+        return self.limite_comida if transcurrido >= self.limite_descanso else self.limite_descanso
+
+    def estado_registro(self, exceso: int) -> str:
+        """Estado de un registro individual según su exceso"""
+        for umbral, estado in self._niveles_registro:
+            if exceso > umbral:
+                return estado
+        return self._estado_registro_normal
+
+    def estado_resumen(self, exceso_total: int) -> str:
+        """Estado general de un usuario según su exceso acumulado"""
+        for umbral, estado in self._niveles_resumen:
+            if exceso_total > umbral:
+                return estado
+        return self._estado_resumen_normal
+
+_lock = threading.Lock()
+_config: Dict = {}
+_version = ''
+_mtime: Optional[float] = None
+_ultima_revision = 0.0
+_compiladas: Dict[Tuple[str, Optional[str]], PoliticaDescanso] = {}
+
+def _leer_archivo() -> Tuple[Dict, Optional[float]]:
+    try:
+        mtime = os.path.getmtime(POLITICAS_FILE)
+    except OSError:
+        return {}, None
+
+    try:
+        with open(POLITICAS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f), mtime
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Error leyendo políticas de {POLITICAS_FILE}: {e}")
+        return _config, mtime
+
+def recargar_politicas(forzar: bool = False) -> bool:
+    """
+    Vuelve a leer el archivo de políticas si cambió
+
+    Args:
+        forzar: Si True lo lee aunque el mtime no haya cambiado
+
+    Returns:
+        bool: True si la configuración cambió
+    """
+    global _config, _version, _mtime, _ultima_revision
+
+    _ultima_revision = time.monotonic()
+    try:
+        mtime = os.path.getmtime(POLITICAS_FILE)
+    except OSError:
+        mtime = None
+
+    if not forzar and _version and mtime == _mtime:
+        return False
+
+    config, mtime = _leer_archivo()
+    with _lock:
+        _config = config
+        _mtime = mtime
+        _version = hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        _compiladas.clear()
+
+    print(f"📐 Políticas de descanso cargadas (versión {_version}, sitio {SITIO})")
+    return True
+
+def _revisar_recarga():
+    if not _version or time.monotonic() - _ultima_revision > INTERVALO_RECARGA:
+        recargar_politicas()
+
+def _config_efectiva(sitio: str, turno: Optional[str]) -> Dict:
+    """Combina default del sistema <- default del archivo <- sitio <- turno"""
+    config = dict(POLITICA_DEFAULT)
+    config_sitio = _config.get('sitios', {}).get(sitio, {})
+
+    config.update(_config.get('default', {}))
+    config.update(config_sitio.get('default', {}))
+    if turno:
+        config.update(_config.get('turnos', {}).get(turno, {}))
+        config.update(config_sitio.get('turnos', {}).get(turno, {}))
+    return config
+
+def obtener_politica(turno: Optional[str] = None, sitio: Optional[str] = None) -> PoliticaDescanso:
+    """
+    Obtiene la política compilada para un turno y sitio
+
+    Args:
+        turno: Turno del usuario ('Full', 'Part Time', 'Llamado'); None usa la política general
+        sitio: Sitio (por defecto el de la variable SITIO)
+
+    Returns:
+        PoliticaDescanso
+    """
+    _revisar_recarga()
+
+    clave = (sitio or SITIO, turno)
+    politica = _compiladas.get(clave)
+    if politica is None:
+        with _lock:
+            politica = _compiladas.get(clave)
+            if politica is None:
+                politica = PoliticaDescanso(_config_efectiva(clave[0], turno))
+                _compiladas[clave] = politica
+    return politica
+
+def version_politicas() -> str:
+    """
+    Identificador de la configuración vigente (cambia cuando RR.HH. edita una regla)
+
+    Returns:
+        str: Hash corto de la configuración
+    """
+    _revisar_recarga()
+    return _version
+
+def describir_politicas(turnos: Optional[List[str]] = None, sitio: Optional[str] = None) -> Dict:
+    """
+    Políticas efectivas para mostrar o auditar
+
+    Args:
+        turnos: Turnos a incluir (por defecto los configurados en el archivo)
+        sitio: Sitio (por defecto el de la variable SITIO)
+
+    Returns:
+        Dict con versión, sitio y configuración efectiva por turno
+    """
+    sitio = sitio or SITIO
+    if turnos is None:
+        turnos = sorted(set(_config.get('turnos', {})) |
+                        set(_config.get('sitios', {}).get(sitio, {}).get('turnos', {})))
+
+    return {
+        'version': version_politicas(),
+        'sitio': sitio,
+        'archivo': POLITICAS_FILE if _mtime is not None else None,
+        'default': obtener_politica(None, sitio).config,
+        'turnos': {turno: obtener_politica(turno, sitio).config for turno in turnos}
+    }
@@ -0,0 +1,162 @@
+"""
+Chequeos de Salud
+=================
+
+Estado del worker para /live, /ready y /health sin generar tráfico extra a
+Supabase en cada sonda del balanceador:
+
+- Base de datos: se guarda el resultado del último chequeo; cuando vence
+  (HEALTH_DB_TTL_SECONDS) se renueva en un hilo de fondo y la sonda responde
+  con el dato anterior, nunca espera a la red.
+- Pool HTTP: conexiones en uso y peticiones en espera (saturación).
+- Circuit breaker: estado de db_resiliencia.
+- Cachés: directorio de usuarios, snapshot de descansos activos y políticas.
+- Trabajos: backlog de exportaciones en segundo plano.
+
+estado_salud() combina todo y decide si el worker está listo para recibir
+tráfico, con la lista de motivos cuando no lo está.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import db_utils
+import export_jobs
+from politicas import version_politicas
+
+# Configuración
+DB_TTL_SEGUNDOS = float(os.getenv('HEALTH_DB_TTL_SECONDS', '15'))
+DB_MAX_EDAD_SEGUNDOS = float(os.getenv('HEALTH_DB_MAX_AGE_SECONDS', '60'))
+SATURACION_MAX = float(os.getenv('HEALTH_POOL_SATURATION_MAX', '0.9'))
+BACKLOG_MAX = int(os.getenv('HEALTH_JOB_BACKLOG_MAX', '20'))
+
+_lock = threading.Lock()
+_chequeo_en_curso = False
+_ultimo_chequeo: Dict = {
+    'ok': None,
+    'momento': None,
+    'ultimo_exito': None,
+    'latencia_ms': None,
+    'error': None
+}
+
+def _chequear_base_datos():
+    """Consulta mínima a Supabase (pasa por el circuit breaker)"""
+    global _chequeo_en_curso
+    inicio = time.monotonic()
+    try:
+        db_utils.ejecutar(db_utils.get_client().table('usuarios').select('id').limit(1), 'kiosco')
+        _ultimo_chequeo.update({
+            'ok': True,
+            'ultimo_exito': time.time(),
+            'latencia_ms': round((time.monotonic() - inicio) * 1000, 1),
+            'error': None
+        })
+    except Exception as e:
+        _ultimo_chequeo.update({
+            'ok': False,
+            'latencia_ms': round((time.monotonic() - inicio) * 1000, 1),
+            'error': f"{type(e).__name__}: {e}"
+        })
+    finally:
+        _ultimo_chequeo['momento'] = time.time()
+        with _lock:
+            _chequeo_en_curso = False
+
+def _reservar_chequeo() -> bool:
+    global _chequeo_en_curso
+    with _lock:
+        if _chequeo_en_curso:
+            return False
+        _chequeo_en_curso = True
+        return True
+
+def refrescar_base_datos() -> bool:
+    """
+    Ejecuta el chequeo de la base de datos en el hilo actual (p. ej. al calentar)
+
+    Returns:
+        bool: True si la base respondió; si ya había un chequeo en curso
+        devuelve el último resultado conocido
+    """
+    if _reservar_chequeo():
+        _chequear_base_datos()
+    return bool(_ultimo_chequeo['ok'])
+
+def estado_base_datos() -> Dict:
+    """
+    Último chequeo de la base de datos; si venció lanza uno nuevo en segundo plano
+
+    Returns:
+        Dict con ok, momento, ultimo_exito, latencia_ms, error y edad_segundos
+    """
+    momento = _ultimo_chequeo['momento']
+    if (momento is None or time.time() - momento > DB_TTL_SEGUNDOS) and _reservar_chequeo():
+        threading.Thread(target=_chequear_base_datos, name='chequeo_db', daemon=True).start()
+
+    estado = dict(_ultimo_chequeo)
+    estado['edad_segundos'] = round(time.time() - momento, 1) if momento is not None else None
+    return estado
+
+def estado_caches() -> Dict:
+    """
+    Estado de las cachés locales que usa el kiosco
+
+    Returns:
+        Dict con directorio de usuarios, snapshot de descansos y versión de políticas
+    """
+    snapshot = db_utils.obtener_snapshot_descansos_activos()
+    return {
+        'directorio_usuarios': db_utils.estado_directorio(),
+        'descansos_activos': {
+            'cargado': snapshot is not None,
+            'descansos': len(snapshot[0]) if snapshot else 0,
+            'edad_segundos': round(time.time() - snapshot[1], 1) if snapshot else None
+        },
+        'politicas': version_politicas()
+    }
+
+def estado_salud(arranque: Optional[Dict] = None) -> Dict:
+    """
+    Estado completo del worker, calculado solo con datos en memoria
+
+    Args:
+        arranque: Estado del calentamiento de la aplicación (estado_arranque)
+
+    Returns:
+        Dict con status ('ok' o 'degradado'), listo, motivos y el detalle por componente
+    """
+    base_datos = estado_base_datos()
+    pool = db_utils.estado_pool()
+    circuito = db_utils.estado_resiliencia()
+    caches = estado_caches()
+    trabajos = export_jobs.resumen_trabajos()
+
+    motivos: List[str] = []
+    if arranque is not None and not arranque.get('listo'):
+        motivos.append('calentamiento incompleto')
+    if not base_datos['ultimo_exito'] or time.time() - base_datos['ultimo_exito'] > DB_MAX_EDAD_SEGUNDOS:
+        motivos.append('sin chequeo exitoso reciente de la base de datos')
+    if circuito['estado'] == 'abierto':
+        motivos.append('circuit breaker abierto')
+    if pool['saturacion'] >= SATURACION_MAX:
+        motivos.append(f"pool HTTP saturado ({pool['en_uso']} en uso, {pool['en_espera']} en espera)")
+    if trabajos['pendientes'] > BACKLOG_MAX:
+        motivos.append(f"{trabajos['pendientes']} exportaciones pendientes")
+
+    return {
+        'status': 'ok' if not motivos else 'degradado',
+        'listo': not motivos,
+        'motivos': motivos,
+        'base_datos': base_datos,
+        'pool': pool,
+        'circuito': {
+            'estado': circuito['estado'],
+            'fallos_consecutivos': circuito['fallos_consecutivos'],
+            'segundos_para_reintento': circuito['segundos_para_reintento']
+        },
+        'caches': caches,
+        'trabajos': trabajos
+    }
@@ -0,0 +1,255 @@
+"""
+Sesiones del Lado del Servidor
+==============================
+
+Reemplaza la cookie firmada de Flask (que guardaba todos los datos y se
+re-firmaba en cada respuesta al actualizar last_activity) por una cookie que
+solo lleva el ID de sesión firmado. Los datos viven en el servidor:
+
+- Memoria del worker: diccionario {sid: entrada}; verificar la sesión en cada
+  petición es una búsqueda en el diccionario.
+- SQLite local (SESSION_DB_PATH): compartido por los workers de gunicorn de
+  la misma máquina. Se lee solo cuando el worker no conoce la sesión y se
+  escribe al crearla, modificarla o cerrarla.
+
+Expiración deslizante: la última actividad se actualiza en memoria en cada
+petición y se persiste como máximo una vez cada SESSION_TOUCH_SECONDS. Una
+sesión inactiva más de PERMANENT_SESSION_LIFETIME se elimina. La cookie es de
+sesión del navegador (sin Expires), así que no se reenvía para deslizarla:
+solo se envía al iniciar sesión y se borra al cerrarla.
+
+Un logout borra la cookie del navegador y la fila en SQLite; otro worker que
+tuviera la sesión en memoria lo nota en su siguiente persistencia de actividad.
+"""
+
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+# Configuración
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join(tempfile.gettempdir(), 'breaktime_sesiones.sqlite3'))
+TOQUE_SEGUNDOS = int(os.getenv('SESSION_TOUCH_SECONDS', '60'))
+
+# Cada cuánto se eliminan de SQLite las sesiones vencidas
+LIMPIEZA_SEGUNDOS = 600
+
+_serializador = TaggedJSONSerializer()
+
+class SesionServidor(CallbackDict, SessionMixin):
+    """Datos de sesión; el ID solo viaja en la cookie"""
+
+    def __init__(self, datos: Optional[Dict] = None, sid: Optional[str] = None, vencida: bool = False):
+        def al_modificar(sesion):
+            sesion.modified = True
+            sesion.accessed = True
+
+        super().__init__(datos, al_modificar)
+        self.sid = sid
+        # La cookie traía un ID vencido o cerrado: se borra, o se reemplaza si se inicia sesión
+        self.vencida = vencida
+        self.modified = False
+        self.accessed = False
+
+class AlmacenSesiones:
+    """Sesiones en memoria del worker, respaldadas en SQLite"""
+
+    def __init__(self, ruta: str = SESSION_DB_PATH, duracion: float = 1800.0):
+        self.ruta = ruta
+        # Inactividad permitida; la interfaz la fija con PERMANENT_SESSION_LIFETIME
+        self.duracion = duracion
+        self._lock = threading.Lock()
+        self._memoria: Dict[str, Dict] = {}
+        self._ultima_limpieza = 0.0
+        self._crear_tabla()
+
+    def _sql(self, consulta: str, parametros: tuple = ()) -> Tuple[List[tuple], int]:
+        """
+        Ejecuta una sentencia en su propia conexión (confirmada y cerrada al terminar)
+
+        Returns:
+            Tupla (filas, filas afectadas)
+        """
+        conexion = sqlite3.connect(self.ruta, timeout=5)
+        try:
+            with conexion:
+                cursor = conexion.execute(consulta, parametros)
+                return cursor.fetchall(), cursor.rowcount
+        finally:
+            conexion.close()
+
+    def _crear_tabla(self):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._sql('PRAGMA journal_mode=WAL')
+        self._sql('''CREATE TABLE IF NOT EXISTS sesiones (
+                         sid TEXT PRIMARY KEY,
+                         datos TEXT NOT NULL,
+                         ultima_actividad REAL NOT NULL)''')
+        print(f"🔑 Sesiones del servidor en {self.ruta}")
+
+    def obtener(self, sid: str) -> Optional[Dict]:
+        """
+        Datos de una sesión vigente (desliza su expiración)
+
+        Args:
+            sid: ID de sesión
+
+        Returns:
+            Dict con los datos, o None si no existe o venció
+        """
+        ahora = time.time()
+        entrada = self._memoria.get(sid)
+
+        if entrada is None or ahora - entrada['ultima_actividad'] > self.duracion:
+            # Desconocida o aparentemente vencida: otro worker pudo crearla o tocarla
+            entrada = self._leer(sid)
+            if entrada is None or ahora - entrada['ultima_actividad'] > self.duracion:
+                self.eliminar(sid)
+                return None
+            self._memoria[sid] = entrada
+
+        entrada['ultima_actividad'] = ahora
+        if ahora - entrada['persistida'] >= TOQUE_SEGUNDOS:
+            self._tocar(sid, entrada)
+        return dict(entrada['datos']) if sid in self._memoria else None
+
+    def guardar(self, sid: str, datos: Dict):
+        """Crea o reemplaza una sesión"""
+        ahora = time.time()
+        self._sql('INSERT OR REPLACE INTO sesiones (sid, datos, ultima_actividad) VALUES (?, ?, ?)',
+                  (sid, _serializador.dumps(datos), ahora))
+        self._memoria[sid] = {'datos': dict(datos), 'ultima_actividad': ahora, 'persistida': ahora}
+        self._limpiar_vencidas(ahora)
+
+    def eliminar(self, sid: str):
+        """Elimina una sesión (logout o vencimiento)"""
+        self._memoria.pop(sid, None)
+        try:
+            self._sql('DELETE FROM sesiones WHERE sid = ?', (sid,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Error eliminando sesión: {e}")
+
+    def _leer(self, sid: str) -> Optional[Dict]:
+        try:
+            filas, _ = self._sql('SELECT datos, ultima_actividad FROM sesiones WHERE sid = ?', (sid,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Error leyendo sesión: {e}")
+            return None
+        if not filas:
+            return None
+        fila = filas[0]
+        return {'datos': _serializador.loads(fila[0]), 'ultima_actividad': fila[1], 'persistida': fila[1]}
+
+    def _tocar(self, sid: str, entrada: Dict):
+        """Persiste la última actividad; si la fila ya no existe la sesión se cerró en otro worker"""
+        entrada['persistida'] = entrada['ultima_actividad']
+        try:
+            _, actualizadas = self._sql('UPDATE sesiones SET ultima_actividad = ? WHERE sid = ?',
+                                        (entrada['ultima_actividad'], sid))
+            if actualizadas == 0:
+                self._memoria.pop(sid, None)
+        except sqlite3.Error as e:
+            print(f"⚠️ Error actualizando actividad de sesión: {e}")
+        self._limpiar_vencidas(entrada['ultima_actividad'])
+
+    def _limpiar_vencidas(self, ahora: float):
+        if ahora - self._ultima_limpieza < LIMPIEZA_SEGUNDOS:
+            return
+        with self._lock:
+            if ahora - self._ultima_limpieza < LIMPIEZA_SEGUNDOS:
+                return
+            self._ultima_limpieza = ahora
+        limite = ahora - self.duracion
+        for sid in [s for s, e in self._memoria.items() if e['ultima_actividad'] < limite]:
+            self._memoria.pop(sid, None)
+        try:
+            self._sql('DELETE FROM sesiones WHERE ultima_actividad < ?', (limite,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Error limpiando sesiones vencidas: {e}")
+
+class InterfazSesionServidor(SessionInterface):
+    """SessionInterface de Flask: cookie con el ID firmado, datos en AlmacenSesiones"""
+
+    salt = 'breaktime-sesion'
+
+    def __init__(self, almacen: Optional[AlmacenSesiones] = None):
+        self._almacen = almacen
+        self._lock = threading.Lock()
+
+    @property
+    def almacen(self) -> AlmacenSesiones:
+        # Se crea al primer uso para no tocar el disco al importar la aplicación
+        if self._almacen is None:
+            with self._lock:
+                if self._almacen is None:
+                    self._almacen = AlmacenSesiones()
+        return self._almacen
+
+    def _firmador(self, app) -> Optional[Signer]:
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request) -> Optional[SesionServidor]:
+        firmador = self._firmador(app)
+        if firmador is None:
+            return None
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return SesionServidor()
+
+        try:
+            sid = firmador.unsign(cookie).decode('utf-8')
+        except BadSignature:
+            return SesionServidor()
+
+        self.almacen.duracion = app.permanent_session_lifetime.total_seconds()
+        datos = self.almacen.obtener(sid)
+        if datos is None:
+            return SesionServidor(vencida=True)
+        return SesionServidor(datos, sid=sid)
+
+    def save_session(self, app, session: SesionServidor, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid and session.modified:
+                self.almacen.eliminar(session.sid)
+            if session.vencida or (session.sid and session.modified):
+                response.delete_cookie(nombre, domain=dominio, path=ruta,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if not session.modified:
+            return
+
+        if session.sid is None:
+            # Sesión nueva (p. ej. login): ID nuevo, la única vez que se envía la cookie
+            session.sid = secrets.token_urlsafe(32)
+            self.almacen.guardar(session.sid, dict(session))
+            response.set_cookie(nombre, self._firmador(app).sign(session.sid).decode('utf-8'),
+                                domain=dominio, path=ruta,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app),
+                                httponly=self.get_cookie_httponly(app))
+            return
+
+        self.almacen.guardar(session.sid, dict(session))
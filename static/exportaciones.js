@@ -0,0 +1,43 @@
+// Exportaciones en segundo plano: encola el trabajo, consulta el progreso y descarga
+// Los enlaces con data-exportar mantienen su href como alternativa si algo falla
+(function () {
+    function consultar(urlEstado, boton, textoOriginal) {
+        fetch(urlEstado, { credentials: 'same-origin' })
+            .then(r => r.json())
+            .then(trabajo => {
+                if (trabajo.estado === 'listo') {
+                    boton.textContent = textoOriginal;
+                    window.location.href = trabajo.descarga;
+                } else if (trabajo.estado === 'error' || trabajo.error) {
+                    boton.textContent = textoOriginal;
+                    alert('Error al generar la exportación: ' + (trabajo.error || 'desconocido'));
+                } else {
+                    const total = trabajo.total ? ' / ' + trabajo.total : '';
+                    boton.textContent = '⏳ ' + trabajo.procesados + total + ' registros...';
+                    setTimeout(() => consultar(urlEstado, boton, textoOriginal), 1500);
+                }
+            })
+            .catch(() => { boton.textContent = textoOriginal; });
+    }
+
+    document.querySelectorAll('a[data-exportar]').forEach(boton => {
+        boton.addEventListener('click', evento => {
+            evento.preventDefault();
+            const textoOriginal = boton.textContent;
+            const params = new URL(boton.href, window.location.origin).searchParams;
+
+            boton.textContent = '⏳ Preparando...';
+            fetch(boton.dataset.exportar, { method: 'POST', body: params, credentials: 'same-origin' })
+                .then(r => {
+                    if (!r.ok) { throw new Error('HTTP ' + r.status); }
+                    return r.json();
+                })
+                .then(trabajo => consultar(boton.dataset.exportar + '/' + trabajo.id, boton, textoOriginal))
+                .catch(() => {
+                    // Alternativa: descarga directa
+                    boton.textContent = textoOriginal;
+                    window.location.href = boton.href;
+                });
+        });
+    });
+})();
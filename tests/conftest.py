@@ -0,0 +1,33 @@
+"""
+Fixtures de las Pruebas
+=======================
+
+El fixture db conecta un FakeSupabase (ver fake_supabase.py) a los módulos db_*
+y deja limpios el directorio de usuarios y el circuit breaker.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_admin
+import db_descansos
+import db_resiliencia
+import db_usuarios
+from fake_supabase import FakeSupabase
+
+@pytest.fixture
+def db(monkeypatch) -> FakeSupabase:
+    """Supabase falso conectado a los módulos db_*, con directorio y circuito limpios"""
+    falso = FakeSupabase()
+    for modulo in (db_usuarios, db_descansos, db_admin):
+        monkeypatch.setattr(modulo, 'get_client', lambda: falso, raising=False)
+        monkeypatch.setattr(modulo, 'get_admin_client', lambda: falso, raising=False)
+    monkeypatch.setattr(db_resiliencia, '_breaker', db_resiliencia._CircuitBreaker(3, 30))
+    monkeypatch.setattr(db_resiliencia, 'REINTENTOS', 0)
+    db_usuarios.invalidar_directorio_usuarios()
+    yield falso
+    db_usuarios.invalidar_directorio_usuarios()
@@ -0,0 +1,200 @@
+"""
+Supabase Falso para las Pruebas
+===============================
+
+FakeSupabase reemplaza al cliente de Supabase con tablas en memoria. Implementa
+el subconjunto del query builder de postgrest que usan los módulos db_*
+(select con JOIN a usuarios, filtros, order, range/limit, insert, upsert,
+update y delete) y, opcionalmente, restricciones UNIQUE revisadas fila por
+fila como en Postgres (no diferibles).
+"""
+
+import copy
+from typing import Any, Dict, List, Optional
+
+class ErrorFalso(Exception):
+    """Error de datos devuelto por el PostgREST falso (no es de infraestructura)"""
+
+class RespuestaFalsa:
+    def __init__(self, data: List[Dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+def _separar_columnas(texto: str) -> List[str]:
+    partes, actual, nivel = [], '', 0
+    for c in texto:
+        if c == ',' and nivel == 0:
+            partes.append(actual.strip())
+            actual = ''
+            continue
+        nivel += c == '('
+        nivel -= c == ')'
+        actual += c
+    if actual.strip():
+        partes.append(actual.strip())
+    return partes
+
+class ConsultaFalsa:
+    def __init__(self, db: 'FakeSupabase', tabla: str):
+        self.db = db
+        self.tabla = tabla
+        self.operacion = 'select'
+        self.columnas = '*'
+        self.contar = False
+        self.filtros = []
+        self.orden = []
+        self.desde = None
+        self.hasta = None
+        self.limite = None
+        self.datos = None
+        self.on_conflict = None
+
+    # Construcción
+    def select(self, columnas: str = '*', count: Optional[str] = None):
+        self.columnas, self.contar = columnas, count == 'exact'
+        return self
+
+    def insert(self, datos):
+        self.operacion, self.datos = 'insert', datos
+        return self
+
+    def upsert(self, datos, on_conflict: str = 'id'):
+        self.operacion, self.datos, self.on_conflict = 'upsert', datos, on_conflict
+        return self
+
+    def update(self, datos: Dict):
+        self.operacion, self.datos = 'update', datos
+        return self
+
+    def delete(self):
+        self.operacion = 'delete'
+        return self
+
+    def _filtro(self, columna, funcion):
+        self.filtros.append((columna, funcion))
+        return self
+
+    def eq(self, columna, valor):
+        return self._filtro(columna, lambda v: str(v) == str(valor))
+
+    def gte(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and str(v) >= str(valor))
+
+    def lte(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and str(v) <= str(valor))
+
+    def lt(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and str(v) < str(valor))
+
+    def in_(self, columna, valores):
+        textos = {str(v) for v in valores}
+        return self._filtro(columna, lambda v: str(v) in textos)
+
+    def order(self, columna, desc: bool = False):
+        self.orden.append((columna, desc))
+        return self
+
+    def range(self, desde: int, hasta: int):
+        self.desde, self.hasta = desde, hasta
+        return self
+
+    def limit(self, cantidad: int):
+        self.limite = cantidad
+        return self
+
+    # Ejecución
+    def _coinciden(self) -> List[Dict]:
+        return [f for f in self.db.tablas.setdefault(self.tabla, [])
+                if all(funcion(f.get(columna)) for columna, funcion in self.filtros)]
+
+    def _proyectar(self, fila: Dict) -> Dict:
+        resultado = {}
+        for columna in _separar_columnas(self.columnas):
+            if '(' in columna:
+                tabla, internas = columna[:-1].split('(', 1)
+                tabla = tabla.strip()
+                clave = fila.get(tabla[:-1] + '_id')
+                relacionada = next((f for f in self.db.tablas.get(tabla, []) if f['id'] == clave), None)
+                resultado[tabla] = None if relacionada is None else \
+                    {c: relacionada.get(c) for c in _separar_columnas(internas)}
+            elif columna == '*':
+                resultado.update(copy.deepcopy(fila))
+            else:
+                resultado[columna] = fila.get(columna)
+        return resultado
+
+    def execute(self) -> RespuestaFalsa:
+        self.db.consultas.append((self.operacion, self.tabla))
+        if self.db.falla is not None:
+            raise self.db.falla
+        if self.operacion == 'select':
+            filas = self._coinciden()
+            total = len(filas)
+            for columna, desc in reversed(self.orden):
+                filas = sorted(filas, key=lambda f: (f.get(columna) is None, f.get(columna)), reverse=desc)
+            if self.desde is not None:
+                filas = filas[self.desde:self.hasta + 1]
+            if self.limite is not None:
+                filas = filas[:self.limite]
+            filas = filas[:self.db.max_filas]
+            return RespuestaFalsa([self._proyectar(f) for f in filas], total if self.contar else None)
+        return RespuestaFalsa(self.db._escribir(self))
+
+class FakeSupabase:
+    """Cliente falso: db.table('usuarios')... como el cliente real"""
+
+    def __init__(self, unicos: Optional[Dict[str, List[str]]] = None, max_filas: int = 1000):
+        self.tablas: Dict[str, List[Dict]] = {}
+        self.unicos = unicos or {}
+        self.max_filas = max_filas
+        self.consultas: List[tuple] = []
+        self.falla: Optional[Exception] = None
+
+    def table(self, nombre: str) -> ConsultaFalsa:
+        return ConsultaFalsa(self, nombre)
+
+    def agregar(self, tabla: str, filas: List[Dict]):
+        self.tablas.setdefault(tabla, []).extend(copy.deepcopy(filas))
+
+    def _revisar_unicos(self, tabla: str, filas: List[Dict], fila: Dict):
+        for columna in self.unicos.get(tabla, []):
+            valor = fila.get(columna)
+            if valor is not None and any(f is not fila and f.get(columna) == valor for f in filas):
+                raise ErrorFalso(f'duplicate key value violates unique constraint "{tabla}_{columna}_key" (23505)')
+
+    def _escribir(self, consulta: ConsultaFalsa) -> List[Dict]:
+        # Todo o nada, revisando UNIQUE después de cada fila (restricción no diferible)
+        filas = copy.deepcopy(self.tablas.setdefault(consulta.tabla, []))
+        afectadas = []
+        datos = consulta.datos if isinstance(consulta.datos, list) else [consulta.datos]
+
+        if consulta.operacion in ('insert', 'upsert'):
+            for dato in datos:
+                existente = next((f for f in filas if consulta.operacion == 'upsert'
+                                  and f.get(consulta.on_conflict) == dato.get(consulta.on_conflict)), None)
+                if existente is None:
+                    existente = {'id': max((f['id'] for f in filas), default=0) + 1}
+                    filas.append(existente)
+                existente.update(copy.deepcopy(dato))
+                self._revisar_unicos(consulta.tabla, filas, existente)
+                afectadas.append(copy.deepcopy(existente))
+        else:
+            ids = {id(f) for f in consulta._coinciden()}
+            originales = [f for f in self.tablas[consulta.tabla]]
+            for original, fila in zip(originales, filas):
+                if id(original) not in ids:
+                    continue
+                if consulta.operacion == 'update':
+                    fila.update(copy.deepcopy(consulta.datos))
+                    self._revisar_unicos(consulta.tabla, filas, fila)
+                afectadas.append(copy.deepcopy(fila))
+            if consulta.operacion == 'delete':
+                borradas = {a['id'] for a in afectadas}
+                filas = [f for f in filas if f['id'] not in borradas]
+
+        self.tablas[consulta.tabla] = filas
+        return afectadas
+
+def usuario(id: int, nombre: str, codigo: str, tarjeta: str, turno: str = 'Full') -> Dict[str, Any]:
+    """Fila de la tabla usuarios"""
+    return {'id': id, 'nombre': nombre, 'codigo': codigo, 'tarjeta': tarjeta, 'turno': turno}
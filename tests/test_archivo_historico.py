@@ -0,0 +1,130 @@
+"""Archivo histórico en Parquet y proceso de archivado (user-050)"""
+
+from datetime import date
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import archivo_historico
+import db_descansos
+from fake_supabase import usuario
+
+HOY = date(2026, 10, 19)
+
+def _registro(id: int, usuario_id: int, fecha: str, duracion: int = 10, tipo: str = 'DESCANSO'):
+    return {'id': id, 'usuario_id': usuario_id, 'fecha': fecha, 'tipo': tipo,
+            'inicio': '10:00:00', 'fin': '10:10:00', 'duracion_minutos': duracion}
+
+@pytest.fixture
+def archivo(db, tmp_path, monkeypatch):
+    """Archivo vacío en tmp_path, con registros en enero, febrero y septiembre"""
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR', str(tmp_path / 'archivo'))
+    monkeypatch.setattr(archivo_historico, '_manifiesto_cache', (None, {}))
+    monkeypatch.setattr(archivo_historico, 'MESES_CALIENTES', 3)
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_PURGAR', False)
+    db.agregar('usuarios', [usuario(1, 'Ana', 'A1', '111'), usuario(2, 'Beto', 'B2', '222')])
+    db.agregar('tiempos_descanso', [
+        _registro(1, 1, '2026-01-05'), _registro(2, 2, '2026-01-20', 45),
+        _registro(3, 1, '2026-02-10', 35, 'COMIDA'), _registro(4, 2, '2026-09-01')])
+    return db
+
+def _ids(registros):
+    return sorted(r['id'] for r in registros)
+
+def test_archivar_mes_y_leer_registros(archivo):
+    enero = [r for r in db_descansos._iterar_tabla('2026-01-01', '2026-01-31', '*, usuarios(nombre, codigo, turno)',
+                                                     False, 1000, None)]
+    assert archivo_historico.archivar_mes('2026-01', enero) == {'registros': 2, 'agregados': 2}
+    # Volver a archivar no duplica: solo agrega IDs nuevos
+    assert archivo_historico.archivar_mes('2026-01', enero[:1])['agregados'] == 0
+
+    leidos = list(archivo_historico.leer_registros('2026-01-01', '2026-01-31', ordenar=True))
+    assert [r['id'] for r in leidos] == [2, 1]
+    assert leidos[0]['usuarios'] == {'id': 2, 'nombre': 'Beto', 'codigo': 'B2', 'turno': 'Full'}
+    assert _ids(archivo_historico.leer_registros('2026-01-01', '2026-01-31', usuario_id='1')) == [1]
+    assert list(archivo_historico.leer_registros('2026-01-01', '2026-01-31', usuario_id='abc')) == []
+    assert archivo_historico.contar_registros('2026-01-10', '2026-01-31') == 1
+
+def test_dividir_rango_segun_el_corte(archivo):
+    assert archivo_historico.dividir_rango('2026-01-01', '2026-09-30') == (None, ('2026-01-01', '2026-09-30'))
+    archivo_historico.archivar_mes('2026-01', [])
+
+    assert archivo_historico.corte() == date(2026, 2, 1)
+    assert archivo_historico.dividir_rango('2026-01-15', '2026-03-01') == \
+        (('2026-01-15', '2026-01-31'), ('2026-02-01', '2026-03-01'))
+    assert archivo_historico.dividir_rango('2026-01-01', '2026-01-31') == (('2026-01-01', '2026-01-31'), None)
+    assert archivo_historico.dividir_rango('2026-05-01', '2026-05-31') == (None, ('2026-05-01', '2026-05-31'))
+
+def test_archivado_por_defecto_copia_sin_borrar_de_la_tabla(archivo):
+    simulacion = db_descansos.archivar_historial(hoy=HOY)
+    assert simulacion['simulacion'] and archivo_historico.meses_archivados() == {}
+
+    resultado = db_descansos.archivar_historial(aplicar=True, hoy=HOY)
+    assert resultado['movidos'] == 0 and resultado['purga'] is False
+    assert resultado['limite'] == '2026-07-01'
+    assert _ids(archivo.tablas['tiempos_descanso']) == [1, 2, 3, 4]
+    assert archivo_historico.corte() == date(2026, 7, 1)
+
+    # Los meses copiados se leen del archivo, sin duplicar las filas que siguen en la tabla
+    assert _ids(db_descansos.iterar_registros_periodo('2026-01-01', '2026-09-30')) == [1, 2, 3, 4]
+    assert db_descansos.huella_periodo('2026-01-01', '2026-09-30') == '1:4:3'
+
+    # Una segunda ejecución no vuelve a leer los meses ya copiados
+    archivo.consultas.clear()
+    assert db_descansos.archivar_historial(aplicar=True, hoy=HOY)['meses'] == []
+    assert len(archivo.consultas) == 1
+
+def test_perder_el_archivo_vuelve_a_la_tabla(archivo, tmp_path, monkeypatch):
+    db_descansos.archivar_historial(aplicar=True, hoy=HOY)
+    # Redeploy sin disco persistente: el directorio (y el manifiesto) desaparece
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR', str(tmp_path / 'nuevo'))
+
+    assert archivo_historico.corte() is None
+    assert _ids(db_descansos.iterar_registros_periodo('2026-01-01', '2026-09-30')) == [1, 2, 3, 4]
+
+def test_purga_requiere_un_directorio_persistente(archivo, monkeypatch):
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_PURGAR', True)
+    with pytest.raises(RuntimeError, match='Archivado rechazado'):
+        db_descansos.archivar_historial(aplicar=True, hoy=HOY)
+    assert len(archivo.tablas['tiempos_descanso']) == 4
+
+    monkeypatch.setattr(archivo_historico, 'verificar_persistencia', lambda: None)
+    resultado = db_descansos.archivar_historial(aplicar=True, hoy=HOY, tamano_lote=1)
+    assert resultado['movidos'] == 3
+    assert _ids(archivo.tablas['tiempos_descanso']) == [4]
+    assert all(m['purgado'] for m in archivo_historico.meses_archivados().values())
+    assert _ids(db_descansos.iterar_registros_periodo('2026-01-01', '2026-09-30')) == [1, 2, 3, 4]
+
+def test_purga_de_meses_copiados_antes(archivo, monkeypatch):
+    db_descansos.archivar_historial(aplicar=True, hoy=HOY)
+    assert archivo_historico.estado_archivo()['pendientes_purga'] == ['2026-01', '2026-02', '2026-03',
+                                                                       '2026-04', '2026-05', '2026-06']
+
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_PURGAR', True)
+    monkeypatch.setattr(archivo_historico, 'verificar_persistencia', lambda: None)
+    assert db_descansos.archivar_historial(aplicar=True, hoy=HOY)['movidos'] == 3
+    assert archivo_historico.estado_archivo()['pendientes_purga'] == []
+    assert archivo_historico.contar_registros('2026-01-01', '2026-06-30') == 3
+
+def test_reclasificar_actualiza_el_archivo_y_la_copia_en_la_tabla(archivo):
+    db_descansos.archivar_historial(aplicar=True, hoy=HOY)
+
+    resultado = db_descansos.recalcular_tipos_periodo('2026-01-01', '2026-09-30', aplicar=True)
+    # El registro 2 (45 min) pasa a COMIDA; se cuenta una vez aunque esté en ambos lados
+    assert (resultado['revisados'], resultado['a_comida'], resultado['actualizados']) == (4, 1, 1)
+    assert next(r for r in archivo.tablas['tiempos_descanso'] if r['id'] == 2)['tipo'] == 'COMIDA'
+    assert next(r for r in archivo_historico.leer_registros('2026-01-01', '2026-01-31') if r['id'] == 2)['tipo'] == 'COMIDA'
+
+def test_verificar_persistencia(monkeypatch, tmp_path):
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR_CONFIGURADO', False)
+    assert 'no está configurado' in archivo_historico.verificar_persistencia()
+
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR_CONFIGURADO', True)
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR_PERSISTENTE', True)
+    monkeypatch.setattr(archivo_historico.tempfile, 'gettempdir', lambda: str(tmp_path))
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR', str(tmp_path / 'archivo'))
+    assert 'directorio temporal' in archivo_historico.verificar_persistencia()
+
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR', '/var/data/breaktime_archivo')
+    assert archivo_historico.verificar_persistencia() is None
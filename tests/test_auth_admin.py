@@ -0,0 +1,137 @@
+"""Login de administradores: cubetas de tokens y verificación de claves en tiempo fijo (user-045)"""
+
+import pytest
+
+import auth_admin
+from fake_supabase import ErrorFalso
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """time.monotonic controlado por la prueba (reloj[0] en segundos)"""
+    actual = [1000.0]
+    monkeypatch.setattr(auth_admin.time, 'monotonic', lambda: actual[0])
+    return actual
+
+@pytest.fixture
+def admins(db, reloj, monkeypatch):
+    monkeypatch.setattr(auth_admin, 'limitador_ip', auth_admin.LimitadorTokens(4, 6))
+    monkeypatch.setattr(auth_admin, 'limitador_usuario', auth_admin.LimitadorTokens(3, 6))
+    auth_admin.invalidar_administrador()
+    db.agregar('administradores', [
+        {'id': 1, 'usuario': 'jefa', 'nombre': 'Jefa', 'activo': True,
+         'clave': auth_admin.generar_hash_clave('correcta')},
+        {'id': 2, 'usuario': 'antiguo', 'nombre': 'Antiguo', 'activo': True, 'clave': 'plana'},
+        {'id': 3, 'usuario': 'baja', 'nombre': 'Baja', 'activo': False, 'clave': 'plana'}
+    ])
+    yield db
+    auth_admin.invalidar_administrador()
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """Registra cada verificación de hash (para comprobar que siempre se paga su costo)"""
+    llamadas = []
+    original = auth_admin.check_password_hash
+
+    def verificar(guardada, clave):
+        llamadas.append(guardada)
+        return original(guardada, clave)
+
+    monkeypatch.setattr(auth_admin, 'check_password_hash', verificar)
+    return llamadas
+
+def _admin(db, id):
+    return next(a for a in db.tablas['administradores'] if a['id'] == id)
+
+def test_cubeta_de_tokens_se_recarga_con_el_tiempo(reloj):
+    limitador = auth_admin.LimitadorTokens(2, 6)  # un token cada 10 s
+
+    assert limitador.consumir('ip') == 0 and limitador.consumir('ip') == 0
+    assert limitador.consumir('ip') == pytest.approx(10)
+    assert limitador.consumir('otra') == 0
+
+    reloj[0] += 4
+    assert limitador.consumir('ip') == pytest.approx(6)
+    reloj[0] += 6
+    assert limitador.consumir('ip') == 0
+
+    limitador.reiniciar('ip')
+    assert limitador.consumir('ip') == 0 and limitador.consumir('ip') == 0
+
+def test_cubetas_llenas_se_descartan_al_superar_el_maximo(reloj):
+    limitador = auth_admin.LimitadorTokens(1, 60)
+    limitador.MAX_CUBETAS = 2
+    limitador.consumir('a')
+    reloj[0] += 5
+    limitador.consumir('b')
+    limitador.consumir('c')
+
+    # 'a' ya se recargó (equivale a no tener cubeta); 'b' y 'c' siguen vacías
+    assert set(limitador._cubetas) == {'b', 'c'}
+
+def test_login_con_hash(admins, hashes):
+    admin = auth_admin.autenticar('jefa', 'correcta', '10.0.0.1')
+    assert admin == {'id': 1, 'usuario': 'jefa', 'nombre': 'Jefa', 'activo': True}
+    assert auth_admin.autenticar('jefa', 'otra', '10.0.0.1') is None
+    assert len(hashes) == 2
+
+def test_usuario_inexistente_paga_el_mismo_hash_y_queda_en_cache(admins, hashes):
+    assert auth_admin.autenticar('nadie', 'x', '10.0.0.1') is None
+    assert auth_admin.autenticar('baja', 'plana', '10.0.0.1') is None
+    assert auth_admin.autenticar('nadie', 'y', '10.0.0.1') is None
+
+    # Un hash ficticio por intento, como con una clave incorrecta
+    assert len(hashes) == 3 and all(auth_admin.es_hash(h) for h in hashes)
+    assert admins.consultas.count(('select', 'administradores')) == 2
+
+def test_clave_en_texto_plano_se_compara_en_tiempo_constante_y_se_migra(admins, monkeypatch):
+    comparaciones = []
+    original = auth_admin.hmac.compare_digest
+
+    def comparar(a, b):
+        if isinstance(a, bytes):
+            # werkzeug compara los hashes como texto; aquí solo interesa la clave plana
+            comparaciones.append((a, b))
+        return original(a, b)
+
+    monkeypatch.setattr(auth_admin.hmac, 'compare_digest', comparar)
+
+    assert auth_admin.autenticar('antiguo', 'plan', '10.0.0.1') is None
+    assert _admin(admins, 2)['clave'] == 'plana'
+
+    assert auth_admin.autenticar('antiguo', 'plana', '10.0.0.1')['id'] == 2
+    assert comparaciones == [(b'plana', b'plan'), (b'plana', b'plana')]
+    assert auth_admin.es_hash(_admin(admins, 2)['clave'])
+
+    # El siguiente login ya usa el hash (también el de la caché)
+    assert auth_admin.autenticar('antiguo', 'plana', '10.0.0.1')['id'] == 2
+    assert len(comparaciones) == 2
+
+def test_limite_por_usuario_rechaza_sin_consultar_ni_calcular_hash(admins, hashes, reloj):
+    for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+        assert auth_admin.autenticar('jefa', 'mala', ip) is None
+    consultas, verificaciones = len(admins.consultas), len(hashes)
+
+    with pytest.raises(auth_admin.LimiteIntentos) as error:
+        auth_admin.autenticar('JEFA', 'correcta', '10.0.0.4')
+    assert error.value.espera == pytest.approx(10)
+    assert (len(admins.consultas), len(hashes)) == (consultas, verificaciones)
+
+    reloj[0] += 10
+    assert auth_admin.autenticar('jefa', 'correcta', '10.0.0.4')['id'] == 1
+
+def test_limite_por_ip_y_reinicio_tras_login_correcto(admins):
+    for _ in range(2):
+        auth_admin.autenticar('jefa', 'mala', '10.0.0.9')
+    # El login correcto llena la cubeta del usuario, no la de la IP
+    assert auth_admin.autenticar('jefa', 'correcta', '10.0.0.9') is not None
+    assert auth_admin.limitador_usuario.consumir('jefa') == 0
+
+    assert auth_admin.autenticar('otro', 'x', '10.0.0.9') is None  # cuarto intento de la IP
+    with pytest.raises(auth_admin.LimiteIntentos):
+        auth_admin.autenticar('jefa', 'correcta', '10.0.0.9')
+    assert auth_admin.autenticar('jefa', 'correcta', '10.0.0.10') is not None
+
+def test_error_de_base_de_datos_no_se_confunde_con_credenciales_invalidas(admins):
+    admins.falla = ErrorFalso('timeout')
+    with pytest.raises(ErrorFalso):
+        auth_admin.autenticar('jefa', 'correcta', '10.0.0.1')
@@ -0,0 +1,158 @@
+"""Plazos, reintentos y circuit breaker (user-037); consultas en paralelo (user-039)"""
+
+import threading
+
+import httpx
+import pytest
+
+import db_resiliencia
+from db_resiliencia import ServicioNoDisponible, ejecutar
+from fake_supabase import ErrorFalso
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """time.monotonic controlado por la prueba; time.sleep solo avanza el reloj"""
+    actual = [1000.0]
+
+    def dormir(segundos):
+        actual[0] += segundos
+
+    monkeypatch.setattr(db_resiliencia.time, 'monotonic', lambda: actual[0])
+    monkeypatch.setattr(db_resiliencia.time, 'sleep', dormir)
+    return actual
+
+def _caido(db):
+    db.falla = httpx.ConnectError('connection refused')
+
+def _error_http(codigo: int) -> httpx.HTTPStatusError:
+    peticion = httpx.Request('GET', 'https://supabase.test/rest/v1/usuarios')
+    return httpx.HTTPStatusError('error', request=peticion, response=httpx.Response(codigo, request=peticion))
+
+def _ejecuciones(db):
+    return len(db.consultas)
+
+def test_breaker_cerrado_abierto_semiabierto_cerrado(reloj):
+    breaker = db_resiliencia._CircuitBreaker(2, 30)
+    assert breaker.permitir() and breaker.estado()['estado'] == 'cerrado'
+
+    breaker.registrar_fallo()
+    assert breaker.estado()['estado'] == 'cerrado'
+    breaker.registrar_fallo()
+    assert breaker.estado()['estado'] == 'abierto'
+    assert not breaker.permitir()
+    assert breaker.estado()['segundos_para_reintento'] == 30
+
+    reloj[0] += 30
+    # Semiabierto: una sola llamada de prueba a la vez
+    assert breaker.permitir()
+    assert not breaker.permitir()
+    assert breaker.estado()['estado'] == 'semiabierto'
+
+    breaker.registrar_exito()
+    estado = breaker.estado()
+    assert (estado['estado'], estado['fallos_consecutivos'], estado['aperturas'], estado['rechazadas']) == \
+        ('cerrado', 0, 1, 2)
+
+def test_prueba_fallida_reabre_y_prueba_cancelada_se_libera(reloj):
+    breaker = db_resiliencia._CircuitBreaker(1, 10)
+    breaker.registrar_fallo()
+    reloj[0] += 10
+
+    assert breaker.permitir()
+    breaker.registrar_fallo()
+    assert breaker.estado()['estado'] == 'abierto' and not breaker.permitir()
+
+    reloj[0] += 10
+    assert breaker.permitir()
+    breaker.liberar_prueba()
+    assert breaker.permitir()
+
+def test_lectura_se_reintenta_y_abre_el_circuito(db, reloj, monkeypatch):
+    monkeypatch.setattr(db_resiliencia, 'REINTENTOS', 2)
+    _caido(db)
+
+    with pytest.raises(ServicioNoDisponible, match='connection refused'):
+        ejecutar(db.table('usuarios').select('*'))
+    assert _ejecuciones(db) == 3
+    assert db_resiliencia.circuito_abierto()
+
+    # Abierto: falla al instante, sin tocar la red
+    with pytest.raises(ServicioNoDisponible, match='Circuito abierto'):
+        ejecutar(db.table('usuarios').select('*'))
+    assert _ejecuciones(db) == 3
+
+    reloj[0] += 30
+    db.falla = None
+    assert ejecutar(db.table('usuarios').select('*')).data == []
+    assert db_resiliencia.estado_resiliencia()['estado'] == 'cerrado'
+
+def test_escritura_no_se_reintenta(db, reloj, monkeypatch):
+    monkeypatch.setattr(db_resiliencia, 'REINTENTOS', 2)
+    _caido(db)
+
+    with pytest.raises(ServicioNoDisponible):
+        ejecutar(db.table('usuarios').insert({'nombre': 'Ana'}), 'escritura')
+    assert _ejecuciones(db) == 1
+    assert db_resiliencia.estado_resiliencia()['fallos_consecutivos'] == 1
+
+def test_errores_de_datos_no_cuentan_como_falla(db, reloj):
+    for error in (ErrorFalso('23505 duplicate key'), _error_http(404)):
+        db.falla = error
+        for _ in range(5):
+            with pytest.raises(type(error)):
+                ejecutar(db.table('usuarios').select('*'))
+    assert db_resiliencia.estado_resiliencia()['estado'] == 'cerrado'
+
+    db.falla = _error_http(503)
+    for _ in range(3):
+        with pytest.raises(ServicioNoDisponible):
+            ejecutar(db.table('usuarios').select('*'))
+    assert db_resiliencia.circuito_abierto()
+
+def test_plazo_agotado_y_servicio_degradado(db, reloj):
+    with db_resiliencia.limite_latencia(1):
+        assert not db_resiliencia.servicio_degradado()
+        reloj[0] += 1
+        with pytest.raises(ServicioNoDisponible, match='Plazo agotado'):
+            ejecutar(db.table('usuarios').select('*'), 'kiosco')
+        assert db_resiliencia.servicio_degradado()
+    assert _ejecuciones(db) == 0
+    assert not db_resiliencia.servicio_degradado()
+
+class _ConsultaLenta:
+    def __init__(self, barrera, valor):
+        self.barrera = barrera
+        self.valor = valor
+
+    def execute(self):
+        # Solo avanza si las tres consultas están en curso a la vez
+        self.barrera.wait(timeout=2)
+        if isinstance(self.valor, Exception):
+            raise self.valor
+        return self.valor
+
+def test_consultas_paralelas_corren_a_la_vez_y_heredan_el_bloque(db):
+    barrera = threading.Barrier(3)
+    consultas = {'a': _ConsultaLenta(barrera, 1), 'b': _ConsultaLenta(barrera, 2),
+                 'c': _ConsultaLenta(barrera, ErrorFalso('columna inexistente'))}
+
+    with db_resiliencia.limite_latencia(5):
+        resultados = db_resiliencia.consultas_paralelas(consultas, capturar_errores=True)
+    assert not barrera.broken
+    assert (resultados['a'], resultados['b']) == (1, 2)
+    assert isinstance(resultados['c'], ErrorFalso)
+
+    barrera = threading.Barrier(2)
+    with pytest.raises(ErrorFalso):
+        db_resiliencia.consultas_paralelas({'a': _ConsultaLenta(barrera, 1),
+                                            'c': _ConsultaLenta(barrera, ErrorFalso('x'))})
+
+def test_consultas_paralelas_marcan_el_bloque_degradado(db):
+    _caido(db)
+    with db_resiliencia.limite_latencia(5):
+        resultados = db_resiliencia.consultas_paralelas({
+            'usuarios': db.table('usuarios').select('*'),
+            'descansos': db.table('descansos').select('*')
+        }, capturar_errores=True)
+        assert db_resiliencia.servicio_degradado()
+    assert all(isinstance(r, ServicioNoDisponible) for r in resultados.values())
@@ -0,0 +1,90 @@
+"""Directorio de usuarios en memoria: carga paginada y búsqueda por prefijo (user-048), unicidad (user-049)"""
+
+import pytest
+
+import db_usuarios
+from fake_supabase import ErrorFalso, usuario
+
+@pytest.fixture
+def directorio(db):
+    db.agregar('usuarios', [
+        usuario(1, 'Ana González', 'A1', '1234'),
+        usuario(2, 'Ángel Ruiz', 'B2', '1299', 'Part Time'),
+        usuario(3, 'Beto Anabalón', 'C3', '5678'),
+        usuario(4, 'Carla Soto', 'D4', '9012', 'Llamado')
+    ])
+    return db
+
+def _nombres(resultado):
+    return [u['nombre'] for u in resultado['usuarios']]
+
+def test_carga_paginada_cubre_el_conteo_aunque_el_servidor_corte_las_paginas(db):
+    db.agregar('usuarios', [usuario(i, f'Usuario {i}', f'U{i}', str(10000 + i)) for i in range(1, 2502)])
+    db.max_filas = 400
+
+    assert db_usuarios.precargar_directorio_usuarios() == 2501
+    assert len({u['id'] for u in db_usuarios.obtener_directorio_usuarios().values()}) == 2501
+    estado = db_usuarios.estado_directorio()
+    assert estado['completo'] and estado['total_tabla'] == 2501
+    assert sum(1 for op, tabla in db.consultas if tabla == 'usuarios') == 7
+
+def test_busqueda_por_prefijo_de_nombre_codigo_y_tarjeta(directorio):
+    assert _nombres(db_usuarios.listar_usuarios_directorio('an')) == ['Ana González', 'Ángel Ruiz', 'Beto Anabalón']
+    assert _nombres(db_usuarios.listar_usuarios_directorio('ANA gon')) == ['Ana González']
+    assert _nombres(db_usuarios.listar_usuarios_directorio('c3')) == ['Beto Anabalón']
+    assert _nombres(db_usuarios.listar_usuarios_directorio('12')) == ['Ana González', 'Ángel Ruiz']
+    assert _nombres(db_usuarios.listar_usuarios_directorio('zzz')) == []
+    # Sin consultas salvo la carga inicial
+    assert len(directorio.consultas) == 1
+
+def test_listado_paginado_ordenado_por_nombre(directorio):
+    resultado = db_usuarios.listar_usuarios_directorio('', pagina=2, por_pagina=3)
+    assert _nombres(resultado) == ['Carla Soto']
+    assert (resultado['total'], resultado['paginas'], resultado['pagina']) == (4, 2, 2)
+    # Una página fuera de rango se ajusta a la última
+    assert db_usuarios.listar_usuarios_directorio('', pagina=9, por_pagina=3)['pagina'] == 2
+
+def test_registrar_y_quitar_actualizan_los_indices_sin_recargar(directorio):
+    db_usuarios.precargar_directorio_usuarios()
+    db_usuarios.registrar_usuario_en_directorio(usuario(5, 'Anita Pérez', 'E5', '3333'))
+    db_usuarios.quitar_usuario_del_directorio('1')
+
+    assert _nombres(db_usuarios.listar_usuarios_directorio('an')) == ['Ángel Ruiz', 'Anita Pérez', 'Beto Anabalón']
+    assert db_usuarios.verificar_unicidad('a1', '1234') is None
+    assert 'Anita Pérez' in db_usuarios.verificar_unicidad('e5', '0000')
+    assert len(directorio.consultas) == 1
+
+def test_verificar_unicidad_en_memoria(directorio):
+    assert 'Ana González (A1)' in db_usuarios.verificar_unicidad(' a1 ', '0000')
+    assert 'tarjeta 5678' in db_usuarios.verificar_unicidad('Z9', '5678')
+    assert db_usuarios.verificar_unicidad('Z9', '0000') is None
+    # Al editar, los datos propios no cuentan como repetidos
+    assert db_usuarios.verificar_unicidad('A1', '1234', usuario_id='1') is None
+    assert 'Ángel Ruiz' in db_usuarios.verificar_unicidad('A1', '1299', usuario_id=1)
+
+def test_directorio_incompleto_verifica_en_la_base_de_datos(directorio):
+    # La carga se cortó: faltan usuarios del final de la tabla
+    db_usuarios.guardar_directorio_usuarios(directorio.tablas['usuarios'][:2], total=4)
+    directorio.consultas.clear()
+
+    assert 'Carla Soto' in db_usuarios.verificar_unicidad('D4', '0000')
+    assert db_usuarios.verificar_unicidad('Z9', '0000') is None
+    # Una consulta por código (encontrado) y dos por el par libre (código y tarjeta)
+    assert directorio.consultas == [('select', 'usuarios')] * 3
+    assert db_usuarios.listar_usuarios_directorio()['completo'] is False
+
+    with pytest.raises(db_usuarios.DirectorioIncompleto, match='2 de 4'):
+        db_usuarios.indice_usuarios()
+
+def test_directorio_incompleto_sin_base_de_datos_no_da_por_libre(directorio):
+    db_usuarios.guardar_directorio_usuarios(directorio.tablas['usuarios'][:2], total=4)
+    directorio.falla = ErrorFalso('timeout')
+
+    assert 'No se pudo verificar' in db_usuarios.verificar_unicidad('Z9', '0000')
+
+def test_indice_usuarios_detecta_repetidos(db):
+    db.agregar('usuarios', [usuario(1, 'Ana', 'A1', '111'), usuario(2, 'Ana Bis', 'a1', '222')])
+
+    por_codigo, por_tarjeta = db_usuarios.indice_usuarios()
+    assert por_codigo['A1']['id'] == 1 and set(por_tarjeta) == {'111', '222'}
+    assert db_usuarios.estado_directorio()['codigos_repetidos'] == 1
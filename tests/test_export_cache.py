@@ -0,0 +1,132 @@
+"""Caché de exportaciones de períodos cerrados: claves, invalidación y ETag estable (user-031)"""
+
+import gzip
+import hashlib
+import io
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+import archivo_historico
+import db_usuarios
+import export_cache
+import export_utils
+from fake_supabase import ErrorFalso, usuario
+
+PERIODO = ('2026-01-01', '2026-01-31')
+
+@pytest.fixture
+def cache(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(archivo_historico, 'ARCHIVO_DIR', str(tmp_path / 'archivo'))
+    monkeypatch.setattr(archivo_historico, '_manifiesto_cache', (None, {}))
+    db.agregar('usuarios', [usuario(1, 'Ana', 'A1', '111'), usuario(2, 'Beto', 'B2', '222', 'Part Time')])
+    db.agregar('tiempos_descanso', [
+        {'id': 1, 'usuario_id': 1, 'fecha': '2026-01-05', 'tipo': 'DESCANSO',
+         'inicio': '10:00:00', 'fin': '10:15:00', 'duracion_minutos': 15},
+        {'id': 2, 'usuario_id': 2, 'fecha': '2026-01-06', 'tipo': 'COMIDA',
+         'inicio': '13:00:00', 'fin': '13:40:00', 'duracion_minutos': 40}])
+
+    generadas = []
+    original = export_cache.generar_exportacion
+
+    def generar(*args, **kwargs):
+        generadas.append(args[0])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(export_cache, 'generar_exportacion', generar)
+    db.generadas = generadas
+    return db
+
+def _obtener(tipo='completo', formato='csv'):
+    return export_cache.obtener_exportacion_cacheada(tipo, *PERIODO, formato)
+
+def _contenido(entrada):
+    with open(entrada['ruta'], 'rb') as f:
+        return f.read()
+
+def test_periodo_cerrado_excluye_ayer(monkeypatch):
+    monkeypatch.setattr(export_cache, 'get_current_time', lambda: datetime(2026, 2, 10, 0, 30))
+    assert export_cache.es_periodo_cerrado('2026-02-08')
+    assert not export_cache.es_periodo_cerrado('2026-02-09')
+    assert not export_cache.es_periodo_cerrado('2026-02-10')
+    assert not export_cache.es_periodo_cerrado('no-es-fecha')
+
+def test_segunda_descarga_sale_de_la_cache_con_el_mismo_etag(cache):
+    primera = _obtener()
+    segunda = _obtener()
+    assert primera == segunda and cache.generadas == ['completo']
+    assert primera['etag'] == hashlib.sha256(_contenido(primera)).hexdigest()
+    # Otro formato u otro tipo es otra entrada
+    _obtener(formato='excel')
+    _obtener(tipo='resumen')
+    assert cache.generadas == ['completo', 'completo', 'resumen']
+
+def test_registro_tardio_o_cambio_de_usuario_invalidan_la_clave(cache):
+    original = _obtener()
+
+    cache.agregar('tiempos_descanso', [{'id': 3, 'usuario_id': 1, 'fecha': '2026-01-31', 'tipo': 'DESCANSO',
+                                        'inicio': '23:50:00', 'fin': '00:05:00', 'duracion_minutos': 15}])
+    con_registro = _obtener()
+    assert con_registro['etag'] != original['etag']
+
+    # Renombre: la huella sale del directorio, que se recarga al editar un usuario
+    cache.tablas['usuarios'][1]['nombre'] = 'Beto Ruiz'
+    db_usuarios.invalidar_directorio_usuarios()
+    renombrado = _obtener()
+    assert renombrado['etag'] != con_registro['etag'] and b'Beto Ruiz' in _contenido(renombrado)
+    assert len(cache.generadas) == 3
+
+def test_cambio_de_politicas_invalida_la_clave(cache, monkeypatch):
+    _obtener()
+    monkeypatch.setattr(export_cache, 'version_politicas', lambda: 'otra')
+    _obtener()
+    assert len(cache.generadas) == 2
+
+def test_sin_huella_se_sirve_la_ultima_exportacion(cache):
+    anterior = _obtener()
+    cache.agregar('tiempos_descanso', [{'id': 3, 'usuario_id': 1, 'fecha': '2026-01-20', 'tipo': 'DESCANSO',
+                                        'inicio': '11:00:00', 'fin': '11:10:00', 'duracion_minutos': 10}])
+    ultima = _obtener()
+
+    cache.falla = ErrorFalso('timeout')
+    assert _obtener() == ultima != anterior
+    # Sin una exportación previa de esos parámetros, el error se propaga
+    with pytest.raises(ErrorFalso):
+        _obtener(tipo='resumen')
+
+def test_exportaciones_son_identicas_byte_a_byte(cache):
+    registros = list(export_utils.iterar_registros_periodo(*PERIODO))
+    combinaciones = (('completo', 'excel'), ('estadisticas', 'csv'), ('estadisticas', 'excel'), ('paquete', 'zip'))
+
+    def generar_todas():
+        contenidos = {}
+        for tipo, formato in combinaciones:
+            destino = io.BytesIO()
+            export_utils.generar_exportacion(tipo, *PERIODO, destino, formato, registros=list(registros))
+            contenidos[tipo, formato] = destino.getvalue()
+        return contenidos
+
+    primera = generar_todas()
+    # Más que la resolución de 2 s de las fechas dentro de un ZIP/XLSX
+    time.sleep(2.1)
+    assert generar_todas() == primera
+
+def test_variante_comprimida_y_limpieza(cache, monkeypatch):
+    entrada = _obtener()
+    variante = export_cache.obtener_variante_comprimida(entrada, 'gzip')
+    assert variante['etag'] == f"{entrada['etag']}-gz"
+    with open(variante['ruta'], 'rb') as f:
+        assert gzip.decompress(f.read()) == _contenido(entrada)
+
+    assert export_cache.codificacion_preferida('gzip;q=0, br', 'csv') is None
+    assert export_cache.codificacion_preferida('gzip, deflate', 'csv') == 'gzip'
+    assert export_cache.codificacion_preferida('gzip', 'excel') is None
+
+    antiguo = os.path.getmtime(entrada['ruta']) - (export_cache.CACHE_DIAS + 1) * 86400
+    for nombre in os.listdir(export_cache.CACHE_DIR):
+        os.utime(os.path.join(export_cache.CACHE_DIR, nombre), (antiguo, antiguo))
+    assert export_cache.limpiar_cache() == 4
+    assert os.listdir(export_cache.CACHE_DIR) == []
@@ -0,0 +1,139 @@
+"""Importación masiva (user-046) y reasignación de tarjetas/turnos (user-047)"""
+
+import io
+
+import pytest
+
+import importacion_usuarios
+from fake_supabase import ErrorFalso, usuario
+
+def _csv(*lineas: str) -> io.BytesIO:
+    return io.BytesIO('\n'.join(('Nombre;Tarjeta;Turno;Código',) + lineas).encode('utf-8-sig'))
+
+def _tarjetas(db):
+    return {u['codigo']: u['tarjeta'] for u in db.tablas['usuarios']}
+
+@pytest.fixture
+def db_unico(db):
+    """Usuarios con la restricción UNIQUE (tarjeta) que recomienda db_usuarios"""
+    db.unicos['usuarios'] = ['codigo', 'tarjeta']
+    db.agregar('usuarios', [usuario(1, 'Ana', 'A1', '111'), usuario(2, 'Beto', 'B2', '222'),
+                            usuario(3, 'Carla', 'C3', '333')])
+    return db
+
+def test_leer_archivo_acepta_alias_y_rechaza_columnas_faltantes():
+    registros = importacion_usuarios.leer_archivo(
+        io.BytesIO('N° Tarjeta,Nombre completo,Tipo de turno,Cod\n555, Dora ,Full,d4\n\n'.encode()), 'a.csv')
+    assert registros == [(2, {'tarjeta': '555', 'nombre': 'Dora', 'turno': 'Full', 'codigo': 'd4'})]
+
+    with pytest.raises(ValueError, match='Faltan columnas: turno'):
+        importacion_usuarios.leer_archivo(io.BytesIO(b'nombre;tarjeta;codigo\nA;1;A1'), 'a.csv')
+    with pytest.raises(ValueError, match='Formato no soportado'):
+        importacion_usuarios.leer_archivo(io.BytesIO(b''), 'a.pdf')
+
+def test_leer_archivo_limita_la_cantidad_de_filas(monkeypatch):
+    monkeypatch.setattr(importacion_usuarios, 'MAX_FILAS', 2)
+    with pytest.raises(ValueError, match='máximo de 2 filas'):
+        importacion_usuarios.leer_archivo(_csv('A;1;Full;A1', 'B;2;Full;B2', 'C;3;Full;C3'), 'a.csv')
+
+def test_validar_filas_reporta_cada_error_por_fila(db_unico):
+    reporte = importacion_usuarios.importar_usuarios(_csv(
+        'Ana;111;Full;a1',           # sin cambios (código normalizado a mayúsculas)
+        'Beto Ruiz;222;llamado;B2',  # actualización de nombre y turno
+        'Dora;444;PART-TIME;D4',     # nueva
+        ';555;Full;E5',              # nombre vacío
+        'Fito;666;Noche;F6',         # turno no válido
+        'Gina;777;Full;D4',          # código repetido en el archivo
+        'Hugo;444;Full;H8',          # tarjeta repetida en el archivo
+        'Iris;333;Full;I9'           # tarjeta de Carla
+    ), 'asistentes.csv', dry_run=True)
+
+    assert (reporte['total'], reporte['nuevos'], reporte['actualizados'], reporte['sin_cambios']) == (8, 1, 1, 1)
+    assert [(e['fila'], e['error'].split(' ')[0]) for e in reporte['errores']] == [
+        (5, 'Campos'), (6, 'Turno'), (7, 'Código'), (8, 'Tarjeta'), (9, 'Tarjeta')]
+    assert 'fila 4' in reporte['errores'][2]['error'] and 'Carla' in reporte['errores'][4]['error']
+
+def test_dry_run_no_escribe_y_la_importacion_si(db_unico):
+    archivo = ('Beto Ruiz;222;llamado;B2', 'Dora;444;part time;D4')
+    importacion_usuarios.importar_usuarios(_csv(*archivo), 'a.csv', dry_run=True)
+    assert len(db_unico.tablas['usuarios']) == 3 and not any(op != 'select' for op, _ in db_unico.consultas)
+
+    reporte = importacion_usuarios.importar_usuarios(_csv(*archivo), 'a.csv')
+    assert (reporte['nuevos'], reporte['actualizados'], reporte['errores']) == (1, 1, [])
+    por_codigo = {u['codigo']: u for u in db_unico.tablas['usuarios']}
+    assert por_codigo['B2']['nombre'] == 'Beto Ruiz' and por_codigo['B2']['turno'] == 'Llamado'
+    assert por_codigo['D4']['turno'] == 'Part Time'
+
+def test_lote_rechazado_se_reintenta_fila_por_fila(db_unico, monkeypatch):
+    monkeypatch.setattr(importacion_usuarios, 'TAMANO_LOTE', 2)
+    original = importacion_usuarios.crear_usuarios_lote
+    lotes = []
+
+    def crear(filas):
+        lotes.append(len(filas))
+        if any(f['codigo'] == 'E5' for f in filas):
+            raise ErrorFalso('usuarios_turno_check')
+        return original(filas)
+
+    monkeypatch.setattr(importacion_usuarios, 'crear_usuarios_lote', crear)
+    reporte = importacion_usuarios.importar_usuarios(
+        _csv('Dora;444;Full;D4', 'Eva;555;Full;E5', 'Fito;666;Full;F6'), 'a.csv')
+
+    assert lotes == [2, 1, 1, 1]
+    assert reporte['nuevos'] == 2
+    assert reporte['errores'] == [{'fila': 3, 'codigo': 'E5', 'nombre': 'Eva',
+                                   'error': "Turno 'Full' rechazado por la base de datos"}]
+
+def test_upsert_directo_de_un_intercambio_viola_unique(db_unico):
+    # Lo que hacía la reasignación antes: un solo upsert con ambas filas
+    with pytest.raises(ErrorFalso, match='23505'):
+        importacion_usuarios.actualizar_usuarios_lote([
+            {**usuario(1, 'Ana', 'A1', '222')}, {**usuario(2, 'Beto', 'B2', '111')}])
+
+def test_intercambio_de_tarjetas_se_escribe_en_dos_fases(db_unico):
+    cambios = [{'codigo': 'A1', 'tarjeta': '222'}, {'codigo': 'B2', 'tarjeta': '111'}]
+
+    simulacion = importacion_usuarios.reasignar_usuarios(cambios, dry_run=True)
+    assert simulacion['actualizados'] == 2 and not simulacion['errores']
+
+    reporte = importacion_usuarios.reasignar_usuarios(cambios)
+    assert reporte['actualizados'] == 2
+    assert reporte['errores'] == []
+    assert _tarjetas(db_unico) == {'A1': '222', 'B2': '111', 'C3': '333'}
+
+def test_cadena_y_ciclo_de_tres_tarjetas(db_unico):
+    cambios = [{'codigo': 'A1', 'tarjeta': '222'}, {'codigo': 'B2', 'tarjeta': '333'},
+               {'codigo': 'C3', 'tarjeta': '111', 'turno': 'part time'}]
+    reporte = importacion_usuarios.reasignar_usuarios(cambios)
+
+    assert reporte['actualizados'] == 3 and not reporte['errores']
+    assert _tarjetas(db_unico) == {'A1': '222', 'B2': '333', 'C3': '111'}
+    assert next(u for u in db_unico.tablas['usuarios'] if u['codigo'] == 'C3')['turno'] == 'Part Time'
+    assert not any(u['tarjeta'].startswith(importacion_usuarios.PREFIJO_TARJETA_TEMPORAL)
+                   for u in db_unico.tablas['usuarios'])
+
+def test_tarjeta_de_alguien_fuera_del_lote_se_rechaza(db_unico):
+    reporte = importacion_usuarios.reasignar_usuarios([{'codigo': 'A1', 'tarjeta': '333'}])
+    assert reporte['actualizados'] == 0
+    assert 'Carla' in reporte['errores'][0]['error']
+    assert _tarjetas(db_unico)['A1'] == '111'
+
+def test_asignacion_fallida_devuelve_la_tarjeta_estacionada(db_unico, monkeypatch):
+    original = importacion_usuarios.actualizar_usuarios_lote
+
+    def falla_para_beto(filas):
+        if any(f['codigo'] == 'B2' and f['tarjeta'] == '111' for f in filas):
+            raise ErrorFalso('usuarios_turno_check')
+        return original(filas)
+
+    monkeypatch.setattr(importacion_usuarios, 'actualizar_usuarios_lote', falla_para_beto)
+    reporte = importacion_usuarios.reasignar_usuarios([{'codigo': 'A1', 'tarjeta': '222'},
+                                                       {'codigo': 'B2', 'tarjeta': '111'}])
+
+    # Ana recibió la tarjeta de Beto; Beto no pudo tomar la de Ana y la suya ya
+    # no está libre: queda con la temporal y el reporte pide reasignarla a mano
+    assert {e['codigo'] for e in reporte['errores']} == {'B2'}
+    tarjetas = _tarjetas(db_unico)
+    assert tarjetas['A1'] == '222'
+    assert tarjetas['B2'] == importacion_usuarios.PREFIJO_TARJETA_TEMPORAL + '2'
+    assert any('manualmente' in e['error'] for e in reporte['errores'])
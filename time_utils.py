@@ -4,8 +4,11 @@ Funciones para manejo de fechas, horas y zonas horarias.
 """
 
 import pytz
-from datetime import datetime, timedelta, date
-from typing import Tuple, Dict, Any
+from datetime import datetime, timedelta, date, time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from politicas import obtener_politica
 
 # Zona horaria del proyecto (Chile/Punta Arenas)
 TZ = pytz.timezone('America/Punta_Arenas')
@@ -17,27 +20,111 @@ def get_current_time() -> datetime:
     """
     return datetime.now(TZ)
 
-def calcular_duracion_descanso(inicio_iso: str) -> Tuple[int, str]:
+@lru_cache(maxsize=4096)
+def parse_iso_utc(valor: str) -> datetime:
+    """
+    Parser central de timestamps ISO de Supabase.
+    
+    Acepta el sufijo 'Z' directamente (sin reemplazarlo por '+00:00') y
+    memoiza el resultado: los descansos activos se vuelven a parsear en cada
+    refresco del dashboard con el mismo string.
+    
+    Args:
+        valor: String ISO (con 'Z', con offset o sin zona horaria)
+    
+    Returns:
+        datetime: Con zona horaria; si el string no la trae se asume UTC
+    
+    Raises:
+        ValueError: Si el string no es un timestamp ISO válido
+    """
+    try:
+        dt = datetime.fromisoformat(valor)
+    except ValueError:
+        # Python < 3.11 no acepta 'Z' en fromisoformat
+        if not valor.endswith('Z'):
+            raise
+        dt = datetime.fromisoformat(valor[:-1]).replace(tzinfo=pytz.UTC)
+    
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=pytz.UTC)
+    return dt
+
+@lru_cache(maxsize=1024)
+def _offset_local_dia(dia_utc: date) -> Optional[Tuple[timedelta, Any]]:
+    """
+    Offset UTC -> hora local vigente durante todo un día UTC.
+    
+    Returns:
+        (offset, tzinfo local) o None si ese día hay un cambio de horario
+    """
+    inicio = pytz.UTC.localize(datetime.combine(dia_utc, time.min)).astimezone(TZ)
+    fin = pytz.UTC.localize(datetime.combine(dia_utc, time.max)).astimezone(TZ)
+    if inicio.utcoffset() != fin.utcoffset():
+        return None
+    return inicio.utcoffset(), inicio.tzinfo
+
+def a_hora_local(dt: datetime) -> datetime:
+    """
+    Convierte un datetime a la zona horaria del proyecto.
+    
+    Equivale a dt.astimezone(TZ), pero reutiliza el offset memoizado del día
+    en lugar de buscar la transición de pytz en cada llamada.
+    
+    Args:
+        dt: datetime (si no tiene zona horaria se asume UTC)
+    
+    Returns:
+        datetime: En hora de Punta Arenas
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=pytz.UTC)
+    
+    utc = dt.replace(tzinfo=None) - dt.utcoffset()
+    datos_dia = _offset_local_dia(utc.date())
+    if datos_dia is None:
+        return dt.astimezone(TZ)
+    
+    offset, tz_local = datos_dia
+    return (utc + offset).replace(tzinfo=tz_local)
+
+@lru_cache(maxsize=4096)
+def parse_iso_local(valor: str) -> datetime:
+    """
+    Parsea un timestamp ISO y lo convierte a hora de Punta Arenas.
+    
+    Memoizado por string: en el dashboard cada descanso activo se convierte
+    una sola vez mientras siga activo.
+    
+    Args:
+        valor: String ISO
+    
+    Returns:
+        datetime: En hora local
+    """
+    return a_hora_local(parse_iso_utc(valor))
+
+def calcular_duracion_descanso(inicio_iso: str, turno: Optional[str] = None) -> Tuple[int, str]:
     """
     Calcular duración y tipo de descanso
     
     Args:
         inicio_iso: Tiempo de inicio en formato ISO
+        turno: Turno del usuario (para aplicar su política)
     
     Returns:
         Tuple con (duración_minutos, tipo)
     """
-    inicio = datetime.fromisoformat(inicio_iso.replace('Z', '+00:00'))
-    if inicio.tzinfo is None:
-        inicio = inicio.replace(tzinfo=pytz.UTC)
+    inicio = parse_iso_utc(inicio_iso)
     
     fin = get_current_time()
     duracion_minutos = max(1, int((fin - inicio).total_seconds() / 60))
-    tipo = 'COMIDA' if duracion_minutos >= 30 else 'DESCANSO'
+    tipo = obtener_politica(turno).tipo_por_duracion(duracion_minutos)
     
     return duracion_minutos, tipo
 
-def preparar_datos_tiempo_descanso(usuario_id: int, inicio_iso: str, fin_dt: datetime) -> Dict[str, Any]:
+def preparar_datos_tiempo_descanso(usuario_id: int, inicio_iso: str, fin_dt: datetime,
+                                   turno: Optional[str] = None) -> Dict[str, Any]:
     """
     Preparar datos para insertar en la tabla tiempos_descanso
     
@@ -45,16 +132,15 @@ def preparar_datos_tiempo_descanso(usuario_id: int, inicio_iso: str, fin_dt: dat
         usuario_id: ID del usuario
         inicio_iso: Tiempo de inicio en formato ISO
         fin_dt: Tiempo de fin
+        turno: Turno del usuario (para aplicar su política)
     
     Returns:
         Dict con los datos preparados
     """
-    inicio = datetime.fromisoformat(inicio_iso.replace('Z', '+00:00'))
-    if inicio.tzinfo is None:
-        inicio = inicio.replace(tzinfo=pytz.UTC)
+    inicio = parse_iso_utc(inicio_iso)
     
     duracion_minutos = max(1, int((fin_dt - inicio).total_seconds() / 60))
-    tipo = 'COMIDA' if duracion_minutos >= 30 else 'DESCANSO'
+    tipo = obtener_politica(turno).tipo_por_duracion(duracion_minutos)
     
     return {
         'usuario_id': usuario_id,
@@ -95,43 +181,76 @@ def formatear_fecha_usuario(fecha_iso: str) -> str:
     except:
         return fecha_iso
 
-def es_tiempo_excesivo(duracion_minutos: int, tipo: str) -> Tuple[bool, int]:
+def es_tiempo_excesivo(duracion_minutos: int, tipo: str, turno: Optional[str] = None) -> Tuple[bool, int]:
     """
     Verificar si un descanso tiene tiempo excesivo
     
     Args:
         duracion_minutos: Duración en minutos
         tipo: Tipo de descanso ('DESCANSO' o 'COMIDA')
+        turno: Turno del usuario (para aplicar su política)
     
     Returns:
         Tuple con (es_excesivo, minutos_exceso)
     """
-    limite = 40 if tipo == 'COMIDA' else 20
-    exceso = max(0, duracion_minutos - limite)
+    exceso = obtener_politica(turno).exceso(tipo, duracion_minutos)
     return exceso > 0, exceso
 
-def get_tiempo_restante(inicio_iso: str) -> Tuple[int, str]:
+def get_tiempo_restante(inicio_iso: str, turno: Optional[str] = None) -> Tuple[int, str]:
     """
     Calcular tiempo restante para un descanso activo
     
     Args:
         inicio_iso: Tiempo de inicio en formato ISO
+        turno: Turno del usuario (para aplicar su política)
     
     Returns:
         Tuple con (tiempo_restante_minutos, tipo_probable)
     """
-    inicio = datetime.fromisoformat(inicio_iso.replace('Z', '+00:00'))
-    if inicio.tzinfo is None:
-        inicio = inicio.replace(tzinfo=pytz.UTC)
+    estado = calcular_descansos_activos([inicio_iso], turnos=[turno])
+    return estado['restante'][0], estado['tipo_probable'][0]
+
+def calcular_descansos_activos(inicios: Sequence[Union[str, datetime]],
+                               ahora: Optional[datetime] = None,
+                               turnos: Optional[Sequence[Optional[str]]] = None) -> Dict[str, List]:
+    """
+    Calcula en un solo paso el estado de todos los descansos activos
     
-    ahora = get_current_time()
-    tiempo_transcurrido = int((ahora - inicio).total_seconds() / 60)
+    Todos los descansos se comparan contra el mismo instante "ahora", por lo
+    que la pantalla queda consistente aunque haya cientos de descansos.
     
-    tiempo_maximo = 40 if tiempo_transcurrido >= 20 else 20
-    tiempo_restante = max(0, tiempo_maximo - tiempo_transcurrido)
-    tipo_probable = 'COMIDA' if tiempo_transcurrido >= 20 else 'DESCANSO'
+    Args:
+        inicios: Inicios de los descansos (datetime o string ISO)
+        ahora: Instante de referencia (por defecto la hora actual)
+        turnos: Turno de cada descanso, para aplicar su política (opcional)
     
-    return tiempo_restante, tipo_probable
+    Returns:
+        Dict de columnas alineadas con inicios:
+            'transcurrido': minutos transcurridos (nunca negativos)
+            'restante': minutos restantes hasta el máximo probable
+            'tipo_probable': 'DESCANSO' o 'COMIDA'
+            'excedido': True si ya superó el máximo
+            'maximo': máximo probable en minutos según la política del turno
+            'limite_comida': límite de COMIDA de esa política (el máximo al
+                pasar el límite de DESCANSO)
+    """
+    ahora_ts = (ahora or get_current_time()).timestamp()
+    
+    transcurridos = [
+        max(0, int((ahora_ts - (inicio if isinstance(inicio, datetime) else parse_iso_utc(inicio)).timestamp()) / 60))
+        for inicio in inicios
+    ]
+    politicas = [obtener_politica(turno) for turno in turnos] if turnos else [obtener_politica()] * len(transcurridos)
+    maximos = [p.maximo_probable(t) for t, p in zip(transcurridos, politicas)]
+    
+    return {
+        'transcurrido': transcurridos,
+        'restante': [max(0, m - t) for t, m in zip(transcurridos, maximos)],
+        'tipo_probable': [p.tipo_probable(t) for t, p in zip(transcurridos, politicas)],
+        'excedido': [t > m for t, m in zip(transcurridos, maximos)],
+        'maximo': maximos,
+        'limite_comida': [p.limite_comida for p in politicas]
+    }
 
 def get_current_time_formatted() -> str:
     """
@@ -182,15 +301,7 @@ def parse_iso_datetime_safe(iso_string: str) -> datetime:
         datetime: Objeto datetime con zona horaria UTC
     """
     try:
-        # Limpiar el string
-        clean_string = iso_string.replace('Z', '+00:00')
-        dt = datetime.fromisoformat(clean_string)
-        
-        # Asegurar que tenga zona horaria UTC
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=pytz.UTC)
-        
-        return dt
+        return parse_iso_utc(iso_string)
     except Exception as e:
         print(f"⚠️ Error parseando datetime ISO '{iso_string}': {e}")
         return get_current_time()
@@ -214,3 +325,30 @@ def get_date_range_defaults() -> Dict[str, str]:
     tipo_probable = 'COMIDA' if tiempo_transcurrido >= 20 else 'DESCANSO'
     
     return tiempo_restante, tipo_probable
+
+if __name__ == '__main__':
+    # Benchmark del bucle del dashboard: python time_utils.py
+    import timeit
+    
+    ahora = get_current_time()
+    inicios = [(ahora - timedelta(minutes=i % 45, seconds=i)).astimezone(pytz.UTC).isoformat().replace('+00:00', 'Z')
+               for i in range(50)]
+    
+    def bucle_anterior():
+        for valor in inicios:
+            inicio = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+            if inicio.tzinfo is None:
+                inicio = inicio.replace(tzinfo=pytz.UTC)
+            inicio_local = inicio.astimezone(TZ)
+            int((ahora - inicio_local).total_seconds() / 60)
+            inicio_local.strftime('%H:%M')
+    
+    def bucle_actual():
+        locales = [parse_iso_local(valor) for valor in inicios]
+        calcular_descansos_activos(locales, ahora)
+        for inicio_local in locales:
+            inicio_local.strftime('%H:%M')
+    
+    for nombre, funcion in (('anterior', bucle_anterior), ('actual', bucle_actual)):
+        segundos = min(timeit.repeat(funcion, number=1000, repeat=5))
+        print(f"⏱️ Dashboard ({len(inicios)} descansos) {nombre}: {segundos * 1000:.2f} µs por refresco")